@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+"""Compares reading the blocks of the first target of a Scratch project via json.loads
+with stream-parsing them via facilitate.loader.load_blocks_from_project.
+
+Projects are synthesized from the example programs within the test resources: the
+first target holds the program, and is followed by a number of other sprites that
+each hold a copy of the program together with costume and sound metadata, as
+well as monitors, extensions and metadata, in the order in which Scratch writes them.
+"""
+from pathlib import Path
+import json
+import random
+import timeit
+import uuid
+
+from facilitate.loader import load_blocks_from_project
+
+DIR_SCRIPTS = Path(__file__).resolve().parent
+DIR_REPO = DIR_SCRIPTS.parent
+DIR_PROGRAMS = DIR_REPO / "tests" / "resources" / "programs"
+
+NUM_REPEATS = 20
+
+
+def _costume(rng: random.Random) -> dict:
+    asset_id = uuid.UUID(int=rng.getrandbits(128)).hex
+    return {
+        "name": f"costume{rng.randrange(1000)}",
+        "bitmapResolution": 2,
+        "dataFormat": "png",
+        "assetId": asset_id,
+        "md5ext": f"{asset_id}.png",
+        "rotationCenterX": rng.randrange(480),
+        "rotationCenterY": rng.randrange(360),
+    }
+
+
+def _sound(rng: random.Random) -> dict:
+    asset_id = uuid.UUID(int=rng.getrandbits(128)).hex
+    return {
+        "name": f"sound{rng.randrange(1000)}",
+        "assetId": asset_id,
+        "dataFormat": "wav",
+        "format": "",
+        "rate": 48000,
+        "sampleCount": rng.randrange(10_000, 1_000_000),
+        "md5ext": f"{asset_id}.wav",
+    }
+
+
+def _target(name: str, blocks: dict, rng: random.Random, *, num_costumes: int, num_sounds: int) -> dict:
+    return {
+        "isStage": False,
+        "name": name,
+        "variables": {},
+        "lists": {},
+        "broadcasts": {},
+        "blocks": blocks,
+        "comments": {},
+        "currentCostume": 0,
+        "costumes": [_costume(rng) for _ in range(num_costumes)],
+        "sounds": [_sound(rng) for _ in range(num_sounds)],
+        "volume": 100,
+        "layerOrder": 1,
+        "visible": True,
+        "x": 0,
+        "y": 0,
+        "size": 100,
+        "direction": 90,
+        "draggable": False,
+        "rotationStyle": "all around",
+    }
+
+
+def synthesize_project(blocks: dict, *, num_sprites: int, num_costumes: int, num_sounds: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    targets = [
+        _target(f"sprite{index}", blocks, rng, num_costumes=num_costumes, num_sounds=num_sounds)
+        for index in range(num_sprites + 1)
+    ]
+    return json.dumps({
+        "targets": targets,
+        "monitors": [{"id": str(index), "mode": "default", "opcode": "data_variable"} for index in range(20)],
+        "extensions": ["flipperevents", "flippermotor", "flippermove", "flippersensors"],
+        "meta": {"semver": "3.0.0", "vm": "0.2.0", "agent": "benchmark"},
+    })
+
+
+def main() -> None:
+    program_files = sorted(DIR_PROGRAMS.glob("*/*/*.json"))
+    largest = max(program_files, key=lambda path: path.stat().st_size)
+    blocks = json.loads(largest.read_text())
+
+    print(f"blocks of the first target: {largest.relative_to(DIR_REPO)} ({len(blocks)} blocks)")
+    print(f"{'sprites':>8} {'costumes':>9} {'sounds':>7} {'size (KiB)':>11} {'json (ms)':>10} {'stream (ms)':>12} {'speedup':>8}")
+    for num_sprites, num_costumes, num_sounds in [(0, 2, 1), (4, 20, 10), (16, 50, 20), (64, 100, 40)]:
+        project = synthesize_project(blocks, num_sprites=num_sprites, num_costumes=num_costumes, num_sounds=num_sounds)
+        assert load_blocks_from_project(project) == json.loads(project)["targets"][0]["blocks"]
+
+        json_seconds = min(timeit.repeat(
+            lambda project=project: json.loads(project)["targets"][0]["blocks"],
+            number=1,
+            repeat=NUM_REPEATS,
+        ))
+        stream_seconds = min(timeit.repeat(
+            lambda project=project: load_blocks_from_project(project),
+            number=1,
+            repeat=NUM_REPEATS,
+        ))
+        print(
+            f"{num_sprites:>8} {num_costumes:>9} {num_sounds:>7} {len(project) / 1024:>11.1f} "
+            f"{json_seconds * 1000:>10.2f} {stream_seconds * 1000:>12.2f} {json_seconds / stream_seconds:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
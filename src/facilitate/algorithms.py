@@ -1,7 +1,9 @@
 from __future__ import annotations
 
+import bisect
 import typing as t
 from collections import deque
+from dataclasses import dataclass
 
 if t.TYPE_CHECKING:
     from facilitate.model.node import Node
@@ -14,3 +16,65 @@ def breadth_first_search(root: Node) -> t.Iterator[Node]:
         node = queue.popleft()
         yield node
         queue.extend(node.children())
+
+
+def longest_increasing_subsequence(values: t.Sequence[int]) -> list[int]:
+    """Finds the positions of a longest strictly increasing subsequence of the given values.
+
+    Uses patience sorting, which takes O(n log n) time. Of the longest subsequences,
+    the one whose elements end earliest is returned.
+    """
+    # tails[k] is the position of the smallest value that ends an increasing subsequence of length k + 1
+    tails: list[int] = []
+    tail_values: list[int] = []
+    predecessors: list[int] = [-1] * len(values)
+    for position, value in enumerate(values):
+        k = bisect.bisect_left(tail_values, value)
+        if k > 0:
+            predecessors[position] = tails[k - 1]
+        if k == len(tails):
+            tails.append(position)
+            tail_values.append(value)
+        else:
+            tails[k] = position
+            tail_values[k] = value
+
+    subsequence: list[int] = []
+    position = tails[-1] if tails else -1
+    while position != -1:
+        subsequence.append(position)
+        position = predecessors[position]
+    subsequence.reverse()
+    return subsequence
+
+
+@dataclass
+class FenwickTree:
+    """Maintains counts over a fixed number of slots, and sums the counts of any prefix in O(log n) time."""
+    _tree: list[int]
+
+    @classmethod
+    def build(cls, counts: t.Sequence[int]) -> FenwickTree:
+        """Builds a tree over the given initial counts of each slot in O(n) time."""
+        tree = [0, *counts]
+        for index in range(1, len(tree)):
+            parent = index + (index & -index)
+            if parent < len(tree):
+                tree[parent] += tree[index]
+        return cls(tree)
+
+    def add(self, slot: int, delta: int) -> None:
+        """Adds a delta to the count of the given slot."""
+        index = slot + 1
+        while index < len(self._tree):
+            self._tree[index] += delta
+            index += index & -index
+
+    def prefix_sum(self, slot: int) -> int:
+        """Sums the counts of every slot up to and including the given slot."""
+        total = 0
+        index = slot + 1
+        while index > 0:
+            total += self._tree[index]
+            index -= index & -index
+        return total
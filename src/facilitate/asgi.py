@@ -0,0 +1,496 @@
+"""Provides an asynchronous (ASGI) entry point to the HTTP API.
+
+The Flask app (see facilitate.server) handles each request synchronously, so a
+single large diff occupies its worker until it is done. This entry point instead
+decodes and validates each request on the event loop, using the same schemas, and
+offloads the computation to a pool of worker processes that run the same
+handlers as the Flask app.
+
+The number of jobs that are pending within the pool is bounded: once the bound is
+reached, requests are rejected with 503 Service Unavailable and a Retry-After
+header rather than queued indefinitely. A streamed progress request is admitted
+once, after which each of its per-solution jobs waits for a place within the
+pool, so that the bound is shared by every request. Health
+checks (GET /health) are answered by the event loop itself, so they remain
+responsive while the pool is saturated.
+
+Time budgets, admission limits (see facilitate.limits) and the memoization of
+responses (see facilitate.memo) are applied in the same way as by the Flask app.
+Memoized responses are looked up by the event loop, so a hit never waits for the
+pool. The deadline of a request is set when it arrives, so time
+spent waiting within the pool counts against its budget.
+
+Since the handlers run within separate processes, the solution registry (see
+facilitate.registry) is only available if it is persisted to a directory that is
+shared by the workers; otherwise, requests that involve it are rejected with
+501 Not Implemented.
+
+The app does not depend on a particular ASGI server, e.g.:
+
+    uvicorn facilitate.asgi:app
+"""
+from __future__ import annotations
+
+__all__ = (
+    "ENV_MAX_PENDING",
+    "ENV_RETRY_AFTER",
+    "ENV_WORKERS",
+    "AsyncApp",
+    "app",
+)
+
+import asyncio
+import functools
+import os
+import re
+import typing as t
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from http import HTTPStatus
+
+from loguru import logger
+from marshmallow import ValidationError
+
+from facilitate.deadline import deadline_after
+from facilitate.limits import AdmissionError
+from facilitate.memo import CachedResponse
+from facilitate.registry import UnknownSolutionError
+from facilitate.server import (
+    NDJSON,
+    TIME_BUDGET_HEADER,
+    DiffRequest,
+    DistanceRequest,
+    ProgressRequest,
+    RegisterSolutionsRequest,
+    StreamingProgressRequest,
+    TrajectoryProgressRequest,
+    handle_diff,
+    handle_distance,
+    handle_progress,
+    handle_register_solutions,
+    handle_registered_solutions,
+    handle_solution_progress,
+    handle_trajectory_progress,
+    is_memoizable,
+    limits,
+    registry,
+    response_key,
+    responses,
+    split_progress_request,
+)
+from facilitate.util import exception_to_crash_description
+from facilitate.wire import (
+    JSON,
+    StreamCompressor,
+    UnsupportedWireFormatError,
+    accepts_gzip,
+    decode_request,
+    encode_response,
+    get_wire_format,
+    negotiate_wire_format,
+)
+
+if t.TYPE_CHECKING:
+    from apiflask import Schema
+
+_Scope = dict[str, t.Any]
+_Message = dict[str, t.Any]
+_Receive = t.Callable[[], t.Awaitable[_Message]]
+_Send = t.Callable[[_Message], t.Awaitable[None]]
+
+# the number of worker processes (defaults to the number of CPUs)
+ENV_WORKERS = "FACILITATE_WORKERS"
+# the maximum number of jobs that may be pending within the pool at once
+ENV_MAX_PENDING = "FACILITATE_MAX_PENDING"
+# the number of seconds after which clients should retry a rejected request
+ENV_RETRY_AFTER = "FACILITATE_RETRY_AFTER"
+
+_DEFAULT_MAX_PENDING = 32
+_DEFAULT_RETRY_AFTER = 5
+
+
+@dataclass(frozen=True)
+class _Route:
+    # the schema of the request body, if the route takes one
+    schema: type[Schema] | None
+    handler: t.Callable[..., t.Any]
+    # whether the handler accepts the deadline of the request
+    budgeted: bool = False
+    # whether the handler encodes edit scripts, and thus accepts compact_edits
+    encodes_edits: bool = True
+    # whether responses are memoized across requests
+    memoized: bool = False
+
+
+_ROUTES: dict[str, dict[str, _Route]] = {
+    "/diff": {"PUT": _Route(DiffRequest, handle_diff, memoized=True)},
+    "/distance": {"PUT": _Route(DistanceRequest, handle_distance, budgeted=True, memoized=True)},
+    "/progress": {"PUT": _Route(ProgressRequest, handle_progress, budgeted=True, memoized=True)},
+    "/progress/stream": {"PUT": _Route(StreamingProgressRequest, handle_solution_progress, budgeted=True)},
+    "/progress/trajectory": {"PUT": _Route(TrajectoryProgressRequest, handle_trajectory_progress)},
+    "/levels/<level_id>/solutions": {
+        "GET": _Route(None, handle_registered_solutions, encodes_edits=False),
+        "PUT": _Route(RegisterSolutionsRequest, handle_register_solutions, encodes_edits=False),
+    },
+}
+
+_LEVEL_SOLUTIONS_PATH = re.compile(r"/levels/(?P<level_id>[^/]+)/solutions")
+
+
+def _match_route(path: str) -> tuple[dict[str, _Route] | None, dict[str, str]]:
+    """Finds the routes for a path, together with the parameters within the path."""
+    match = _LEVEL_SOLUTIONS_PATH.fullmatch(path)
+    if match is not None:
+        return _ROUTES["/levels/<level_id>/solutions"], match.groupdict()
+    return _ROUTES.get(path), {}
+
+
+def _uses_registry(path_parameters: dict[str, str], json_data: dict[str, t.Any]) -> bool:
+    return "level_id" in path_parameters or "level" in json_data
+
+
+class _Rejected(Exception):  # noqa: N818
+    """Raised when a request cannot be admitted to the pool."""
+
+
+def _read_headers(scope: _Scope) -> dict[str, str]:
+    return {
+        name.decode("latin-1").lower(): value.decode("latin-1")
+        for name, value in scope["headers"]
+    }
+
+
+async def _read_body(receive: _Receive) -> bytes:
+    """Reads the body of a request, or raises AdmissionError as soon as it exceeds the size limit."""
+    chunks: list[bytes] = []
+    size = 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            break
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        limits.check_request_size(size)
+        chunks.append(chunk)
+        if not message.get("more_body", False):
+            break
+    return b"".join(chunks)
+
+
+def _request_deadline(json_data: dict[str, t.Any], headers: dict[str, str]) -> float | None:
+    header = headers.get(TIME_BUDGET_HEADER.lower())
+    try:
+        header_budget = float(header) if header is not None else None
+    except ValueError:
+        header_budget = None
+    return deadline_after(limits.time_budget(header_budget, json_data.get("time_budget")))
+
+
+async def _start_response(send: _Send, status: int, headers: dict[str, str]) -> None:
+    headers = {"Access-Control-Allow-Origin": "*"} | headers
+    await send({
+        "type": "http.response.start",
+        "status": int(status),
+        "headers": [
+            (name.lower().encode("latin-1"), value.encode("latin-1"))
+            for name, value in headers.items()
+        ],
+    })
+
+
+async def _respond(
+    send: _Send,
+    status: int,
+    body: bytes,
+    headers: dict[str, str],
+) -> None:
+    await _start_response(send, status, headers | {"Content-Length": str(len(body))})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _respond_with_error(
+    send: _Send,
+    status: HTTPStatus,
+    detail: dict[str, t.Any] | None = None,
+    headers: dict[str, str] | None = None,
+) -> None:
+    """Responds with an error in the same form as the Flask app."""
+    payload = {"detail": detail or {}, "message": status.phrase}
+    body = get_wire_format(JSON).dumps(payload)
+    await _respond(send, status, body, {"Content-Type": JSON} | (headers or {}))
+
+
+@dataclass
+class AsyncApp:
+    """An ASGI app that serves the HTTP API using a pool of worker processes.
+
+    Attributes
+    ----------
+    max_workers
+        the number of worker processes, or None to use the number of CPUs
+    max_pending
+        the maximum number of jobs that may be pending (i.e., queued or running)
+        within the pool at once
+    retry_after
+        the number of seconds after which clients should retry a rejected request
+    """
+    max_workers: int | None = None
+    max_pending: int = _DEFAULT_MAX_PENDING
+    retry_after: int = _DEFAULT_RETRY_AFTER
+    _executor: ProcessPoolExecutor | None = field(default=None, init=False, repr=False)
+    _pending: int = field(default=0, init=False)
+    _waiters: list[asyncio.Future[None]] = field(default_factory=list, init=False, repr=False)
+
+    @classmethod
+    def build(cls) -> AsyncApp:
+        """Builds an app that is configured via environment variables."""
+        max_workers = os.environ.get(ENV_WORKERS)
+        return AsyncApp(
+            max_workers=int(max_workers) if max_workers else None,
+            max_pending=int(os.environ.get(ENV_MAX_PENDING, _DEFAULT_MAX_PENDING)),
+            retry_after=int(os.environ.get(ENV_RETRY_AFTER, _DEFAULT_RETRY_AFTER)),
+        )
+
+    @property
+    def pending(self) -> int:
+        """The number of jobs that are currently pending within the pool."""
+        return self._pending
+
+    def close(self) -> None:
+        """Shuts down the worker processes, cancelling any jobs that have yet to start."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    def _admit(self, num_jobs: int) -> None:
+        """Reserves places within the pool for a number of jobs, or raises _Rejected if the pool is full."""
+        if self._pending + num_jobs > self.max_pending:
+            raise _Rejected
+        self._pending += num_jobs
+
+    async def _wait_for_place(self) -> None:
+        """Reserves a place within the pool for a single job, waiting until one is released if the pool is full."""
+        while self._pending >= max(self.max_pending, 1):
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            await waiter
+        self._pending += 1
+
+    def _release(self, _: Future[t.Any]) -> None:
+        self._pending -= 1
+        # NOTE every waiter is woken, since a place may be taken by a newly admitted request
+        # before any of them resumes; those that find the pool full wait again
+        waiters, self._waiters = self._waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def _submit(
+        self,
+        handler: t.Callable[..., t.Any],
+        *args: t.Any,  # noqa: ANN401
+        **kwargs: t.Any,  # noqa: ANN401
+    ) -> asyncio.Future[t.Any]:
+        """Submits a job to the pool, which must already have been admitted."""
+        loop = asyncio.get_running_loop()
+        future = self._get_executor().submit(functools.partial(handler, *args, **kwargs))
+        # NOTE the place within the pool is only released once the job is done, even if its
+        # request is abandoned, since the worker remains busy until then
+        future.add_done_callback(lambda future: loop.call_soon_threadsafe(self._release, future))
+        return asyncio.wrap_future(future, loop=loop)
+
+    async def __call__(self, scope: _Scope, receive: _Receive, send: _Send) -> None:
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self._http(scope, receive, send)
+        else:
+            error = f"unsupported ASGI scope type: {scope['type']}"
+            raise ValueError(error)
+
+    async def _lifespan(self, receive: _Receive, send: _Send) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                self._get_executor()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.close()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _http(self, scope: _Scope, receive: _Receive, send: _Send) -> None:
+        method: str = scope["method"]
+        path: str = scope["path"]
+        headers = _read_headers(scope)
+
+        if method == "OPTIONS":
+            await _respond(send, HTTPStatus.NO_CONTENT, b"", {
+                "Access-Control-Allow-Methods": "GET, PUT, OPTIONS",
+                "Access-Control-Allow-Headers": headers.get("access-control-request-headers", "*"),
+            })
+            return
+
+        if path == "/health":
+            if method not in {"GET", "HEAD"}:
+                await _respond_with_error(send, HTTPStatus.METHOD_NOT_ALLOWED, headers={"Allow": "GET, HEAD"})
+                return
+            body = get_wire_format(JSON).dumps({
+                "status": "ok",
+                "pending": self._pending,
+                "max_pending": self.max_pending,
+            })
+            await _respond(send, HTTPStatus.OK, body, {"Content-Type": JSON})
+            return
+
+        routes, path_parameters = _match_route(path)
+        if routes is None:
+            await _respond_with_error(send, HTTPStatus.NOT_FOUND)
+            return
+        route = routes.get(method)
+        if route is None:
+            await _respond_with_error(send, HTTPStatus.METHOD_NOT_ALLOWED, headers={"Allow": ", ".join(routes)})
+            return
+
+        json_data: dict[str, t.Any] = {}
+        if route.schema is not None:
+            try:
+                body = await _read_body(receive)
+                payload = decode_request(
+                    body,
+                    headers.get("content-type"),
+                    headers.get("content-encoding"),
+                    max_size=limits.max_request_bytes or None,
+                )
+            except UnsupportedWireFormatError as err:
+                await _respond_with_error(send, HTTPStatus.UNSUPPORTED_MEDIA_TYPE, {"body": str(err)})
+                return
+            except AdmissionError as err:
+                await _respond_with_error(send, HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {"body": str(err)})
+                return
+            try:
+                json_data = route.schema().load(payload)
+            except ValidationError as err:
+                await _respond_with_error(send, HTTPStatus.UNPROCESSABLE_ENTITY, {"json": err.messages})
+                return
+
+        if _uses_registry(path_parameters, json_data) and not registry.persistent:
+            detail = {"registry": "the solution registry must be persisted to a directory shared by the workers"}
+            await _respond_with_error(send, HTTPStatus.NOT_IMPLEMENTED, detail)
+            return
+
+        kwargs: dict[str, t.Any] = dict(path_parameters)
+        if route.budgeted:
+            kwargs["deadline"] = _request_deadline(json_data, headers)
+        gzip_allowed = accepts_gzip(headers.get("accept-encoding"))
+        try:
+            if path == "/progress/stream":
+                await self._stream_progress(json_data, send, gzip_allowed=gzip_allowed, **kwargs)
+            else:
+                await self._compute(route, path, json_data, headers, send, gzip_allowed=gzip_allowed, **kwargs)
+        except AdmissionError as err:
+            await _respond_with_error(send, HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {"json": str(err)})
+        except UnknownSolutionError as err:
+            await _respond_with_error(send, HTTPStatus.NOT_FOUND, {"json": str(err)})
+        except _Rejected:
+            await _respond_with_error(
+                send,
+                HTTPStatus.SERVICE_UNAVAILABLE,
+                headers={"Retry-After": str(self.retry_after)},
+            )
+
+    async def _compute(
+        self,
+        route: _Route,
+        path: str,
+        json_data: dict[str, t.Any],
+        headers: dict[str, str],
+        send: _Send,
+        *,
+        gzip_allowed: bool,
+        **kwargs: t.Any,  # noqa: ANN401
+    ) -> None:
+        wire_format = negotiate_wire_format(headers.get("accept"))
+        key = None
+        if route.memoized:
+            key = response_key(path, json_data, wire_format, gzip_allowed=gzip_allowed)
+            cached = responses.get(key)
+            if cached is not None:
+                await _respond(send, HTTPStatus.OK, cached.body, cached.headers)
+                return
+
+        if route.encodes_edits:
+            kwargs["compact_edits"] = wire_format.compact
+        self._admit(1)
+        try:
+            result = await self._submit(route.handler, json_data, **kwargs)
+        except (AdmissionError, UnknownSolutionError):
+            raise
+        except Exception:  # noqa: BLE001
+            logger.exception("failed to handle request")
+            await _respond_with_error(send, HTTPStatus.INTERNAL_SERVER_ERROR)
+            return
+
+        body, response_headers = encode_response(result, wire_format, gzip_allowed=gzip_allowed)
+        if key is not None and is_memoizable(json_data, result):
+            responses.put(key, CachedResponse(body=body, headers=response_headers))
+        await _respond(send, HTTPStatus.OK, body, response_headers)
+
+    async def _stream_progress(
+        self,
+        json_data: dict[str, t.Any],
+        send: _Send,
+        *,
+        gzip_allowed: bool,
+        deadline: float | None = None,
+    ) -> None:
+        """Computes the progress towards each solution as a separate job, and streams each result as it is done.
+
+        The request is admitted once. Each of its jobs then waits for a place within the pool, so that a request
+        with more solutions than max_pending is throttled rather than rejected, and concurrent streams share
+        that bound with each other and with all other requests.
+        """
+        # NOTE the request is split within the pool, since the solutions to a level may need to be loaded
+        self._admit(1)
+        requests = await self._submit(split_progress_request, json_data)
+
+        async def compute(request: dict[str, t.Any]) -> dict[str, t.Any]:
+            await self._wait_for_place()
+            result: dict[str, t.Any] = await self._submit(handle_solution_progress, request, deadline=deadline)
+            return result
+
+        futures = [asyncio.ensure_future(compute(request)) for request in requests]
+        results = futures if json_data["order"] == "solution" else asyncio.as_completed(futures)
+
+        compressor = StreamCompressor() if gzip_allowed else None
+        response_headers = {"Content-Type": NDJSON, "Vary": "Accept-Encoding"}
+        if compressor is not None:
+            response_headers["Content-Encoding"] = "gzip"
+        await _start_response(send, HTTPStatus.OK, response_headers)
+
+        async def write(line: dict[str, t.Any]) -> None:
+            chunk = get_wire_format(JSON).dumps(line) + b"\n"
+            if compressor is not None:
+                chunk = compressor.compress(chunk)
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+
+        # NOTE the status of the response has already been sent, so errors are reported in-band
+        try:
+            for result in results:
+                await write(await result)
+        except Exception as err:  # noqa: BLE001
+            logger.exception("failed to compute progress")
+            for future in futures:
+                future.cancel()
+            await write({"error": exception_to_crash_description(err)})
+
+        final_chunk = compressor.finish() if compressor is not None else b""
+        await send({"type": "http.response.body", "body": final_chunk, "more_body": False})
+
+
+app = AsyncApp.build()
@@ -0,0 +1,380 @@
+"""Computes the distances between many pairs of programs in a single process pool.
+
+Pairs are read from a manifest, which is either a CSV file with "before" and
+"after" columns (the header row is optional), or a JSON Lines file whose lines are
+objects of the form {"before": ..., "after": ...}. Each program is given either
+as the path to a program file or as a corpus locator (see facilitate.corpus).
+"""
+from __future__ import annotations
+
+__all__ = (
+    "BatchItem",
+    "BatchResult",
+    "BatchStats",
+    "read_manifest",
+    "run_batch",
+)
+
+import abc
+import collections
+import concurrent.futures
+import csv
+import functools
+import itertools
+import json
+import time
+import typing as t
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from loguru import logger
+from overrides import overrides
+
+from facilitate.corpus import load_from_locator
+from facilitate.distance import compute_edit_script_and_distance
+from facilitate.util import exception_to_crash_description
+
+if t.TYPE_CHECKING:
+    from types import TracebackType
+
+    from facilitate.model.program import Program
+
+_CSV_HEADER = ("index", "before", "after", "distance", "num_edits", "seconds", "error", "edit_script")
+
+# the number of recently loaded programs that each worker keeps in memory
+_PROGRAM_CACHE_SIZE = 256
+
+
+@dataclass(frozen=True)
+class BatchItem:
+    """Describes a single pair of programs within a manifest."""
+    index: int
+    before: str
+    after: str
+
+
+@dataclass(frozen=True)
+class BatchResult:
+    """Describes the outcome of comparing a single pair of programs.
+
+    Attributes
+    ----------
+    index
+        the position of the pair within the manifest
+    before
+        the program from which the distance was computed
+    after
+        the program to which the distance was computed
+    distance
+        the weighted edit distance between the programs, or None if an error occurred
+    num_edits
+        the number of edits within the edit script, or None if an error occurred
+    seconds
+        the time taken to compare the programs
+    error
+        a short description of the crash that occurred, if any
+    edit_script
+        the edit script between the programs, if requested
+    """
+    index: int
+    before: str
+    after: str
+    distance: float | None
+    num_edits: int | None
+    seconds: float
+    error: str | None = None
+    edit_script: dict[str, t.Any] | None = None
+
+    def to_dict(self) -> dict[str, t.Any]:
+        dict_: dict[str, t.Any] = {
+            "index": self.index,
+            "before": self.before,
+            "after": self.after,
+            "distance": self.distance,
+            "num-edits": self.num_edits,
+            "seconds": self.seconds,
+        }
+        if self.error is not None:
+            dict_["error"] = self.error
+        if self.edit_script is not None:
+            dict_["edit-script"] = self.edit_script
+        return dict_
+
+    def to_csv_row(self) -> list[str]:
+        return [
+            str(self.index),
+            self.before,
+            self.after,
+            "" if self.distance is None else str(self.distance),
+            "" if self.num_edits is None else str(self.num_edits),
+            f"{self.seconds:.6f}",
+            self.error or "",
+            "" if self.edit_script is None else json.dumps(self.edit_script),
+        ]
+
+
+@dataclass
+class BatchStats:
+    pairs: int = 0
+    failures: int = 0
+    seconds: float = 0.0
+
+    def describe(self) -> str:
+        seconds = max(self.seconds, 1e-9)
+        return (
+            f"compared {self.pairs} pairs ({self.pairs / seconds:.1f}/s) "
+            f"with {self.failures} failures in {self.seconds:.1f}s"
+        )
+
+
+def _read_csv_manifest(path: Path) -> t.Iterator[tuple[str, str]]:
+    with path.open(newline="") as file:
+        for row_number, row in enumerate(csv.reader(file)):
+            if not row:
+                continue
+            if row_number == 0 and [cell.strip().lower() for cell in row[:2]] == ["before", "after"]:
+                continue
+            if len(row) < 2:  # noqa: PLR2004
+                error = f"bad manifest row [{path}:{row_number + 1}]: expected before and after"
+                raise ValueError(error)
+            yield row[0], row[1]
+
+
+def _read_jsonl_manifest(path: Path) -> t.Iterator[tuple[str, str]]:
+    with path.open() as file:
+        for line_number, line in enumerate(file, start=1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            try:
+                yield str(record["before"]), str(record["after"])
+            except KeyError as err:
+                error = f"bad manifest line [{path}:{line_number}]: missing {err}"
+                raise ValueError(error) from err
+
+
+def read_manifest(filename: str | Path) -> t.Iterator[BatchItem]:
+    """Lazily reads the pairs of programs within a CSV or JSON Lines manifest."""
+    path = Path(filename)
+    pairs = _read_jsonl_manifest(path) if path.suffix in (".jsonl", ".ndjson") else _read_csv_manifest(path)
+    for index, (before, after) in enumerate(pairs):
+        yield BatchItem(index=index, before=before, after=after)
+
+
+@functools.lru_cache(maxsize=_PROGRAM_CACHE_SIZE)
+def _load_program(locator: str) -> Program:
+    # NOTE programs are never modified by the diff, which works on copies
+    return load_from_locator(locator)
+
+
+def _compare(item: BatchItem, *, include_edit_script: bool) -> BatchResult:
+    started_at = time.perf_counter()
+    try:
+        before = _load_program(item.before)
+        after = _load_program(item.after)
+        edit_script, distance = compute_edit_script_and_distance(before, after)
+    except Exception as err:  # noqa: BLE001
+        return BatchResult(
+            index=item.index,
+            before=item.before,
+            after=item.after,
+            distance=None,
+            num_edits=None,
+            seconds=time.perf_counter() - started_at,
+            error=exception_to_crash_description(err),
+        )
+    return BatchResult(
+        index=item.index,
+        before=item.before,
+        after=item.after,
+        distance=distance,
+        num_edits=len(edit_script),
+        seconds=time.perf_counter() - started_at,
+        edit_script=edit_script.to_dict() if include_edit_script else None,
+    )
+
+
+def _compare_chunk(chunk: list[BatchItem], *, include_edit_script: bool) -> list[BatchResult]:
+    return [_compare(item, include_edit_script=include_edit_script) for item in chunk]
+
+
+def _map_chunks(
+    compare_chunk: t.Callable[[list[BatchItem]], list[BatchResult]],
+    chunks: t.Iterable[list[BatchItem]],
+    *,
+    workers: int,
+    max_pending: int,
+    ordered: bool,
+) -> t.Iterator[list[BatchResult]]:
+    """Compares the given chunks of pairs using a pool of worker processes.
+
+    If ordered, results are yielded in the same order as the chunks; otherwise,
+    they are yielded as soon as they are ready.
+    At most max_pending chunks are held in memory at any time.
+    """
+    if workers <= 1:
+        yield from map(compare_chunk, chunks)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        if ordered:
+            queue: collections.deque[Future[list[BatchResult]]] = collections.deque()
+            for chunk in chunks:
+                if len(queue) >= max_pending:
+                    yield queue.popleft().result()
+                queue.append(executor.submit(compare_chunk, chunk))
+            while queue:
+                yield queue.popleft().result()
+            return
+
+        pending: set[Future[list[BatchResult]]] = set()
+        for chunk in chunks:
+            if len(pending) >= max_pending:
+                done, pending = concurrent.futures.wait(
+                    pending,
+                    return_when=concurrent.futures.FIRST_COMPLETED,
+                )
+                for future in done:
+                    yield future.result()
+            pending.add(executor.submit(compare_chunk, chunk))
+        for future in concurrent.futures.as_completed(pending):
+            yield future.result()
+
+
+@dataclass
+class ResultWriter(abc.ABC):
+    """Streams results to a file, flushing after each batch of results."""
+    output_to: Path
+    _file: t.TextIO = field(init=False)
+
+    def __post_init__(self) -> None:
+        self._file = self.output_to.open("w", newline="")
+
+    @classmethod
+    def for_format(cls, output_to: Path, format_: str | None = None) -> ResultWriter:
+        """Builds a writer for a given format, or for the suffix of output_to if unspecified."""
+        if format_ is None:
+            format_ = "csv" if output_to.suffix == ".csv" else "jsonl"
+        if format_ == "csv":
+            return CsvResultWriter(output_to)
+        if format_ == "jsonl":
+            return JsonlResultWriter(output_to)
+        error = f"unknown output format: {format_}"
+        raise ValueError(error)
+
+    @abc.abstractmethod
+    def write(self, results: list[BatchResult]) -> None:
+        ...
+
+    def __enter__(self) -> t.Self:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        self._file.close()
+
+
+@dataclass
+class JsonlResultWriter(ResultWriter):
+    @overrides
+    def write(self, results: list[BatchResult]) -> None:
+        for result in results:
+            self._file.write(json.dumps(result.to_dict()))
+            self._file.write("\n")
+        self._file.flush()
+
+
+@dataclass
+class CsvResultWriter(ResultWriter):
+    _writer: t.Any = field(init=False)
+
+    @overrides
+    def __post_init__(self) -> None:
+        super().__post_init__()
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(_CSV_HEADER)
+
+    @overrides
+    def write(self, results: list[BatchResult]) -> None:
+        self._writer.writerows(result.to_csv_row() for result in results)
+        self._file.flush()
+
+
+def _chunked(items: t.Iterable[BatchItem], size: int) -> t.Iterator[list[BatchItem]]:
+    iterator = iter(items)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+
+def run_batch(
+    manifest: str | Path,
+    output_to: str | Path,
+    *,
+    output_format: str | None = None,
+    workers: int = 1,
+    chunk_size: int = 16,
+    max_pending: int | None = None,
+    ordered: bool = True,
+    include_edit_scripts: bool = False,
+    report_every: int = 10_000,
+) -> BatchStats:
+    """Computes the distance between each pair of programs within a manifest.
+
+    Results are streamed to the output file as soon as they are available.
+
+    Parameters
+    ----------
+    manifest
+        the path to a CSV or JSON Lines manifest of pairs
+    output_to
+        the file to which results should be written
+    output_format
+        either "jsonl" or "csv"; if unspecified, this is inferred from output_to
+    workers
+        the number of worker processes that should be used to compare pairs
+    chunk_size
+        the number of pairs that are sent to a worker at a time
+    max_pending
+        the maximum number of chunks that may be queued for the workers at once
+    ordered
+        whether results should be written in the same order as the manifest
+    include_edit_scripts
+        whether the edit script of each pair should be written alongside its distance
+    report_every
+        the (approximate) number of pairs between progress reports
+    """
+    if max_pending is None:
+        max_pending = 4 * workers
+
+    compare_chunk = functools.partial(_compare_chunk, include_edit_script=include_edit_scripts)
+    chunks = _chunked(read_manifest(manifest), chunk_size)
+
+    stats = BatchStats()
+    started_at = time.perf_counter()
+    reported_at = 0
+
+    with ResultWriter.for_format(Path(output_to), output_format) as writer:
+        for results in _map_chunks(
+            compare_chunk,
+            chunks,
+            workers=workers,
+            max_pending=max_pending,
+            ordered=ordered,
+        ):
+            writer.write(results)
+            stats.pairs += len(results)
+            stats.failures += sum(1 for result in results if result.error is not None)
+
+            if stats.pairs - reported_at >= report_every:
+                reported_at = stats.pairs
+                stats.seconds = time.perf_counter() - started_at
+                logger.info(stats.describe())
+
+    stats.seconds = time.perf_counter() - started_at
+    logger.info(stats.describe())
+    return stats
@@ -0,0 +1,246 @@
+"""Provides a compact, versioned binary encoding of program trees.
+
+Each encoded program begins with a fixed header that records the format version
+and the version of the loader that produced the tree, followed by a table of the
+distinct strings within the program and a preorder listing of its nodes.
+Nodes refer to strings by their index within the table.
+"""
+from __future__ import annotations
+
+__all__ = (
+    "FORMAT_VERSION",
+    "BinaryFormatError",
+    "dump_program",
+    "load_program_from_bytes",
+    "read_header",
+)
+
+import json
+import struct
+import typing as t
+
+from facilitate.model.block import Block
+from facilitate.model.field import Field
+from facilitate.model.input import Input
+from facilitate.model.literal import Literal
+from facilitate.model.program import Program
+from facilitate.model.sequence import Sequence
+
+if t.TYPE_CHECKING:
+    from facilitate.model.node import Node
+
+FORMAT_VERSION = 1
+
+_MAGIC = b"FCPT"
+_HEADER = struct.Struct("<4sHI")
+_U8 = struct.Struct("<B")
+_U32 = struct.Struct("<I")
+_BLOCK = struct.Struct("<IIBHH")
+_FIELD = struct.Struct("<IIBI")
+_INPUT = struct.Struct("<IIB")
+_PAIR = struct.Struct("<II")
+
+_TAG_PROGRAM = 0
+_TAG_SEQUENCE = 1
+_TAG_BLOCK = 2
+_TAG_FIELD = 3
+_TAG_INPUT = 4
+_TAG_LITERAL = 5
+
+# field values are usually strings, but may be arbitrary JSON values (e.g., grids)
+_VALUE_STRING = 0
+_VALUE_JSON = 1
+
+
+class BinaryFormatError(ValueError):
+    """Raised when a binary-encoded program is malformed or has an unsupported version."""
+
+
+class _StringTable:
+    def __init__(self) -> None:
+        self._string_to_index: dict[str, int] = {}
+
+    def index(self, string: str) -> int:
+        index = self._string_to_index.get(string)
+        if index is None:
+            index = len(self._string_to_index)
+            self._string_to_index[string] = index
+        return index
+
+    def encode(self) -> bytes:
+        output = bytearray(_U32.pack(len(self._string_to_index)))
+        for string in self._string_to_index:
+            encoded = string.encode("utf-8")
+            output += _U32.pack(len(encoded))
+            output += encoded
+        return bytes(output)
+
+
+def _encode_node(node: Node, strings: _StringTable, output: bytearray) -> None:
+    match node:
+        case Program():
+            output += _U8.pack(_TAG_PROGRAM)
+            output += _PAIR.pack(strings.index(node.id_), len(node.top_level_nodes))
+        case Sequence():
+            output += _U8.pack(_TAG_SEQUENCE)
+            output += _PAIR.pack(strings.index(node.id_), len(node.blocks))
+        case Block():
+            output += _U8.pack(_TAG_BLOCK)
+            output += _BLOCK.pack(
+                strings.index(node.id_),
+                strings.index(node.opcode),
+                node.is_shadow,
+                len(node.fields),
+                len(node.inputs),
+            )
+        case Field():
+            value_kind = _VALUE_STRING
+            value = node.value
+            if not isinstance(value, str):
+                value_kind = _VALUE_JSON
+                value = json.dumps(value)
+            output += _U8.pack(_TAG_FIELD)
+            output += _FIELD.pack(
+                strings.index(node.id_),
+                strings.index(node.name),
+                value_kind,
+                strings.index(value),
+            )
+        case Input():
+            output += _U8.pack(_TAG_INPUT)
+            output += _INPUT.pack(
+                strings.index(node.id_),
+                strings.index(node.name),
+                len(node._children),
+            )
+        case Literal():
+            output += _U8.pack(_TAG_LITERAL)
+            output += _PAIR.pack(strings.index(node.id_), strings.index(node.value))
+        case _:
+            error = f"cannot encode node of type {node.__class__.__name__}"
+            raise TypeError(error)
+
+    for child in node.children():
+        _encode_node(child, strings, output)
+
+
+def dump_program(program: Program, *, loader_version: int = 0) -> bytes:
+    """Encodes a program as bytes."""
+    strings = _StringTable()
+    nodes = bytearray()
+    _encode_node(program, strings, nodes)
+    header = _HEADER.pack(_MAGIC, FORMAT_VERSION, loader_version)
+    return header + strings.encode() + bytes(nodes)
+
+
+def read_header(data: bytes) -> tuple[int, int]:
+    """Reads the format version and loader version of a binary-encoded program."""
+    if len(data) < _HEADER.size:
+        error = "truncated header"
+        raise BinaryFormatError(error)
+    magic, format_version, loader_version = _HEADER.unpack_from(data, 0)
+    if magic != _MAGIC:
+        error = "not a binary-encoded program"
+        raise BinaryFormatError(error)
+    return format_version, loader_version
+
+
+class _Decoder:
+    def __init__(self, data: bytes, offset: int) -> None:
+        self._data = data
+        self._offset = offset
+        self._strings: list[str] = []
+
+        (num_strings,) = self._unpack(_U32)
+        for _ in range(num_strings):
+            (length,) = self._unpack(_U32)
+            end = self._offset + length
+            self._strings.append(data[self._offset:end].decode("utf-8"))
+            self._offset = end
+
+    def _unpack(self, fmt: struct.Struct) -> tuple[t.Any, ...]:
+        values = fmt.unpack_from(self._data, self._offset)
+        self._offset += fmt.size
+        return values
+
+    def decode_node(self) -> Node:
+        (tag,) = self._unpack(_U8)
+        strings = self._strings
+
+        if tag == _TAG_PROGRAM:
+            id_index, num_children = self._unpack(_PAIR)
+            sequences = [self.decode_node() for _ in range(num_children)]
+            assert all(isinstance(sequence, Sequence) for sequence in sequences)
+            return Program(
+                id_=strings[id_index],
+                top_level_nodes=t.cast("list[Sequence]", sequences),
+            )
+
+        if tag == _TAG_SEQUENCE:
+            id_index, num_blocks = self._unpack(_PAIR)
+            blocks = [self.decode_node() for _ in range(num_blocks)]
+            return Sequence(
+                id_=strings[id_index],
+                blocks=t.cast("list[Block]", blocks),
+            )
+
+        if tag == _TAG_BLOCK:
+            id_index, opcode_index, is_shadow, num_fields, num_inputs = self._unpack(_BLOCK)
+            fields = [self.decode_node() for _ in range(num_fields)]
+            inputs = [self.decode_node() for _ in range(num_inputs)]
+            return Block(
+                id_=strings[id_index],
+                opcode=strings[opcode_index],
+                is_shadow=bool(is_shadow),
+                fields=t.cast("list[Field]", fields),
+                inputs=t.cast("list[Input]", inputs),
+            )
+
+        if tag == _TAG_FIELD:
+            id_index, name_index, value_kind, value_index = self._unpack(_FIELD)
+            value = strings[value_index]
+            if value_kind == _VALUE_JSON:
+                value = json.loads(value)
+            return Field(
+                id_=strings[id_index],
+                name=strings[name_index],
+                value=value,
+            )
+
+        if tag == _TAG_INPUT:
+            id_index, name_index, num_children = self._unpack(_INPUT)
+            children = [self.decode_node() for _ in range(num_children)]
+            return Input(
+                id_=strings[id_index],
+                name=strings[name_index],
+                _children=children,
+            )
+
+        if tag == _TAG_LITERAL:
+            id_index, value_index = self._unpack(_PAIR)
+            return Literal(
+                id_=strings[id_index],
+                value=strings[value_index],
+            )
+
+        error = f"invalid node tag: {tag}"
+        raise BinaryFormatError(error)
+
+
+def load_program_from_bytes(data: bytes) -> Program:
+    """Decodes a program that was encoded via dump_program."""
+    format_version, _ = read_header(data)
+    if format_version != FORMAT_VERSION:
+        error = f"unsupported format version: {format_version}"
+        raise BinaryFormatError(error)
+
+    try:
+        program = _Decoder(data, _HEADER.size).decode_node()
+    except (struct.error, IndexError, UnicodeDecodeError) as err:
+        error = "malformed binary-encoded program"
+        raise BinaryFormatError(error) from err
+
+    if not isinstance(program, Program):
+        error = "binary-encoded tree is not a program"
+        raise BinaryFormatError(error)
+    return program
@@ -0,0 +1,102 @@
+"""Provides an on-disk cache of parsed programs, keyed by the contents of their source files."""
+from __future__ import annotations
+
+__all__ = ("ProgramCache",)
+
+import hashlib
+import os
+import typing as t
+from dataclasses import dataclass
+from pathlib import Path
+
+from loguru import logger
+
+from facilitate.binary import (
+    FORMAT_VERSION,
+    BinaryFormatError,
+    dump_program,
+    load_program_from_bytes,
+    read_header,
+)
+
+if t.TYPE_CHECKING:
+    from facilitate.model.program import Program
+
+# the directory used by the default cache; caching is disabled unless it is set
+ENV_CACHE_DIR = "FACILITATE_CACHE_DIR"
+
+
+def _default_cache_directory() -> Path | None:
+    directory = os.environ.get(ENV_CACHE_DIR)
+    return Path(directory) if directory else None
+
+
+@dataclass(frozen=True)
+class ProgramCache:
+    """Stores parsed programs in a compact binary format within a directory.
+
+    Entries are keyed by a hash of the source contents together with the loader
+    version, so a change to the loader automatically invalidates older entries.
+    The cache is best effort: failures to read or write entries are logged and
+    treated as misses.
+    """
+    directory: Path
+    loader_version: int
+
+    @classmethod
+    def default(cls, loader_version: int) -> ProgramCache | None:
+        """Returns the default cache, or None if no cache directory has been configured."""
+        directory = _default_cache_directory()
+        if directory is None:
+            return None
+        return cls(directory=directory, loader_version=loader_version)
+
+    def _path(self, contents: bytes) -> Path:
+        hasher = hashlib.blake2b(digest_size=20)
+        hasher.update(f"loader:{self.loader_version};format:{FORMAT_VERSION};".encode())
+        hasher.update(contents)
+        key = hasher.hexdigest()
+        return self.directory / key[:2] / f"{key[2:]}.fcp"
+
+    def get(self, contents: bytes) -> Program | None:
+        """Retrieves the program that was parsed from the given contents, if cached."""
+        path = self._path(contents)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            return None
+        except OSError as err:
+            logger.warning(f"failed to read cached program [{path}]: {err}")
+            return None
+
+        try:
+            format_version, loader_version = read_header(data)
+            if format_version != FORMAT_VERSION or loader_version != self.loader_version:
+                logger.debug(f"discarding stale cached program: {path}")
+                path.unlink(missing_ok=True)
+                return None
+            return load_program_from_bytes(data)
+        except BinaryFormatError as err:
+            logger.warning(f"discarding corrupt cached program [{path}]: {err}")
+            path.unlink(missing_ok=True)
+            return None
+
+    def put(self, contents: bytes, program: Program) -> None:
+        """Stores the program that was parsed from the given contents."""
+        path = self._path(contents)
+        data = dump_program(program, loader_version=self.loader_version)
+
+        # write to a temporary file first so that readers never observe partial entries
+        temporary_path = path.with_suffix(f".{os.getpid()}.tmp")
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            temporary_path.write_bytes(data)
+            temporary_path.replace(path)
+        except OSError as err:
+            logger.warning(f"failed to cache program [{path}]: {err}")
+            temporary_path.unlink(missing_ok=True)
+
+    def clear(self) -> None:
+        """Removes all entries from the cache."""
+        for path in self.directory.glob("*/*.fcp"):
+            path.unlink(missing_ok=True)
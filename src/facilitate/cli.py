@@ -2,24 +2,34 @@
 from __future__ import annotations
 
 import csv
+import json
 import sys
+import typing as t
 from pathlib import Path
 
 import click
 from loguru import logger
 
+from facilitate.batch import run_batch
+from facilitate.corpus import Corpus
 from facilitate.diff import compute_edit_script
-from facilitate.distance import compute_distance
+from facilitate.distance import DISTANCE_METHODS, DistanceMethod, compute_distance
 from facilitate.edit import EditScript
 from facilitate.fuzzer.diff import (
     BaseDiffFuzzer,
+    RandomPairDiffFuzzer,
     SuccessiveVersionDiffFuzzer,
 )
 from facilitate.fuzzer.parse import (
     ParserCrash,
     ParserFuzzer,
 )
+from facilitate.fuzzer.perf import PerfFuzzer
+from facilitate.index import SolutionIndex, benchmark_index
 from facilitate.loader import load_from_file
+from facilitate.matrix import compute_distance_matrix
+from facilitate.pqgram import pqgram_distance
+from facilitate.progress import compute_trajectory_progress, load_snapshots
 from facilitate.scraper import scrape as _scrape
 
 
@@ -44,6 +54,28 @@ def cli(verbose: bool) -> None:
         setup_logging()
 
 
+def _build_diff_fuzzer(
+    method: str,
+    number: int,
+    input_: Path,
+    seed: int,
+) -> BaseDiffFuzzer:
+    if method == "successive":
+        return SuccessiveVersionDiffFuzzer.build(
+            number=number,
+            program_directory=input_,
+            seed=seed,
+        )
+    if method == "random":
+        return RandomPairDiffFuzzer.build(
+            number=number,
+            program_directory=input_,
+            seed=seed,
+        )
+    error = f"unknown method for picking pairs: {method}"
+    raise ValueError(error)
+
+
 @cli.group()
 def fuzz() -> None:
     # disable logging during fuzzing
@@ -61,7 +93,7 @@ def fuzz() -> None:
     "-i", "--input", "input_",
     default="./programs",
     type=click.Path(exists=True),
-    help="directory containing programs to parse.",
+    help="directory or corpus containing programs to parse.",
 )
 @click.option(
     "-s", "--seed",
@@ -102,7 +134,7 @@ def fuzz_parse(
 @fuzz.command("diff")
 @click.option(
     "-m", "--method",
-    type=click.Choice(["successive"]),
+    type=click.Choice(["successive", "random"]),
     default="successive",
     help="method that should be used to select program pairs.",
 )
@@ -116,7 +148,7 @@ def fuzz_parse(
     "-i", "--input", "input_",
     default="./programs",
     type=click.Path(exists=True),
-    help="directory containing programs to diff.",
+    help="directory or corpus containing programs to diff.",
 )
 @click.option(
     "-s", "--seed",
@@ -141,17 +173,7 @@ def fuzz_diff(
     input_ = Path(input_)
     output = Path(output)
 
-    fuzzer: BaseDiffFuzzer
-    if method == "successive":
-        fuzzer = SuccessiveVersionDiffFuzzer.build(
-            number=number,
-            program_directory=input_,
-            seed=seed,
-        )
-    else:
-        error = f"unknown method for picking pairs: {method}"
-        raise ValueError(error)
-
+    fuzzer = _build_diff_fuzzer(method, number, input_, seed)
     crashes = list(fuzzer.run())
     with output.open("w") as file:
         writer = csv.writer(file)
@@ -159,6 +181,113 @@ def fuzz_diff(
             writer.writerow(crash.to_csv_row())
 
 
+@fuzz.command("perf")
+@click.option(
+    "-m", "--method",
+    type=click.Choice(["successive", "random"]),
+    default="successive",
+    help="method that should be used to select program pairs.",
+)
+@click.option(
+    "-n", "--number",
+    type=int,
+    default=None,
+    help="maximum number of program pairs to time.",
+)
+@click.option(
+    "-i", "--input", "input_",
+    default="./programs",
+    type=click.Path(exists=True),
+    help="directory or corpus containing programs to diff.",
+)
+@click.option(
+    "-s", "--seed",
+    type=int,
+    default=None,
+    help="seed for random number generator.",
+)
+@click.option(
+    "-b", "--budget",
+    type=float,
+    default=None,
+    help="absolute time budget (in seconds) for a single diff.",
+)
+@click.option(
+    "--outlier-factor",
+    type=float,
+    default=10.0,
+    show_default=True,
+    help="flags diffs that are this many times slower than the fitted scaling curve.",
+)
+@click.option(
+    "--repeats",
+    type=int,
+    default=1,
+    show_default=True,
+    help="number of times each diff is timed (the fastest time is kept).",
+)
+@click.option(
+    "--minimize/--no-minimize",
+    default=True,
+    help="whether slow pairs should be delta-minimized into reproducers.",
+)
+@click.option(
+    "-r", "--reproducers",
+    type=click.Path(),
+    default="perf_reproducers",
+    help="directory to which minimized reproducers will be written.",
+)
+@click.option(
+    "-t", "--timings",
+    type=click.Path(),
+    default=None,
+    help="file to which the runtime of every pair will be written.",
+)
+@click.option(
+    "-o", "--output",
+    type=click.Path(),
+    default="perf_failures.csv",
+    help="file to which list of slow program pairs will be written.",
+)
+def fuzz_perf(
+    *,
+    method: str,
+    number: int,
+    input_: Path | str,
+    seed: int,
+    budget: float | None,
+    outlier_factor: float,
+    repeats: int,
+    minimize: bool,
+    reproducers: Path | str,
+    timings: Path | str | None,
+    output: Path | str,
+) -> None:
+    """Hunts for pairs of Scratch programs that are slow to diff."""
+    input_ = Path(input_)
+    output = Path(output)
+
+    fuzzer = PerfFuzzer.build(
+        _build_diff_fuzzer(method, number, input_, seed),
+        budget=budget,
+        outlier_factor=outlier_factor,
+        repeats=repeats,
+        reproducer_directory=Path(reproducers) if minimize else None,
+    )
+    slow_diffs = list(fuzzer.run())
+
+    with output.open("w") as file:
+        writer = csv.writer(file)
+        for slow_diff in slow_diffs:
+            writer.writerow(slow_diff.to_csv_row())
+
+    if timings:
+        with Path(timings).open("w") as file:
+            writer = csv.writer(file)
+            for timing in fuzzer.timings:
+                writer.writerow(timing.to_csv_row())
+
+
 @cli.command()
 @click.argument("program", type=click.Path(exists=True))
 @click.option(
@@ -194,23 +323,53 @@ def draw(program: str, output: str, format_: str) -> None:
     help="Output file name.",
     type=click.Path(),
 )
-def diff(before: str, after: str, output: str) -> None:
+@click.option(
+    "--anchor-ids",
+    is_flag=True,
+    help="Maps blocks with identical IDs to one another before matching the rest of the programs.",
+)
+@click.option(
+    "--compact",
+    is_flag=True,
+    help="Collapses the insertions and deletions of entire subtrees into single edits.",
+)
+def diff(before: str, after: str, output: str, anchor_ids: bool, compact: bool) -> None:
     """Computes an edit script between two version of a Scratch program."""
     ast_before = load_from_file(before)
     ast_after = load_from_file(after)
 
-    edits = compute_edit_script(ast_before, ast_after)
+    edits = compute_edit_script(
+        ast_before,
+        ast_after,
+        anchor_ids=anchor_ids,
+        compact=compact,
+    )
     edits.save_to_json(output)
 
 
 @cli.command()
 @click.argument("before", type=click.Path(exists=True))
 @click.argument("after", type=click.Path(exists=True))
-def distance(before: str, after: str) -> None:
+@click.option(
+    "--anchor-ids",
+    is_flag=True,
+    help="Maps blocks with identical IDs to one another before matching the rest of the programs.",
+)
+@click.option(
+    "-m", "--method",
+    default="gumtree",
+    show_default=True,
+    help="Method used to compute the distance (pqgram approximates it from pq-gram profiles).",
+    type=click.Choice(DISTANCE_METHODS),
+)
+def distance(before: str, after: str, anchor_ids: bool, method: DistanceMethod) -> None:
     """Computes a weighted edit distance between two versions of a Scratch program."""
     ast_before = load_from_file(before)
     ast_after = load_from_file(after)
-    edits = compute_edit_script(ast_before, ast_after)
+    if method == "pqgram":
+        print(pqgram_distance(ast_before, ast_after))
+        return
+    edits = compute_edit_script(ast_before, ast_after, anchor_ids=anchor_ids)
     distance = compute_distance(
         tree_from=ast_before,
         tree_to=ast_after,
@@ -219,6 +378,174 @@ def distance(before: str, after: str) -> None:
     print(distance)
 
 
+@cli.command("batch-distance")
+@click.argument("manifest", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "-o", "--output",
+    default="distances.jsonl",
+    help="Output file name.",
+    type=click.Path(dir_okay=False),
+)
+@click.option(
+    "-f", "--format", "format_",
+    default=None,
+    help="Output format (inferred from the output file name by default).",
+    type=click.Choice(["jsonl", "csv"]),
+)
+@click.option(
+    "-j", "--workers",
+    default=1,
+    show_default=True,
+    help="Number of worker processes used to compute distances.",
+    type=int,
+)
+@click.option(
+    "--chunk-size",
+    default=16,
+    show_default=True,
+    help="Number of pairs sent to a worker at a time.",
+    type=int,
+)
+@click.option(
+    "--ordered/--unordered",
+    default=True,
+    show_default=True,
+    help="Whether results are written in the same order as the manifest.",
+)
+@click.option(
+    "-e", "--edit-scripts",
+    is_flag=True,
+    help="Writes the edit script of each pair alongside its distance.",
+)
+def batch_distance(
+    *,
+    manifest: str,
+    output: str,
+    format_: str | None,
+    workers: int,
+    chunk_size: int,
+    ordered: bool,
+    edit_scripts: bool,
+) -> None:
+    """Computes the distances between the pairs of programs listed in a CSV or JSONL manifest."""
+    stats = run_batch(
+        manifest,
+        output,
+        output_format=format_,
+        workers=workers,
+        chunk_size=chunk_size,
+        ordered=ordered,
+        include_edit_scripts=edit_scripts,
+    )
+    print(stats.describe())
+
+
+@cli.command("distance-matrix")
+@click.argument("source", type=click.Path(exists=True))
+@click.option(
+    "-o", "--output",
+    default="matrix",
+    help="Output directory.",
+    type=click.Path(file_okay=False),
+)
+@click.option(
+    "-l", "--level",
+    default=None,
+    help="ID of the level (required if the source is a corpus).",
+)
+@click.option(
+    "-j", "--workers",
+    default=1,
+    show_default=True,
+    help="Number of worker processes used to compute rows of the matrix.",
+    type=int,
+)
+@click.option(
+    "--rows-per-chunk",
+    default=8,
+    show_default=True,
+    help="Number of rows computed by a worker at a time.",
+    type=int,
+)
+@click.option(
+    "-m", "--method",
+    default="gumtree",
+    show_default=True,
+    help="Method used to compute distances (pqgram approximates them from pq-gram profiles).",
+    type=click.Choice(DISTANCE_METHODS),
+)
+def distance_matrix(
+    *,
+    source: str,
+    output: str,
+    level: str | None,
+    workers: int,
+    rows_per_chunk: int,
+    method: DistanceMethod,
+) -> None:
+    """Computes the pairwise distances between all final submissions to a level."""
+    stats = compute_distance_matrix(
+        source,
+        output,
+        level_id=level,
+        workers=workers,
+        rows_per_chunk=rows_per_chunk,
+        method=method,
+    )
+    print(stats.describe())
+
+
+@cli.command()
+@click.argument("trajectory", type=click.Path(exists=True))
+@click.argument("solutions", nargs=-1, required=True, type=click.Path(exists=True))
+@click.option(
+    "-o", "--output",
+    default="progress.csv",
+    help="Output file name (CSV, or JSON Lines if it ends in .jsonl).",
+    type=click.Path(dir_okay=False),
+)
+@click.option(
+    "-e", "--edit-scripts",
+    is_flag=True,
+    help="Includes the edit script to each solution (JSON Lines output only).",
+)
+def progress(
+    trajectory: str,
+    solutions: tuple[str, ...],
+    output: str,
+    edit_scripts: bool,
+) -> None:
+    """Computes the distance from each snapshot of a trajectory to each solution.
+
+    The trajectory is either a directory of snapshots named after their frame, a
+    bundle, or a delta-compressed trajectory written by the scrape command.
+    """
+    snapshots = load_snapshots(trajectory)
+    solution_programs = [(Path(solution).stem, load_from_file(solution)) for solution in solutions]
+    frames = [frame for frame, _ in snapshots]
+    results = compute_trajectory_progress(
+        (snapshot for _, snapshot in snapshots),
+        solution_programs,
+        include_edits=edit_scripts,
+    )
+
+    output_path = Path(output)
+    with output_path.open("w", newline="") as file:
+        if output_path.suffix == ".jsonl":
+            for frame, distances in zip(frames, results, strict=True):
+                record = {
+                    "frame": frame,
+                    "distances": [distance.to_dict() for distance in distances],
+                }
+                file.write(json.dumps(record) + "\n")
+        else:
+            writer = csv.writer(file)
+            writer.writerow(["frame", "solution", "distance"])
+            for frame, distances in zip(frames, results, strict=True):
+                for distance in distances:
+                    writer.writerow([frame, distance.solution_id, distance.distance])
+
+
 @cli.command()
 @click.argument("script", type=click.Path(exists=True))
 @click.argument("before", type=click.Path(exists=True))
@@ -248,11 +575,167 @@ def animate(
 @click.option(
     "-o", "--output",
     default="programs",
-    help="Output directory.",
+    help="Output directory (or corpus file).",
     type=click.Path(),
 )
-def scrape(dump: str, output: str) -> None:
-    _scrape(
+@click.option(
+    "-j", "--workers",
+    default=1,
+    show_default=True,
+    help="Number of worker processes used to scrape sessions.",
+    type=int,
+)
+@click.option(
+    "-f", "--format", "format_",
+    default="directory",
+    show_default=True,
+    help=(
+        "Output format: one file per frame, one bundle or trajectory per level and user,"
+        " or a single SQLite corpus."
+    ),
+    type=click.Choice(["directory", "bundle", "trajectory", "corpus"]),
+)
+@click.option(
+    "-z", "--compress",
+    is_flag=True,
+    help="Compresses output files via gzip.",
+)
+@click.option(
+    "--require-consent",
+    is_flag=True,
+    help="Skips frames that lack consent.",
+)
+@click.option(
+    "--require-assent",
+    is_flag=True,
+    help="Skips frames that lack assent.",
+)
+def scrape(
+    *,
+    dump: str,
+    output: str,
+    workers: int,
+    format_: str,
+    compress: bool,
+    require_consent: bool,
+    require_assent: bool,
+) -> None:
+    """Scrapes student programs from a dump of sessions."""
+    stats = _scrape(
         dump_filename=dump,
         output_to=output,
+        workers=workers,
+        output_format=format_,
+        compress=compress,
+        require_consent=require_consent,
+        require_assent=require_assent,
     )
+    print(stats.describe())
+
+
+@cli.group()
+def corpus() -> None:
+    """Manages corpora of programs (see facilitate.corpus)."""
+
+
+@corpus.command("import")
+@click.argument("directory", type=click.Path(exists=True, file_okay=False))
+@click.argument("corpus_file", type=click.Path(dir_okay=False))
+def corpus_import(directory: str, corpus_file: str) -> None:
+    """Imports a directory of scraped programs (level/user/frame.json) into a corpus."""
+    with Corpus.open(corpus_file) as corpus_:
+        num_imported = corpus_.import_directory(directory)
+    print(f"imported {num_imported} programs")
+
+
+@corpus.command("analyze")
+@click.argument("corpus_file", type=click.Path(exists=True, dir_okay=False))
+def corpus_analyze(corpus_file: str) -> None:
+    """Computes missing or outdated parse metadata for the programs within a corpus."""
+    with Corpus.open(corpus_file) as corpus_:
+        num_analyzed = corpus_.analyze()
+    print(f"analyzed {num_analyzed} programs")
+
+
+def _find_programs(paths: t.Iterable[str]) -> list[Path]:
+    """Finds the programs at the given paths, which may be files or directories of JSON files."""
+    programs: list[Path] = []
+    for path in map(Path, paths):
+        programs.extend(sorted(path.rglob("*.json")) if path.is_dir() else [path])
+    return programs
+
+
+@cli.group()
+def index() -> None:
+    """Builds and searches indices over the solutions to a level (see facilitate.index)."""
+
+
+@index.command("build")
+@click.argument("solutions", nargs=-1, required=True, type=click.Path(exists=True))
+@click.option(
+    "-o", "--output",
+    default="index.json",
+    help="Output file name.",
+    type=click.Path(dir_okay=False),
+)
+def index_build(solutions: tuple[str, ...], output: str) -> None:
+    """Builds an index over a set of solutions (files or directories of files).
+
+    Each solution is identified by the stem of its file name.
+    """
+    solution_files = _find_programs(solutions)
+    solution_index = SolutionIndex.build(
+        (solution_file.stem, load_from_file(solution_file)) for solution_file in solution_files
+    )
+    solution_index.save(output)
+    print(f"indexed {len(solution_index)} solutions")
+
+
+@index.command("query")
+@click.argument("index_file", type=click.Path(exists=True, dir_okay=False))
+@click.argument("program", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "-k", "num_nearest",
+    default=1,
+    show_default=True,
+    help="Number of nearest solutions to find.",
+    type=int,
+)
+@click.option(
+    "--slack",
+    default=0.0,
+    show_default=True,
+    help="Relative amount by which the bounds of the search are widened.",
+    type=float,
+)
+def index_query(index_file: str, program: str, num_nearest: int, slack: float) -> None:
+    """Finds the solutions nearest to a program."""
+    solution_index = SolutionIndex.load(index_file)
+    result = solution_index.nearest(load_from_file(program), num_nearest, slack=slack)
+    for solution in result.solutions:
+        print(f"{solution.solution_id}\t{solution.distance}")
+    logger.info(f"computed {result.num_diffs} diffs for {len(solution_index)} solutions")
+
+
+@index.command("benchmark")
+@click.argument("index_file", type=click.Path(exists=True, dir_okay=False))
+@click.argument("queries", nargs=-1, required=True, type=click.Path(exists=True))
+@click.option(
+    "-k", "num_nearest",
+    default=1,
+    show_default=True,
+    help="Number of nearest solutions to find.",
+    type=int,
+)
+@click.option(
+    "--slack",
+    default=0.0,
+    show_default=True,
+    help="Relative amount by which the bounds of the search are widened.",
+    type=float,
+)
+def index_benchmark(index_file: str, queries: tuple[str, ...], num_nearest: int, slack: float) -> None:
+    """Compares the recall and diffs of searches of an index with exhaustive searches."""
+    solution_index = SolutionIndex.load(index_file)
+    query_programs = (load_from_file(query) for query in _find_programs(queries))
+    print(benchmark_index(solution_index, query_programs, k=num_nearest, slack=slack).describe())
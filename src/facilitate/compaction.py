@@ -0,0 +1,242 @@
+"""Compacts edit scripts by collapsing runs of node-level edits into subtree-level edits.
+
+When a new subtree is inserted, the diff emits an addition for each of its nodes;
+when a subtree is removed, it emits a deletion for each of its nodes in postorder.
+The compaction pass replaces each of these runs by a single AddSubtree or
+DeleteSubtree edit. Runs are only collapsed when no other edit within the script
+refers to a node inside the subtree, so that the compacted script has the same
+effect (and the same weighted distance) as the original.
+"""
+from __future__ import annotations
+
+__all__ = ("compact_edit_script",)
+
+import collections
+import typing as t
+
+from facilitate.edit import (
+    AddBlockToInput,
+    AddBlockToSequence,
+    AddFieldToBlock,
+    AddInputToBlock,
+    Addition,
+    AddLiteralToInput,
+    AddSequenceToInput,
+    AddSequenceToProgram,
+    AddSubtree,
+    Delete,
+    DeleteSubtree,
+    Edit,
+    EditScript,
+    MoveBlockInSequence,
+    MoveBlockToSequence,
+    MoveFieldToBlock,
+    MoveInputToBlock,
+    MoveNodeToInput,
+    MoveSequenceInProgram,
+    MoveSequenceToProgram,
+    Update,
+    describe_subtree,
+)
+from facilitate.model.block import Block
+from facilitate.model.input import Input
+from facilitate.model.program import Program
+
+if t.TYPE_CHECKING:
+    from facilitate.model.node import Node
+
+
+def _referenced_ids(edit: Edit) -> set[str]:
+    """Returns the IDs of the existing nodes that an edit refers to."""
+    match edit:
+        case AddInputToBlock() | AddFieldToBlock() | AddSequenceToInput():
+            return {edit.block_id}
+        case AddLiteralToInput() | AddBlockToInput():
+            return {edit.input_id}
+        case AddBlockToSequence():
+            # NOTE block_id is the ID of the block in the destination tree
+            return {edit.sequence_id}
+        case AddSequenceToProgram():
+            return set()
+        case AddSubtree():
+            return {edit.parent_id}
+        case MoveSequenceToProgram() | MoveSequenceInProgram():
+            return {edit.sequence_id}
+        case MoveFieldToBlock():
+            return {edit.move_from_block_id, edit.move_to_block_id, edit.field_id}
+        case MoveInputToBlock():
+            return {edit.move_from_block_id, edit.move_to_block_id, edit.input_id}
+        case MoveBlockToSequence() | MoveBlockInSequence():
+            return {edit.block_id, edit.sequence_id}
+        case MoveNodeToInput():
+            return {edit.node_id, edit.parent_block_id}
+        case Update() | Delete() | DeleteSubtree():
+            return {edit.node_id}
+    error = f"unexpected edit type: {edit.__class__.__name__}"
+    raise TypeError(error)
+
+
+def _count_references(edits: t.Iterable[Edit]) -> collections.Counter[str]:
+    """Counts the references to each node ID by the given edits."""
+    counts: collections.Counter[str] = collections.Counter()
+    for edit in edits:
+        counts.update(_referenced_ids(edit))
+    return counts
+
+
+def _compact_deletions(edits: list[Edit], tree_from: Node) -> list[Edit]:
+    """Collapses the deletions of entire subtrees of the original tree."""
+    delete_index = {
+        edit.node_id: index for index, edit in enumerate(edits) if isinstance(edit, Delete)
+    }
+    other_references = _count_references(
+        edit for edit in edits if not isinstance(edit, Delete)
+    )
+
+    # find the subtrees of the original tree that are deleted in their entirety
+    deleted_subtrees: set[Node] = set()
+    for node in tree_from.postorder():
+        if (
+            node.id_ in delete_index
+            and node.id_ not in other_references
+            and all(child in deleted_subtrees for child in node.children())
+        ):
+            deleted_subtrees.add(node)
+
+    replaced: dict[int, Edit] = {}
+    dropped: set[int] = set()
+    for node in deleted_subtrees:
+        if node.parent in deleted_subtrees or not node.has_children():
+            continue
+        descendant_indices = [delete_index[descendant.id_] for descendant in node.descendants()]
+        dropped.update(descendant_indices)
+        # the subtree is deleted at the point that its root would have been deleted
+        replaced[delete_index[node.id_]] = DeleteSubtree(node_id=node.id_)
+
+    return [
+        replaced.get(index, edit)
+        for index, edit in enumerate(edits)
+        if index not in dropped
+    ]
+
+
+def _add_subtree(addition: Addition, node: Node) -> AddSubtree | None:
+    """Builds an edit that inserts the given subtree in place of the addition that created its root."""
+    parent = node.parent
+    assert parent is not None
+    subtree = describe_subtree(node)
+
+    match addition:
+        case AddSequenceToProgram():
+            assert isinstance(parent, Program)
+            return AddSubtree(parent_id=parent.id_, subtree=subtree, position=addition.position)
+        case AddBlockToSequence():
+            return AddSubtree(
+                parent_id=addition.sequence_id,
+                subtree=subtree,
+                position=addition.position,
+            )
+        case AddSequenceToInput():
+            return AddSubtree(
+                parent_id=addition.block_id,
+                subtree=subtree,
+                input_name=addition.input_name,
+            )
+        case AddBlockToInput() | AddLiteralToInput():
+            assert isinstance(parent, Input)
+            block = parent.parent
+            assert isinstance(block, Block)
+            return AddSubtree(parent_id=block.id_, subtree=subtree, input_name=parent.name)
+        case AddInputToBlock():
+            return AddSubtree(parent_id=addition.block_id, subtree=subtree)
+    return None
+
+
+def _compact_additions(
+    edits: list[Edit],
+    added_nodes: list[tuple[Addition, Node]],
+) -> list[Edit]:
+    """Collapses the additions of entire subtrees of the edited tree."""
+    addition_index = {id(edit): index for index, edit in enumerate(edits)}
+    node_to_index: dict[Node, int] = {
+        node: addition_index[id(addition)]
+        for addition, node in added_nodes
+        if id(addition) in addition_index
+    }
+
+    # find the subtrees that consist solely of added nodes
+    added_subtrees: set[Node] = set()
+    for node in node_to_index:
+        if node in added_subtrees:
+            continue
+        root = node
+        while root.parent is not None and root.parent in node_to_index:
+            root = root.parent
+        for candidate in root.postorder():
+            if candidate in node_to_index and all(
+                child in added_subtrees for child in candidate.children()
+            ):
+                added_subtrees.add(candidate)
+
+    references = _count_references(edits)
+    replaced: dict[int, Edit] = {}
+    dropped: set[int] = set()
+    roots = sorted(
+        (node for node in added_subtrees if node.parent not in added_subtrees),
+        key=lambda node: node_to_index[node],
+    )
+    for root in roots:
+        subtree_nodes = list(root.nodes())
+        if len(subtree_nodes) == 1:
+            continue
+        subtree_indices = {node_to_index[node] for node in subtree_nodes}
+
+        # the nodes must be referred to by no edit other than the additions that created them
+        other_references = references - _count_references(edits[index] for index in subtree_indices)
+        if any(other_references[node.id_] for node in subtree_nodes):
+            continue
+
+        root_index = node_to_index[root]
+        root_addition = edits[root_index]
+        assert isinstance(root_addition, Addition)
+        compacted = _add_subtree(root_addition, root)
+        if compacted is None:
+            continue
+        replaced[root_index] = compacted
+        dropped.update(subtree_indices - {root_index})
+
+    return [
+        replaced.get(index, edit)
+        for index, edit in enumerate(edits)
+        if index not in dropped
+    ]
+
+
+def compact_edit_script(
+    script: EditScript,
+    tree_from: Node,
+    added_nodes: list[tuple[Addition, Node]] | None = None,
+) -> EditScript:
+    """Collapses runs of node-level edits within an edit script into subtree-level edits.
+
+    Parameters
+    ----------
+    script
+        the edit script to compact
+    tree_from
+        the tree to which the edit script applies
+    added_nodes
+        the node created by each addition within the script (in the tree that the
+        script was computed on), as recorded by the diff; if omitted, only
+        deletions are compacted
+
+    Returns
+    -------
+    EditScript
+        an equivalent edit script that contains AddSubtree and DeleteSubtree edits
+    """
+    edits = list(script)
+    if added_nodes:
+        edits = _compact_additions(edits, added_nodes)
+    edits = _compact_deletions(edits, tree_from)
+    return EditScript(edits)
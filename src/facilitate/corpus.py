@@ -0,0 +1,619 @@
+"""Stores programs, their parse metadata, and computed results within a SQLite database.
+
+A corpus replaces the directory tree of one JSON file per program that is written
+by the scraper: programs are stored (compressed) as rows keyed by level, user, and
+frame, and can be looked up and enumerated via indexed queries rather than by
+walking the filesystem.
+
+Individual programs within a corpus are referred to via locators of the form
+path/to/corpus.sqlite#program_id, which can be loaded via load_from_locator in the
+same way that load_from_file loads a program file.
+"""
+from __future__ import annotations
+
+__all__ = (
+    "CORPUS_SUFFIXES",
+    "Corpus",
+    "CorpusError",
+    "ProgramMetadata",
+    "ProgramRecord",
+    "ResultRecord",
+    "close_open_corpora",
+    "content_hash",
+    "is_corpus",
+    "load_from_locator",
+    "read_block_descriptions",
+)
+
+import atexit
+import collections
+import hashlib
+import json
+import sqlite3
+import threading
+import typing as t
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+
+from loguru import logger
+
+from facilitate.edit import EditScript
+from facilitate.hashing import structural_hash
+from facilitate.loader import (
+    LOADER_VERSION,
+    load_from_bytes,
+    load_from_file,
+    load_program_from_block_descriptions,
+)
+from facilitate.model.block import Block
+from facilitate.util import exception_to_crash_description
+
+if t.TYPE_CHECKING:
+    from types import TracebackType
+
+    from facilitate.model.program import Program
+
+CORPUS_SUFFIXES = (".sqlite", ".sqlite3", ".db")
+
+PARSE_OK = "ok"
+PARSE_ERROR = "error"
+
+# must be incremented whenever the schema changes
+_SCHEMA_VERSION = 1
+
+# the maximum number of corpora that are kept open for loading programs via their locators
+_MAX_OPEN_CORPORA = 8
+
+_SCHEMA = """
+CREATE TABLE programs (
+    id INTEGER PRIMARY KEY,
+    level_id TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    frame INTEGER NOT NULL,
+    blocks BLOB NOT NULL,
+    content_hash TEXT NOT NULL,
+    loader_version INTEGER,
+    parse_status TEXT,
+    parse_error TEXT,
+    num_nodes INTEGER,
+    num_blocks INTEGER,
+    structural_hash TEXT,
+    UNIQUE (level_id, user_id, frame)
+);
+CREATE INDEX programs_by_content_hash ON programs (content_hash);
+CREATE INDEX programs_by_structural_hash ON programs (level_id, structural_hash);
+CREATE INDEX programs_by_parse_status ON programs (parse_status);
+
+CREATE TABLE results (
+    from_program INTEGER NOT NULL REFERENCES programs (id) ON DELETE CASCADE,
+    to_program INTEGER NOT NULL REFERENCES programs (id) ON DELETE CASCADE,
+    method TEXT NOT NULL,
+    distance REAL,
+    num_edits INTEGER,
+    edit_script BLOB,
+    PRIMARY KEY (from_program, to_program, method)
+);
+CREATE INDEX results_by_to_program ON results (to_program, method);
+"""
+
+_INSERT_PROGRAM = """
+INSERT INTO programs (
+    level_id, user_id, frame, blocks, content_hash, loader_version,
+    parse_status, parse_error, num_nodes, num_blocks, structural_hash
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (level_id, user_id, frame) DO UPDATE SET
+    blocks = excluded.blocks,
+    content_hash = excluded.content_hash,
+    loader_version = excluded.loader_version,
+    parse_status = excluded.parse_status,
+    parse_error = excluded.parse_error,
+    num_nodes = excluded.num_nodes,
+    num_blocks = excluded.num_blocks,
+    structural_hash = excluded.structural_hash
+"""
+
+_PROGRAM_COLUMNS = (
+    "id, level_id, user_id, frame, content_hash, loader_version,"
+    " parse_status, parse_error, num_nodes, num_blocks, structural_hash"
+)
+
+
+class CorpusError(Exception):
+    """Raised when a corpus cannot be opened or does not contain a requested entry."""
+
+
+def _compress(data: bytes) -> bytes:
+    return zlib.compress(data, 6)
+
+
+def _decompress(data: bytes) -> bytes:
+    return zlib.decompress(data)
+
+
+def content_hash(blocks: bytes) -> str:
+    """Computes a hash of the exact contents of a program description."""
+    return hashlib.blake2b(blocks, digest_size=20).hexdigest()
+
+
+@dataclass(frozen=True)
+class ProgramMetadata:
+    """Describes the outcome of parsing a program.
+
+    Attributes
+    ----------
+    parse_status
+        "ok" if the program was parsed successfully, or "error" otherwise
+    parse_error
+        a short description of the crash that occurred during parsing, if any
+    num_nodes
+        the number of nodes within the parsed program
+    num_blocks
+        the number of blocks within the parsed program
+    structural_hash
+        the structural hash of the parsed program (see facilitate.hashing)
+    loader_version
+        the version of the loader that was used to parse the program
+    """
+    parse_status: str
+    parse_error: str | None = None
+    num_nodes: int | None = None
+    num_blocks: int | None = None
+    structural_hash: str | None = None
+    loader_version: int = LOADER_VERSION
+
+    @classmethod
+    def compute(cls, blocks: bytes) -> ProgramMetadata:
+        """Parses the JSON-encoded description of a program and describes the outcome."""
+        try:
+            program = load_program_from_block_descriptions(json.loads(blocks))
+        except Exception as err:  # noqa: BLE001
+            return cls(
+                parse_status=PARSE_ERROR,
+                parse_error=exception_to_crash_description(err),
+            )
+        num_nodes = 0
+        num_blocks = 0
+        for node in program.nodes():
+            num_nodes += 1
+            if isinstance(node, Block):
+                num_blocks += 1
+        return cls(
+            parse_status=PARSE_OK,
+            num_nodes=num_nodes,
+            num_blocks=num_blocks,
+            structural_hash=structural_hash(program),
+        )
+
+
+@dataclass(frozen=True)
+class ProgramRecord:
+    """Describes a program that is stored within a corpus (excluding its blocks)."""
+    id_: int
+    level_id: str
+    user_id: str
+    frame: int
+    content_hash: str
+    metadata: ProgramMetadata | None
+
+    @classmethod
+    def from_row(cls, row: tuple[t.Any, ...]) -> ProgramRecord:
+        (
+            id_,
+            level_id,
+            user_id,
+            frame,
+            content_hash_,
+            loader_version,
+            parse_status,
+            parse_error,
+            num_nodes,
+            num_blocks,
+            structural_hash_,
+        ) = row
+        metadata: ProgramMetadata | None = None
+        if parse_status is not None:
+            metadata = ProgramMetadata(
+                parse_status=parse_status,
+                parse_error=parse_error,
+                num_nodes=num_nodes,
+                num_blocks=num_blocks,
+                structural_hash=structural_hash_,
+                loader_version=loader_version,
+            )
+        return cls(
+            id_=id_,
+            level_id=level_id,
+            user_id=user_id,
+            frame=frame,
+            content_hash=content_hash_,
+            metadata=metadata,
+        )
+
+
+@dataclass(frozen=True)
+class ResultRecord:
+    """Describes the result of comparing two programs within a corpus."""
+    from_program: int
+    to_program: int
+    method: str
+    distance: float | None
+    num_edits: int | None
+    edit_script: EditScript | None
+
+
+@dataclass
+class Corpus:
+    """Provides access to a corpus of programs stored within a SQLite database.
+
+    Writes are grouped into transactions: use the corpus as a context manager, or
+    call commit, to ensure that they are persisted.
+    """
+    path: Path
+    _connection: sqlite3.Connection
+
+    @classmethod
+    def open(cls, path: str | Path, *, readonly: bool = False) -> Corpus:
+        """Opens the corpus at a given path, creating it unless opened as read-only."""
+        path = Path(path)
+        try:
+            if readonly:
+                uri = f"{path.absolute().as_uri()}?mode=ro"
+                connection = sqlite3.connect(uri, uri=True)
+            else:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                connection = sqlite3.connect(path)
+                connection.execute("PRAGMA journal_mode = WAL")
+                connection.execute("PRAGMA synchronous = NORMAL")
+            connection.execute("PRAGMA foreign_keys = ON")
+            schema_version = connection.execute("PRAGMA user_version").fetchone()[0]
+        except sqlite3.Error as err:
+            error = f"failed to open corpus [{path}]: {err}"
+            raise CorpusError(error) from err
+
+        if schema_version == 0 and not readonly:
+            with connection:
+                connection.executescript(_SCHEMA)
+                connection.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
+        elif schema_version != _SCHEMA_VERSION:
+            connection.close()
+            error = (
+                f"unsupported corpus schema version [{path}]:"
+                f" expected {_SCHEMA_VERSION}, but was {schema_version}"
+            )
+            raise CorpusError(error)
+
+        return cls(path=path, _connection=connection)
+
+    def close(self) -> None:
+        self._connection.commit()
+        self._connection.close()
+
+    def commit(self) -> None:
+        self._connection.commit()
+
+    def __enter__(self) -> t.Self:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        if exc_type is not None:
+            self._connection.rollback()
+        self.close()
+
+    def locator(self, program_id: int) -> str:
+        """Returns a locator for a given program within this corpus.
+
+        Locators are strings rather than paths, since they do not refer to files.
+        """
+        return f"{self.path.absolute()}#{program_id}"
+
+    def add_program(
+        self,
+        level_id: str,
+        user_id: str,
+        frame: int,
+        blocks: bytes,
+        metadata: ProgramMetadata | None = None,
+    ) -> int:
+        """Stores the JSON-encoded blocks of a program, replacing any existing entry.
+
+        Returns the ID of the stored program.
+        """
+        self.add_programs([(level_id, user_id, frame, blocks, metadata)])
+        row = self._connection.execute(
+            "SELECT id FROM programs WHERE level_id = ? AND user_id = ? AND frame = ?",
+            (level_id, user_id, frame),
+        ).fetchone()
+        return int(row[0])
+
+    def add_programs(
+        self,
+        programs: t.Iterable[tuple[str, str, int, bytes, ProgramMetadata | None]],
+    ) -> None:
+        """Stores many programs at once, given as (level_id, user_id, frame, blocks, metadata)."""
+        rows = [
+            (
+                level_id,
+                user_id,
+                frame,
+                _compress(blocks),
+                content_hash(blocks),
+                metadata.loader_version if metadata else None,
+                metadata.parse_status if metadata else None,
+                metadata.parse_error if metadata else None,
+                metadata.num_nodes if metadata else None,
+                metadata.num_blocks if metadata else None,
+                metadata.structural_hash if metadata else None,
+            )
+            for level_id, user_id, frame, blocks, metadata in programs
+        ]
+        self._connection.executemany(_INSERT_PROGRAM, rows)
+
+    def import_directory(self, directory: str | Path) -> int:
+        """Imports all programs from a directory of the form level_id/user_id/frame.json.
+
+        Returns the number of imported programs.
+        """
+        directory = Path(directory)
+        num_imported = 0
+        for path in sorted(directory.glob("*/*/*.json")):
+            try:
+                frame = int(path.stem)
+            except ValueError:
+                logger.warning(f"skipping program with non-numeric frame: {path}")
+                continue
+            blocks = path.read_bytes()
+            self.add_programs([(
+                path.parent.parent.name,
+                path.parent.name,
+                frame,
+                blocks,
+                ProgramMetadata.compute(blocks),
+            )])
+            num_imported += 1
+        self.commit()
+        return num_imported
+
+    def analyze(self) -> int:
+        """Computes the parse metadata of all programs that lack up-to-date metadata.
+
+        Returns the number of analyzed programs.
+        """
+        stale_ids = [
+            row[0] for row in self._connection.execute(
+                "SELECT id FROM programs"
+                " WHERE loader_version IS NULL OR loader_version != ?",
+                (LOADER_VERSION,),
+            )
+        ]
+        for program_id in stale_ids:
+            metadata = ProgramMetadata.compute(self.blocks(program_id))
+            self._connection.execute(
+                "UPDATE programs SET loader_version = ?, parse_status = ?, parse_error = ?,"
+                " num_nodes = ?, num_blocks = ?, structural_hash = ? WHERE id = ?",
+                (
+                    metadata.loader_version,
+                    metadata.parse_status,
+                    metadata.parse_error,
+                    metadata.num_nodes,
+                    metadata.num_blocks,
+                    metadata.structural_hash,
+                    program_id,
+                ),
+            )
+        self.commit()
+        return len(stale_ids)
+
+    def __len__(self) -> int:
+        return int(self._connection.execute("SELECT COUNT(*) FROM programs").fetchone()[0])
+
+    def levels(self) -> list[str]:
+        """Returns the IDs of all levels within this corpus."""
+        return [
+            row[0] for row in self._connection.execute(
+                "SELECT DISTINCT level_id FROM programs ORDER BY level_id",
+            )
+        ]
+
+    def program(self, program_id: int) -> ProgramRecord:
+        """Returns the record of a given program."""
+        row = self._connection.execute(
+            f"SELECT {_PROGRAM_COLUMNS} FROM programs WHERE id = ?",  # noqa: S608
+            (program_id,),
+        ).fetchone()
+        if row is None:
+            error = f"no program with ID {program_id} in corpus [{self.path}]"
+            raise CorpusError(error)
+        return ProgramRecord.from_row(row)
+
+    def programs(
+        self,
+        *,
+        level_id: str | None = None,
+        user_id: str | None = None,
+        parse_status: str | None = None,
+    ) -> t.Iterator[ProgramRecord]:
+        """Iterates over the records of all matching programs, ordered by level, user, and frame."""
+        conditions: list[str] = []
+        parameters: list[t.Any] = []
+        for column, value in (
+            ("level_id", level_id),
+            ("user_id", user_id),
+            ("parse_status", parse_status),
+        ):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                parameters.append(value)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        query = (
+            f"SELECT {_PROGRAM_COLUMNS} FROM programs{where}"  # noqa: S608
+            " ORDER BY level_id, user_id, frame"
+        )
+        for row in self._connection.execute(query, parameters):
+            yield ProgramRecord.from_row(row)
+
+    def program_ids(self, *, level_id: str | None = None) -> list[int]:
+        """Returns the IDs of all programs (within a given level), ordered by user and frame."""
+        if level_id is None:
+            query = "SELECT id FROM programs ORDER BY level_id, user_id, frame"
+            cursor = self._connection.execute(query)
+        else:
+            query = "SELECT id FROM programs WHERE level_id = ? ORDER BY user_id, frame"
+            cursor = self._connection.execute(query, (level_id,))
+        return [row[0] for row in cursor]
+
+    def final_submissions(self, level_id: str) -> list[ProgramRecord]:
+        """Returns the record of the last program submitted by each user to a given level."""
+        query = f"""
+            SELECT {_PROGRAM_COLUMNS} FROM programs
+            WHERE level_id = ? AND frame = (
+                SELECT MAX(frame) FROM programs AS other
+                WHERE other.level_id = programs.level_id AND other.user_id = programs.user_id
+            )
+            ORDER BY user_id
+        """  # noqa: S608
+        return [
+            ProgramRecord.from_row(row)
+            for row in self._connection.execute(query, (level_id,))
+        ]
+
+    def successive_pairs(self) -> t.Iterator[tuple[int, int]]:
+        """Iterates over the IDs of each pair of successive programs by the same user and level."""
+        query = """
+            SELECT previous_id, id FROM (
+                SELECT id, LAG(id) OVER (
+                    PARTITION BY level_id, user_id ORDER BY frame
+                ) AS previous_id
+                FROM programs
+            )
+            WHERE previous_id IS NOT NULL
+        """
+        yield from self._connection.execute(query)
+
+    def blocks(self, program_id: int) -> bytes:
+        """Returns the JSON-encoded blocks of a given program."""
+        row = self._connection.execute(
+            "SELECT blocks FROM programs WHERE id = ?",
+            (program_id,),
+        ).fetchone()
+        if row is None:
+            error = f"no program with ID {program_id} in corpus [{self.path}]"
+            raise CorpusError(error)
+        return _decompress(row[0])
+
+    def load_program(self, program_id: int) -> Program:
+        """Loads a given program (see facilitate.loader.load_from_bytes)."""
+        return load_from_bytes(self.blocks(program_id))
+
+    def add_result(
+        self,
+        from_program: int,
+        to_program: int,
+        *,
+        method: str,
+        distance: float | None = None,
+        edit_script: EditScript | None = None,
+    ) -> None:
+        """Stores the result of comparing two programs, replacing any existing result."""
+        encoded_edit_script: bytes | None = None
+        num_edits: int | None = None
+        if edit_script is not None:
+            encoded_edit_script = _compress(json.dumps(edit_script.to_dict()).encode("utf-8"))
+            num_edits = len(edit_script)
+        self._connection.execute(
+            "INSERT OR REPLACE INTO results"
+            " (from_program, to_program, method, distance, num_edits, edit_script)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (from_program, to_program, method, distance, num_edits, encoded_edit_script),
+        )
+
+    def result(self, from_program: int, to_program: int, *, method: str) -> ResultRecord | None:
+        """Returns the stored result of comparing two programs, if any."""
+        row = self._connection.execute(
+            "SELECT distance, num_edits, edit_script FROM results"
+            " WHERE from_program = ? AND to_program = ? AND method = ?",
+            (from_program, to_program, method),
+        ).fetchone()
+        if row is None:
+            return None
+        distance, num_edits, encoded_edit_script = row
+        edit_script: EditScript | None = None
+        if encoded_edit_script is not None:
+            edit_script = EditScript.from_dict(json.loads(_decompress(encoded_edit_script)))
+        return ResultRecord(
+            from_program=from_program,
+            to_program=to_program,
+            method=method,
+            distance=distance,
+            num_edits=num_edits,
+            edit_script=edit_script,
+        )
+
+
+def is_corpus(path: str | Path) -> bool:
+    """Determines whether a given path refers to a corpus (rather than a directory of programs)."""
+    path = Path(path)
+    return path.suffix in CORPUS_SUFFIXES and not path.is_dir()
+
+
+def _parse_locator(locator: str | Path) -> tuple[Path, int] | None:
+    corpus_path, separator, program_id = str(locator).rpartition("#")
+    if not separator or not is_corpus(corpus_path) or not program_id.isdigit():
+        return None
+    return Path(corpus_path), int(program_id)
+
+
+_open_corpora: collections.OrderedDict[Path, Corpus] = collections.OrderedDict()
+_open_corpora_lock = threading.Lock()
+
+
+def _open_corpus(path: Path) -> Corpus:
+    """Returns a read-only corpus, reusing it across locators.
+
+    The least recently used corpus is closed once more than _MAX_OPEN_CORPORA are open.
+    """
+    with _open_corpora_lock:
+        corpus = _open_corpora.get(path)
+        if corpus is not None:
+            _open_corpora.move_to_end(path)
+            return corpus
+        corpus = Corpus.open(path, readonly=True)
+        _open_corpora[path] = corpus
+        while len(_open_corpora) > _MAX_OPEN_CORPORA:
+            _, evicted = _open_corpora.popitem(last=False)
+            evicted.close()
+        return corpus
+
+
+@atexit.register
+def close_open_corpora() -> None:
+    """Closes every corpus that was opened to load programs via their locators."""
+    with _open_corpora_lock:
+        while _open_corpora:
+            _, corpus = _open_corpora.popitem()
+            corpus.close()
+
+
+def read_block_descriptions(locator: str | Path) -> dict[str, t.Any]:
+    """Reads the block descriptions of a program, given either a locator or a program file."""
+    if parsed := _parse_locator(locator):
+        corpus_path, program_id = parsed
+        contents = _open_corpus(corpus_path.absolute()).blocks(program_id)
+    else:
+        contents = Path(locator).read_bytes()
+    block_descriptions = json.loads(contents)
+    assert isinstance(block_descriptions, dict)
+    return block_descriptions
+
+
+def load_from_locator(locator: str | Path) -> Program:
+    """Loads a program, given either a locator or a program file."""
+    if parsed := _parse_locator(locator):
+        corpus_path, program_id = parsed
+        return _open_corpus(corpus_path.absolute()).load_program(program_id)
+    return load_from_file(locator)
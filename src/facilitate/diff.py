@@ -1,10 +1,14 @@
 from __future__ import annotations
 
+import itertools
 import typing as t
+from dataclasses import dataclass
 
 from loguru import logger
 
-from facilitate.algorithms import breadth_first_search
+from facilitate.algorithms import FenwickTree, breadth_first_search, longest_increasing_subsequence
+from facilitate.compaction import compact_edit_script
+from facilitate.deadline import check_deadline
 from facilitate.edit import (
     AddBlockToInput,
     AddBlockToSequence,
@@ -24,25 +28,36 @@ from facilitate.edit import (
     MoveNodeToInput,
     MoveSequenceInProgram,
     MoveSequenceToProgram,
+    NodeIds,
     Update,
 )
-from facilitate.gumtree import compute_gumtree_mappings
+from facilitate.gumtree import compute_gumtree_mappings, map_equivalent_trees
+from facilitate.mappings import NodeMappings
 from facilitate.model.block import Block
 from facilitate.model.field import Field
 from facilitate.model.input import Input
 from facilitate.model.literal import Literal
 from facilitate.model.program import Program
 from facilitate.model.sequence import Sequence
-from facilitate.util import longest_common_subsequence
+from facilitate.verification import VerificationMode, VerificationPolicy, default_verification_policy
 
 if t.TYPE_CHECKING:
-    from facilitate.mappings import NodeMappings
     from facilitate.model.node import Node
 
 
+def _index_positions(tree: Node) -> dict[Node, int]:
+    """Computes the position of each child of every sequence and program within a tree."""
+    positions: dict[Node, int] = {}
+    for node in tree.nodes():
+        if isinstance(node, Sequence | Program):
+            positions.update({child: position for position, child in enumerate(node.children())})
+    return positions
+
+
 def _find_insertion_position(
     missing_node: Node,
     mappings: NodeMappings,
+    positions_to: dict[Node, int],
 ) -> int:
     logger.debug("finding insertion position for {}", missing_node.id_)
 
@@ -54,7 +69,7 @@ def _find_insertion_position(
     assert parent_from is not None
     assert isinstance(parent_from, Program | Sequence)
 
-    missing_node_position = parent_to.position_of_child(missing_node)
+    missing_node_position = positions_to[missing_node]
 
     if missing_node_position == 0:
         return 0
@@ -64,6 +79,10 @@ def _find_insertion_position(
     # it's possible that the node before the missing node hasn't been mapped,
     # so we need to work leftwards until we find a mapped node
     # if we fail to find a mapped node, we return zero as the index
+    # NOTE siblings are processed from left to right, so the partner of the preceding sibling
+    # has usually been placed within parent_from already, and the walk stops after one step;
+    # positions within parent_from are then found by a (linear) search of its children, which
+    # is negligible next to the matching, so they are not indexed while the tree is edited
     for node_before_position in range(missing_node_position - 1, -1, -1):
         node_before_missing = parent_to.child(node_before_position)
         insert_after_node = mappings.destination_is_mapped_to(node_before_missing)
@@ -73,66 +92,134 @@ def _find_insertion_position(
     return 0
 
 
+@dataclass
+class _AlignmentSlots:
+    """Tracks the positions of the children of a node while they are aligned.
+
+    Each moved child is placed directly after the partner of the preceding child of
+    the other node (its anchor), or at the front if there is none. Since each child
+    anchors at most one other, the order of the children after every move is known
+    upfront: each child that is not moved is followed by the chain of moved children
+    that are (transitively) placed after it. Each moved child is given a slot at its
+    original position, which it occupies until it is moved, and a slot at its final
+    position, which it occupies afterwards. The position of a child is then the
+    number of occupied slots before its own, which is maintained by a Fenwick tree.
+    """
+    _occupied: FenwickTree
+    _current_slot: dict[Node, int]
+    _final_slot: dict[Node, int]
+
+    @classmethod
+    def build(
+        cls,
+        children: list[Node],
+        partners: list[Node],
+        moved: set[Node],
+    ) -> _AlignmentSlots:
+        """Builds the slots for the given children of the node, which are moved into the order of their partners."""
+        successor = dict(itertools.pairwise(partners))
+        current_slot: dict[Node, int] = {}
+        final_slot: dict[Node, int] = {}
+        occupied: list[int] = []
+
+        def add_chain(node: Node | None) -> None:
+            while node is not None and node in moved:
+                final_slot[node] = len(occupied)
+                occupied.append(0)
+                node = successor.get(node)
+
+        if partners:
+            add_chain(partners[0])
+        for child in children:
+            current_slot[child] = len(occupied)
+            occupied.append(1)
+            if child not in moved:
+                add_chain(successor.get(child))
+
+        return cls(
+            _occupied=FenwickTree.build(occupied),
+            _current_slot=current_slot,
+            _final_slot=final_slot,
+        )
+
+    def position_after(self, anchor: Node) -> int:
+        """Computes the position directly after the given child."""
+        return self._occupied.prefix_sum(self._current_slot[anchor])
+
+    def move(self, child: Node) -> None:
+        """Records that the given child was moved to its final position."""
+        self._occupied.add(self._current_slot[child], -1)
+        self._current_slot[child] = self._final_slot[child]
+        self._occupied.add(self._current_slot[child], 1)
+
+
 def _align_children(
     script: EditScript,
-    tree_from: Node,
     parent_from: Sequence | Program,
     parent_to: Sequence | Program,
     mappings: NodeMappings,
 ) -> None:
-    """Aligns the children of two nodes."""
+    """Aligns the children of two nodes.
+
+    The children of parent_to whose partners are children of parent_from (and vice
+    versa) are put into the same order by moving the partners of those children that
+    do not belong to a longest common subsequence of both orders. Since each child is
+    mapped to at most one other, that subsequence is a longest increasing subsequence
+    of the positions of the partners, which is found in O(n log n) time. The position
+    of each move is then computed in O(log n) time (see _AlignmentSlots), rather than
+    by searching the children.
+    """
     logger.debug("aligning children of {} and {}", parent_from.id_, parent_to.id_)
 
-    def equals(x: Node, y: Node) -> bool:
-        return (x, y) in mappings
+    children_from = list(parent_from.children())
 
     # sequence of children of (parent_from) whose partners are children of (parent_to)
-    mapped_node_from_children = [
-        child for child in parent_from.children() if mappings.source_is_mapped(child)
-    ]
-    mapped_node_from_children = [
-        child for child in mapped_node_from_children if mappings.source_is_mapped_to(child).parent == parent_to  # type: ignore
-    ]
-
-    # sequence of children of (parent_to) whose partners are children of (parent_from)
-    mapped_node_to_children = [
-        child for child in parent_to.children() if mappings.destination_is_mapped(child)
-    ]
-    mapped_node_to_children = [
-        child for child in mapped_node_to_children if mappings.destination_is_mapped_to(child).parent == parent_from  # type: ignore
-    ]
+    mapped_node_from_positions: dict[Node, int] = {}
+    for child in children_from:
+        partner = mappings.source_is_mapped_to(child)
+        if partner is not None and partner.parent is parent_to:
+            mapped_node_from_positions[child] = len(mapped_node_from_positions)
+
+    # sequence of children of (parent_to) whose partners are children of (parent_from),
+    # together with those partners
+    mapped_node_to_children: list[Node] = []
+    partners: list[Node] = []
+    for child in parent_to.children():
+        partner = mappings.destination_is_mapped_to(child)
+        if partner is not None and partner in mapped_node_from_positions:
+            mapped_node_to_children.append(child)
+            partners.append(partner)
 
     logger.debug(
-        f"mapped node from children [{len(mapped_node_from_children)}]: "
-        f"{', '.join(block.id_ for block in mapped_node_from_children)}",
+        f"mapped node from children [{len(mapped_node_from_positions)}]: "
+        f"{', '.join(block.id_ for block in mapped_node_from_positions)}",
     )
     logger.debug(
         f"mapped node to children [{len(mapped_node_to_children)}]: "
         f"{', '.join(block.id_ for block in mapped_node_to_children)}",
     )
 
-    lcs: list[tuple[Node, Node]] = longest_common_subsequence(
-        mapped_node_from_children,
-        mapped_node_to_children,
-        equals,
+    lcs = longest_increasing_subsequence([mapped_node_from_positions[partner] for partner in partners])
+    in_lcs = [False] * len(partners)
+    for index in lcs:
+        in_lcs[index] = True
+    logger.debug(
+        f"lcs (node to) [{len(lcs)}]: {', '.join(mapped_node_to_children[index].id_ for index in lcs)}",
     )
-    lcs_node_to: list[Node] = [y for (_, y) in lcs]
-    logger.debug(f"lcs (node to) [{len(lcs_node_to)}]: {', '.join(child.id_ for child in lcs_node_to)}")
+    if len(lcs) == len(partners):
+        return
 
-    for b in mapped_node_to_children:
-        if b in lcs_node_to:
-            continue
-
-        a = mappings.destination_is_mapped_to(b)
-        assert a is not None
+    slots = _AlignmentSlots.build(
+        children_from,
+        partners,
+        moved={partners[index] for index in range(len(partners)) if not in_lcs[index]},
+    )
 
-        if a not in mapped_node_from_children:
+    for index, a in enumerate(partners):
+        if in_lcs[index]:
             continue
 
-        position = _find_insertion_position(
-            missing_node=b,
-            mappings=mappings,
-        )
+        position = slots.position_after(partners[index - 1]) if index > 0 else 0
 
         move: Edit
         if isinstance(parent_to, Sequence):
@@ -153,13 +240,15 @@ def _align_children(
             raise TypeError(error)
 
         script.append(move)
-        move.apply(tree_from)
+        move.apply(parent_from)
+        slots.move(a)
 
 
 def _compute_move_position(
     move_node: Node,
     move_to_parent: Program | Sequence,
     mappings: NodeMappings,
+    positions_to: dict[Node, int],
 ) -> int:
     position = 0
     partner = mappings.source_is_mapped_to(move_node)
@@ -167,16 +256,14 @@ def _compute_move_position(
     partner_parent = partner.parent
     assert isinstance(partner_parent, Program | Sequence)
 
-    move_to_parent_children = list(move_to_parent.children())
-
-    partner_position = partner_parent.position_of_child(partner)
-    partner_children = list(partner_parent.children())
+    partner_position = positions_to[partner]
 
+    # NOTE as for insertions, the walk usually stops at the preceding sibling (see _find_insertion_position)
     for partner_insert_at_position in range(partner_position - 1, -1, -1):
-        partner_insert_after_node = partner_children[partner_insert_at_position]
+        partner_insert_after_node = partner_parent.child(partner_insert_at_position)
         insert_after_node = mappings.destination_is_mapped_to(partner_insert_after_node)
         if insert_after_node is not None:
-            position = move_to_parent_children.index(insert_after_node) + 1
+            position = move_to_parent.position_of_child(insert_after_node) + 1
             break
 
     return position
@@ -204,6 +291,7 @@ def _move_block(
     move_from_parent: Node,
     move_to_parent: Node,
     mappings: NodeMappings,
+    positions_to: dict[Node, int],
 ) -> Edit:
     if isinstance(move_to_parent, Input):
         return _move_block_to_input(
@@ -216,8 +304,9 @@ def _move_block(
         assert isinstance(move_block_partner_parent, Sequence)
 
         position = 0
-        partner_position = move_block_partner_parent.position_of_block(move_block_partner)
+        partner_position = positions_to[move_block_partner]
 
+        # NOTE as for insertions, the walk usually stops at the preceding sibling (see _find_insertion_position)
         for partner_insert_at_position in range(partner_position - 1, -1, -1):
             partner_insert_after_node = move_block_partner_parent.blocks[partner_insert_at_position]
             insert_after_node = mappings.destination_is_mapped_to(partner_insert_after_node)
@@ -291,6 +380,7 @@ def _move_sequence(
     move_sequence: Sequence,
     move_to_parent: Node,
     mappings: NodeMappings,
+    positions_to: dict[Node, int],
 ) -> Edit:
     if isinstance(move_to_parent, Input):
         parent_block = move_to_parent.parent
@@ -310,6 +400,7 @@ def _move_sequence(
             move_node=move_sequence,
             move_to_parent=move_to_parent,
             mappings=mappings,
+            positions_to=positions_to,
         )
 
         return MoveSequenceToProgram(
@@ -327,6 +418,8 @@ def _move_node(
     move_node: Node,
     move_node_partner: Node,
     mappings: NodeMappings,
+    *,
+    positions_to: dict[Node, int],
 ) -> Edit:
     logger.debug("moving node: {} {}", move_node.id_, move_node.__class__.__name__)
 
@@ -366,6 +459,7 @@ def _move_node(
             move_from_parent=move_from_parent,
             move_to_parent=move_to_parent,
             mappings=mappings,
+            positions_to=positions_to,
         )
 
     if isinstance(move_node, Sequence):
@@ -374,6 +468,7 @@ def _move_node(
             move_sequence=move_node,
             move_to_parent=move_to_parent,
             mappings=mappings,
+            positions_to=positions_to,
         )
 
     if isinstance(move_node, Literal):
@@ -392,6 +487,7 @@ def _insert_missing_node(
     tree_to: Node,
     missing_node: Node,
     mappings: NodeMappings,
+    positions_to: dict[Node, int],
 ) -> Addition:
     logger.debug(
         "inserting missing node: {} {}",
@@ -427,6 +523,7 @@ def _insert_missing_node(
         position = _find_insertion_position(
             missing_node=missing_node,
             mappings=mappings,
+            positions_to=positions_to,
         )
         return AddBlockToSequence(
             sequence_id=parent.id_,
@@ -455,6 +552,7 @@ def _insert_missing_node(
         position = _find_insertion_position(
             missing_node=missing_node,
             mappings=mappings,
+            positions_to=positions_to,
         )
         return AddSequenceToProgram(
             position=position,
@@ -475,11 +573,30 @@ def delete_phase(
     tree_from: Node,
     mappings: NodeMappings,
 ) -> EditScript:
-    for node_ in tree_from.postorder():
-        if not mappings.source_is_mapped(node_):
-            edit = Delete(node_id=node_.id_)
-            edit.apply(tree_from)
-            script.append(edit)
+    """Deletes each unmapped node, in postorder, so that each is a leaf when it is deleted.
+
+    Rather than applying each deletion separately (which must find the node within
+    the tree and then remove it from its parent), the deletions are applied in bulk,
+    and the children of each affected parent are only traversed once.
+    """
+    deleted = [node_ for node_ in tree_from.postorder() if not mappings.source_is_mapped(node_)]
+    deleted_nodes = set(deleted)
+
+    # NOTE each parent is removed from at most once, in the order in which it was first encountered
+    parents: dict[Node, None] = {}
+    for node_ in deleted:
+        if any(child not in deleted_nodes for child in node_.children()):
+            error = f"cannot delete node {node_.id_}: has children."
+            raise ValueError(error)
+        if node_.parent is None:
+            error = f"cannot delete node {node_.id_}: no parent."
+            raise ValueError(error)
+        parents[node_.parent] = None
+        node_.tags.append("DELETED")
+        script.append(Delete(node_id=node_.id_))
+
+    for parent in parents:
+        parent.remove_children(deleted_nodes)
     return script
 
 
@@ -487,10 +604,20 @@ def update_insert_align_move_phase(
     tree_from: Node,
     tree_to: Node,
     mappings: NodeMappings,
+    *,
+    added_nodes: list[tuple[Addition, Node]] | None = None,
 ) -> EditScript:
+    """Computes the updates, insertions, moves, and alignments needed to transform one tree into another.
+
+    If a list of added nodes is given, the node created by each insertion is recorded within it.
+    """
     script = EditScript()
+    # NOTE tree_to is never modified, so the positions of its nodes are computed once
+    positions_to = _index_positions(tree_to)
+    node_ids = NodeIds(tree_from)
 
     for node_to in breadth_first_search(tree_to):
+        check_deadline()
         logger.debug(f"processing node: {node_to.id_} {node_to.__class__.__name__}")
 
         _maybe_node_from = mappings.destination_is_mapped_to(node_to)
@@ -501,11 +628,14 @@ def update_insert_align_move_phase(
                 tree_to=tree_to,
                 missing_node=node_to,
                 mappings=mappings,
+                positions_to=positions_to,
             )
-            added_node = insertion.apply(tree_from)
+            added_node = insertion.apply(tree_from, node_ids=node_ids)
             assert added_node is not None
             script.append(insertion)
             mappings.add(added_node, node_to)
+            if added_nodes is not None:
+                added_nodes.append((insertion, added_node))
 
         else:
             if not _maybe_node_from.surface_equivalent_to(node_to):
@@ -527,6 +657,7 @@ def update_insert_align_move_phase(
                         move_node=_maybe_node_from,
                         move_node_partner=node_to,
                         mappings=mappings,
+                        positions_to=positions_to,
                     )
                     edit.apply(tree_from)
                     script.append(edit)
@@ -536,7 +667,6 @@ def update_insert_align_move_phase(
                 assert isinstance(node_to, Sequence | Program)
                 _align_children(
                     script=script,
-                    tree_from=tree_from,
                     parent_from=_maybe_node_from,
                     parent_to=node_to,
                     mappings=mappings,
@@ -545,24 +675,160 @@ def update_insert_align_move_phase(
     return script
 
 
-def compute_edit_script(
+def _translate_mappings(
+    mappings: NodeMappings,
+    source_translation: dict[Node, Node],
+    destination_translation: dict[Node, Node],
+) -> NodeMappings:
+    """Translates mappings between one pair of trees onto another, structurally identical pair."""
+    translated = NodeMappings()
+    for source, destination in mappings:
+        translated_source = source_translation.get(source)
+        translated_destination = destination_translation.get(destination)
+        if translated_source is not None and translated_destination is not None:
+            translated.add(translated_source, translated_destination)
+    return translated
+
+
+def _compact_and_verify(
+    script: EditScript,
     tree_from: Node,
     tree_to: Node,
+    added_nodes: list[tuple[Addition, Node]],
+    *,
+    verify: bool,
 ) -> EditScript:
-    """Computes an edit script to transform one tree into another."""
-    tree_from = tree_from.copy()
-    tree_to = tree_to.copy()
+    """Compacts an edit script, falling back to the given script if the compacted one cannot be replayed.
+
+    The compacted script is only replayed if verify is set; the given script must
+    already have been verified.
+    """
+    compacted = compact_edit_script(script, tree_from, added_nodes)
+    if not verify:
+        return compacted
+    try:
+        replayed = compacted.apply(tree_from).equivalent_to(tree_to)
+    except (KeyError, TypeError, ValueError) as err:
+        logger.warning(f"cannot apply compacted edit script to {tree_from.id_}: {err}")
+        replayed = False
+    if replayed:
+        return compacted
+    logger.warning(
+        f"compacted edit script does not transform {tree_from.id_} into {tree_to.id_}: "
+        "falling back to the uncompacted edit script",
+    )
+    return script
+
 
-    mappings = compute_gumtree_mappings(tree_from, tree_to)
+def compute_edit_script_and_mappings(
+    tree_from: Node,
+    tree_to: Node,
+    *,
+    seed: NodeMappings | None = None,
+    anchor_ids: bool = False,
+    compact: bool = False,
+    verification: VerificationPolicy | None = None,
+) -> tuple[EditScript, NodeMappings]:
+    """Computes an edit script to transform one tree into another, along with the mappings it is based on.
+
+    The returned mappings relate the nodes of the given trees (rather than the
+    copies on which the script is computed), and can be used to seed a later diff
+    between similar trees (see compute_gumtree_mappings).
+
+    If anchor_ids is set, nodes are first mapped by their IDs, and identical trees
+    are immediately given an empty edit script.
+
+    If compact is set, the additions and deletions of entire subtrees are collapsed
+    into subtree-level edits (see facilitate.compaction). Whenever the diff is
+    verified as it is computed, the compacted script is also replayed against the
+    source tree, and the uncompacted script is returned if its result differs.
+
+    The mappings and the result of the script are verified according to the given
+    verification policy, which defaults to the one that is configured via
+    environment variables (see facilitate.verification).
+    """
+    if anchor_ids and tree_from.equivalent_to(tree_to):
+        return EditScript(), map_equivalent_trees(tree_from, tree_to)
+
+    if verification is None:
+        verification = default_verification_policy()
+    verify_inline = verification.verify_inline()
+
+    tree_from_copy = tree_from.copy()
+    tree_to_copy = tree_to.copy()
+
+    # NOTE copies preserve the order of nodes, so nodes can be related by position
+    original_to_copy_from = dict(zip(tree_from.nodes(), tree_from_copy.nodes(), strict=True))
+    original_to_copy_to = dict(zip(tree_to.nodes(), tree_to_copy.nodes(), strict=True))
+
+    if seed is not None:
+        seed = _translate_mappings(seed, original_to_copy_from, original_to_copy_to)
+
+    mappings = compute_gumtree_mappings(
+        tree_from_copy,
+        tree_to_copy,
+        seed=seed,
+        anchor_ids=anchor_ids,
+        check=False,
+    )
     logger.debug("mappings: {}", mappings)
+    if verify_inline:
+        # NOTE the copies have yet to be edited, so they can stand in for the given trees
+        verification.check_mappings(mappings, tree_from=tree_from_copy, tree_to=tree_to_copy)
+
+    original_mappings = _translate_mappings(
+        mappings,
+        {copy: original for original, copy in original_to_copy_from.items()},
+        {copy: original for original, copy in original_to_copy_to.items()},
+    )
 
-    script = update_insert_align_move_phase(tree_from, tree_to, mappings)
+    added_nodes: list[tuple[Addition, Node]] = []
+    script = update_insert_align_move_phase(
+        tree_from_copy,
+        tree_to_copy,
+        mappings,
+        added_nodes=added_nodes,
+    )
     delete_phase(
         script=script,
-        tree_from=tree_from,
+        tree_from=tree_from_copy,
         mappings=mappings,
     )
 
-    assert tree_from.equivalent_to(tree_to)
+    if verify_inline:
+        verification.check_result(tree_from_copy, tree_from=tree_from, tree_to=tree_to, edit_script=script)
+
+    if compact:
+        script = _compact_and_verify(script, tree_from, tree_to, added_nodes, verify=verify_inline)
+
+    if verification.mode is VerificationMode.SHADOW:
+        verification.submit(script, original_mappings, tree_from=tree_from, tree_to=tree_to)
 
+    return script, original_mappings
+
+
+def compute_edit_script(
+    tree_from: Node,
+    tree_to: Node,
+    *,
+    seed: NodeMappings | None = None,
+    anchor_ids: bool = False,
+    compact: bool = False,
+    verification: VerificationPolicy | None = None,
+) -> EditScript:
+    """Computes an edit script to transform one tree into another.
+
+    Optionally, node mappings between the two trees can be given to seed the diff,
+    nodes can be mapped by their IDs before the general matcher runs, the script
+    can be compacted into subtree-level edits, and a verification policy can be
+    given (see compute_edit_script_and_mappings).
+    """
+    script, _ = compute_edit_script_and_mappings(
+        tree_from,
+        tree_to,
+        seed=seed,
+        anchor_ids=anchor_ids,
+        compact=compact,
+        verification=verification,
+    )
     return script
@@ -1,6 +1,12 @@
 """Computes weighted distances from edit scripts."""
 from __future__ import annotations
 
+import collections
+import typing as t
+
+from loguru import logger
+
+from facilitate.deadline import DeadlineExceededError, estimate_diff_seconds, time_remaining
 from facilitate.diff import compute_edit_script
 from facilitate.edit import (
     AddBlockToInput,
@@ -10,7 +16,9 @@ from facilitate.edit import (
     Addition,
     AddSequenceToInput,
     AddSequenceToProgram,
+    AddSubtree,
     Delete,
+    DeleteSubtree,
     EditScript,
     Move,
     MoveBlockInSequence,
@@ -21,7 +29,9 @@ from facilitate.edit import (
     MoveSequenceInProgram,
     MoveSequenceToProgram,
     Update,
+    build_subtree,
 )
+from facilitate.hashing import surface_label
 from facilitate.model.block import Block
 from facilitate.model.field import Field
 from facilitate.model.input import Input
@@ -29,6 +39,19 @@ from facilitate.model.literal import Literal
 from facilitate.model.program import Program
 from facilitate.model.sequence import Sequence
 
+if t.TYPE_CHECKING:
+    from facilitate.model.node import Node
+
+# the methods by which distances can be computed: "gumtree" computes the weighted
+# distance of an edit script, whereas "pqgram" approximates the distance from the
+# pq-gram profiles of the programs (see facilitate.pqgram)
+DistanceMethod = t.Literal["gumtree", "pqgram"]
+DISTANCE_METHODS: tuple[DistanceMethod, ...] = t.get_args(DistanceMethod)
+
+# must be incremented whenever a change to the costs (or to the diff) alters the distances or
+# edit scripts that are computed, since these are memoized across requests (see facilitate.memo)
+COST_MODEL_VERSION = 3
+
 DELETE_BLOCK_COST = 0.5
 DELETE_FIELD_COST = 0.0
 DELETE_INPUT_COST = 0.0
@@ -99,6 +122,22 @@ def _compute_move_costs(edit_script: EditScript) -> float:
     return cost
 
 
+def _compute_deletion_cost(node: Node) -> float:
+    """Computes the cost of deleting a single node."""
+    match node:
+        case Block():
+            return DELETE_BLOCK_COST
+        case Sequence():
+            return DELETE_SEQUENCE_COST
+        case Literal():
+            return DELETE_LITERAL_COST
+        case Field():
+            return DELETE_FIELD_COST
+        case Input():
+            return DELETE_INPUT_COST
+    return 0.0
+
+
 def _compute_deletion_costs(
     tree_from: Program,
     edit_script: EditScript,
@@ -106,26 +145,34 @@ def _compute_deletion_costs(
     """Computes the cost of all deletions within a given edit script."""
     cost = 0.0
 
-    deletions: list[Delete] = [edit for edit in edit_script if isinstance(edit, Delete)]
-    for deletion in deletions:
-        node = tree_from.find(deletion.node_id)
-        assert node is not None
-
-        match node:
-            case Block():
-                cost += DELETE_BLOCK_COST
-            case Sequence():
-                cost += DELETE_SEQUENCE_COST
-            case Literal():
-                cost += DELETE_LITERAL_COST
-            case Field():
-                cost += DELETE_FIELD_COST
-            case Input():
-                cost += DELETE_INPUT_COST
+    for edit in edit_script:
+        if isinstance(edit, Delete):
+            node = tree_from.find(edit.node_id)
+            assert node is not None
+            cost += _compute_deletion_cost(node)
+        elif isinstance(edit, DeleteSubtree):
+            # the subtree is deleted in its entirety, so each of its nodes is paid for
+            root = tree_from.find(edit.node_id)
+            assert root is not None
+            cost += sum(_compute_deletion_cost(node) for node in root.nodes())
 
     return cost
 
 
+def _compute_insertion_cost(node: Node) -> float:
+    """Computes the cost of inserting a single node."""
+    match node:
+        case Sequence():
+            return INSERT_SEQUENCE_COST
+        case Block():
+            return INSERT_BLOCK_COST
+        case Field():
+            return INSERT_FIELD_COST
+        case Input():
+            return INSERT_INPUT_COST
+    return 0.0
+
+
 def _compute_insertion_costs(
     edit_script: EditScript,
 ) -> float:
@@ -143,6 +190,9 @@ def _compute_insertion_costs(
                 cost += INSERT_FIELD_COST
             case AddInputToBlock():
                 cost += INSERT_INPUT_COST
+            case AddSubtree():
+                subtree = build_subtree(insertion.subtree)
+                cost += sum(_compute_insertion_cost(node) for node in subtree.nodes())
 
     return cost
 
@@ -177,12 +227,88 @@ def compute_distance(
 def compute_edit_script_and_distance(
     tree_from: Program,
     tree_to: Program,
+    *,
+    anchor_ids: bool = False,
+    compact: bool = False,
 ) -> tuple[EditScript, float]:
-    """Computes the edit script and weighted distance between two trees."""
-    edit_script = compute_edit_script(tree_from, tree_to)
+    """Computes the edit script and weighted distance between two trees.
+
+    If anchor_ids is set, nodes are first mapped by their IDs, and if compact is set,
+    the edit script is compacted into subtree-level edits (see compute_edit_script).
+    """
+    edit_script = compute_edit_script(
+        tree_from,
+        tree_to,
+        anchor_ids=anchor_ids,
+        compact=compact,
+    )
     distance = compute_distance(
         tree_from=tree_from,
         tree_to=tree_to,
         edit_script=edit_script,
     )
     return edit_script, distance
+
+
+def approximate_distance(tree_from: Program, tree_to: Program) -> float:
+    """Approximates the weighted distance between two trees in linear time.
+
+    Each node is identified by its surface label together with that of its parent
+    (see facilitate.hashing.surface_label). The approximation is the cost of deleting
+    the nodes of tree_from that have no counterpart in tree_to, plus the cost of
+    inserting the nodes of tree_to that have no counterpart in tree_from. Moves are
+    ignored, and updates are priced as a deletion and an insertion.
+    """
+    def key(node: Node) -> tuple[bytes, bytes]:
+        parent_label = b"" if node.parent is None else surface_label(node.parent)
+        return surface_label(node), parent_label
+
+    counts_from = collections.Counter(key(node) for node in tree_from.nodes())
+    counts_to = collections.Counter(key(node) for node in tree_to.nodes())
+    unmatched_from = counts_from - counts_to
+    unmatched_to = counts_to - counts_from
+
+    cost = 0.0
+    for node in tree_from.nodes():
+        node_key = key(node)
+        if unmatched_from[node_key] > 0:
+            unmatched_from[node_key] -= 1
+            cost += _compute_deletion_cost(node)
+    for node in tree_to.nodes():
+        node_key = key(node)
+        if unmatched_to[node_key] > 0:
+            unmatched_to[node_key] -= 1
+            cost += _compute_insertion_cost(node)
+    return cost
+
+
+def compute_edit_script_and_distance_before_deadline(
+    tree_from: Program,
+    tree_to: Program,
+    *,
+    anchor_ids: bool = False,
+    compact: bool = False,
+) -> tuple[EditScript | None, float]:
+    """Computes the edit script and weighted distance between two trees within the current deadline.
+
+    If the diff is predicted to exceed the deadline (see facilitate.deadline), or
+    actually exceeds it, an approximate distance is returned without an edit script
+    instead (see approximate_distance).
+    """
+    remaining = time_remaining()
+    if remaining is not None:
+        estimate = estimate_diff_seconds(len(list(tree_from.nodes())), len(list(tree_to.nodes())))
+        if estimate > remaining:
+            logger.info(f"diff predicted to take {estimate:.3f}s with {remaining:.3f}s remaining; approximating")
+            return None, approximate_distance(tree_from, tree_to)
+
+    try:
+        return compute_edit_script_and_distance(
+            tree_from,
+            tree_to,
+            anchor_ids=anchor_ids,
+            compact=compact,
+        )
+    except DeadlineExceededError:
+        logger.info("diff exceeded its deadline; approximating")
+        return None, approximate_distance(tree_from, tree_to)
@@ -21,13 +21,247 @@ if t.TYPE_CHECKING:
     from PIL.Image import Image
 
     from facilitate.model.node import Node
+    from facilitate.wire import WireFormat
+
+
+def describe_subtree(node: Node) -> dict[str, t.Any]:
+    """Describes the contents of a subtree (excluding node IDs) as a JSON-serializable dict."""
+    if isinstance(node, Sequence):
+        return {
+            "type": "sequence",
+            "blocks": [describe_subtree(block) for block in node.blocks],
+        }
+    if isinstance(node, Block):
+        return {
+            "type": "block",
+            "opcode": node.opcode,
+            "is-shadow": node.is_shadow,
+            "fields": {field.name: field.value for field in node.fields},
+            "inputs": {
+                input_.name: None if input_.expression is None else describe_subtree(input_.expression)
+                for input_ in node.inputs
+            },
+        }
+    if isinstance(node, Input):
+        return {
+            "type": "input",
+            "name": node.name,
+            "expression": None if node.expression is None else describe_subtree(node.expression),
+        }
+    if isinstance(node, Literal):
+        return {
+            "type": "literal",
+            "value": node.value,
+        }
+    error = f"cannot describe subtree rooted at node of type {node.__class__.__name__}"
+    raise TypeError(error)
+
+
+@dataclass
+class NodeIds:
+    """Derives the IDs of the nodes that are added to a tree from the IDs of their parents.
+
+    Derived IDs are deterministic, so that applying the same edits to the same tree
+    always yields the same tree. Since nodes keep their IDs when they are moved, a
+    derived ID may already be taken, in which case it is given a numeric suffix.
+    The suffix is attached to the kind of the node rather than appended to the
+    whole ID (i.e., :kind#2@parent), since the ID of the parent may itself end
+    in a suffix: otherwise, the second child of a parent and the first child of
+    that parent's second sibling could be given the same ID, depending on the
+    order in which their IDs were claimed.
+
+    The IDs within the tree are collected once, when the first ID is claimed. A
+    single instance should therefore be shared by every edit that is applied to
+    the same tree (see Edit.apply), which keeps it up to date as nodes are added
+    and deleted.
+    """
+    root: Node | None = None
+    _taken: set[str] | None = field(default=None, init=False, repr=False)
+
+    def claim(self, kind: str, parent_id: str) -> str:
+        """Returns an unused ID for a node of the given kind (e.g., "literal") within a given parent."""
+        if self._taken is None:
+            self._taken = set() if self.root is None else {node.id_ for node in self.root.nodes()}
+        id_ = f":{kind}@{parent_id}"
+        suffix = 1
+        while id_ in self._taken:
+            suffix += 1
+            id_ = f":{kind}#{suffix}@{parent_id}"
+        self._taken.add(id_)
+        return id_
+
+    def release(self, node: Node) -> None:
+        """Frees the IDs of a subtree that has been deleted from the tree."""
+        if self._taken is not None:
+            self._taken.difference_update(descendant.id_ for descendant in node.nodes())
+
+
+def build_subtree(
+    description: dict[str, t.Any],
+    *,
+    parent_id: str = "",
+    node_ids: NodeIds | None = None,
+) -> Node:
+    """Builds a detached subtree from its description (see describe_subtree).
+
+    The IDs of its nodes are derived from the ID of the node into which it is to be
+    inserted, avoiding those already claimed from node_ids.
+    """
+    if node_ids is None:
+        node_ids = NodeIds()
+    match description["type"]:
+        case "sequence":
+            sequence = Sequence.create(id_=node_ids.claim("seq", parent_id))
+            for block_description in description["blocks"]:
+                block = build_subtree(block_description, parent_id=sequence.id_, node_ids=node_ids)
+                assert isinstance(block, Block)
+                block.parent = sequence
+                sequence.blocks.append(block)
+            return sequence
+        case "block":
+            block = Block.create(
+                opcode=description["opcode"],
+                is_shadow=description["is-shadow"],
+                id_=node_ids.claim(f"block[{description['opcode']}]", parent_id),
+            )
+            for name, value in description["fields"].items():
+                block.add_field(name, value, id_=node_ids.claim(f"field[{name}]", block.id_))
+            for name, expression in description["inputs"].items():
+                input_ = block.add_input(name, id_=node_ids.claim(f"input[{name}]", block.id_))
+                if expression is not None:
+                    input_.add_child(build_subtree(expression, parent_id=input_.id_, node_ids=node_ids))
+            return block
+        case "input":
+            input_ = Input.create(
+                name=description["name"],
+                expression=None,
+                id_=node_ids.claim(f"input[{description['name']}]", parent_id),
+            )
+            if description["expression"] is not None:
+                input_.add_child(build_subtree(description["expression"], parent_id=input_.id_, node_ids=node_ids))
+            return input_
+        case "literal":
+            return Literal.create(value=description["value"], id_=node_ids.claim("literal", parent_id))
+        case type_:
+            error = f"unknown subtree type: {type_}"
+            raise ValueError(error)
+
+
+# the compact encoding of an edit script (see Edit.to_compact_dict) replaces the
+# keys and type names of the verbose encoding by the short forms given below
+_COMPACT_KEYS: dict[str, str] = {
+    "type": "t",
+    "node-id": "n",
+    "block-id": "b",
+    "sequence-id": "s",
+    "input-id": "i",
+    "field-id": "f",
+    "parent-id": "p",
+    "move-from-block-id": "mf",
+    "move-to-block-id": "mt",
+    "input-name": "in",
+    "position": "at",
+    "name": "nm",
+    "value": "v",
+    "opcode": "o",
+    "is-shadow": "sh",
+    "subtree": "st",
+    "blocks": "bs",
+    "fields": "fs",
+    "inputs": "is",
+    "expression": "x",
+    "edits": "e",
+}
+_COMPACT_EDIT_TYPES: dict[str, str] = {
+    "AddSequenceToProgram": "asp",
+    "AddInputToBlock": "aib",
+    "AddLiteralToInput": "ali",
+    "AddBlockToSequence": "abs",
+    "AddSequenceToInput": "asi",
+    "AddBlockToInput": "abi",
+    "AddFieldToBlock": "afb",
+    "AddSubtree": "at",
+    "MoveSequenceToProgram": "msp",
+    "MoveFieldToBlock": "mfb",
+    "MoveInputToBlock": "mib",
+    "MoveBlockToSequence": "mbs",
+    "MoveNodeToInput": "mni",
+    "MoveSequenceInProgram": "msip",
+    "MoveBlockInSequence": "mbis",
+    "Update": "u",
+    "Delete": "d",
+    "DeleteSubtree": "dt",
+}
+_COMPACT_SUBTREE_TYPES: dict[str, str] = {
+    "sequence": "S",
+    "block": "B",
+    "input": "I",
+    "literal": "L",
+}
+_VERBOSE_KEYS = {short: key for key, short in _COMPACT_KEYS.items()}
+_VERBOSE_EDIT_TYPES = {short: type_ for type_, short in _COMPACT_EDIT_TYPES.items()}
+_VERBOSE_SUBTREE_TYPES = {short: type_ for type_, short in _COMPACT_SUBTREE_TYPES.items()}
+
+
+def _compact_subtree(description: dict[str, t.Any]) -> dict[str, t.Any]:
+    """Shortens the keys and type names of a subtree description (see describe_subtree)."""
+    compact: dict[str, t.Any] = {}
+    for key, value in description.items():
+        match key:
+            case "type":
+                value = _COMPACT_SUBTREE_TYPES[value]  # noqa: PLW2901
+            case "blocks":
+                value = [_compact_subtree(block) for block in value]  # noqa: PLW2901
+            case "inputs":
+                # NOTE the keys of fields and inputs are names, which are left intact
+                value = {  # noqa: PLW2901
+                    name: None if expression is None else _compact_subtree(expression)
+                    for name, expression in value.items()
+                }
+            case "expression" if value is not None:
+                value = _compact_subtree(value)  # noqa: PLW2901
+        compact[_COMPACT_KEYS[key]] = value
+    return compact
+
+
+def _expand_subtree(compact: dict[str, t.Any]) -> dict[str, t.Any]:
+    """Restores the verbose form of a compacted subtree description."""
+    description: dict[str, t.Any] = {}
+    for short_key, value in compact.items():
+        key = _VERBOSE_KEYS[short_key]
+        match key:
+            case "type":
+                value = _VERBOSE_SUBTREE_TYPES[value]  # noqa: PLW2901
+            case "blocks":
+                value = [_expand_subtree(block) for block in value]  # noqa: PLW2901
+            case "inputs":
+                value = {  # noqa: PLW2901
+                    name: None if expression is None else _expand_subtree(expression)
+                    for name, expression in value.items()
+                }
+            case "expression" if value is not None:
+                value = _expand_subtree(value)  # noqa: PLW2901
+        description[key] = value
+    return description
 
 
 class Edit(abc.ABC):
     _name_to_edit_class: t.ClassVar[dict[str, type[Edit]]] = {}
 
     @abc.abstractmethod
-    def apply(self, root: Node, *, no_delete: bool = False) -> Node | None:
+    def apply(
+        self,
+        root: Node,
+        *,
+        no_delete: bool = False,
+        node_ids: NodeIds | None = None,
+    ) -> Node | None:
+        """Applies this edit to a tree in place.
+
+        Node IDs are claimed from the given node_ids, if any, which must be shared
+        by every edit that is applied to the same tree, and otherwise from the
+        IDs that are collected from the tree anew.
+        """
         ...
 
     @abc.abstractmethod
@@ -41,6 +275,33 @@ class Edit(abc.ABC):
         type_cls = cls._name_to_edit_class[type_name]
         return type_cls._from_dict(dict_)
 
+    @final
+    def to_compact_dict(self) -> dict[str, t.Any]:
+        """Encodes this edit as a dict with short keys and type names (see from_compact_dict)."""
+        compact: dict[str, t.Any] = {}
+        for key, value in self.to_dict().items():
+            match key:
+                case "type":
+                    value = _COMPACT_EDIT_TYPES[value]  # noqa: PLW2901
+                case "subtree":
+                    value = _compact_subtree(value)  # noqa: PLW2901
+            compact[_COMPACT_KEYS[key]] = value
+        return compact
+
+    @classmethod
+    @final
+    def from_compact_dict(cls, compact: dict[str, t.Any]) -> Edit:
+        dict_: dict[str, t.Any] = {}
+        for short_key, value in compact.items():
+            key = _VERBOSE_KEYS[short_key]
+            match key:
+                case "type":
+                    value = _VERBOSE_EDIT_TYPES[value]  # noqa: PLW2901
+                case "subtree":
+                    value = _expand_subtree(value)  # noqa: PLW2901
+            dict_[key] = value
+        return cls.from_dict(dict_)
+
     @classmethod
     @abc.abstractmethod
     def _from_dict(cls, dict_: dict[str, t.Any]) -> Edit:
@@ -67,10 +328,17 @@ class AddSequenceToProgram(Addition):
     position: int
 
     @overrides
-    def apply(self, root: Node, *, no_delete: bool = False) -> Node | None:  # noqa: ARG002
+    def apply(
+        self,
+        root: Node,
+        *,
+        no_delete: bool = False,  # noqa: ARG002
+        node_ids: NodeIds | None = None,
+    ) -> Node | None:
         """Inserts and returns the given input."""
+        node_ids = node_ids or NodeIds(root)
         assert isinstance(root, Program)
-        added = Sequence.create()
+        added = Sequence.create(id_=node_ids.claim("seq", root.id_))
         added.tags.append("ADDED")
         added.parent = root
         root.top_level_nodes.insert(self.position, added)
@@ -98,11 +366,18 @@ class AddInputToBlock(Addition):
     name: str
 
     @overrides
-    def apply(self, root: Node, *, no_delete: bool = False) -> Node | None:  # noqa: ARG002
+    def apply(
+        self,
+        root: Node,
+        *,
+        no_delete: bool = False,  # noqa: ARG002
+        node_ids: NodeIds | None = None,
+    ) -> Node | None:
         """Inserts and returns the given input."""
+        node_ids = node_ids or NodeIds(root)
         parent = root.find(self.block_id)
         assert isinstance(parent, Block)
-        added = parent.add_input(self.name)
+        added = parent.add_input(self.name, id_=node_ids.claim(f"input[{self.name}]", parent.id_))
         added.tags.append("ADDED")
         return added
 
@@ -133,11 +408,18 @@ class AddLiteralToInput(Addition):
     value: str
 
     @overrides
-    def apply(self, root: Node, *, no_delete: bool = False) -> Node | None:  # noqa: ARG002
+    def apply(
+        self,
+        root: Node,
+        *,
+        no_delete: bool = False,  # noqa: ARG002
+        node_ids: NodeIds | None = None,
+    ) -> Node | None:
         """Inserts and returns the given literal."""
+        node_ids = node_ids or NodeIds(root)
         parent = root.find(self.input_id)
         assert isinstance(parent, Input)
-        added = Literal.create(value=self.value)
+        added = Literal.create(value=self.value, id_=node_ids.claim("literal", parent.id_))
         parent.add_child(added)
         added.tags.append("ADDED")
         return added
@@ -172,14 +454,22 @@ class AddBlockToSequence(Addition):
     is_shadow: bool
 
     @overrides
-    def apply(self, root: Node, *, no_delete: bool = False) -> Node | None:  # noqa: ARG002
+    def apply(
+        self,
+        root: Node,
+        *,
+        no_delete: bool = False,  # noqa: ARG002
+        node_ids: NodeIds | None = None,
+    ) -> Node | None:
         """Inserts and returns the given block."""
+        node_ids = node_ids or NodeIds(root)
         parent = root.find(self.sequence_id)
         assert isinstance(parent, Sequence)
         added = parent.insert_block(
             opcode=self.opcode,
             is_shadow=self.is_shadow,
             position=self.position,
+            id_=node_ids.claim(f"block[{self.opcode}]", parent.id_),
         )
         added.tags.append("ADDED")
         return added
@@ -220,13 +510,20 @@ class AddSequenceToInput(Addition):
     input_name: str
 
     @overrides
-    def apply(self, root: Node, *, no_delete: bool = False) -> Node | None:  # noqa: ARG002
+    def apply(
+        self,
+        root: Node,
+        *,
+        no_delete: bool = False,  # noqa: ARG002
+        node_ids: NodeIds | None = None,
+    ) -> Node | None:
         """Inserts and returns the given sequence."""
+        node_ids = node_ids or NodeIds(root)
         block = root.find(self.block_id)
         assert isinstance(block, Block)
         input_ = block.find_input(self.input_name)
         assert input_ is not None
-        sequence = Sequence.create()
+        sequence = Sequence.create(id_=node_ids.claim("seq", input_.id_))
         input_.add_child(sequence)
         return sequence
 
@@ -258,13 +555,21 @@ class AddBlockToInput(Addition):
     is_shadow: bool
 
     @overrides
-    def apply(self, root: Node, *, no_delete: bool = False) -> Node | None:  # noqa: ARG002
+    def apply(
+        self,
+        root: Node,
+        *,
+        no_delete: bool = False,  # noqa: ARG002
+        node_ids: NodeIds | None = None,
+    ) -> Node | None:
         """Inserts and returns the given block."""
+        node_ids = node_ids or NodeIds(root)
         parent = root.find(self.input_id)
         assert isinstance(parent, Input)
         block = Block.create(
             opcode=self.opcode,
             is_shadow=self.is_shadow,
+            id_=node_ids.claim(f"block[{self.opcode}]", parent.id_),
         )
         parent.add_child(block)
         block.tags.append("ADDED")
@@ -301,11 +606,22 @@ class AddFieldToBlock(Addition):
     value: str
 
     @overrides
-    def apply(self, root: Node, *, no_delete: bool = False) -> Node | None:  # noqa: ARG002
+    def apply(
+        self,
+        root: Node,
+        *,
+        no_delete: bool = False,  # noqa: ARG002
+        node_ids: NodeIds | None = None,
+    ) -> Node | None:
         """Inserts and returns the given field."""
+        node_ids = node_ids or NodeIds(root)
         parent = root.find(self.block_id)
         assert isinstance(parent, Block)
-        added = parent.add_field(self.name, self.value)
+        added = parent.add_field(
+            self.name,
+            self.value,
+            id_=node_ids.claim(f"field[{self.name}]", parent.id_),
+        )
         added.tags.append("ADDED")
         return added
 
@@ -332,13 +648,112 @@ class AddFieldToBlock(Addition):
         )
 
 
+@dataclass(frozen=True, kw_only=True)
+class AddSubtree(Addition):
+    """Inserts an entire subtree, replacing an addition for each of its nodes.
+
+    The subtree is inserted into the node with the given ID, as follows:
+
+    * a sequence is inserted into the program at the given position;
+    * a block is inserted into a sequence at the given position;
+    * an input is inserted into a block;
+    * the expression of an input (i.e., a block, sequence, or literal) is inserted
+      into the input of the block with the given name.
+
+    Attributes
+    ----------
+    parent_id
+        the ID of the node into which the subtree is inserted
+    subtree
+        a description of the contents of the subtree (see describe_subtree)
+    position
+        the position at which the subtree is inserted into a program or sequence
+    input_name
+        the name of the input into which the subtree is inserted, if any
+    """
+    parent_id: str
+    subtree: dict[str, t.Any] = field(hash=False)
+    position: int | None = None
+    input_name: str | None = None
+
+    @overrides
+    def apply(
+        self,
+        root: Node,
+        *,
+        no_delete: bool = False,  # noqa: ARG002
+        node_ids: NodeIds | None = None,
+    ) -> Node | None:
+        """Inserts and returns the given subtree."""
+        parent = root.find(self.parent_id)
+        node_ids = node_ids or NodeIds(root)
+
+        if isinstance(parent, Program):
+            added = build_subtree(self.subtree, parent_id=parent.id_, node_ids=node_ids)
+            assert isinstance(added, Sequence)
+            assert self.position is not None
+            added.parent = parent
+            parent.top_level_nodes.insert(self.position, added)
+        elif isinstance(parent, Sequence):
+            added = build_subtree(self.subtree, parent_id=parent.id_, node_ids=node_ids)
+            assert isinstance(added, Block)
+            assert self.position is not None
+            added.parent = parent
+            parent.blocks.insert(self.position, added)
+        elif isinstance(parent, Block) and self.input_name is not None:
+            input_ = parent.find_input(self.input_name)
+            assert input_ is not None
+            added = build_subtree(self.subtree, parent_id=input_.id_, node_ids=node_ids)
+            input_.add_child(added)
+        elif isinstance(parent, Block):
+            added = build_subtree(self.subtree, parent_id=parent.id_, node_ids=node_ids)
+            parent.add_child(added)
+        else:
+            error = f"cannot add subtree to node {self.parent_id}"
+            raise ValueError(error)
+
+        for node in added.nodes():
+            node.tags.append("ADDED")
+        return added
+
+    @overrides
+    def to_dict(self) -> dict[str, t.Any]:
+        dict_: dict[str, t.Any] = {
+            "type": "AddSubtree",
+            "parent-id": self.parent_id,
+            "subtree": self.subtree,
+        }
+        if self.position is not None:
+            dict_["position"] = self.position
+        if self.input_name is not None:
+            dict_["input-name"] = self.input_name
+        return dict_
+
+    @classmethod
+    @overrides
+    def _from_dict(cls, dict_: dict[str, t.Any]) -> Edit:
+        assert dict_["type"] == "AddSubtree"
+        return AddSubtree(
+            parent_id=dict_["parent-id"],
+            subtree=dict_["subtree"],
+            position=dict_.get("position"),
+            input_name=dict_.get("input-name"),
+        )
+
+
 @dataclass(frozen=True, kw_only=True)
 class MoveSequenceToProgram(Move):
     sequence_id: str
     position: int
 
     @overrides
-    def apply(self, root: Node, *, no_delete: bool = False) -> Node | None:  # noqa: ARG002
+    def apply(
+        self,
+        root: Node,
+        *,
+        no_delete: bool = False,  # noqa: ARG002
+        node_ids: NodeIds | None = None,  # noqa: ARG002
+    ) -> Node | None:
         assert isinstance(root, Program)
         sequence = root.find(self.sequence_id)
         assert isinstance(sequence, Sequence)
@@ -396,7 +811,13 @@ class MoveFieldToBlock(Move):
     field_id: str
 
     @overrides
-    def apply(self, root: Node, *, no_delete: bool = False) -> Node | None:  # noqa: ARG002
+    def apply(
+        self,
+        root: Node,
+        *,
+        no_delete: bool = False,  # noqa: ARG002
+        node_ids: NodeIds | None = None,  # noqa: ARG002
+    ) -> Node | None:
         move_from_block = root.find(self.move_from_block_id)
         assert isinstance(move_from_block, Block)
         move_to_block = root.find(self.move_to_block_id)
@@ -441,7 +862,13 @@ class MoveInputToBlock(Move):
     input_id: str
 
     @overrides
-    def apply(self, root: Node, *, no_delete: bool = False) -> Node | None:  # noqa: ARG002
+    def apply(
+        self,
+        root: Node,
+        *,
+        no_delete: bool = False,  # noqa: ARG002
+        node_ids: NodeIds | None = None,  # noqa: ARG002
+    ) -> Node | None:
         move_from_block = root.find(self.move_from_block_id)
         assert isinstance(move_from_block, Block)
         move_to_block = root.find(self.move_to_block_id)
@@ -492,7 +919,13 @@ class MoveBlockToSequence(Move):
     position: int
 
     @overrides
-    def apply(self, root: Node, *, no_delete: bool = False) -> Node | None:  # noqa: ARG002
+    def apply(
+        self,
+        root: Node,
+        *,
+        no_delete: bool = False,  # noqa: ARG002
+        node_ids: NodeIds | None = None,  # noqa: ARG002
+    ) -> Node | None:
         move_block = root.find(self.block_id)
         assert isinstance(move_block, Block)
 
@@ -542,7 +975,13 @@ class MoveNodeToInput(Move):
     input_name: str
 
     @overrides
-    def apply(self, root: Node, *, no_delete: bool = False) -> Node | None:  # noqa: ARG002
+    def apply(
+        self,
+        root: Node,
+        *,
+        no_delete: bool = False,  # noqa: ARG002
+        node_ids: NodeIds | None = None,  # noqa: ARG002
+    ) -> Node | None:
         node_to_move = root.find(self.node_id)
         assert node_to_move is not None
 
@@ -587,7 +1026,13 @@ class MoveSequenceInProgram(Move):
     position: int
 
     @overrides
-    def apply(self, root: Node, *, no_delete: bool = False) -> Node | None:  # noqa: ARG002
+    def apply(
+        self,
+        root: Node,
+        *,
+        no_delete: bool = False,  # noqa: ARG002
+        node_ids: NodeIds | None = None,  # noqa: ARG002
+    ) -> Node | None:
         """Moves the sequence to the given position in the program."""
         assert isinstance(root, Program)
         sequence = root.find(self.sequence_id)
@@ -631,16 +1076,23 @@ class MoveBlockInSequence(Move):
     position: int
 
     @overrides
-    def apply(self, root: Node, *, no_delete: bool = False) -> Node | None:  # noqa: ARG002
+    def apply(
+        self,
+        root: Node,
+        *,
+        no_delete: bool = False,  # noqa: ARG002
+        node_ids: NodeIds | None = None,  # noqa: ARG002
+    ) -> Node | None:
         """Moves the block to the given position in the sequence."""
         sequence = root.find(self.sequence_id)
         assert isinstance(sequence, Sequence)
-        block = sequence.find(self.block_id)
-        assert isinstance(block, Block)
-        assert block.parent == sequence
-
-        current_position = sequence.blocks.index(block)
-        sequence.blocks.remove(block)
+        # NOTE the block must be a child of the sequence, so there's no need to search its entire subtree
+        current_position = next(
+            (position for position, block in enumerate(sequence.blocks) if block.id_ == self.block_id),
+            None,
+        )
+        assert current_position is not None
+        block = sequence.blocks.pop(current_position)
 
         new_position = self.position
         if new_position > current_position:
@@ -728,7 +1180,13 @@ class Update(Edit):
         )
 
     @overrides
-    def apply(self, root: Node, *, no_delete: bool = False) -> Node | None:  # noqa: ARG002
+    def apply(
+        self,
+        root: Node,
+        *,
+        no_delete: bool = False,  # noqa: ARG002
+        node_ids: NodeIds | None = None,  # noqa: ARG002
+    ) -> Node | None:
         node = root.find(self.node_id)
 
         if isinstance(node, Block):
@@ -776,7 +1234,13 @@ class Delete(Edit):
     node_id: str
 
     @overrides
-    def apply(self, root: Node, *, no_delete: bool = False) -> Node | None:
+    def apply(
+        self,
+        root: Node,
+        *,
+        no_delete: bool = False,
+        node_ids: NodeIds | None = None,
+    ) -> Node | None:
         node = root.find(self.node_id)
         if not node:
             error = f"cannot delete node {self.node_id}: not found."
@@ -794,6 +1258,8 @@ class Delete(Edit):
 
         if not no_delete:
             parent.remove_child(node)
+            if node_ids is not None:
+                node_ids.release(node)
 
         node.tags.append("DELETED")
 
@@ -816,6 +1282,62 @@ class Delete(Edit):
         )
 
 
+@dataclass(frozen=True, kw_only=True)
+class DeleteSubtree(Edit):
+    """Deletes a node from the tree together with all of its descendants.
+
+    Attributes
+    ----------
+    node_id
+        the id of the root of the subtree to delete
+    """
+    node_id: str
+
+    @overrides
+    def apply(
+        self,
+        root: Node,
+        *,
+        no_delete: bool = False,
+        node_ids: NodeIds | None = None,
+    ) -> Node | None:
+        node = root.find(self.node_id)
+        if not node:
+            error = f"cannot delete subtree {self.node_id}: not found."
+            raise ValueError(error)
+
+        parent = node.parent
+        if not parent:
+            error = f"cannot delete subtree {self.node_id}: no parent."
+            raise ValueError(error)
+
+        if not no_delete:
+            parent.remove_child(node)
+            if node_ids is not None:
+                node_ids.release(node)
+
+        for deleted in node.nodes():
+            deleted.tags.append("DELETED")
+
+        return None
+
+    @overrides
+    def to_dict(self) -> dict[str, t.Any]:
+        return {
+            "type": "DeleteSubtree",
+            "node-id": self.node_id,
+        }
+
+    @classmethod
+    @overrides
+    def _from_dict(cls, dict_: dict[str, t.Any]) -> Edit:
+        assert dict_["type"] == "DeleteSubtree"
+        node_id = dict_["node-id"]
+        return DeleteSubtree(
+            node_id=node_id,
+        )
+
+
 @dataclass
 class EditScript(t.Iterable[Edit]):
     _edits: list[Edit] = field(default_factory=list)
@@ -832,8 +1354,9 @@ class EditScript(t.Iterable[Edit]):
 
     def apply(self, root: Node) -> Node:
         root = root.copy()
+        node_ids = NodeIds(root)
         for edit in self._edits:
-            edit.apply(root)
+            edit.apply(root, node_ids=node_ids)
         return root
 
     def to_dict(self) -> dict[str, t.Any]:
@@ -847,6 +1370,37 @@ class EditScript(t.Iterable[Edit]):
         edits = [Edit.from_dict(edit_dict) for edit_dict in dict_["edits"]]
         return EditScript(edits)
 
+    def to_compact_dict(self) -> dict[str, t.Any]:
+        """Encodes this edit script using short keys and type names.
+
+        The compact encoding is used by the binary and compact JSON wire formats
+        (see facilitate.wire). Most of an edit script consists of node IDs, so the
+        compact encoding is only about a quarter smaller than the verbose encoding;
+        compression accounts for most of the savings on the wire.
+        """
+        return {
+            _COMPACT_KEYS["edits"]: [edit.to_compact_dict() for edit in self._edits],
+        }
+
+    @classmethod
+    def from_compact_dict(cls, dict_: dict[str, t.Any]) -> EditScript:
+        assert _COMPACT_KEYS["edits"] in dict_
+        edits = [Edit.from_compact_dict(edit_dict) for edit_dict in dict_[_COMPACT_KEYS["edits"]]]
+        return EditScript(edits)
+
+    def to_bytes(self, wire_format: WireFormat) -> bytes:
+        """Encodes this edit script in the given wire format (see facilitate.wire)."""
+        if wire_format.compact:
+            return wire_format.dumps(self.to_compact_dict())
+        return wire_format.dumps(self.to_dict())
+
+    @classmethod
+    def from_bytes(cls, data: bytes, wire_format: WireFormat) -> EditScript:
+        dict_ = wire_format.loads(data)
+        if wire_format.compact:
+            return cls.from_compact_dict(dict_)
+        return cls.from_dict(dict_)
+
     @classmethod
     def load(cls, filename: Path | str) -> EditScript:
         if isinstance(filename, str):
@@ -872,9 +1426,10 @@ class EditScript(t.Iterable[Edit]):
         frames.append(tree.to_dot_pil_image())
 
         # draw state of tree after each edit
+        node_ids = NodeIds(tree)
         for edit in self._edits:
             logger.debug(f"GIF: applying edit: {edit}")
-            edit.apply(tree, no_delete=True)
+            edit.apply(tree, no_delete=True, node_ids=node_ids)
             frames.append(tree.to_dot_pil_image())
 
         # convert frames to GIF
@@ -8,26 +8,25 @@ from pathlib import Path
 
 from overrides import overrides
 
+from facilitate.corpus import Corpus, is_corpus, load_from_locator
 from facilitate.diff import compute_edit_script
-from facilitate.loader import load_from_file
 from facilitate.util import exception_to_crash_description
+from facilitate.verification import VerificationMode, VerificationPolicy
 
 
 @dataclass(frozen=True)
 class DiffCrash:
-    from_program: Path
-    to_program: Path
+    from_program: str
+    to_program: str
     exception: Exception
 
     @classmethod
     def build(
         cls,
-        from_program: Path,
-        to_program: Path,
+        from_program: str,
+        to_program: str,
         exception: Exception,
     ) -> DiffCrash:
-        from_program = from_program.absolute()
-        to_program = to_program.absolute()
         return DiffCrash(
             from_program=from_program,
             to_program=to_program,
@@ -36,8 +35,8 @@ class DiffCrash:
 
     def to_csv_row(self) -> list[str]:
         return [
-            str(self.from_program),
-            str(self.to_program),
+            self.from_program,
+            self.to_program,
             exception_to_crash_description(self.exception),
         ]
 
@@ -49,12 +48,12 @@ class BaseDiffFuzzer(abc.ABC):
     _rng: random.Random
 
     @abc.abstractmethod
-    def generate_pairs(self) -> t.Iterator[tuple[Path, Path]]:
+    def generate_pairs(self) -> t.Iterator[tuple[str, str]]:
         ...
 
     def run(self) -> t.Iterator[DiffCrash]:
         """Runs fuzzer and yields pairs of program paths that failed to diff."""
-        pairs: list[tuple[Path, Path]] = list(self.generate_pairs())
+        pairs: list[tuple[str, str]] = list(self.generate_pairs())
         if self.number:
             pairs = pairs[:self.number]
         print(f"testing {len(pairs)} pairs")
@@ -64,17 +63,22 @@ class BaseDiffFuzzer(abc.ABC):
 
     def _run_one(
         self,
-        from_program_file: Path,
-        to_program_file: Path,
+        from_program_file: str,
+        to_program_file: str,
     ) -> DiffCrash | None:
         """Fuzzes a pair of programs.
 
         Returns a description of the crash, if one occurred.
         """
         try:
-            from_program = load_from_file(from_program_file)
-            to_program = load_from_file(to_program_file)
-            compute_edit_script(from_program, to_program)
+            from_program = load_from_locator(from_program_file)
+            to_program = load_from_locator(to_program_file)
+            # NOTE every diff is verified in full, regardless of the configured policy
+            compute_edit_script(
+                from_program,
+                to_program,
+                verification=VerificationPolicy(mode=VerificationMode.FULL),
+            )
         except Exception as err:  # noqa: BLE001
             return DiffCrash.build(
                 from_program=from_program_file,
@@ -102,8 +106,15 @@ class SuccessiveVersionDiffFuzzer(BaseDiffFuzzer):
         )
 
     @overrides
-    def generate_pairs(self) -> t.Iterator[tuple[Path, Path]]:
+    def generate_pairs(self) -> t.Iterator[tuple[str, str]]:
         """Generates pairs of programs to diff."""
+        if is_corpus(self.program_directory):
+            with Corpus.open(self.program_directory, readonly=True) as corpus:
+                pairs = list(corpus.successive_pairs())
+                for from_program_id, to_program_id in pairs:
+                    yield corpus.locator(from_program_id), corpus.locator(to_program_id)
+            return
+
         level_dirs = [
             child for child in self.program_directory.iterdir() if child.is_dir()
         ]
@@ -122,9 +133,71 @@ class SuccessiveVersionDiffFuzzer(BaseDiffFuzzer):
         for level_dir in level_dir_to_student_dirs:
             student_dirs = level_dir_to_student_dirs[level_dir]
             for student_dir in student_dirs:
-                program_files = list(student_dir.glob("*.json"))
+                program_files = [str(path.absolute()) for path in student_dir.glob("*.json")]
                 for i in range(1, len(program_files)):
                     from_program_file = program_files[i - 1]
                     to_program_file = program_files[i]
                     yield from_program_file, to_program_file
 
+
+
+@dataclass
+class RandomPairDiffFuzzer(BaseDiffFuzzer):
+    @classmethod
+    def build(
+        cls,
+        number: int,
+        program_directory: Path,
+        *,
+        seed: int | None = None,
+    ) -> RandomPairDiffFuzzer:
+        rng = random.Random(seed)  # noqa: S311
+        return RandomPairDiffFuzzer(
+            number=number,
+            program_directory=Path(program_directory),
+            _rng=rng,
+        )
+
+    @overrides
+    def generate_pairs(self) -> t.Iterator[tuple[str, str]]:
+        """Generates random pairs of programs that belong to the same level.
+
+        If no number of pairs is specified, one pair is generated per program.
+        """
+        level_dir_to_program_files: dict[Path, list[str]]
+        if is_corpus(self.program_directory):
+            with Corpus.open(self.program_directory, readonly=True) as corpus:
+                level_dir_to_program_files = {
+                    Path(level_id): [
+                        corpus.locator(id_) for id_ in corpus.program_ids(level_id=level_id)
+                    ]
+                    for level_id in corpus.levels()
+                }
+        else:
+            level_dir_to_program_files = {
+                level_dir: sorted(str(path.absolute()) for path in level_dir.glob("*/*.json"))
+                for level_dir in self.program_directory.iterdir()
+                if level_dir.is_dir()
+            }
+
+        # ignore any level that doesn't have at least two programs
+        level_dir_to_program_files = {
+            level_dir: program_files
+            for level_dir, program_files in level_dir_to_program_files.items()
+            if len(program_files) >= 2  # noqa: PLR2004
+        }
+        if not level_dir_to_program_files:
+            return
+
+        level_dirs = sorted(level_dir_to_program_files)
+        number = self.number
+        if not number:
+            number = sum(len(files) for files in level_dir_to_program_files.values())
+
+        for _ in range(number):
+            level_dir = self._rng.choice(level_dirs)
+            from_program_file, to_program_file = self._rng.sample(
+                level_dir_to_program_files[level_dir],
+                2,
+            )
+            yield from_program_file, to_program_file
@@ -7,18 +7,17 @@ from pathlib import Path
 
 from loguru import logger
 
-from facilitate.loader import load_from_file
+from facilitate.corpus import Corpus, is_corpus, load_from_locator
 from facilitate.util import exception_to_crash_description
 
 
 @dataclass(frozen=True)
 class ParserCrash:
-    program: Path
+    program: str
     exception: Exception
 
     @classmethod
-    def build(cls, program: Path, exception: Exception) -> ParserCrash:
-        program = program.absolute()
+    def build(cls, program: str, exception: Exception) -> ParserCrash:
         return ParserCrash(
             program=program,
             exception=exception,
@@ -26,7 +25,7 @@ class ParserCrash:
 
     def to_csv_row(self) -> list[str]:
         return [
-            str(self.program),
+            self.program,
             exception_to_crash_description(self.exception),
         ]
 
@@ -53,8 +52,16 @@ class ParserFuzzer:
         )
 
     def run(self) -> t.Iterator[ParserCrash]:
-        """Runs fuzzer and yields paths to programs that failed to parse."""
-        program_files = list(self.program_directory.glob("**/*.json"))
+        """Runs fuzzer and yields paths to programs that failed to parse.
+
+        If the program directory is a corpus, locators of the corpus programs are yielded.
+        """
+        program_files: list[str]
+        if is_corpus(self.program_directory):
+            with Corpus.open(self.program_directory, readonly=True) as corpus:
+                program_files = [corpus.locator(id_) for id_ in corpus.program_ids()]
+        else:
+            program_files = [str(path.absolute()) for path in self.program_directory.glob("**/*.json")]
         logger.debug(f"found {len(program_files)} programs to parse")
         self._rng.shuffle(program_files)
         if self.number:
@@ -66,13 +73,13 @@ class ParserFuzzer:
             if maybe_crash:
                 yield maybe_crash
 
-    def _run_one(self, program_file: Path) -> ParserCrash | None:
+    def _run_one(self, program_file: str) -> ParserCrash | None:
         """Fuzzes a single program.
 
         Returns a description of the crash, if one occurred.
         """
         try:
-            load_from_file(program_file)
+            load_from_locator(program_file)
         except Exception as err:  # noqa: BLE001
             return ParserCrash.build(
                 program=program_file,
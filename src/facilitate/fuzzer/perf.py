@@ -0,0 +1,352 @@
+"""Hunts for program pairs that are pathologically slow to diff."""
+from __future__ import annotations
+
+import copy
+import json
+import math
+import time
+import typing as t
+from dataclasses import dataclass
+
+from loguru import logger
+
+from facilitate.corpus import read_block_descriptions
+from facilitate.diff import compute_edit_script
+from facilitate.loader import load_program_from_block_descriptions
+
+if t.TYPE_CHECKING:
+    from pathlib import Path
+
+    from facilitate.fuzzer.diff import BaseDiffFuzzer
+
+_BlockDescriptions = dict[str, dict[str, t.Any]]
+
+# identifies a block within one of the two programs of a pair
+_PairElement = tuple[int, str]
+
+
+def _restrict_block_descriptions(
+    block_descriptions: _BlockDescriptions,
+    keep_ids: set[str],
+) -> _BlockDescriptions:
+    """Removes all blocks except those with the given IDs.
+
+    References to removed blocks (via "next", "parent", and "inputs") are cleared
+    so that the remaining blocks still form a loadable program.
+    """
+    restricted: _BlockDescriptions = {}
+    for id_, description in block_descriptions.items():
+        if id_ not in keep_ids:
+            continue
+
+        description = copy.deepcopy(description)  # noqa: PLW2901
+        if description.get("next") not in keep_ids:
+            description["next"] = None
+        if description.get("parent") not in keep_ids:
+            description["parent"] = None
+            description["topLevel"] = True
+
+        for input_values in description.get("inputs", {}).values():
+            for index in range(1, len(input_values)):
+                value = input_values[index]
+                if isinstance(value, str) and value not in keep_ids:
+                    input_values[index] = None
+
+        restricted[id_] = description
+    return restricted
+
+
+def _ddmin(
+    elements: list[_PairElement],
+    is_interesting: t.Callable[[list[_PairElement]], bool],
+) -> list[_PairElement]:
+    """Reduces a list of elements to a 1-minimal list that remains interesting."""
+    granularity = 2
+    while len(elements) >= 2:  # noqa: PLR2004
+        chunk_size = math.ceil(len(elements) / granularity)
+        chunks = [
+            elements[start:start + chunk_size]
+            for start in range(0, len(elements), chunk_size)
+        ]
+
+        reduced = False
+        for chunk in chunks:
+            if is_interesting(chunk):
+                elements = chunk
+                granularity = 2
+                reduced = True
+                break
+
+        if not reduced:
+            for index in range(len(chunks)):
+                complement = [
+                    element
+                    for other_index, chunk in enumerate(chunks)
+                    if other_index != index
+                    for element in chunk
+                ]
+                if is_interesting(complement):
+                    elements = complement
+                    granularity = max(granularity - 1, 2)
+                    reduced = True
+                    break
+
+        if not reduced:
+            if granularity >= len(elements):
+                break
+            granularity = min(granularity * 2, len(elements))
+
+    return elements
+
+
+@dataclass(frozen=True)
+class DiffTiming:
+    from_program: str
+    to_program: str
+    num_nodes: int
+    seconds: float
+
+    def to_csv_row(self) -> list[str]:
+        return [
+            self.from_program,
+            self.to_program,
+            str(self.num_nodes),
+            f"{self.seconds:.6f}",
+        ]
+
+
+@dataclass(frozen=True)
+class ScalingModel:
+    """Models diff runtime as a power law of the number of nodes in a pair.
+
+    seconds = coefficient * num_nodes ** exponent
+    """
+    coefficient: float
+    exponent: float
+
+    @classmethod
+    def fit(cls, timings: t.Iterable[DiffTiming]) -> ScalingModel | None:
+        """Fits a power law to the given timings via least squares in log-log space.
+
+        Returns None if there are too few distinct data points to fit a curve.
+        """
+        points = [
+            (math.log(timing.num_nodes), math.log(timing.seconds))
+            for timing in timings
+            if timing.num_nodes > 0 and timing.seconds > 0
+        ]
+        if len({x for x, _ in points}) < 2:  # noqa: PLR2004
+            return None
+
+        mean_x = sum(x for x, _ in points) / len(points)
+        mean_y = sum(y for _, y in points) / len(points)
+        covariance = sum((x - mean_x) * (y - mean_y) for x, y in points)
+        variance = sum((x - mean_x) ** 2 for x, _ in points)
+
+        exponent = covariance / variance
+        coefficient = math.exp(mean_y - exponent * mean_x)
+        return cls(coefficient=coefficient, exponent=exponent)
+
+    def predict(self, num_nodes: int) -> float:
+        """Predicts the number of seconds taken to diff a pair of the given size."""
+        return float(self.coefficient * max(num_nodes, 1) ** self.exponent)
+
+
+@dataclass(frozen=True)
+class SlowDiff:
+    timing: DiffTiming
+    predicted_seconds: float | None
+    reason: str
+    reproducer: Path | None
+
+    def to_csv_row(self) -> list[str]:
+        predicted = "" if self.predicted_seconds is None else f"{self.predicted_seconds:.6f}"
+        reproducer = "" if self.reproducer is None else str(self.reproducer.absolute())
+        return [
+            *self.timing.to_csv_row(),
+            predicted,
+            self.reason,
+            reproducer,
+        ]
+
+
+@dataclass
+class PerfFuzzer:
+    """Times the diffing of program pairs and flags those that are unexpectedly slow.
+
+    A pair is slow if it exceeds an absolute time budget or if it takes more than
+    outlier_factor times as long as predicted by a scaling curve fitted to all pairs.
+    Each slow pair may then be delta-minimized into a small reproducer.
+    """
+    pair_fuzzer: BaseDiffFuzzer
+    budget: float | None
+    outlier_factor: float
+    min_seconds: float
+    repeats: int
+    reproducer_directory: Path | None
+    timings: list[DiffTiming]
+    model: ScalingModel | None = None
+
+    @classmethod
+    def build(
+        cls,
+        pair_fuzzer: BaseDiffFuzzer,
+        *,
+        budget: float | None = None,
+        outlier_factor: float = 10.0,
+        min_seconds: float = 0.01,
+        repeats: int = 1,
+        reproducer_directory: Path | None = None,
+    ) -> PerfFuzzer:
+        return PerfFuzzer(
+            pair_fuzzer=pair_fuzzer,
+            budget=budget,
+            outlier_factor=outlier_factor,
+            min_seconds=min_seconds,
+            repeats=max(repeats, 1),
+            reproducer_directory=reproducer_directory,
+            timings=[],
+        )
+
+    def run(self) -> t.Iterator[SlowDiff]:
+        """Runs fuzzer and yields each pair of programs that was slow to diff."""
+        pairs = list(self.pair_fuzzer.generate_pairs())
+        if self.pair_fuzzer.number:
+            pairs = pairs[:self.pair_fuzzer.number]
+        print(f"timing {len(pairs)} pairs")
+
+        for from_program_file, to_program_file in pairs:
+            if timing := self._time_pair(from_program_file, to_program_file):
+                self.timings.append(timing)
+
+        self.model = ScalingModel.fit(self.timings)
+        if self.model:
+            logger.info(
+                "fitted scaling curve: seconds = {:.3g} * nodes ^ {:.2f}",
+                self.model.coefficient,
+                self.model.exponent,
+            )
+
+        for timing in self.timings:
+            reason = self._slow_reason(timing.num_nodes, timing.seconds)
+            if not reason:
+                continue
+
+            reproducer: Path | None = None
+            if self.reproducer_directory is not None:
+                reproducer = self._minimize(timing, self.reproducer_directory)
+
+            yield SlowDiff(
+                timing=timing,
+                predicted_seconds=self.model.predict(timing.num_nodes) if self.model else None,
+                reason=reason,
+                reproducer=reproducer,
+            )
+
+    def _slow_reason(self, num_nodes: int, seconds: float) -> str | None:
+        """Determines why a diff of the given size and duration is slow, if it is."""
+        if self.budget is not None and seconds > self.budget:
+            return "budget"
+        if seconds < self.min_seconds or self.model is None:
+            return None
+        if seconds > self.outlier_factor * self.model.predict(num_nodes):
+            return "outlier"
+        return None
+
+    def _time_block_descriptions(
+        self,
+        from_descriptions: _BlockDescriptions,
+        to_descriptions: _BlockDescriptions,
+    ) -> tuple[int, float] | None:
+        """Measures the fastest of several diffs of a pair of programs.
+
+        Returns the number of nodes in the pair and the measured time in seconds,
+        or None if the programs could not be parsed or diffed.
+        """
+        try:
+            from_program = load_program_from_block_descriptions(copy.deepcopy(from_descriptions))
+            to_program = load_program_from_block_descriptions(copy.deepcopy(to_descriptions))
+            num_nodes = from_program.size() + to_program.size()
+
+            seconds = math.inf
+            for _ in range(self.repeats):
+                started_at = time.perf_counter()
+                compute_edit_script(from_program, to_program)
+                seconds = min(seconds, time.perf_counter() - started_at)
+        except Exception:  # noqa: BLE001
+            return None
+        return num_nodes, seconds
+
+    def _time_pair(
+        self,
+        from_program_file: str,
+        to_program_file: str,
+    ) -> DiffTiming | None:
+        try:
+            from_descriptions = read_block_descriptions(from_program_file)
+            to_descriptions = read_block_descriptions(to_program_file)
+        except (OSError, ValueError):
+            logger.debug(f"skipping pair: failed to read {from_program_file} or {to_program_file}")
+            return None
+
+        measurement = self._time_block_descriptions(from_descriptions, to_descriptions)
+        if measurement is None:
+            logger.debug(f"skipping pair: failed to diff {from_program_file} and {to_program_file}")
+            return None
+
+        num_nodes, seconds = measurement
+        return DiffTiming(
+            from_program=from_program_file,
+            to_program=to_program_file,
+            num_nodes=num_nodes,
+            seconds=seconds,
+        )
+
+    def _minimize(self, timing: DiffTiming, output_to: Path) -> Path:
+        """Delta-minimizes a slow pair and writes the reproducer to a new directory.
+
+        The blocks of both programs are minimized jointly: a candidate pair remains
+        interesting for as long as diffing it is still considered slow.
+        """
+        descriptions = (
+            read_block_descriptions(timing.from_program),
+            read_block_descriptions(timing.to_program),
+        )
+        elements: list[_PairElement] = [
+            (side, id_)
+            for side, side_descriptions in enumerate(descriptions)
+            for id_ in side_descriptions
+        ]
+
+        def restrict(candidate: list[_PairElement]) -> tuple[_BlockDescriptions, _BlockDescriptions]:
+            keep_ids: tuple[set[str], set[str]] = (set(), set())
+            for side, id_ in candidate:
+                keep_ids[side].add(id_)
+            return (
+                _restrict_block_descriptions(descriptions[0], keep_ids[0]),
+                _restrict_block_descriptions(descriptions[1], keep_ids[1]),
+            )
+
+        def is_interesting(candidate: list[_PairElement]) -> bool:
+            measurement = self._time_block_descriptions(*restrict(candidate))
+            if measurement is None:
+                return False
+            return self._slow_reason(*measurement) is not None
+
+        logger.info(f"minimizing slow pair with {len(elements)} blocks: {timing.from_program}")
+        minimized = _ddmin(elements, is_interesting)
+        logger.info(f"minimized slow pair to {len(minimized)} blocks")
+
+        output_to.mkdir(parents=True, exist_ok=True)
+        reproducer_directory = output_to / str(sum(1 for _ in output_to.iterdir()))
+        reproducer_directory.mkdir()
+
+        minimized_from, minimized_to = restrict(minimized)
+        for filename, minimized_descriptions in (
+            ("before.json", minimized_from),
+            ("after.json", minimized_to),
+        ):
+            with (reproducer_directory / filename).open("w") as file:
+                json.dump(minimized_descriptions, file, indent=2)
+
+        return reproducer_directory
@@ -8,10 +8,12 @@ from itertools import product
 
 from loguru import logger
 
+from facilitate.deadline import check_deadline
 from facilitate.mappings import NodeMappings
 from facilitate.model.block import Block
 from facilitate.model.field import Field
 from facilitate.model.input import Input
+from facilitate.model.literal import Literal
 from facilitate.model.program import Program
 from facilitate.model.sequence import Sequence
 
@@ -106,25 +108,72 @@ def dice(
     return score
 
 
+def _find_uniform_subtrees(
+    root: Node,
+    predicate: t.Callable[[Node], bool],
+) -> set[Node]:
+    """Finds all nodes that satisfy a given predicate together with each of their descendants."""
+    uniform: set[Node] = set()
+    for node in root.postorder():
+        if predicate(node) and all(child in uniform for child in node.children()):
+            uniform.add(node)
+    return uniform
+
+
+@dataclass
+class _TopDownSide:
+    """Tracks the subtrees of one of the two trees that remain to be matched top-down.
+
+    Subtrees that are entirely mapped (settled) are skipped, whereas only subtrees
+    that are entirely unmapped (untouched) are considered for matching.
+    """
+    hlist: HeightIndexedPriorityList
+    settled: set[Node]
+    untouched: set[Node]
+    unmapped: list[Node]
+
+    @classmethod
+    def build(cls, root: Node, is_mapped: t.Callable[[Node], bool]) -> _TopDownSide:
+        settled = _find_uniform_subtrees(root, is_mapped)
+        hlist = HeightIndexedPriorityList()
+        if root not in settled:
+            hlist.push(root)
+        return _TopDownSide(
+            hlist=hlist,
+            settled=settled,
+            untouched=_find_uniform_subtrees(root, lambda node: not is_mapped(node)),
+            unmapped=[node for node in root.nodes() if not is_mapped(node)],
+        )
+
+    def expand(self, node: Node) -> None:
+        """Queues the children of a given node, except for those that are settled."""
+        for child in node.children():
+            if child not in self.settled:
+                self.hlist.push(child)
+
+
 def compute_topdown_mappings(
     root_x: Node,
     root_y: Node,
     *,
     min_height: int = 1,
+    seed: NodeMappings | None = None,
 ) -> NodeMappings:
-    mappings = NodeMappings()
-    candidates: list[tuple[Node, Node]] = []
-
-    hlist_x = HeightIndexedPriorityList()
-    hlist_x.push(root_x)
+    """Greedily maps the largest isomorphic subtrees between two trees.
 
-    hlist_y = HeightIndexedPriorityList()
-    hlist_y.push(root_y)
+    If seed mappings are given, they are kept, and matching is restricted to the
+    regions of the trees that they leave unmapped: subtrees that are entirely
+    mapped are skipped, and only subtrees that are entirely unmapped are matched.
+    """
+    mappings = seed.copy() if seed else NodeMappings()
+    candidates: list[tuple[Node, Node]] = []
 
-    nodes_x = list(root_x.nodes())
-    nodes_y = list(root_y.nodes())
+    side_x = _TopDownSide.build(root_x, mappings.source_is_mapped)
+    side_y = _TopDownSide.build(root_y, mappings.destination_is_mapped)
+    hlist_x, hlist_y = side_x.hlist, side_y.hlist
 
     while True:
+        check_deadline()
         min_max_height = min(hlist_x.max_height, hlist_y.max_height)
         if min_max_height < min_height:
             break
@@ -132,10 +181,10 @@ def compute_topdown_mappings(
 
         if hlist_x.max_height > hlist_y.max_height:
             for node in hlist_x.pop():
-                hlist_x.add_children(node)
+                side_x.expand(node)
         elif hlist_x.max_height < hlist_y.max_height:
             for node in hlist_y.pop():
-                hlist_y.add_children(node)
+                side_y.expand(node)
         else:
             max_height_nodes_x = hlist_x.pop()
             max_height_nodes_y = hlist_y.pop()
@@ -151,13 +200,16 @@ def compute_topdown_mappings(
             added_trees_y: list[Node] = []
 
             for node_x, node_y in product(max_height_nodes_x, max_height_nodes_y):
+                check_deadline()
+                if node_x not in side_x.untouched or node_y not in side_y.untouched:
+                    continue
                 if node_x.equivalent_to(node_y):
                     logger.debug(f"equivalent: {node_x.id_} vs. {node_y.id_}")
 
                     # FIXME these queries can be cached
                     # is there more than one possible match for either node?
-                    match_x = any(node.equivalent_to(node_y) and node != node_x for node in nodes_x)
-                    match_y = any(node.equivalent_to(node_x) and node != node_y for node in nodes_y)
+                    match_x = any(node.equivalent_to(node_y) and node != node_x for node in side_x.unmapped)
+                    match_y = any(node.equivalent_to(node_x) and node != node_y for node in side_y.unmapped)
 
                     if match_x or match_y:
                         logger.debug(f"candidate match: {node_x.id_} vs. {node_y.id_}")
@@ -171,19 +223,25 @@ def compute_topdown_mappings(
 
             for node in max_height_nodes_x:
                 if node not in added_trees_x:
-                    hlist_x.add_children(node)
+                    side_x.expand(node)
 
             for node in max_height_nodes_y:
                 if node not in added_trees_y:
-                    hlist_y.add_children(node)
+                    side_y.expand(node)
+
+    _map_candidates(candidates, mappings)
+    return mappings
+
 
+def _map_candidates(candidates: list[tuple[Node, Node]], mappings: NodeMappings) -> None:
+    """Maps candidate subtrees that have more than one possible match in order of their dice scores."""
     def sort_key(map_entry: tuple[Node, Node]) -> float:
         node_x, node_y = map_entry
         score = dice(node_x, node_y, mappings)
         logger.trace(f"score [{node_x.id_} -> {node_y.id_}]: {score}")
         return score
 
-    candidates.sort(key=sort_key)
+    candidates = sorted(candidates, key=sort_key)
 
     logger.debug(
         "sorted candidates:\n{}",
@@ -199,8 +257,6 @@ def compute_topdown_mappings(
             if from_x != node_x and to_y != node_y
         ]
 
-    return mappings
-
 
 def compute_bottom_up_mappings(
     root_x: Node,
@@ -212,6 +268,7 @@ def compute_bottom_up_mappings(
     # to find the container mappings, the nodes of T1 are processed in postorder
     # for each unmatched non-leaf node of T1, we extract a list of candidate nodes from T2
     def visit(node: Node) -> None:
+        check_deadline()
         if mappings.source_is_mapped(node):
             return
 
@@ -249,27 +306,134 @@ def compute_bottom_up_mappings(
     return mappings
 
 
+def map_equivalent_trees(root_x: Node, root_y: Node) -> NodeMappings:
+    """Maps each node of a tree to its counterpart within an equivalent tree.
+
+    Equivalent trees (see Node.equivalent_to) share the same shape, and their
+    children are ordered in the same way, so nodes are simply related by position.
+    """
+    assert root_x.equivalent_to(root_y)
+    mappings = NodeMappings()
+    for node_x, node_y in zip(root_x.nodes(), root_y.nodes(), strict=True):
+        mappings.add(node_x, node_y)
+    return mappings
+
+
+def compute_anchored_mappings(
+    root_x: Node,
+    root_y: Node,
+    *,
+    seed: NodeMappings | None = None,
+) -> NodeMappings:
+    """Maps nodes whose IDs are stable across versions of a program before GumTree is used.
+
+    Blocks with identical IDs and opcodes are mapped to one another. The fields and
+    inputs of each mapped block are mapped to those of its partner by name, as are
+    the literals of those inputs. Sequences that share an ID (which is derived from
+    the ID of their first block) are mapped to one another if the majority of the
+    blocks in each have been mapped to each other; otherwise (e.g., when one
+    sequence has been joined onto another), they are left for GumTree to match.
+
+    Any seed mappings are kept, and only nodes that they leave unmapped are anchored.
+    """
+    mappings = seed.copy() if seed else NodeMappings()
+
+    def anchor(node_x: Node, node_y: Node) -> bool:
+        if mappings.source_is_mapped(node_x) or mappings.destination_is_mapped(node_y):
+            return False
+        mappings.add(node_x, node_y)
+        return True
+
+    if isinstance(root_x, Program) and isinstance(root_y, Program):
+        anchor(root_x, root_y)
+
+    id_to_node_y: dict[str, Node] = {
+        node.id_: node for node in root_y.nodes() if isinstance(node, Block | Sequence)
+    }
+    sequence_pairs: list[tuple[Sequence, Sequence]] = []
+
+    for node_x in root_x.nodes():
+        node_y = id_to_node_y.get(node_x.id_)
+        if node_y is None:
+            continue
+
+        if isinstance(node_x, Sequence) and isinstance(node_y, Sequence):
+            sequence_pairs.append((node_x, node_y))
+
+        elif isinstance(node_x, Block) and isinstance(node_y, Block):
+            if node_x.opcode != node_y.opcode or not anchor(node_x, node_y):
+                continue
+            for field_x in node_x.fields:
+                field_y = node_y.find_field(field_x.name)
+                if field_y is not None:
+                    anchor(field_x, field_y)
+            for input_x in node_x.inputs:
+                input_y = node_y.find_input(input_x.name)
+                if input_y is None or not anchor(input_x, input_y):
+                    continue
+                literal_x = input_x.expression
+                literal_y = input_y.expression
+                if isinstance(literal_x, Literal) and isinstance(literal_y, Literal):
+                    anchor(literal_x, literal_y)
+
+    for sequence_x, sequence_y in sequence_pairs:
+        common_blocks = sum(
+            1 for block_x in sequence_x.blocks
+            if (block_y := mappings.source_is_mapped_to(block_x)) is not None
+            and block_y.parent is sequence_y
+        )
+        if 2 * common_blocks > max(len(sequence_x.blocks), len(sequence_y.blocks)):
+            anchor(sequence_x, sequence_y)
+
+    logger.debug(f"anchored {len(mappings)} nodes by ID")
+    return mappings
+
+
 def compute_gumtree_mappings(
     root_x: Node,
     root_y: Node,
     *,
     min_height: int = 1,
     min_dice: float = 0.5,
+    seed: NodeMappings | None = None,
+    anchor_ids: bool = False,
+    check: bool = True,
 ) -> NodeMappings:
-    """Uses the GumTree algorithm to map nodes between two trees."""
-    mappings = compute_topdown_mappings(root_x, root_y, min_height=min_height)
+    """Uses the GumTree algorithm to map nodes between two trees.
+
+    Optionally, matching can start from a given set of (one-to-one) seed mappings,
+    such as those carried over from a similar pair of trees.
+
+    If anchor_ids is set, nodes whose IDs are stable across versions of a program
+    are first mapped by ID (see compute_anchored_mappings), which leaves GumTree to
+    match only the remaining nodes. This is much cheaper when both trees are derived
+    from the same program (e.g., snapshots of a student's attempt at a level, or a
+    solution built from the same starter project).
+
+    Unless check is unset, the mappings are sanity checked after each stage (see
+    NodeMappings.check); the diff instead checks them according to its
+    verification policy (see facilitate.verification).
+    """
+    if anchor_ids:
+        if root_x.equivalent_to(root_y):
+            return map_equivalent_trees(root_x, root_y)
+        seed = compute_anchored_mappings(root_x, root_y, seed=seed)
+
+    mappings = compute_topdown_mappings(root_x, root_y, min_height=min_height, seed=seed)
     logger.trace(
         "sanity checking top-down mappings:\n{}",
         "\n".join(f"* {node_from.id_} -> {node_to.id_}" for (node_from, node_to) in mappings),
     )
-    mappings.check()
+    if check:
+        mappings.check()
 
     mappings = compute_bottom_up_mappings(root_x, root_y, mappings, min_dice=min_dice)
     logger.trace(
         "sanity checking complete mappings:\n{}",
         "\n".join(f"* {node_from.id_} -> {node_to.id_}" for (node_from, node_to) in mappings),
     )
-    mappings.check()
+    if check:
+        mappings.check()
 
     # ensure root is mapped
     mappings.add(root_x, root_y)
@@ -277,19 +441,17 @@ def compute_gumtree_mappings(
     # try to map top-level sequences
     # - if two top-level sequences share the same ID, they are mapped (if not already mapped)
     if isinstance(root_x, Program) and isinstance(root_y, Program):
+        id_to_top_level_y = {top_level_y.id_: top_level_y for top_level_y in root_y.top_level_nodes}
         for top_level_x in root_x.top_level_nodes:
             assert isinstance(top_level_x, Sequence)
             if mappings.source_is_mapped(top_level_x):
-                    continue
-
-            for top_level_y in root_y.top_level_nodes:
-                assert isinstance(top_level_y, Sequence)
-                if mappings.destination_is_mapped(top_level_y):
-                    continue
+                continue
 
-                if top_level_x.id_ == top_level_y.id_:
-                    mappings.add(top_level_x, top_level_y)
+            top_level_y = id_to_top_level_y.get(top_level_x.id_)
+            if top_level_y is not None and not mappings.destination_is_mapped(top_level_y):
+                mappings.add(top_level_x, top_level_y)
 
-    mappings.check()
+    if check:
+        mappings.check()
 
     return mappings
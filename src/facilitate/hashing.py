@@ -0,0 +1,80 @@
+"""Computes hashes that identify the structure of (sub)trees.
+
+Two subtrees have the same structural hash if and only if (barring collisions) they
+are equivalent to one another (see Node.equivalent_to); node IDs are ignored.
+"""
+from __future__ import annotations
+
+__all__ = (
+    "content_hash",
+    "structural_hash",
+    "structural_hashes",
+    "surface_label",
+)
+
+import hashlib
+import json
+import typing as t
+
+from facilitate.model.block import Block
+from facilitate.model.field import Field
+from facilitate.model.input import Input
+from facilitate.model.literal import Literal
+from facilitate.model.program import Program
+from facilitate.model.sequence import Sequence
+
+if t.TYPE_CHECKING:
+    from facilitate.model.node import Node
+
+_DIGEST_SIZE = 16
+
+
+def surface_label(node: Node) -> bytes:
+    """Describes the surface-level attributes of a node that determine its equivalence."""
+    match node:
+        case Block():
+            return f"block\0{node.opcode}".encode()
+        case Field():
+            value = node.value if isinstance(node.value, str) else json.dumps(node.value)
+            return f"field\0{node.name}\0{value}".encode()
+        case Input():
+            return f"input\0{node.name}".encode()
+        case Literal():
+            return f"literal\0{node.value}".encode()
+        case Sequence():
+            return b"sequence"
+        case Program():
+            return b"program"
+    error = f"cannot hash node of type {node.__class__.__name__}"
+    raise TypeError(error)
+
+
+def structural_hashes(root: Node) -> dict[Node, bytes]:
+    """Computes the structural hash of every subtree within the tree rooted at a given node."""
+    hashes: dict[Node, bytes] = {}
+    for node in root.postorder():
+        hasher = hashlib.blake2b(surface_label(node), digest_size=_DIGEST_SIZE)
+        for child in node.children():
+            hasher.update(hashes[child])
+        hashes[node] = hasher.digest()
+    return hashes
+
+
+def structural_hash(root: Node) -> str:
+    """Computes the structural hash of the tree rooted at a given node, as a hex string."""
+    return structural_hashes(root)[root].hex()
+
+
+def content_hash(root: Node) -> bytes:
+    """Computes a hash of the contents of the tree rooted at a given node, including its node IDs.
+
+    Unlike structural hashes, content hashes distinguish trees whose nodes have
+    different IDs, to which edit scripts refer.
+    """
+    hasher = hashlib.blake2b(digest_size=_DIGEST_SIZE)
+    for node in root.nodes():
+        hasher.update(surface_label(node))
+        hasher.update(b"\0")
+        hasher.update(node.id_.encode())
+        hasher.update(f"\0{sum(1 for _ in node.children())}\0".encode())
+    return hasher.digest()
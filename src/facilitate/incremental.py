@@ -0,0 +1,152 @@
+"""Computes edit scripts incrementally, reusing the mappings of an earlier diff.
+
+When a program changes slightly (e.g., after a single edit by a student), most of
+the mappings between its previous version and some other program remain valid.
+The mappings of nodes that are unchanged (according to their ID and structural
+hash) are carried over to the new version, and GumTree matching is only re-run
+over the regions of the program that have changed.
+"""
+from __future__ import annotations
+
+__all__ = (
+    "carry_over_mappings",
+    "compute_edit_script_incremental",
+)
+
+import typing as t
+
+from loguru import logger
+
+from facilitate.diff import compute_edit_script_and_mappings
+from facilitate.hashing import structural_hashes
+from facilitate.mappings import NodeMappings
+from facilitate.model.block import Block
+from facilitate.model.program import Program
+from facilitate.model.sequence import Sequence
+
+if t.TYPE_CHECKING:
+    from facilitate.edit import EditScript
+    from facilitate.model.node import Node
+
+
+def _has_stable_id(node: Node) -> bool:
+    """Determines whether a node keeps the same ID across separately loaded versions of a program."""
+    return isinstance(node, Block | Sequence | Program)
+
+
+def carry_over_mappings(
+    previous_from: Node,
+    previous_mappings: NodeMappings,
+    new_from: Node,
+    tree_to: Node,
+    *,
+    previous_hashes: dict[Node, bytes] | None = None,
+    new_hashes: dict[Node, bytes] | None = None,
+    to_hashes: dict[Node, bytes] | None = None,
+) -> NodeMappings:
+    """Carries the mappings from a previous version of a tree over to its new version.
+
+    Nodes are related across versions by their ID. Unchanged subtrees (i.e., those
+    with the same structural hash) inherit the mappings of all their descendants by
+    position, whereas changed nodes only inherit their own mapping.
+
+    Subtrees that have an identical counterpart within tree_to are left to be
+    matched afresh, unless they were already mapped to an identical subtree, so
+    that an outdated mapping never prevents an exact match (e.g., once the new
+    version becomes identical to tree_to).
+
+    Structural hashes (see facilitate.hashing) may be given for any of the trees
+    to avoid recomputing them.
+    """
+    if previous_hashes is None:
+        previous_hashes = structural_hashes(previous_from)
+    if new_hashes is None:
+        new_hashes = structural_hashes(new_from)
+    if to_hashes is None:
+        to_hashes = structural_hashes(tree_to)
+    to_hash_values = set(to_hashes.values())
+
+    previous_by_id = {
+        node.id_: node for node in previous_from.nodes() if _has_stable_id(node)
+    }
+    seed = NodeMappings()
+
+    def inherit(node: Node, previous: Node) -> None:
+        destination = previous_mappings.source_is_mapped_to(previous)
+        if destination is not None and not seed.destination_is_mapped(destination):
+            seed.add(node, destination)
+
+    stack: list[Node] = [new_from]
+    while stack:
+        node = stack.pop()
+        previous = previous_by_id.get(node.id_) if _has_stable_id(node) else None
+        if new_hashes[node] in to_hash_values:
+            destination = (
+                previous_mappings.source_is_mapped_to(previous) if previous is not None else None
+            )
+            if destination is None or to_hashes[destination] != new_hashes[node]:
+                continue
+        if previous is not None and type(previous) is type(node):
+            if new_hashes[node] == previous_hashes[previous]:
+                for descendant, previous_descendant in zip(
+                    node.nodes(),
+                    previous.nodes(),
+                    strict=True,
+                ):
+                    inherit(descendant, previous_descendant)
+                continue
+            if not isinstance(node, Block) or node.surface_equivalent_to(previous):
+                inherit(node, previous)
+        stack.extend(node.children())
+
+    return seed
+
+
+def compute_edit_script_incremental(
+    previous_from: Node,
+    previous_mappings: NodeMappings,
+    new_from: Node,
+    tree_to: Node,
+    *,
+    previous_hashes: dict[Node, bytes] | None = None,
+    new_hashes: dict[Node, bytes] | None = None,
+    to_hashes: dict[Node, bytes] | None = None,
+) -> tuple[EditScript, NodeMappings]:
+    """Computes an edit script from a new version of a tree to another tree.
+
+    Parameters
+    ----------
+    previous_from
+        the previous version of the tree
+    previous_mappings
+        the mappings from previous_from to tree_to (see compute_edit_script_and_mappings)
+    new_from
+        the new version of the tree
+    tree_to
+        the tree to which the edit script should transform new_from
+    previous_hashes, new_hashes, to_hashes
+        the structural hashes of each tree, if already known
+
+    Returns
+    -------
+    tuple[EditScript, NodeMappings]
+        an edit script from new_from to tree_to, and the mappings that it is based
+        on, which can be passed to the next incremental diff
+    """
+    seed = carry_over_mappings(
+        previous_from,
+        previous_mappings,
+        new_from,
+        tree_to,
+        previous_hashes=previous_hashes,
+        new_hashes=new_hashes,
+        to_hashes=to_hashes,
+    )
+    # NOTE a seed that is inconsistent with the trees yields invalid mappings (TypeError or
+    # ValueError) or an edit script that fails verification (AssertionError); anything else,
+    # including an exceeded deadline, is not caused by the seed and is propagated
+    try:
+        return compute_edit_script_and_mappings(new_from, tree_to, seed=seed)
+    except (AssertionError, TypeError, ValueError) as err:
+        logger.warning(f"seeded diff failed; retrying from scratch: {err}")
+        return compute_edit_script_and_mappings(new_from, tree_to)
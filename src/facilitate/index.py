@@ -0,0 +1,353 @@
+"""Provides an index over the solutions to a level for nearest-solution search.
+
+Finding the solutions nearest to a student program by scoring every solution
+requires one diff per solution. The index instead arranges the solutions within a
+vantage-point tree (VP-tree): each node of the tree holds a vantage solution and
+the median distance from the other solutions within its subtree to that vantage
+solution, which splits them into an inside and an outside subtree. A search diffs
+the program against the vantage solution of a node, and only descends into a
+subtree if it may contain a solution that is nearer than the k nearest found so far.
+
+The VP-tree relies upon the triangle inequality, which the weighted edit distance
+does not strictly satisfy (it is asymmetric, and the edit scripts found by the diff
+are not necessarily minimal), so a search may miss some of the nearest solutions.
+The slack parameter of a search widens its bounds, which trades diffs for recall;
+see benchmark_index, which measures both against an exhaustive search.
+
+Indices are persisted as JSON, with each solution encoded in the binary format
+(see facilitate.binary), so that they can be built once per level.
+"""
+from __future__ import annotations
+
+__all__ = (
+    "IndexBenchmark",
+    "NearestSolutions",
+    "SolutionIndex",
+    "benchmark_index",
+)
+
+import base64
+import heapq
+import itertools
+import json
+import math
+import random
+import statistics
+import time
+import typing as t
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from loguru import logger
+
+from facilitate.binary import dump_program, load_program_from_bytes
+from facilitate.distance import compute_edit_script_and_distance
+from facilitate.loader import LOADER_VERSION
+from facilitate.progress import SolutionDistance
+
+if t.TYPE_CHECKING:
+    from facilitate.edit import EditScript
+    from facilitate.model.program import Program
+
+_INDEX_VERSION = 1
+
+
+def _measure(tree_from: Program, tree_to: Program) -> tuple[EditScript | None, float]:
+    """Computes the edit script and distance between two programs, or an infinite distance if the diff fails."""
+    try:
+        return compute_edit_script_and_distance(tree_from, tree_to)
+    except Exception as err:  # noqa: BLE001
+        logger.warning(f"failed to diff programs; treating them as infinitely distant: {err}")
+        return None, math.inf
+
+
+@dataclass(frozen=True)
+class _VantagePoint:
+    solution: int
+    radius: float
+    inside: _VantagePoint | None = None
+    outside: _VantagePoint | None = None
+
+    def to_json(self) -> list[t.Any]:
+        return [
+            self.solution,
+            self.radius,
+            None if self.inside is None else self.inside.to_json(),
+            None if self.outside is None else self.outside.to_json(),
+        ]
+
+    @classmethod
+    def from_json(cls, json_: list[t.Any] | None) -> _VantagePoint | None:
+        if json_ is None:
+            return None
+        solution, radius, inside, outside = json_
+        return _VantagePoint(
+            solution=solution,
+            radius=radius,
+            inside=cls.from_json(inside),
+            outside=cls.from_json(outside),
+        )
+
+
+@dataclass(frozen=True)
+class NearestSolutions:
+    """The result of a nearest-solution search.
+
+    Attributes
+    ----------
+    solutions
+        the distance to each of the nearest solutions, from nearest to furthest
+    num_diffs
+        the number of diffs that were computed by the search
+    """
+    solutions: list[SolutionDistance]
+    num_diffs: int
+
+
+@dataclass
+class SolutionIndex:
+    """A vantage-point tree over the solutions to a level.
+
+    Attributes
+    ----------
+    solution_ids
+        the ID of each solution
+    solutions
+        the program of each solution
+    """
+    solution_ids: list[t.Any]
+    solutions: list[Program]
+    _root: _VantagePoint | None = field(default=None, repr=False)
+
+    def __len__(self) -> int:
+        return len(self.solutions)
+
+    @classmethod
+    def build(
+        cls,
+        solutions: t.Iterable[tuple[t.Any, Program]],
+        *,
+        distance: t.Callable[[int, int], float] | None = None,
+        seed: int = 0,
+    ) -> SolutionIndex:
+        """Builds an index over the given solutions.
+
+        Parameters
+        ----------
+        solutions
+            the ID and program of each solution
+        distance
+            computes the distance from one solution to another, given their
+            positions; this allows precomputed distances (e.g., a distance matrix)
+            to be used, and defaults to diffing the solutions
+        seed
+            the seed used to choose vantage solutions
+        """
+        solution_ids: list[t.Any] = []
+        programs: list[Program] = []
+        for solution_id, program in solutions:
+            solution_ids.append(solution_id)
+            programs.append(program)
+
+        if distance is None:
+            def distance(i: int, j: int) -> float:
+                _, distance_ = _measure(programs[i], programs[j])
+                return distance_
+
+        rng = random.Random(seed)  # noqa: S311
+
+        def build_subtree(members: list[int]) -> _VantagePoint | None:
+            if not members:
+                return None
+            vantage = members.pop(rng.randrange(len(members)))
+            if not members:
+                return _VantagePoint(solution=vantage, radius=0.0)
+
+            # NOTE distances are measured in the same direction as queries: from each member to the vantage
+            distances = {member: distance(member, vantage) for member in members}
+            finite = [distance_ for distance_ in distances.values() if math.isfinite(distance_)]
+            radius = statistics.median(finite) if finite else math.inf
+            return _VantagePoint(
+                solution=vantage,
+                radius=radius,
+                inside=build_subtree([member for member in members if distances[member] < radius]),
+                outside=build_subtree([member for member in members if distances[member] >= radius]),
+            )
+
+        return SolutionIndex(
+            solution_ids=solution_ids,
+            solutions=programs,
+            _root=build_subtree(list(range(len(programs)))),
+        )
+
+    def nearest(
+        self,
+        program: Program,
+        k: int = 1,
+        *,
+        slack: float = 0.0,
+        include_edits: bool = False,
+    ) -> NearestSolutions:
+        """Finds the (approximately) k nearest solutions to a program.
+
+        Parameters
+        ----------
+        program
+            the program whose nearest solutions should be found
+        k
+            the number of solutions that should be found
+        slack
+            the relative amount by which the bounds of the search are widened: a
+            subtree is searched if it may contain a solution within (1 + slack)
+            times the distance of the k-th nearest solution found so far
+        include_edits
+            whether the edit script to each solution should be included
+        """
+        if k < 1:
+            error = f"k must be positive: {k}"
+            raise ValueError(error)
+
+        # a max-heap (via negated distances) of the nearest solutions found so far
+        nearest: list[tuple[float, int, SolutionDistance]] = []
+        counter = itertools.count()
+        num_diffs = 0
+
+        def bound() -> float:
+            if len(nearest) < k or math.isinf(slack):
+                return math.inf
+            return -nearest[0][0] * (1.0 + slack)
+
+        def search(node: _VantagePoint | None) -> None:
+            nonlocal num_diffs
+            if node is None:
+                return
+            edit_script, distance = _measure(program, self.solutions[node.solution])
+            num_diffs += 1
+            if len(nearest) < k or distance < -nearest[0][0]:
+                solution_distance = SolutionDistance(
+                    solution_id=self.solution_ids[node.solution],
+                    distance=distance,
+                    edit_script=edit_script if include_edits else None,
+                )
+                entry = (-distance, next(counter), solution_distance)
+                if len(nearest) < k:
+                    heapq.heappush(nearest, entry)
+                else:
+                    heapq.heapreplace(nearest, entry)
+
+            # visit the more promising subtree first, since that tightens the bound sooner
+            if distance < node.radius:
+                search(node.inside)
+                if distance + bound() >= node.radius:
+                    search(node.outside)
+            else:
+                search(node.outside)
+                if distance - bound() < node.radius:
+                    search(node.inside)
+
+        search(self._root)
+        solutions = [solution_distance for _, _, solution_distance in sorted(nearest, reverse=True)]
+        return NearestSolutions(solutions=solutions, num_diffs=num_diffs)
+
+    def nearest_exhaustive(self, program: Program, k: int = 1) -> NearestSolutions:
+        """Finds the k nearest solutions to a program by diffing it against every solution."""
+        distances = [
+            SolutionDistance(solution_id=solution_id, distance=_measure(program, solution)[1])
+            for solution_id, solution in zip(self.solution_ids, self.solutions, strict=True)
+        ]
+        return NearestSolutions(
+            solutions=heapq.nsmallest(k, distances, key=lambda solution_distance: solution_distance.distance),
+            num_diffs=len(distances),
+        )
+
+    def save(self, filename: str | Path) -> None:
+        """Saves this index to a file."""
+        with Path(filename).open("w") as file:
+            json.dump({
+                "version": _INDEX_VERSION,
+                "solutions": [
+                    {
+                        "id": solution_id,
+                        "program": base64.b64encode(
+                            dump_program(program, loader_version=LOADER_VERSION),
+                        ).decode("ascii"),
+                    }
+                    for solution_id, program in zip(self.solution_ids, self.solutions, strict=True)
+                ],
+                "tree": None if self._root is None else self._root.to_json(),
+            }, file)
+
+    @classmethod
+    def load(cls, filename: str | Path) -> SolutionIndex:
+        """Loads an index that was saved via save."""
+        with Path(filename).open() as file:
+            json_ = json.load(file)
+        if json_.get("version") != _INDEX_VERSION:
+            error = f"unsupported index version: {json_.get('version')}"
+            raise ValueError(error)
+        return SolutionIndex(
+            solution_ids=[solution["id"] for solution in json_["solutions"]],
+            solutions=[
+                load_program_from_bytes(base64.b64decode(solution["program"]))
+                for solution in json_["solutions"]
+            ],
+            _root=_VantagePoint.from_json(json_["tree"]),
+        )
+
+
+@dataclass
+class IndexBenchmark:
+    """Compares the searches of an index to exhaustive searches.
+
+    Recall is the fraction of the true k nearest solutions that were found by the
+    index, where a solution at the same distance as a true nearest solution counts
+    as a true nearest solution.
+    """
+    k: int
+    solutions: int = 0
+    queries: int = 0
+    recall: float = 0.0
+    index_diffs: int = 0
+    exhaustive_diffs: int = 0
+    index_seconds: float = 0.0
+    exhaustive_seconds: float = 0.0
+
+    def describe(self) -> str:
+        queries = max(self.queries, 1)
+        return (
+            f"recall@{self.k} of {self.recall:.3f} over {self.queries} queries and {self.solutions} solutions; "
+            f"{self.index_diffs / queries:.1f} diffs/query via the index ({self.index_seconds:.1f}s) "
+            f"vs. {self.exhaustive_diffs / queries:.1f} exhaustively ({self.exhaustive_seconds:.1f}s)"
+        )
+
+
+def benchmark_index(
+    index: SolutionIndex,
+    queries: t.Iterable[Program],
+    *,
+    k: int = 1,
+    slack: float = 0.0,
+) -> IndexBenchmark:
+    """Measures the recall and number of diffs of searches of an index against exhaustive searches."""
+    benchmark = IndexBenchmark(k=k, solutions=len(index))
+    num_found = 0
+    num_expected = 0
+    for query in queries:
+        started_at = time.perf_counter()
+        found = index.nearest(query, k, slack=slack)
+        benchmark.index_seconds += time.perf_counter() - started_at
+
+        started_at = time.perf_counter()
+        expected = index.nearest_exhaustive(query, k)
+        benchmark.exhaustive_seconds += time.perf_counter() - started_at
+
+        # NOTE ties are broken arbitrarily, so solutions are compared by their distances
+        threshold = max(solution.distance for solution in expected.solutions)
+        num_found += sum(1 for solution in found.solutions if solution.distance <= threshold)
+        num_expected += len(expected.solutions)
+        benchmark.queries += 1
+        benchmark.index_diffs += found.num_diffs
+        benchmark.exhaustive_diffs += expected.num_diffs
+
+    benchmark.recall = num_found / num_expected if num_expected else 1.0
+    return benchmark
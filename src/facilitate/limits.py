@@ -0,0 +1,92 @@
+"""Provides the hard limits on the requests that the HTTP API admits.
+
+Requests that exceed a limit are rejected with 413 Content Too Large before any
+diff is computed. Limits are configured via environment variables, and a limit
+of zero disables the corresponding check. A default time budget (see
+facilitate.deadline) can also be configured for requests that do not give one.
+"""
+from __future__ import annotations
+
+__all__ = (
+    "ENV_DEFAULT_TIME_BUDGET",
+    "ENV_MAX_PROGRAM_NODES",
+    "ENV_MAX_REQUEST_BYTES",
+    "ENV_MAX_SOLUTIONS",
+    "AdmissionError",
+    "RequestLimits",
+)
+
+import os
+import typing as t
+from dataclasses import dataclass
+
+if t.TYPE_CHECKING:
+    from facilitate.model.node import Node
+
+ENV_MAX_REQUEST_BYTES = "FACILITATE_MAX_REQUEST_BYTES"
+ENV_MAX_PROGRAM_NODES = "FACILITATE_MAX_PROGRAM_NODES"
+ENV_MAX_SOLUTIONS = "FACILITATE_MAX_SOLUTIONS"
+ENV_DEFAULT_TIME_BUDGET = "FACILITATE_DEFAULT_TIME_BUDGET"
+
+_DEFAULT_MAX_REQUEST_BYTES = 32 * 1024 * 1024
+_DEFAULT_MAX_PROGRAM_NODES = 20_000
+_DEFAULT_MAX_SOLUTIONS = 200
+
+
+class AdmissionError(ValueError):
+    """Raised when a request exceeds one of the hard limits on its size."""
+
+
+@dataclass(frozen=True)
+class RequestLimits:
+    """Describes the limits on the requests that are admitted by the HTTP API.
+
+    Attributes
+    ----------
+    max_request_bytes
+        the maximum size of a request body, after decompression
+    max_program_nodes
+        the maximum number of nodes within a single program
+    max_solutions
+        the maximum number of solutions within a single progress request
+    default_time_budget
+        the time budget, in seconds, of requests that do not give one, if any
+    """
+    max_request_bytes: int = _DEFAULT_MAX_REQUEST_BYTES
+    max_program_nodes: int = _DEFAULT_MAX_PROGRAM_NODES
+    max_solutions: int = _DEFAULT_MAX_SOLUTIONS
+    default_time_budget: float | None = None
+
+    @classmethod
+    def build(cls) -> RequestLimits:
+        """Builds the limits that are configured via environment variables."""
+        default_time_budget = os.environ.get(ENV_DEFAULT_TIME_BUDGET)
+        return RequestLimits(
+            max_request_bytes=int(os.environ.get(ENV_MAX_REQUEST_BYTES, _DEFAULT_MAX_REQUEST_BYTES)),
+            max_program_nodes=int(os.environ.get(ENV_MAX_PROGRAM_NODES, _DEFAULT_MAX_PROGRAM_NODES)),
+            max_solutions=int(os.environ.get(ENV_MAX_SOLUTIONS, _DEFAULT_MAX_SOLUTIONS)),
+            default_time_budget=float(default_time_budget) if default_time_budget else None,
+        )
+
+    def check_request_size(self, num_bytes: int) -> None:
+        if self.max_request_bytes and num_bytes > self.max_request_bytes:
+            error = f"request body exceeds {self.max_request_bytes} bytes"
+            raise AdmissionError(error)
+
+    def check_program(self, program: Node) -> None:
+        if not self.max_program_nodes:
+            return
+        num_nodes = sum(1 for _ in program.nodes())
+        if num_nodes > self.max_program_nodes:
+            error = f"program has {num_nodes} nodes, exceeding the limit of {self.max_program_nodes}"
+            raise AdmissionError(error)
+
+    def check_solutions(self, num_solutions: int) -> None:
+        if self.max_solutions and num_solutions > self.max_solutions:
+            error = f"request has {num_solutions} solutions, exceeding the limit of {self.max_solutions}"
+            raise AdmissionError(error)
+
+    def time_budget(self, *budgets: float | None) -> float | None:
+        """Returns the tightest of the given time budgets, or the default if none is given."""
+        given = [budget for budget in budgets if budget is not None]
+        return min(given) if given else self.default_time_budget
@@ -1,13 +1,16 @@
 from __future__ import annotations
 
+import io
 import itertools
 import json
 import typing as t
 from pathlib import Path
 
+import ijson
 import networkx as nx
 from loguru import logger
 
+from facilitate.cache import ProgramCache
 from facilitate.model.block import Block
 from facilitate.model.field import Field
 from facilitate.model.input import Input
@@ -20,8 +23,16 @@ if t.TYPE_CHECKING:
 
 _NodeDescription = dict[str, t.Any]
 
+# must be incremented whenever a change to the loader alters the trees that it produces
+LOADER_VERSION = 2
+
 _INPUT_VALUE_ARRAY_LENGTH = 2
 
+# projects smaller than this (in bytes) are decoded in full, which is faster than streaming them
+_PROJECT_STREAMING_THRESHOLD = 32 * 1024
+# the parser decodes each chunk of a streamed project in full, so small chunks let it stop sooner
+_PROJECT_STREAMING_CHUNK_SIZE = 16 * 1024
+
 
 def _toposort(
     id_to_node_description: dict[str, _NodeDescription],
@@ -173,6 +184,7 @@ def _fix_input_block_references(
 
 
 def _build_input(
+    block_id: str,
     name: str,
     value_array: list[t.Any],
     id_to_node: dict[str, Node],
@@ -180,13 +192,15 @@ def _build_input(
     assert len(value_array) == _INPUT_VALUE_ARRAY_LENGTH
     assert isinstance(value_array[0], int)
 
+    # NOTE IDs are derived from the path to each node, so that loading a program is deterministic
+    id_ = Input.determine_id(block_id, name)
     expression: Node
     if isinstance(value_array[1], str):
         expression = id_to_node[value_array[1]]
     elif isinstance(value_array[1], list):
         assert len(value_array[1]) == _INPUT_VALUE_ARRAY_LENGTH
         literal_value = value_array[1][1]
-        expression = Literal.create(literal_value)
+        expression = Literal.create(literal_value, id_=Literal.determine_id(id_))
     elif value_array[1] is None:
         logger.trace(f"input {name} has no expression")
         return None
@@ -194,7 +208,7 @@ def _build_input(
         error = f"invalid input value: {value_array[1]}"
         raise TypeError(error)
 
-    return Input.create(name, expression)
+    return Input.create(name, expression, id_=id_)
 
 
 def _build_program_from_node_descriptions(
@@ -212,6 +226,7 @@ def _build_program_from_node_descriptions(
             inputs: list[Input] = []
             for input_name, input_value_arr in description["inputs"].items():
                 if input_ := _build_input(
+                    block_id=id_,
                     name=input_name,
                     value_array=input_value_arr,
                     id_to_node=id_to_node,
@@ -222,6 +237,7 @@ def _build_program_from_node_descriptions(
                 Field.create(
                     name=name,
                     value=value_arr[0],
+                    id_=Field.determine_id(id_, name),
                 )
                 for name, value_arr in description["fields"].items()
             ]
@@ -327,9 +343,76 @@ def load_program_from_block_descriptions(
     return _build_program_from_node_descriptions(id_to_node_description)
 
 
-def load_from_file(filename_or_path: str | Path) -> Program:
-    """Loads a Facilitate program from a file."""
+def load_blocks_from_project(
+    project: str | bytes | t.BinaryIO,
+    *,
+    target: int = 0,
+) -> dict[str, _NodeDescription]:
+    """Reads the block descriptions of a single target within a JSON-encoded Scratch project.
+
+    The project is stream-parsed, so that only the blocks of the given target are
+    decoded into Python objects; everything else (e.g., the costumes and sounds of
+    each target, monitors and extensions) is merely scanned. Parsing stops as soon
+    as the blocks have been read, and since Scratch serializes the blocks of each
+    target before its assets, the remainder of the project is never even scanned.
+    """
+    if isinstance(project, str | bytes) and len(project) < _PROJECT_STREAMING_THRESHOLD:
+        try:
+            return t.cast("dict[str, _NodeDescription]", json.loads(project)["targets"][target]["blocks"])
+        except IndexError as err:
+            error = f"project has no target {target}"
+            raise ValueError(error) from err
+
+    if isinstance(project, str):
+        project = project.encode()
+    if isinstance(project, bytes):
+        project = io.BytesIO(project)
+
+    blocks_of_each_target = ijson.items(
+        project,
+        "targets.item.blocks",
+        use_float=True,
+        buf_size=_PROJECT_STREAMING_CHUNK_SIZE,
+    )
+    blocks = next(itertools.islice(blocks_of_each_target, target, None), None)
+    if blocks is None:
+        error = f"project has no target {target}"
+        raise ValueError(error)
+    return t.cast("dict[str, _NodeDescription]", blocks)
+
+
+def load_from_bytes(
+    contents: bytes,
+    *,
+    cache: ProgramCache | t.Literal[False] | None = None,
+) -> Program:
+    """Loads a Facilitate program from the JSON-encoded description of its blocks.
+
+    Parsed programs can be cached on disk, keyed by the given contents. Unless a
+    cache is given, the default cache is used, which is only enabled if a cache
+    directory has been configured (see facilitate.cache). Caching can be disabled
+    for a single call by passing False as the cache.
+    """
+    if cache is None:
+        cache = ProgramCache.default(LOADER_VERSION) or False
+    if cache and (program := cache.get(contents)):
+        return program
+
+    block_descriptions = json.loads(contents)
+    program = load_program_from_block_descriptions(block_descriptions)
+    if cache:
+        cache.put(contents, program)
+    return program
+
+
+def load_from_file(
+    filename_or_path: str | Path,
+    *,
+    cache: ProgramCache | t.Literal[False] | None = None,
+) -> Program:
+    """Loads a Facilitate program from a file.
+
+    Parsed programs are cached in the same way as load_from_bytes.
+    """
     path = Path(filename_or_path)
-    with path.open() as file:
-        block_descriptions = json.load(file)
-    return load_program_from_block_descriptions(block_descriptions)
+    return load_from_bytes(path.read_bytes(), cache=cache)
@@ -0,0 +1,353 @@
+"""Computes the pairwise distances between all final submissions to a level.
+
+Since the distance is asymmetric, the full matrix is computed: the entry at row i
+and column j is the distance from program i to program j. Programs whose contents
+are identical are only included once. Distances may instead be approximated from
+the pq-gram profiles of the programs (see facilitate.pqgram), which are computed
+once per program by each worker and are far cheaper to compare.
+
+The matrix is computed in chunks of rows by a pool of worker processes, which
+write directly into a memory-mapped NumPy array (requires the matrix extra). The output
+directory contains:
+
+* programs.json, which describes the program (and the users that submitted it)
+  that corresponds to each row and column of the matrix;
+* distances.npy, which holds the matrix itself (NaN marks pairs that failed);
+* done.txt, which records the ranges of rows that have been completed, so that
+  an interrupted computation can be resumed.
+"""
+from __future__ import annotations
+
+__all__ = (
+    "MatrixStats",
+    "compute_distance_matrix",
+    "find_final_submissions",
+)
+
+import importlib.util
+import json
+import math
+import time
+import typing as t
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+
+from loguru import logger
+
+from facilitate.corpus import Corpus, content_hash, is_corpus, load_from_locator
+from facilitate.distance import compute_edit_script_and_distance
+from facilitate.pqgram import PQGramProfile
+
+if t.TYPE_CHECKING:
+    import numpy as np
+
+    from facilitate.distance import DistanceMethod
+    from facilitate.model.program import Program
+
+_PROGRAMS_FILENAME = "programs.json"
+_MATRIX_FILENAME = "distances.npy"
+_DONE_FILENAME = "done.txt"
+
+# the state of each worker process (see _init_worker)
+_worker_programs: list[Program | None] = []
+_worker_profiles: list[PQGramProfile | None] = []
+_worker_matrix: np.memmap | None = None
+
+
+@dataclass(frozen=True)
+class _UniqueProgram:
+    locator: str
+    content_hash: str
+    users: list[str]
+
+    def to_dict(self) -> dict[str, t.Any]:
+        return {
+            "program": self.locator,
+            "content-hash": self.content_hash,
+            "users": self.users,
+        }
+
+
+@dataclass
+class MatrixStats:
+    submissions: int = 0
+    programs: int = 0
+    pairs: int = 0
+    failures: int = 0
+    seconds: float = 0.0
+
+    def describe(self) -> str:
+        seconds = max(self.seconds, 1e-9)
+        return (
+            f"compared {self.pairs} pairs ({self.pairs / seconds:.1f}/s) "
+            f"between {self.programs} unique programs ({self.submissions} submissions) "
+            f"with {self.failures} failures in {self.seconds:.1f}s"
+        )
+
+
+def find_final_submissions(
+    source: str | Path,
+    *,
+    level_id: str | None = None,
+) -> dict[str, tuple[str, bytes]]:
+    """Finds the last program submitted by each user to a level.
+
+    The source is either a level directory of the form user_id/frame.json, or a
+    corpus, in which case the ID of the level must be given.
+    Returns the locator and contents of the final submission of each user.
+    """
+    source = Path(source)
+    if is_corpus(source):
+        if level_id is None:
+            error = "level ID must be given when reading from a corpus"
+            raise ValueError(error)
+        with Corpus.open(source, readonly=True) as corpus:
+            return {
+                record.user_id: (corpus.locator(record.id_), corpus.blocks(record.id_))
+                for record in corpus.final_submissions(level_id)
+            }
+
+    submissions: dict[str, tuple[str, bytes]] = {}
+    for user_directory in sorted(source.iterdir()):
+        if not user_directory.is_dir():
+            continue
+        frames = [path for path in user_directory.glob("*.json") if path.stem.isdigit()]
+        if not frames:
+            continue
+        final_frame = max(frames, key=lambda path: int(path.stem))
+        submissions[user_directory.name] = (str(final_frame), final_frame.read_bytes())
+    return submissions
+
+
+def _deduplicate(submissions: dict[str, tuple[str, bytes]]) -> list[_UniqueProgram]:
+    hash_to_program: dict[str, _UniqueProgram] = {}
+    for user_id, (locator, contents) in submissions.items():
+        hash_ = content_hash(contents)
+        if hash_ in hash_to_program:
+            hash_to_program[hash_].users.append(user_id)
+        else:
+            hash_to_program[hash_] = _UniqueProgram(
+                locator=locator,
+                content_hash=hash_,
+                users=[user_id],
+            )
+    return list(hash_to_program.values())
+
+
+def _require_numpy() -> None:
+    """Raises an ImportError that explains how to install numpy, if it is not installed."""
+    if importlib.util.find_spec("numpy") is None:
+        error = "computing a distance matrix requires numpy: install facilitate with its matrix extra"
+        raise ImportError(error)
+
+
+def _init_worker(locators: list[str], matrix_path: Path, method: DistanceMethod = "gumtree") -> None:
+    import numpy as np  # noqa: PLC0415  # numpy is an optional dependency (see _require_numpy)
+
+    global _worker_matrix  # noqa: PLW0603
+    _worker_programs.clear()
+    _worker_profiles.clear()
+    for locator in locators:
+        try:
+            _worker_programs.append(load_from_locator(locator))
+        except Exception as err:  # noqa: BLE001
+            logger.warning(f"failed to load program [{locator}]: {err}")
+            _worker_programs.append(None)
+    if method == "pqgram":
+        _worker_profiles.extend(
+            None if program is None else PQGramProfile.build(program)
+            for program in _worker_programs
+        )
+    _worker_matrix = np.load(matrix_path, mmap_mode="r+")
+
+
+def _close_worker() -> None:
+    global _worker_matrix  # noqa: PLW0603
+    _worker_programs.clear()
+    _worker_profiles.clear()
+    _worker_matrix = None
+
+
+def _compute_distance(i: int, j: int) -> float:
+    if _worker_profiles:
+        profile_from = _worker_profiles[i]
+        profile_to = _worker_profiles[j]
+        assert profile_from is not None
+        assert profile_to is not None
+        return profile_from.distance_to(profile_to)
+
+    program_from = _worker_programs[i]
+    program_to = _worker_programs[j]
+    assert program_from is not None
+    assert program_to is not None
+    _, distance = compute_edit_script_and_distance(program_from, program_to)
+    return distance
+
+
+def _compute_rows(start: int, end: int) -> tuple[int, int, int]:
+    """Computes the given rows of the matrix and returns them with the number of failures."""
+    matrix = _worker_matrix
+    assert matrix is not None
+
+    failures = 0
+    for i in range(start, end):
+        program_from = _worker_programs[i]
+        for j, program_to in enumerate(_worker_programs):
+            if i == j:
+                matrix[i, j] = 0.0
+                continue
+            if program_from is None or program_to is None:
+                matrix[i, j] = math.nan
+                failures += 1
+                continue
+            try:
+                distance = _compute_distance(i, j)
+            except Exception:  # noqa: BLE001
+                distance = math.nan
+                failures += 1
+            matrix[i, j] = distance
+
+    matrix.flush()
+    return start, end, failures
+
+
+def _read_done_rows(path: Path) -> set[int]:
+    done: set[int] = set()
+    if not path.exists():
+        return done
+    with path.open() as file:
+        for line in file:
+            # ignore a trailing line that was only partially written before an interruption
+            bounds = line.split()
+            if len(bounds) != 2 or not line.endswith("\n"):  # noqa: PLR2004
+                continue
+            start, end = map(int, bounds)
+            done.update(range(start, end))
+    return done
+
+
+def _prepare_output(
+    output_to: Path,
+    description: dict[str, t.Any],
+) -> set[int]:
+    """Creates (or reuses) the output files and returns the rows that are already done."""
+    from numpy.lib.format import open_memmap  # noqa: PLC0415  # numpy is an optional dependency (see _require_numpy)
+
+    programs_path = output_to / _PROGRAMS_FILENAME
+    matrix_path = output_to / _MATRIX_FILENAME
+    done_path = output_to / _DONE_FILENAME
+
+    if programs_path.exists() and matrix_path.exists():
+        with programs_path.open() as file:
+            if json.load(file) == description:
+                done = _read_done_rows(done_path)
+                logger.info(f"resuming distance matrix: {len(done)} rows already done")
+                return done
+        logger.warning(f"programs have changed since last run; recomputing matrix: {output_to}")
+
+    output_to.mkdir(parents=True, exist_ok=True)
+    done_path.unlink(missing_ok=True)
+    num_programs = len(description["programs"])
+    matrix = open_memmap(
+        matrix_path,
+        mode="w+",
+        dtype="float64",
+        shape=(num_programs, num_programs),
+    )
+    matrix[:] = math.nan
+    matrix.flush()
+    del matrix
+    with programs_path.open("w") as file:
+        json.dump(description, file, indent=2)
+    return set()
+
+
+def _pending_chunks(num_rows: int, done: set[int], rows_per_chunk: int) -> list[tuple[int, int]]:
+    """Splits the rows that aren't done into contiguous chunks of at most rows_per_chunk rows."""
+    chunks: list[tuple[int, int]] = []
+    start: int | None = None
+    for row in range(num_rows + 1):
+        is_pending = row < num_rows and row not in done
+        if is_pending and start is None:
+            start = row
+        if start is not None and (not is_pending or row - start == rows_per_chunk):
+            chunks.append((start, row))
+            start = row if is_pending else None
+    return chunks
+
+
+def compute_distance_matrix(
+    source: str | Path,
+    output_to: str | Path,
+    *,
+    level_id: str | None = None,
+    workers: int = 1,
+    rows_per_chunk: int = 8,
+    method: DistanceMethod = "gumtree",
+) -> MatrixStats:
+    """Computes the pairwise distance matrix between all final submissions to a level.
+
+    Parameters
+    ----------
+    source
+        either a level directory of the form user_id/frame.json, or a corpus
+    output_to
+        the directory to which the matrix should be written; if it already holds a
+        partially computed matrix for the same programs, the computation is resumed
+    level_id
+        the ID of the level, if the source is a corpus
+    workers
+        the number of worker processes that should be used to compute rows
+    rows_per_chunk
+        the number of rows of the matrix that are computed by a worker at a time
+    method
+        the method by which distances are computed (see facilitate.distance)
+    """
+    _require_numpy()
+    output_to = Path(output_to)
+    started_at = time.perf_counter()
+
+    submissions = find_final_submissions(source, level_id=level_id)
+    programs = _deduplicate(submissions)
+    description = {
+        "source": str(source),
+        "level": level_id,
+        "method": method,
+        "programs": [program.to_dict() for program in programs],
+    }
+    done = _prepare_output(output_to, description)
+    chunks = _pending_chunks(len(programs), done, rows_per_chunk)
+
+    stats = MatrixStats(submissions=len(submissions), programs=len(programs))
+    locators = [program.locator for program in programs]
+    matrix_path = output_to / _MATRIX_FILENAME
+
+    with (output_to / _DONE_FILENAME).open("a") as done_file:
+        def record(start: int, end: int, failures: int) -> None:
+            done_file.write(f"{start} {end}\n")
+            done_file.flush()
+            stats.pairs += (end - start) * max(len(programs) - 1, 0)
+            stats.failures += failures
+            stats.seconds = time.perf_counter() - started_at
+            logger.info(f"completed rows {start}-{end - 1}: {stats.describe()}")
+
+        if workers <= 1:
+            _init_worker(locators, matrix_path, method)
+            try:
+                for start, end in chunks:
+                    record(*_compute_rows(start, end))
+            finally:
+                _close_worker()
+        else:
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_init_worker,
+                initargs=(locators, matrix_path, method),
+            ) as executor:
+                futures = [executor.submit(_compute_rows, start, end) for start, end in chunks]
+                for future in as_completed(futures):
+                    record(*future.result())
+
+    stats.seconds = time.perf_counter() - started_at
+    return stats
@@ -0,0 +1,212 @@
+"""Memoizes the responses to diff, distance and progress requests across requests.
+
+Students poll for their progress repeatedly, often without having changed their
+program, so the same diffs are requested over and over again. The encoded body of
+each response is therefore kept in a two-level cache: an in-process LRU, backed by
+an optional SQLite database that survives restarts and is shared by every process
+that uses it. A hit returns the stored body as is, without parsing or diffing any
+program.
+
+Responses are keyed by the content hashes of their programs (see content_digest),
+every option of the request that affects the response, and the versions of the
+loader and the cost model (see facilitate.loader.LOADER_VERSION and
+facilitate.distance.COST_MODEL_VERSION), so changes to either invalidate older
+entries. Like facilitate.cache, the cache is best effort: failures to read or write
+the database are logged and treated as misses.
+"""
+from __future__ import annotations
+
+__all__ = (
+    "ENV_RESPONSE_CACHE_DB",
+    "ENV_RESPONSE_CACHE_SIZE",
+    "CachedResponse",
+    "ResponseCache",
+    "content_digest",
+)
+
+import collections
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import typing as t
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from loguru import logger
+
+# the maximum number of responses that are kept in memory; zero disables the in-process cache
+ENV_RESPONSE_CACHE_SIZE = "FACILITATE_RESPONSE_CACHE_SIZE"
+# the SQLite database in which responses are persisted; they are only kept in memory if unset
+ENV_RESPONSE_CACHE_DB = "FACILITATE_RESPONSE_CACHE_DB"
+
+_DEFAULT_MAX_SIZE = 256
+_DIGEST_SIZE = 20
+
+_SCHEMA_VERSION = 1
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key BLOB PRIMARY KEY,
+    body BLOB NOT NULL,
+    headers TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+
+def content_digest(source: str | bytes | dict[str, t.Any]) -> bytes:
+    """Computes a hash of the source of a program, as given within a request.
+
+    Since loading is deterministic, programs with the same source are loaded as
+    identical trees, including their node IDs (to which edit scripts refer). Block
+    descriptions are hashed in a canonical form, so the order of their keys does not
+    matter.
+    """
+    if isinstance(source, dict):
+        source = json.dumps(source, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    if isinstance(source, str):
+        source = source.encode()
+    return hashlib.blake2b(source, digest_size=_DIGEST_SIZE).digest()
+
+
+@dataclass(frozen=True)
+class CachedResponse:
+    """The encoded body of a response, together with its Content-Type, Content-Encoding and Vary headers."""
+    body: bytes
+    headers: dict[str, str]
+
+
+@dataclass
+class ResponseCache:
+    """Holds recent responses in memory, and optionally persists them to a SQLite database.
+
+    The cache is safe to share between threads.
+    """
+    max_size: int = _DEFAULT_MAX_SIZE
+    path: Path | None = None
+    _responses: collections.OrderedDict[bytes, CachedResponse] = field(
+        default_factory=collections.OrderedDict,
+        init=False,
+        repr=False,
+    )
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False)
+    # NOTE SQLite connections cannot be shared between threads, so each thread opens its own
+    _local: threading.local = field(default_factory=threading.local, init=False, repr=False)
+
+    @classmethod
+    def build(cls) -> ResponseCache:
+        """Builds a cache that is configured via environment variables."""
+        path = os.environ.get(ENV_RESPONSE_CACHE_DB)
+        return ResponseCache(
+            max_size=int(os.environ.get(ENV_RESPONSE_CACHE_SIZE, _DEFAULT_MAX_SIZE)),
+            path=Path(path) if path else None,
+        )
+
+    def __len__(self) -> int:
+        return len(self._responses)
+
+    @staticmethod
+    def key(*parts: t.Any) -> bytes:  # noqa: ANN401
+        """Derives a key from JSON-serializable parts, in which bytes (e.g., digests) are hex-encoded."""
+        encoded = json.dumps(
+            parts,
+            sort_keys=True,
+            separators=(",", ":"),
+            default=lambda part: part.hex() if isinstance(part, bytes) else str(part),
+        )
+        return hashlib.blake2b(encoded.encode(), digest_size=_DIGEST_SIZE).digest()
+
+    def get(self, key: bytes) -> CachedResponse | None:
+        """Retrieves the response with the given key, if cached."""
+        with self._lock:
+            response = self._responses.get(key)
+            if response is not None:
+                self._responses.move_to_end(key)
+                return response
+
+        response = self._load(key)
+        if response is not None:
+            self._remember(key, response)
+        return response
+
+    def put(self, key: bytes, response: CachedResponse) -> None:
+        """Stores a response under the given key."""
+        self._remember(key, response)
+        self._store(key, response)
+
+    def clear(self) -> None:
+        """Removes all responses from the cache."""
+        with self._lock:
+            self._responses.clear()
+        connection = self._connection()
+        if connection is None:
+            return
+        try:
+            with connection:
+                connection.execute("DELETE FROM responses")
+        except sqlite3.Error as err:
+            logger.warning(f"failed to clear response cache [{self.path}]: {err}")
+
+    def _remember(self, key: bytes, response: CachedResponse) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._responses[key] = response
+            self._responses.move_to_end(key)
+            while len(self._responses) > self.max_size:
+                self._responses.popitem(last=False)
+
+    def _connection(self) -> sqlite3.Connection | None:
+        if self.path is None:
+            return None
+        connection: sqlite3.Connection | None = getattr(self._local, "connection", None)
+        if connection is not None:
+            return connection
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=5.0)
+            connection.execute("PRAGMA journal_mode = WAL")
+            connection.execute("PRAGMA synchronous = NORMAL")
+            schema_version = connection.execute("PRAGMA user_version").fetchone()[0]
+            if schema_version != _SCHEMA_VERSION:
+                with connection:
+                    connection.execute("DROP TABLE IF EXISTS responses")
+                    connection.executescript(_SCHEMA)
+                    connection.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
+        except (OSError, sqlite3.Error) as err:
+            logger.warning(f"failed to open response cache [{self.path}]: {err}")
+            return None
+        self._local.connection = connection
+        return connection
+
+    def _load(self, key: bytes) -> CachedResponse | None:
+        connection = self._connection()
+        if connection is None:
+            return None
+        try:
+            row = connection.execute(
+                "SELECT body, headers FROM responses WHERE key = ?",
+                (key,),
+            ).fetchone()
+        except sqlite3.Error as err:
+            logger.warning(f"failed to read cached response [{self.path}]: {err}")
+            return None
+        if row is None:
+            return None
+        body, headers = row
+        return CachedResponse(body=bytes(body), headers=json.loads(headers))
+
+    def _store(self, key: bytes, response: CachedResponse) -> None:
+        connection = self._connection()
+        if connection is None:
+            return
+        try:
+            with connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO responses (key, body, headers, created_at) VALUES (?, ?, ?, ?)",
+                    (key, response.body, json.dumps(response.headers), time.time()),
+                )
+        except sqlite3.Error as err:
+            logger.warning(f"failed to cache response [{self.path}]: {err}")
@@ -144,8 +144,8 @@ class Block(Node):
         """
         return next((field for field in self.fields if field.name == name), None)
 
-    def add_input(self, name: str) -> Input:
-        input_ = Input.create(name=name, expression=None)
+    def add_input(self, name: str, *, id_: str | None = None) -> Input:
+        input_ = Input.create(name=name, expression=None, id_=id_)
         input_.parent = self
 
         # insert input in alphabetical order
@@ -177,6 +177,11 @@ class Block(Node):
 
         child.parent = None
 
+    @overrides
+    def remove_children(self, children: t.Container[Node]) -> None:
+        self._detach_from(self.fields, children)
+        self._detach_from(self.inputs, children)
+
     @overrides
     def children(self) -> t.Iterator[Node]:
         yield from self.fields
@@ -30,6 +30,10 @@ class Field(TerminalNode):
             id_ = generate_id(f"field:{name}")
         return cls(id_=id_, name=name, value=value)
 
+    @classmethod
+    def determine_id(cls, block_id: str, field_name: str) -> str:
+        return f":field[{field_name}]@{block_id}"
+
     def __hash__(self) -> int:
         return hash(self.id_)
 
@@ -96,6 +96,10 @@ class Input(Node):
         child.parent = None
         self._children.remove(child)
 
+    @overrides
+    def remove_children(self, children: t.Container[Node]) -> None:
+        self._detach_from(self._children, children)
+
     @overrides
     def _add_to_nx_digraph(self, graph: nx.DiGraph) -> None:
         label = f'"input:{self.name}"'
@@ -24,6 +24,10 @@ class Literal(TerminalNode):
             id_ = generate_id("literal")
         return cls(id_=id_, value=value)
 
+    @classmethod
+    def determine_id(cls, input_id: str) -> str:
+        return f":literal@{input_id}"
+
     def __hash__(self) -> int:
         return hash(self.id_)
 
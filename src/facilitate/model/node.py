@@ -13,6 +13,8 @@ import networkx as nx
 import PIL.Image
 from overrides import final, overrides
 
+NodeT = t.TypeVar("NodeT", bound="Node")
+
 
 @dataclass(kw_only=True, eq=False)
 class Node(abc.ABC):
@@ -121,6 +123,25 @@ class Node(abc.ABC):
         """Removes a child from this node."""
         ...
 
+    def remove_children(self, children: t.Container[Node]) -> None:
+        """Removes all of the given children from this node.
+
+        Subclasses traverse their children once, rather than once per removed child.
+        """
+        for child in [child for child in self.children() if child in children]:
+            self.remove_child(child)
+
+    @staticmethod
+    def _detach_from(nodes: list[NodeT], children: t.Container[Node]) -> None:
+        """Removes the given children from a list of nodes in place, and detaches them from their parent."""
+        kept: list[NodeT] = []
+        for node in nodes:
+            if node in children:
+                node.parent = None
+            else:
+                kept.append(node)
+        nodes[:] = kept
+
     def _nx_node_attributes(self) -> dict[str, str]:
         """Returns the attributes of this node to be used in a NetworkX graph."""
         attributes: dict[str, str] = {}
@@ -89,6 +89,10 @@ class Program(Node):
         self.top_level_nodes.remove(child)
         child.parent = None
 
+    @overrides
+    def remove_children(self, children: t.Container[Node]) -> None:
+        self._detach_from(self.top_level_nodes, children)
+
     @overrides
     def _add_to_nx_digraph(self, graph: nx.DiGraph) -> None:
         attributes = self._nx_node_attributes()
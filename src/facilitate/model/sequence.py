@@ -19,9 +19,10 @@ class Sequence(Node):
     blocks: list[Block] = field(default_factory=list)
 
     @classmethod
-    def create(cls) -> Sequence:
+    def create(cls, *, id_: str | None = None) -> Sequence:
         """Creates a new empty sequence."""
-        id_ = generate_id("seq")
+        if not id_:
+            id_ = generate_id("seq")
         return cls(
             id_=id_,
             blocks=[],
@@ -106,6 +107,10 @@ class Sequence(Node):
         self.blocks.remove(child)
         child.parent = None
 
+    @overrides
+    def remove_children(self, children: t.Container[Node]) -> None:
+        self._detach_from(self.blocks, children)
+
     def child(self, index: int) -> Node:
         return self.blocks[index]
 
@@ -0,0 +1,212 @@
+"""Computes approximate distances between programs from their pq-gram profiles.
+
+A pq-gram is a small, fixed-shape subtree: a stem of p ancestors (the last of
+which is the anchor) together with q consecutive children of the anchor, where
+missing ancestors and children are padded with a null label. The pq-gram profile
+of a tree is the bag of all of its pq-grams, which is computed in linear time, and
+the pq-gram distance between two trees is the normalized size of the symmetric
+difference of their profiles (see Augsten et al., "The pq-Gram Distance between
+Ordered Labeled Trees", TODS 2010). The distance lies between zero (identical
+profiles) and one (no pq-grams in common), so it is not on the same scale as the
+weighted edit distance (see facilitate.distance), but it tracks structural
+similarity well enough to rank solutions and to analyze large corpora.
+
+Nodes are labelled by the opcodes of blocks, the names of inputs and fields, and
+the values of literals. Each pq-gram is stored as a 64-bit hash of its labels, so
+that profiles are compact and can be cached per program (see ProfileCache).
+"""
+from __future__ import annotations
+
+__all__ = (
+    "DEFAULT_P",
+    "DEFAULT_Q",
+    "PQGramProfile",
+    "ProfileCache",
+    "pqgram_distance",
+    "pqgram_label",
+)
+
+import collections
+import hashlib
+import struct
+import threading
+import typing as t
+from dataclasses import dataclass, field
+
+from facilitate.model.block import Block
+from facilitate.model.field import Field
+from facilitate.model.input import Input
+from facilitate.model.literal import Literal
+from facilitate.model.program import Program
+from facilitate.model.sequence import Sequence
+
+if t.TYPE_CHECKING:
+    from facilitate.model.node import Node
+
+DEFAULT_P = 2
+DEFAULT_Q = 3
+
+_LABEL_DIGEST_SIZE = 8
+_NULL_LABEL = bytes(_LABEL_DIGEST_SIZE)
+
+_MAGIC = b"PQG1"
+_HEADER = struct.Struct("<4sBBI")
+_ENTRY = struct.Struct("<QI")
+
+
+def pqgram_label(node: Node) -> str:
+    """Returns the label of a node within a pq-gram."""
+    match node:
+        case Block():
+            return f"block:{node.opcode}"
+        case Field():
+            return f"field:{node.name}"
+        case Input():
+            return f"input:{node.name}"
+        case Literal():
+            return f"literal:{node.value}"
+        case Sequence():
+            return "sequence"
+        case Program():
+            return "program"
+    error = f"cannot label node of type {node.__class__.__name__}"
+    raise TypeError(error)
+
+
+def _label_digest(node: Node) -> bytes:
+    return hashlib.blake2b(pqgram_label(node).encode(), digest_size=_LABEL_DIGEST_SIZE).digest()
+
+
+def _gram_key(stem: tuple[bytes, ...], base: tuple[bytes, ...]) -> int:
+    digest = hashlib.blake2b(b"".join(stem + base), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+@dataclass(frozen=True)
+class PQGramProfile:
+    """The bag of pq-grams of a tree, each of which is represented by a hash of its labels.
+
+    Attributes
+    ----------
+    grams
+        the number of occurrences of each pq-gram within the tree
+    p
+        the number of ancestors within the stem of each pq-gram
+    q
+        the number of children within the base of each pq-gram
+    """
+    grams: collections.Counter[int]
+    p: int = DEFAULT_P
+    q: int = DEFAULT_Q
+
+    @classmethod
+    def build(cls, root: Node, *, p: int = DEFAULT_P, q: int = DEFAULT_Q) -> PQGramProfile:
+        """Computes the pq-gram profile of the tree rooted at a given node."""
+        if p < 1 or q < 1:
+            error = f"p and q must be positive (p={p}, q={q})"
+            raise ValueError(error)
+
+        grams: collections.Counter[int] = collections.Counter()
+        null_base = (_NULL_LABEL,) * q
+        # NOTE the tree is traversed iteratively since programs can be deeply nested
+        stack = [(root, (_NULL_LABEL,) * p)]
+        while stack:
+            node, ancestors = stack.pop()
+            stem = (*ancestors[1:], _label_digest(node))
+            children = list(node.children())
+            if not children:
+                grams[_gram_key(stem, null_base)] += 1
+                continue
+
+            base = null_base
+            for child in children:
+                base = (*base[1:], _label_digest(child))
+                grams[_gram_key(stem, base)] += 1
+                stack.append((child, stem))
+            for _ in range(q - 1):
+                base = (*base[1:], _NULL_LABEL)
+                grams[_gram_key(stem, base)] += 1
+
+        return PQGramProfile(grams=grams, p=p, q=q)
+
+    @property
+    def size(self) -> int:
+        """The number of pq-grams within this profile, counting duplicates."""
+        return self.grams.total()
+
+    def distance_to(self, other: PQGramProfile) -> float:
+        """Computes the pq-gram distance between this profile and another."""
+        if (self.p, self.q) != (other.p, other.q):
+            error = f"cannot compare profiles with different shapes: {(self.p, self.q)} and {(other.p, other.q)}"
+            raise ValueError(error)
+        union = self.size + other.size
+        if union == 0:
+            return 0.0
+        intersection = (self.grams & other.grams).total()
+        return 1.0 - 2.0 * intersection / union
+
+    def to_bytes(self) -> bytes:
+        """Encodes this profile in a compact binary format."""
+        entries = b"".join(_ENTRY.pack(key, count) for key, count in sorted(self.grams.items()))
+        return _HEADER.pack(_MAGIC, self.p, self.q, len(self.grams)) + entries
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> PQGramProfile:
+        """Decodes a profile that was encoded via to_bytes."""
+        magic, p, q, num_entries = _HEADER.unpack_from(data)
+        if magic != _MAGIC:
+            error = "not a pq-gram profile"
+            raise ValueError(error)
+        entries = data[_HEADER.size:]
+        if len(entries) != num_entries * _ENTRY.size:
+            error = f"expected {num_entries} pq-gram profile entries but found {len(entries) / _ENTRY.size}"
+            raise ValueError(error)
+        return PQGramProfile(
+            grams=collections.Counter(dict(_ENTRY.iter_unpack(entries))),
+            p=p,
+            q=q,
+        )
+
+
+def pqgram_distance(tree_from: Node, tree_to: Node, *, p: int = DEFAULT_P, q: int = DEFAULT_Q) -> float:
+    """Computes the pq-gram distance between two trees."""
+    return PQGramProfile.build(tree_from, p=p, q=q).distance_to(PQGramProfile.build(tree_to, p=p, q=q))
+
+
+@dataclass
+class ProfileCache:
+    """Holds the profiles of recently seen programs in memory, keyed by their source contents.
+
+    This avoids parsing and profiling the same programs (e.g., the solutions to a
+    level) over and over again. The cache is safe to share between threads.
+    """
+    max_size: int = 256
+    p: int = DEFAULT_P
+    q: int = DEFAULT_Q
+    _profiles: collections.OrderedDict[bytes, PQGramProfile] = field(
+        default_factory=collections.OrderedDict,
+        init=False,
+        repr=False,
+    )
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False)
+
+    def __len__(self) -> int:
+        return len(self._profiles)
+
+    def get(self, contents: str | bytes, load: t.Callable[[], Node]) -> PQGramProfile:
+        """Returns the profile of the program with the given contents, loading it via load if needed."""
+        if isinstance(contents, str):
+            contents = contents.encode()
+        key = hashlib.blake2b(contents, digest_size=20).digest()
+        with self._lock:
+            profile = self._profiles.get(key)
+            if profile is not None:
+                self._profiles.move_to_end(key)
+                return profile
+
+        profile = PQGramProfile.build(load(), p=self.p, q=self.q)
+        with self._lock:
+            self._profiles[key] = profile
+            while len(self._profiles) > self.max_size:
+                self._profiles.popitem(last=False)
+        return profile
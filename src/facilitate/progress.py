@@ -0,0 +1,342 @@
+"""Computes the progress of a student towards a set of solutions.
+
+The progress of a program is its distance to each solution, which can be computed
+in the order of the solutions or, so that the nearest solutions can be reported as
+soon as they are found, in parallel by a pool of worker processes, in the order in
+which they are completed. That pool is started once and shared by every call; where
+worker processes are unavailable (e.g., on AWS Lambda), distances are computed in
+the order of the solutions instead.
+
+The progress at each snapshot of the trajectory is the distance from that snapshot
+to each solution. Rather than computing each distance from scratch, the solutions
+are prepared once for the whole trajectory, and each diff is seeded with the
+mappings of the previous snapshot to the same solution: consecutive snapshots
+usually differ by a handful of blocks, so most of those mappings remain valid.
+"""
+from __future__ import annotations
+
+__all__ = (
+    "PreparedSolution",
+    "ProgressOrder",
+    "SolutionDistance",
+    "TrajectoryProgress",
+    "compute_progress",
+    "compute_trajectory_progress",
+    "load_program_from_project",
+    "load_snapshots",
+)
+
+import copy
+import functools
+import gzip
+import json
+import threading
+import typing as t
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from loguru import logger
+
+from facilitate.deadline import deadline_after, enforce_deadline, time_remaining
+from facilitate.diff import compute_edit_script_and_mappings
+from facilitate.distance import (
+    compute_distance,
+    compute_edit_script_and_distance_before_deadline,
+)
+from facilitate.hashing import content_hash, structural_hashes
+from facilitate.incremental import compute_edit_script_incremental
+from facilitate.loader import (
+    load_blocks_from_project,
+    load_from_file,
+    load_program_from_block_descriptions,
+)
+from facilitate.scraper.trajectory import Trajectory
+
+if t.TYPE_CHECKING:
+    from facilitate.edit import EditScript
+    from facilitate.mappings import NodeMappings
+    from facilitate.model.node import Node
+    from facilitate.model.program import Program
+
+ProgressOrder = t.Literal["solution", "completion"]
+
+# the pools of worker processes, by their maximum number of workers, or None if
+# worker processes cannot be started on this platform
+_executors: dict[int | None, ProcessPoolExecutor | None] = {}
+_executors_lock = threading.Lock()
+
+
+def load_program_from_project(project: str | bytes | dict[str, t.Any]) -> Program:
+    """Loads the program of the (first) target within a Scratch project.
+
+    JSON-encoded projects are stream-parsed, so that only the blocks of the target
+    are decoded (see facilitate.loader.load_blocks_from_project).
+    """
+    if isinstance(project, dict):
+        return load_program_from_block_descriptions(project["targets"][0]["blocks"])
+    return load_program_from_block_descriptions(load_blocks_from_project(project))
+
+
+def load_snapshots(filename: str | Path) -> list[tuple[int, Program]]:
+    """Loads the snapshots of a trajectory, together with their frame indices.
+
+    The trajectory is either a directory of programs named after their frame
+    (e.g., as written for each user by the scraper), a bundle of frames, or a
+    delta-compressed trajectory (see facilitate.scraper.writer).
+    """
+    path = Path(filename)
+    if path.is_dir():
+        program_files = [child for child in path.glob("*.json") if child.stem.isdigit()]
+        program_files.sort(key=lambda child: int(child.stem))
+        return [(int(child.stem), load_from_file(child)) for child in program_files]
+
+    if ".trajectory.jsonl" in path.name:
+        # NOTE loading rewrites the given block descriptions in place, so each frame
+        # is copied to keep it from corrupting the blocks that later frames carry over
+        return [
+            (index, load_program_from_block_descriptions(copy.deepcopy(blocks)))
+            for index, blocks in Trajectory.load(path).frames()
+        ]
+
+    opener = gzip.open if path.suffix == ".gz" else open
+    with opener(path, "rt") as file:
+        records = [json.loads(line) for line in file if line.strip()]
+    return [
+        (int(record["frame"]), load_program_from_block_descriptions(record["blocks"]))
+        for record in records
+    ]
+
+
+@dataclass(frozen=True)
+class PreparedSolution:
+    """A solution that has been parsed and hashed once so that it can be shared by many diffs."""
+    id_: t.Any
+    program: Program
+    hashes: dict[Node, bytes]
+
+    @classmethod
+    def build(cls, id_: t.Any, program: Program) -> PreparedSolution:  # noqa: ANN401
+        return PreparedSolution(
+            id_=id_,
+            program=program,
+            hashes=structural_hashes(program),
+        )
+
+    @functools.cached_property
+    def content_hash(self) -> bytes:
+        """A hash of the contents of this solution, including its node IDs (see facilitate.hashing)."""
+        return content_hash(self.program)
+
+
+@dataclass(frozen=True)
+class SolutionDistance:
+    """Describes the distance to a solution.
+
+    If the distance is approximate (i.e., the diff did not finish before its
+    deadline), no edit script is available.
+    """
+    solution_id: t.Any
+    distance: float
+    edit_script: EditScript | None = None
+    approximate: bool = False
+
+    def to_dict(self, *, compact: bool = False) -> dict[str, t.Any]:
+        """Encodes this distance as a dict, using the compact encoding of its edit script if requested."""
+        dict_: dict[str, t.Any] = {
+            "id": self.solution_id,
+            "distance": self.distance,
+            "approximate": self.approximate,
+        }
+        if self.edit_script is not None:
+            dict_["edits"] = (
+                self.edit_script.to_compact_dict() if compact else self.edit_script.to_dict()
+            )
+        return dict_
+
+
+@dataclass
+class TrajectoryProgress:
+    """Tracks the distance from each snapshot of a trajectory to each of a set of solutions.
+
+    Snapshots must be given in order via update.
+    """
+    solutions: list[PreparedSolution]
+    include_edits: bool = False
+    _previous: Program | None = field(default=None, init=False)
+    _previous_hashes: dict[Node, bytes] = field(default_factory=dict, init=False)
+    _previous_mappings: list[NodeMappings] = field(default_factory=list, init=False)
+
+    @classmethod
+    def build(
+        cls,
+        solutions: t.Iterable[tuple[t.Any, Program]],
+        *,
+        include_edits: bool = False,
+    ) -> TrajectoryProgress:
+        return TrajectoryProgress(
+            solutions=[PreparedSolution.build(id_, program) for id_, program in solutions],
+            include_edits=include_edits,
+        )
+
+    def update(self, snapshot: Program) -> list[SolutionDistance]:
+        """Computes the distance from the next snapshot to each solution."""
+        hashes = structural_hashes(snapshot)
+        mappings: list[NodeMappings] = []
+        distances: list[SolutionDistance] = []
+
+        for index, solution in enumerate(self.solutions):
+            if self._previous is None:
+                edit_script, solution_mappings = compute_edit_script_and_mappings(
+                    snapshot,
+                    solution.program,
+                )
+            else:
+                edit_script, solution_mappings = compute_edit_script_incremental(
+                    self._previous,
+                    self._previous_mappings[index],
+                    snapshot,
+                    solution.program,
+                    previous_hashes=self._previous_hashes,
+                    new_hashes=hashes,
+                    to_hashes=solution.hashes,
+                )
+            distance = compute_distance(
+                tree_from=snapshot,
+                tree_to=solution.program,
+                edit_script=edit_script,
+            )
+            mappings.append(solution_mappings)
+            distances.append(SolutionDistance(
+                solution_id=solution.id_,
+                distance=distance,
+                edit_script=edit_script if self.include_edits else None,
+            ))
+
+        self._previous = snapshot
+        self._previous_hashes = hashes
+        self._previous_mappings = mappings
+        return distances
+
+
+def compute_trajectory_progress(
+    snapshots: t.Iterable[Program],
+    solutions: t.Iterable[tuple[t.Any, Program]],
+    *,
+    include_edits: bool = False,
+) -> t.Iterator[list[SolutionDistance]]:
+    """Computes the distance from each snapshot to each solution, in order."""
+    progress = TrajectoryProgress.build(solutions, include_edits=include_edits)
+    for snapshot in snapshots:
+        yield progress.update(snapshot)
+
+
+def _measure(
+    program: Program,
+    solution_id: t.Any,  # noqa: ANN401
+    solution: Program,
+    *,
+    include_edits: bool,
+) -> SolutionDistance:
+    edit_script, distance = compute_edit_script_and_distance_before_deadline(
+        tree_from=program,
+        tree_to=solution,
+    )
+    return SolutionDistance(
+        solution_id=solution_id,
+        distance=distance,
+        edit_script=edit_script if include_edits else None,
+        approximate=edit_script is None,
+    )
+
+
+def _measure_in_worker(
+    program: Program,
+    solution_id: t.Any,  # noqa: ANN401
+    solution: Program,
+    *,
+    include_edits: bool,
+    deadline: float | None,
+) -> SolutionDistance:
+    """Measures the distance to a solution within a worker process, which does not share the deadline of its caller."""
+    with enforce_deadline(deadline):
+        return _measure(program, solution_id, solution, include_edits=include_edits)
+
+
+def _get_executor(max_workers: int | None) -> ProcessPoolExecutor | None:
+    """Returns the shared pool of worker processes, or None if worker processes cannot be started."""
+    with _executors_lock:
+        if max_workers not in _executors:
+            try:
+                _executors[max_workers] = ProcessPoolExecutor(max_workers=max_workers)
+            except (ImportError, NotImplementedError, OSError) as err:
+                logger.warning(f"cannot start worker processes, so progress is computed in solution order: {err}")
+                _executors[max_workers] = None
+        return _executors[max_workers]
+
+
+def _discard_executor(max_workers: int | None, executor: ProcessPoolExecutor) -> None:
+    """Discards a broken pool of worker processes, so that the next call starts a new one."""
+    with _executors_lock:
+        if _executors.get(max_workers) is executor:
+            del _executors[max_workers]
+
+
+def compute_progress(
+    program: Program,
+    solutions: t.Iterable[tuple[t.Any, Program]],
+    *,
+    include_edits: bool = True,
+    order: ProgressOrder = "solution",
+    max_workers: int | None = None,
+) -> t.Iterator[SolutionDistance]:
+    """Computes the distance from a program to each solution, yielding each distance as soon as it is known.
+
+    Parameters
+    ----------
+    program
+        the program whose progress should be computed
+    solutions
+        the ID and program of each solution; solutions are consumed lazily when
+        distances are computed in solution order
+    include_edits
+        whether the edit script to each solution should be included
+    order
+        the order in which distances are yielded: "solution" computes them one at
+        a time in the order of the solutions, whereas "completion" computes them
+        in parallel within a pool of worker processes and yields each one as soon
+        as it has been computed, which tends to report the nearest solutions first
+        (or falls back to solution order if worker processes are unavailable)
+    max_workers
+        the maximum number of worker processes used to compute distances in
+        completion order, or None to use the number of CPUs
+
+    If a deadline is enforced by the caller (see facilitate.deadline), distances
+    that cannot be computed exactly before the deadline are approximated.
+    """
+    executor = _get_executor(max_workers) if order == "completion" else None
+    if executor is None:
+        for solution_id, solution in solutions:
+            yield _measure(program, solution_id, solution, include_edits=include_edits)
+        return
+
+    # NOTE the deadline of the caller's context is handed to each worker explicitly
+    measure = functools.partial(
+        _measure_in_worker,
+        include_edits=include_edits,
+        deadline=deadline_after(time_remaining()),
+    )
+    futures = []
+    try:
+        for solution_id, solution in solutions:
+            futures.append(executor.submit(measure, program, solution_id, solution))
+        for future in as_completed(futures):
+            yield future.result()
+    except BrokenProcessPool:
+        _discard_executor(max_workers, executor)
+        raise
+    finally:
+        # avoid computing the remaining distances if the caller stops early
+        for future in futures:
+            future.cancel()
@@ -0,0 +1,173 @@
+"""Provides a registry of the solutions to each level, so that they need only be sent once.
+
+Solutions are registered for a level once (see PUT /levels/<level>/solutions), and
+are kept parsed and hashed in memory (see PreparedSolution), so that progress
+requests can refer to them by ID rather than sending every solution with every
+request. If a directory is given, the solutions to each level are also persisted
+to a file within it, so that they survive restarts and are shared by every process
+that uses the same directory: each process reloads a level whenever its file has
+changed since it was last loaded.
+"""
+from __future__ import annotations
+
+__all__ = (
+    "ENV_SOLUTIONS_DIR",
+    "SolutionRegistry",
+    "UnknownSolutionError",
+)
+
+import base64
+import hashlib
+import json
+import os
+import threading
+import typing as t
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from loguru import logger
+
+from facilitate.binary import dump_program, load_program_from_bytes
+from facilitate.loader import LOADER_VERSION
+from facilitate.progress import PreparedSolution
+
+if t.TYPE_CHECKING:
+    from facilitate.model.program import Program
+
+# the directory in which registered solutions are persisted; they are only kept in memory if unset
+ENV_SOLUTIONS_DIR = "FACILITATE_SOLUTIONS_DIR"
+
+_REGISTRY_VERSION = 1
+
+
+class UnknownSolutionError(LookupError):
+    """Raised when a level or solution has not been registered."""
+
+
+@dataclass(frozen=True)
+class _Level:
+    solutions: dict[t.Any, PreparedSolution]
+    # the modification time of the file from which the level was loaded, if any
+    mtime_ns: int | None = None
+
+
+@dataclass
+class SolutionRegistry:
+    """Holds the prepared solutions to each level, optionally persisting them to a directory.
+
+    The registry is safe to share between threads.
+    """
+    directory: Path | None = None
+    _levels: dict[str, _Level] = field(default_factory=dict, init=False, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False)
+
+    @classmethod
+    def build(cls) -> SolutionRegistry:
+        """Builds a registry that is configured via environment variables."""
+        directory = os.environ.get(ENV_SOLUTIONS_DIR)
+        return SolutionRegistry(directory=Path(directory) if directory else None)
+
+    @property
+    def persistent(self) -> bool:
+        """Whether solutions are persisted to disk."""
+        return self.directory is not None
+
+    def _path(self, level_id: str) -> Path:
+        assert self.directory is not None
+        return self.directory / f"{hashlib.blake2b(level_id.encode(), digest_size=16).hexdigest()}.json"
+
+    def register(self, level_id: str, solutions: t.Iterable[tuple[t.Any, Program]]) -> list[t.Any]:
+        """Registers the solutions to a level, replacing any that were previously registered.
+
+        Returns the IDs of the registered solutions, in order.
+        """
+        prepared = {
+            solution_id: PreparedSolution.build(solution_id, program)
+            for solution_id, program in solutions
+        }
+        mtime_ns = None
+        if self.directory is not None:
+            mtime_ns = self._save(level_id, prepared)
+        with self._lock:
+            self._levels[level_id] = _Level(solutions=prepared, mtime_ns=mtime_ns)
+        logger.info(f"registered {len(prepared)} solutions to level {level_id}")
+        return list(prepared)
+
+    def solution_ids(self, level_id: str) -> list[t.Any]:
+        """Returns the IDs of the solutions to a level, in the order in which they were registered."""
+        return list(self._level(level_id).solutions)
+
+    def get(self, level_id: str, solution_ids: t.Iterable[t.Any] | None = None) -> list[PreparedSolution]:
+        """Retrieves the given solutions to a level, or all of its solutions if no IDs are given."""
+        solutions = self._level(level_id).solutions
+        if solution_ids is None:
+            return list(solutions.values())
+        try:
+            return [solutions[solution_id] for solution_id in solution_ids]
+        except KeyError as err:
+            error = f"solution {err.args[0]} has not been registered for level {level_id}"
+            raise UnknownSolutionError(error) from err
+
+    def _level(self, level_id: str) -> _Level:
+        with self._lock:
+            level = self._levels.get(level_id)
+        if self.directory is None:
+            if level is None:
+                error = f"no solutions have been registered for level {level_id}"
+                raise UnknownSolutionError(error)
+            return level
+
+        # NOTE the level may have been registered (again) by another process that shares the directory
+        path = self._path(level_id)
+        try:
+            mtime_ns = path.stat().st_mtime_ns
+        except FileNotFoundError:
+            mtime_ns = None
+        if level is not None and level.mtime_ns == mtime_ns:
+            return level
+        if mtime_ns is None:
+            error = f"no solutions have been registered for level {level_id}"
+            raise UnknownSolutionError(error)
+
+        level = _Level(solutions=self._load(path), mtime_ns=mtime_ns)
+        with self._lock:
+            self._levels[level_id] = level
+        return level
+
+    def _save(self, level_id: str, solutions: dict[t.Any, PreparedSolution]) -> int:
+        """Writes the solutions to a level to disk and returns the modification time of the file."""
+        path = self._path(level_id)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # NOTE the file is replaced atomically so that other processes never read a partial file
+        temporary_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with temporary_path.open("w") as file:
+            json.dump({
+                "version": _REGISTRY_VERSION,
+                "level": level_id,
+                "solutions": [
+                    {
+                        "id": solution.id_,
+                        "program": base64.b64encode(
+                            dump_program(solution.program, loader_version=LOADER_VERSION),
+                        ).decode("ascii"),
+                    }
+                    for solution in solutions.values()
+                ],
+            }, file)
+        temporary_path.replace(path)
+        return path.stat().st_mtime_ns
+
+    @staticmethod
+    def _load(path: Path) -> dict[t.Any, PreparedSolution]:
+        with path.open() as file:
+            json_ = json.load(file)
+        if json_.get("version") != _REGISTRY_VERSION:
+            error = f"unsupported solution registry version: {json_.get('version')}"
+            raise ValueError(error)
+        return {
+            solution["id"]: PreparedSolution.build(
+                solution["id"],
+                load_program_from_bytes(base64.b64decode(solution["program"])),
+            )
+            for solution in json_["solutions"]
+        }
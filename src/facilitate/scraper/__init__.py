@@ -1,14 +1,29 @@
 from __future__ import annotations
 
+import collections
+import functools
+import hashlib
 import json
+import time
 import typing as t
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
 
 import ijson
 from loguru import logger
 
+from facilitate.scraper.frame import LazyFrame
+from facilitate.scraper.writer import (
+    BundleFrameWriter,
+    CorpusFrameWriter,
+    DirectoryFrameWriter,
+    FrameWriter,
+    ScrapedSession,
+    TrajectoryFrameWriter,
+)
+
 _Session = dict[str, t.Any]
-_Frame = dict[str, t.Any]
 _Block = dict[str, t.Any]
 _Blocks = dict[str, _Block]
 
@@ -17,14 +32,16 @@ def _extract_blocks_from_frame(
     level_id: str,
     user_id: str,
     frame_index: int,
-    frame: _Frame,
-    output_to: Path,
+    frame: LazyFrame,
     *,
     log_version: str | None = None,
     require_consent: bool = False,
     require_assent: bool = False,
 ) -> _Blocks | None:
     # restrict attention to frames that change the program
+    # - cheaply rule out most frames before decoding any part of them
+    if not frame.may_contain('"programming_interface"'):
+        return None
     if frame.get("actor") != "programming_interface":
         return None
 
@@ -39,12 +56,15 @@ def _extract_blocks_from_frame(
         return None
 
     # extract program from state_info
-    if "state_info" not in frame:
+    # - this is the only point at which the (large) program is decoded
+    state_info = frame.get("state_info")
+    if state_info is None:
         logger.debug(f"skipping frame [{frame_id}]: missing 'state_info'")
         return None
 
-    state_info = frame["state_info"]
     program = state_info["program"]
+    if isinstance(program, str):
+        program = json.loads(program)
     targets = program["targets"]
     if not targets:
         logger.debug(f"skipping frame [{frame_id}]: no targets")
@@ -73,14 +93,17 @@ def _extract_blocks_from_frame(
 
 def _scrape_session(
     session: _Session,
-    output_to: Path,
     *,
     require_consent: bool = False,
     require_assent: bool = False,
-) -> None:
+) -> ScrapedSession | None:
+    """Extracts the frames that change the program from a given session.
+
+    Returns None if the session should be skipped.
+    """
     if "_id" not in session:
         logger.debug("skipping session: missing '_id'")
-        return
+        return None
 
     session_id: str
     if isinstance(session["_id"], int | str):
@@ -89,27 +112,21 @@ def _scrape_session(
         session_id = session["_id"]["$oid"]
     else:
         logger.debug("skipping session: invalid '_id'")
-        return
+        return None
 
     # extract frames
     if "frames" not in session:
         logger.debug(f"skipping session {session_id}: missing 'frames'")
-        return
-
-    def _load_frame(frame_dict_or_text: str | dict[str, t.Any]) -> _Frame:
-        if isinstance(frame_dict_or_text, str):
-            frame = json.loads(frame_dict_or_text)
-            assert isinstance(frame, dict)
-            return frame
-        return frame_dict_or_text
+        return None
 
-    frames: list[_Frame] = [
-        _load_frame(text_or_dict) for text_or_dict in session["frames"]
+    # frames are only decoded as far as necessary
+    frames: list[LazyFrame] = [
+        LazyFrame(text_or_dict) for text_or_dict in session["frames"]
     ]
 
     if not frames:
         logger.debug(f"skipping session {session_id}: no frames")
-        return
+        return None
 
     # determine level_id
     level_id: str | None = None
@@ -117,27 +134,32 @@ def _scrape_session(
         level_id = str(session["level_id"])
 
     if not level_id:
-        episode_started_frame: _Frame | None = next(
-            (frame for frame in frames if frame["verb"] == "episode_started"),
+        episode_started_frame: LazyFrame | None = next(
+            (
+                frame for frame in frames
+                if frame.may_contain('"episode_started"') and frame.get("verb") == "episode_started"
+            ),
             None,
         )
         if episode_started_frame and "object_name" in episode_started_frame:
-            level_id = str(episode_started_frame["object_name"])
+            level_id = str(episode_started_frame.get("object_name"))
 
     if not level_id:
         logger.debug(f"skipping session {session_id}: failed to determine 'level_id'")
-        return
+        return None
 
     # determine user_id
     if "user_id" not in frames[0]:
         logger.debug(f"skipping session {session_id}: missing 'user_id' in first frame")
-        return
-    user_id = str(frames[0]["user_id"])
+        return None
+    user_id = str(frames[0].get("user_id"))
 
     # determine data format version used by session
     log_version: str | None = frames[0].get("context", {}).get("version")
 
-    last_seen_blocks: _Blocks | None = None
+    # detect unchanged programs by comparing digests of their (canonical) encodings
+    last_seen_digest: bytes | None = None
+    scraped_frames: list[tuple[int, bytes]] = []
 
     for index, frame in enumerate(frames):
         maybe_blocks: _Blocks | None = _extract_blocks_from_frame(
@@ -145,22 +167,95 @@ def _scrape_session(
             user_id=user_id,
             frame_index=index,
             frame=frame,
-            output_to=output_to,
             require_consent=require_consent,
             require_assent=require_assent,
             log_version=log_version,
         )
         if maybe_blocks:
-            if maybe_blocks == last_seen_blocks:
+            encoded_blocks = json.dumps(maybe_blocks, separators=(",", ":"), sort_keys=True).encode("utf-8")
+            digest = hashlib.blake2b(encoded_blocks, digest_size=16).digest()
+            if digest == last_seen_digest:
                 logger.debug(f"skipping frame [{level_id}/{user_id}/{index}]: no change")
                 continue
 
-            last_seen_blocks = maybe_blocks
+            last_seen_digest = digest
+            scraped_frames.append((index, encoded_blocks))
+
+    return ScrapedSession(
+        level_id=level_id,
+        user_id=user_id,
+        frames=scraped_frames,
+    )
+
+
+@dataclass
+class ScrapeStats:
+    """Measures the throughput of a scrape."""
+    sessions: int = 0
+    frames: int = 0
+    bytes_read: int = 0
+    bytes_written: int = 0
+    seconds: float = 0.0
+
+    def describe(self) -> str:
+        seconds = max(self.seconds, 1e-9)
+        megabytes_read = self.bytes_read / 1e6
+        return (
+            f"scraped {self.sessions} sessions ({self.sessions / seconds:.1f}/s), "
+            f"{self.frames} frames ({self.frames / seconds:.1f}/s), "
+            f"read {megabytes_read:.1f} MB ({megabytes_read / seconds:.2f} MB/s), "
+            f"wrote {self.bytes_written / 1e6:.1f} MB in {self.seconds:.1f}s"
+        )
+
 
-            frame_filename = output_to / level_id / user_id / f"{index}.json"
-            frame_filename.parent.mkdir(parents=True, exist_ok=True)
-            with frame_filename.open("w") as file:
-                json.dump(maybe_blocks, file, indent=2)
+_OUTPUT_FORMAT_TO_WRITER: dict[str, type[FrameWriter]] = {
+    "directory": DirectoryFrameWriter,
+    "bundle": BundleFrameWriter,
+    "trajectory": TrajectoryFrameWriter,
+    "corpus": CorpusFrameWriter,
+}
+
+
+def _scrape_and_encode_session(
+    session: _Session,
+    *,
+    writer_class: type[FrameWriter],
+    require_consent: bool = False,
+    require_assent: bool = False,
+) -> ScrapedSession | None:
+    scraped_session = _scrape_session(
+        session,
+        require_consent=require_consent,
+        require_assent=require_assent,
+    )
+    if scraped_session is None:
+        return None
+    return writer_class.encode_session(scraped_session)
+
+
+def _map_sessions(
+    scrape_session: t.Callable[[_Session], ScrapedSession | None],
+    sessions: t.Iterable[_Session],
+    *,
+    workers: int,
+    max_pending: int,
+) -> t.Iterator[ScrapedSession | None]:
+    """Scrapes the given sessions, in order, using a pool of worker processes.
+
+    At most max_pending sessions are held in memory at any time.
+    """
+    if workers <= 1:
+        yield from map(scrape_session, sessions)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending: collections.deque[Future[ScrapedSession | None]] = collections.deque()
+        for session in sessions:
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+            pending.append(executor.submit(scrape_session, session))
+        while pending:
+            yield pending.popleft().result()
 
 
 def scrape(
@@ -169,17 +264,90 @@ def scrape(
     *,
     require_consent: bool = False,
     require_assent: bool = False,
-) -> None:
+    workers: int = 1,
+    max_pending: int | None = None,
+    output_format: str = "directory",
+    compress: bool = False,
+    report_every: int = 1000,
+) -> ScrapeStats:
+    """Scrapes the programs from a dump of sessions.
+
+    Sessions are streamed from the dump by a single reader, scraped by a pool of
+    worker processes, and written to disk by a single writer.
+
+    Parameters
+    ----------
+    dump_filename
+        the path to a JSON array of sessions
+    output_to
+        the directory to which programs should be written
+    workers
+        the number of worker processes that should be used to scrape sessions
+    max_pending
+        the maximum number of sessions that may be queued for the workers at once
+    require_consent
+        whether frames that lack consent should be skipped
+    require_assent
+        whether frames that lack assent should be skipped
+    output_format
+        either "directory", which writes each frame to its own file, "bundle",
+        which writes all frames for a given level and user to a single file, or
+        "trajectory", which writes all frames for a given level and user to a
+        single delta-compressed file (see facilitate.scraper.trajectory), or
+        "corpus", which writes all frames to a SQLite corpus at output_to (see
+        facilitate.corpus)
+    compress
+        whether output files should be compressed via gzip
+    report_every
+        the number of sessions between progress reports
+    """
     if isinstance(dump_filename, str):
         dump_filename = Path(dump_filename)
     if isinstance(output_to, str):
         output_to = Path(output_to)
-
-    with dump_filename.open("r") as file:
-        for session in ijson.items(file, "item"):
-            _scrape_session(
-                session=session,
-                output_to=output_to,
-                require_assent=require_assent,
-                require_consent=require_consent,
-            )
+    if max_pending is None:
+        max_pending = 4 * workers
+
+    if output_format not in _OUTPUT_FORMAT_TO_WRITER:
+        error = f"unknown output format: {output_format}"
+        raise ValueError(error)
+    writer_class = _OUTPUT_FORMAT_TO_WRITER[output_format]
+
+    scrape_session = functools.partial(
+        _scrape_and_encode_session,
+        writer_class=writer_class,
+        require_assent=require_assent,
+        require_consent=require_consent,
+    )
+
+    stats = ScrapeStats()
+    started_at = time.perf_counter()
+
+    with (
+        dump_filename.open("rb") as file,
+        writer_class(output_to=output_to, compress=compress) as writer,
+    ):
+        sessions = ijson.items(file, "item", use_float=True)
+        for scraped_session in _map_sessions(
+            scrape_session,
+            sessions,
+            workers=workers,
+            max_pending=max_pending,
+        ):
+            stats.sessions += 1
+            if scraped_session and scraped_session.frames:
+                writer.write(scraped_session)
+                stats.frames += len(scraped_session.frames)
+
+            if stats.sessions % report_every == 0:
+                stats.bytes_read = file.tell()
+                stats.bytes_written = writer.bytes_written
+                stats.seconds = time.perf_counter() - started_at
+                logger.info(stats.describe())
+
+        stats.bytes_read = file.tell()
+
+    stats.bytes_written = writer.bytes_written
+    stats.seconds = time.perf_counter() - started_at
+    logger.info(stats.describe())
+    return stats
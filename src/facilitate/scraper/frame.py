@@ -0,0 +1,95 @@
+"""Provides selective decoding of the frames within a session."""
+from __future__ import annotations
+
+__all__ = ("LazyFrame",)
+
+import json
+import re
+import typing as t
+
+_DECODER = json.JSONDecoder()
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+class LazyFrame:
+    """Provides read access to the top-level values of a frame.
+
+    Frames are often stored as JSON-encoded strings.
+    Rather than decoding the entire string up front, the top-level values of such
+    frames are decoded one at a time, in order, until the requested key is found.
+    Cheap header values (e.g., "actor" and "verb") can thus be inspected without
+    paying to decode the (large) program within "state_info".
+
+    How lazy this is depends on the order of the keys: every value that precedes
+    the requested key is decoded along the way (e.g., "state_info", if it comes
+    before "actor"), and looking up a key that is absent decodes the entire frame.
+    """
+    def __init__(self, raw: str | dict[str, t.Any]) -> None:
+        """Wraps a frame, given either as a JSON-encoded string or as an already decoded object."""
+        self._text: str | None = None
+        self._values: dict[str, t.Any]
+        self._offset = 0
+        self._exhausted = True
+
+        if isinstance(raw, dict):
+            self._values = raw
+            return
+
+        self._text = raw
+        self._values = {}
+        self._offset = self._skip_whitespace(0)
+        if raw[self._offset:self._offset + 1] != "{":
+            error = "frame is not a JSON object"
+            raise ValueError(error)
+        self._offset += 1
+        self._exhausted = False
+
+    def may_contain(self, text: str) -> bool:
+        """Cheaply determines whether the given (unescaped) text may appear within this frame.
+
+        Returns True if the frame has already been decoded, since the check would not be cheap.
+        """
+        if self._text is None:
+            return True
+        return text in self._text
+
+    def _skip_whitespace(self, offset: int) -> int:
+        assert self._text is not None
+        match = _WHITESPACE.match(self._text, offset)
+        return match.end() if match else offset
+
+    def _decode_next(self) -> None:
+        text = self._text
+        assert text is not None
+
+        offset = self._skip_whitespace(self._offset)
+        if text[offset:offset + 1] == ",":
+            offset = self._skip_whitespace(offset + 1)
+        if text[offset:offset + 1] == "}":
+            self._exhausted = True
+            return
+
+        try:
+            key, offset = _DECODER.raw_decode(text, offset)
+            offset = self._skip_whitespace(offset)
+            if not isinstance(key, str) or text[offset:offset + 1] != ":":
+                error = f"malformed frame at position {offset}"
+                raise ValueError(error)
+            offset = self._skip_whitespace(offset + 1)
+            value, offset = _DECODER.raw_decode(text, offset)
+        except json.JSONDecodeError as err:
+            error = f"malformed frame at position {err.pos}"
+            raise ValueError(error) from err
+
+        self._values[key] = value
+        self._offset = offset
+
+    def get(self, key: str, default: t.Any = None) -> t.Any:  # noqa: ANN401
+        """Returns the value of a top-level key within this frame."""
+        while key not in self._values and not self._exhausted:
+            self._decode_next()
+        return self._values.get(key, default)
+
+    def __contains__(self, key: str) -> bool:
+        sentinel = object()
+        return self.get(key, sentinel) is not sentinel
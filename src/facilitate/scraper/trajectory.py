@@ -0,0 +1,172 @@
+"""Stores the successive programs of a student as a delta-compressed trajectory.
+
+A trajectory file is a JSON Lines file in which each line describes a single frame.
+Checkpoint records store a complete snapshot of the blocks within the program:
+
+    {"frame": 3, "checkpoint": {...blocks...}}
+
+All other records store the blocks that were added, changed, or removed since the
+previous record:
+
+    {"frame": 4, "added": {...}, "changed": {...}, "removed": [...]}
+
+Every session begins with a checkpoint, and checkpoints are repeated periodically
+so that any frame can be rebuilt by replaying only a handful of deltas.
+"""
+from __future__ import annotations
+
+__all__ = (
+    "DEFAULT_CHECKPOINT_INTERVAL",
+    "Trajectory",
+    "encode_trajectory",
+)
+
+import gzip
+import json
+import typing as t
+from dataclasses import dataclass
+from pathlib import Path
+
+_Blocks = dict[str, dict[str, t.Any]]
+
+DEFAULT_CHECKPOINT_INTERVAL = 16
+
+# records are written as {"frame":N,"<kind>":...}, so checkpoints are recognized without
+# decoding them by reading the key that directly follows the frame index
+_FRAME_PREFIX = b'{"frame":'
+_CHECKPOINT_KEY = b'"checkpoint":'
+
+
+def _encode(value: object) -> bytes:
+    return json.dumps(value, separators=(",", ":")).encode("utf-8")
+
+
+def _is_checkpoint(line: bytes) -> bool:
+    """Determines whether a record is a checkpoint, decoding it only if it was not written by encode_trajectory."""
+    if line.startswith(_FRAME_PREFIX):
+        end_of_frame = line.find(b",", len(_FRAME_PREFIX))
+        if end_of_frame != -1 and line[len(_FRAME_PREFIX):end_of_frame].isdigit():
+            return line.startswith(_CHECKPOINT_KEY, end_of_frame + 1)
+    return "checkpoint" in json.loads(line)
+
+
+def _apply_delta(blocks: _Blocks, record: dict[str, t.Any]) -> _Blocks:
+    """Applies a delta record to a snapshot of blocks in place."""
+    for id_ in record["removed"]:
+        del blocks[id_]
+    blocks.update(record["changed"])
+    blocks.update(record["added"])
+    return blocks
+
+
+def encode_trajectory(
+    frames: t.Iterable[tuple[int, _Blocks]],
+    *,
+    checkpoint_interval: int = DEFAULT_CHECKPOINT_INTERVAL,
+) -> list[tuple[int, bytes]]:
+    """Encodes the successive frames of a session as a list of trajectory records.
+
+    A checkpoint is also written whenever a delta would not exactly reproduce the
+    order of the blocks within a frame, since that order determines the order of
+    the top-level sequences within the parsed program.
+    """
+    records: list[tuple[int, bytes]] = []
+    previous: _Blocks | None = None
+    since_checkpoint = 0
+
+    for index, blocks in frames:
+        record: dict[str, t.Any] | None = None
+        if previous is not None and since_checkpoint < checkpoint_interval:
+            record = {
+                "frame": index,
+                "added": {id_: block for id_, block in blocks.items() if id_ not in previous},
+                "changed": {
+                    id_: block
+                    for id_, block in blocks.items()
+                    if id_ in previous and previous[id_] != block
+                },
+                "removed": [id_ for id_ in previous if id_ not in blocks],
+            }
+            rebuilt = _apply_delta(dict(previous), record)
+            if list(rebuilt) != list(blocks):
+                record = None
+
+        if record is None:
+            record = {"frame": index, "checkpoint": blocks}
+            since_checkpoint = 0
+        else:
+            since_checkpoint += 1
+
+        records.append((index, _encode(record)))
+        previous = blocks
+
+    return records
+
+
+@dataclass(frozen=True)
+class Trajectory:
+    """Provides random access to the frames within a trajectory file.
+
+    Records are only decoded when they are needed to rebuild a requested frame.
+    """
+    _lines: list[bytes]
+    _is_checkpoint: list[bool]
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> Trajectory:
+        lines = [line for line in data.split(b"\n") if line]
+        is_checkpoint = [_is_checkpoint(line) for line in lines]
+        if lines and not is_checkpoint[0]:
+            error = "trajectory must begin with a checkpoint"
+            raise ValueError(error)
+        return cls(_lines=lines, _is_checkpoint=is_checkpoint)
+
+    @classmethod
+    def load(cls, filename: str | Path) -> Trajectory:
+        path = Path(filename)
+        if path.suffix == ".gz":
+            with gzip.open(path, "rb") as file:
+                return cls.from_bytes(file.read())
+        return cls.from_bytes(path.read_bytes())
+
+    def __len__(self) -> int:
+        return len(self._lines)
+
+    def frame_index(self, position: int) -> int:
+        """Returns the index of the frame at a given position within the trajectory."""
+        record = json.loads(self._lines[position])
+        return int(record["frame"])
+
+    def blocks(self, position: int) -> _Blocks:
+        """Rebuilds the blocks of the frame at a given position within the trajectory.
+
+        The blocks are decoded afresh, so they can be modified freely.
+        """
+        if position < 0:
+            position += len(self._lines)
+        if not 0 <= position < len(self._lines):
+            error = f"frame position out of range: {position}"
+            raise IndexError(error)
+
+        checkpoint_position = position
+        while not self._is_checkpoint[checkpoint_position]:
+            checkpoint_position -= 1
+
+        blocks: _Blocks = json.loads(self._lines[checkpoint_position])["checkpoint"]
+        for line in self._lines[checkpoint_position + 1:position + 1]:
+            _apply_delta(blocks, json.loads(line))
+        return blocks
+
+    def frames(self) -> t.Iterator[tuple[int, _Blocks]]:
+        """Iterates over the index and blocks of each frame within the trajectory, in order.
+
+        Frames are read-only: to avoid copying every block of every frame, each frame
+        shares the descriptions of its unchanged blocks with the frame before it, so
+        a frame must be copied before it is modified (e.g., before it is loaded as a
+        program). Use blocks to rebuild a single frame that can be modified freely.
+        """
+        blocks: _Blocks = {}
+        for line in self._lines:
+            record = json.loads(line)
+            blocks = record["checkpoint"] if "checkpoint" in record else _apply_delta(dict(blocks), record)
+            yield int(record["frame"]), blocks
@@ -0,0 +1,242 @@
+"""Writes the frames of scraped sessions to disk."""
+from __future__ import annotations
+
+__all__ = (
+    "BundleFrameWriter",
+    "CorpusFrameWriter",
+    "DirectoryFrameWriter",
+    "FrameWriter",
+    "ScrapedSession",
+    "TrajectoryFrameWriter",
+)
+
+import abc
+import gzip
+import json
+import typing as t
+from dataclasses import dataclass, field
+
+from overrides import overrides
+
+from facilitate.corpus import Corpus, ProgramMetadata
+from facilitate.scraper.trajectory import encode_trajectory
+
+if t.TYPE_CHECKING:
+    from pathlib import Path
+    from types import TracebackType
+
+
+@dataclass(frozen=True)
+class ScrapedSession:
+    """Describes the program-changing frames of a single session.
+
+    Attributes
+    ----------
+    level_id
+        the ID of the level that was attempted during the session
+    user_id
+        the ID of the user that performed the session
+    frames
+        the index of each frame within the session, paired with the compact
+        JSON encoding of the blocks of the program at that frame
+    metadata
+        the parse metadata of the program at each frame, if computed
+    """
+    level_id: str
+    user_id: str
+    frames: list[tuple[int, bytes]]
+    metadata: list[ProgramMetadata] | None = None
+
+
+@dataclass
+class FrameWriter(abc.ABC):
+    output_to: Path
+    compress: bool = False
+    bytes_written: int = field(default=0, init=False)
+
+    @classmethod
+    def encode_session(cls, session: ScrapedSession) -> ScrapedSession:
+        """Prepares the frames of a scraped session for writing.
+
+        This is called by the worker that scraped the session, before the session
+        is handed to the writer, so that expensive encodings are done in parallel.
+        """
+        return session
+
+    @abc.abstractmethod
+    def write(self, session: ScrapedSession) -> None:
+        """Writes the frames of a scraped session."""
+        ...
+
+    def close(self) -> None:
+        """Flushes any buffered output."""
+        return
+
+    def __enter__(self) -> t.Self:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        self.close()
+
+    def _write_bytes(self, path: Path, data: bytes, *, append: bool = False) -> None:
+        mode: t.Literal["ab", "wb"] = "ab" if append else "wb"
+        if self.compress:
+            with gzip.open(path, mode, compresslevel=6) as file:
+                file.write(data)
+        else:
+            with path.open(mode) as file:
+                file.write(data)
+        self.bytes_written += len(data)
+
+
+@dataclass
+class DirectoryFrameWriter(FrameWriter):
+    """Writes each frame to its own file at output_to/level_id/user_id/frame_index.json."""
+    _created_directories: set[Path] = field(default_factory=set, init=False)
+
+    @overrides
+    def write(self, session: ScrapedSession) -> None:
+        directory = self.output_to / session.level_id / session.user_id
+        if directory not in self._created_directories:
+            directory.mkdir(parents=True, exist_ok=True)
+            self._created_directories.add(directory)
+
+        suffix = ".json.gz" if self.compress else ".json"
+        for index, blocks in session.frames:
+            self._write_bytes(directory / f"{index}{suffix}", blocks)
+
+
+@dataclass
+class BundleFrameWriter(FrameWriter):
+    """Writes all frames for a given level and user to a single JSON Lines file.
+
+    Frames are written to output_to/level_id/user_id.jsonl as objects of the form
+    {"frame": frame_index, "blocks": blocks}, and are buffered in memory so that
+    they can be written in bulk. Any existing file is replaced by the first
+    flush that writes to it, and appended to by later flushes.
+    """
+    buffer_size: int = 8 * 1024 * 1024
+    _buffers: dict[Path, bytearray] = field(default_factory=dict, init=False)
+    _buffered: int = field(default=0, init=False)
+    _created_directories: set[Path] = field(default_factory=set, init=False)
+    _written_paths: set[Path] = field(default_factory=set, init=False)
+
+    def _path(self, session: ScrapedSession) -> Path:
+        suffix = ".jsonl.gz" if self.compress else ".jsonl"
+        return self.output_to / session.level_id / f"{session.user_id}{suffix}"
+
+    def _encode_line(self, index: int, blocks: bytes) -> bytes:
+        return b'{"frame":%d,"blocks":%b}\n' % (index, blocks)
+
+    @overrides
+    def write(self, session: ScrapedSession) -> None:
+        path = self._path(session)
+        buffer = self._buffers.setdefault(path, bytearray())
+        size_before = len(buffer)
+        for index, blocks in session.frames:
+            buffer += self._encode_line(index, blocks)
+        self._buffered += len(buffer) - size_before
+
+        if self._buffered >= self.buffer_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """Writes all buffered frames to their files."""
+        for path, buffer in self._buffers.items():
+            if path.parent not in self._created_directories:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                self._created_directories.add(path.parent)
+            # NOTE files written by an earlier run are truncated, rather than appended to
+            self._write_bytes(path, bytes(buffer), append=path in self._written_paths)
+            self._written_paths.add(path)
+        self._buffers.clear()
+        self._buffered = 0
+
+    @overrides
+    def close(self) -> None:
+        self.flush()
+
+
+@dataclass
+class TrajectoryFrameWriter(BundleFrameWriter):
+    """Writes all frames for a given level and user to a single delta-compressed trajectory.
+
+    Trajectories are written to output_to/level_id/user_id.trajectory.jsonl and
+    can be read via facilitate.scraper.trajectory.Trajectory.
+    """
+    @classmethod
+    @overrides
+    def encode_session(cls, session: ScrapedSession) -> ScrapedSession:
+        frames = [(index, json.loads(blocks)) for index, blocks in session.frames]
+        return ScrapedSession(
+            level_id=session.level_id,
+            user_id=session.user_id,
+            frames=encode_trajectory(frames),
+        )
+
+    @overrides
+    def _path(self, session: ScrapedSession) -> Path:
+        suffix = ".trajectory.jsonl.gz" if self.compress else ".trajectory.jsonl"
+        return self.output_to / session.level_id / f"{session.user_id}{suffix}"
+
+    @overrides
+    def _encode_line(self, index: int, blocks: bytes) -> bytes:  # noqa: ARG002
+        # NOTE trajectory records already contain the index of their frame
+        return blocks + b"\n"
+
+
+@dataclass
+class CorpusFrameWriter(FrameWriter):
+    """Writes all frames to a corpus at output_to (see facilitate.corpus).
+
+    Programs are parsed by the workers that scraped them, so that their parse
+    metadata is stored alongside them, and are inserted in bulk.
+    Programs are always compressed within a corpus, so compress is ignored.
+    """
+    buffer_size: int = 10_000
+    _buffer: list[tuple[str, str, int, bytes, ProgramMetadata | None]] = field(
+        default_factory=list,
+        init=False,
+    )
+    _corpus: Corpus = field(init=False)
+
+    def __post_init__(self) -> None:
+        self._corpus = Corpus.open(self.output_to)
+
+    @classmethod
+    @overrides
+    def encode_session(cls, session: ScrapedSession) -> ScrapedSession:
+        return ScrapedSession(
+            level_id=session.level_id,
+            user_id=session.user_id,
+            frames=session.frames,
+            metadata=[ProgramMetadata.compute(blocks) for _, blocks in session.frames],
+        )
+
+    @overrides
+    def write(self, session: ScrapedSession) -> None:
+        metadata: t.Sequence[ProgramMetadata | None] = (
+            session.metadata or [None] * len(session.frames)
+        )
+        for (index, blocks), frame_metadata in zip(session.frames, metadata, strict=True):
+            self._buffer.append((session.level_id, session.user_id, index, blocks, frame_metadata))
+            self.bytes_written += len(blocks)
+
+        if len(self._buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """Inserts all buffered frames into the corpus."""
+        self._corpus.add_programs(self._buffer)
+        self._corpus.commit()
+        self._buffer.clear()
+
+    @overrides
+    def close(self) -> None:
+        self.flush()
+        self._corpus.close()
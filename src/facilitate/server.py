@@ -1,10 +1,12 @@
 from __future__ import annotations
 
-import json
+import io
 import typing as t
 
 import flask
 import flask_cors
+import werkzeug.exceptions
+import werkzeug.wsgi
 from apiflask import APIFlask, Schema
 from apiflask.fields import (
     Boolean,
@@ -16,15 +18,190 @@ from apiflask.fields import (
     Nested,
     String,
 )
+from apiflask.validators import OneOf, Range
+from loguru import logger
+from marshmallow import ValidationError, validates_schema
 
+from facilitate.deadline import deadline_after, enforce_deadline
 from facilitate.diff import compute_edit_script
-from facilitate.distance import compute_edit_script_and_distance
-from facilitate.loader import load_program_from_block_descriptions
+from facilitate.distance import (
+    COST_MODEL_VERSION,
+    DISTANCE_METHODS,
+    compute_edit_script_and_distance_before_deadline,
+)
+from facilitate.limits import AdmissionError, RequestLimits
+from facilitate.loader import LOADER_VERSION, load_program_from_block_descriptions
+from facilitate.memo import CachedResponse, ResponseCache, content_digest
+from facilitate.pqgram import PQGramProfile, ProfileCache
+from facilitate.progress import (
+    ProgressOrder,
+    SolutionDistance,
+    compute_progress,
+    compute_trajectory_progress,
+    load_program_from_project,
+)
+from facilitate.registry import SolutionRegistry, UnknownSolutionError
+from facilitate.util import exception_to_crash_description
+from facilitate.verification import default_verification_policy
+from facilitate.wire import (
+    JSON,
+    UnsupportedWireFormatError,
+    WireFormat,
+    accepts_gzip,
+    compress_stream,
+    decode_request,
+    encode_response,
+    get_wire_format,
+    negotiate_wire_format,
+)
+
+if t.TYPE_CHECKING:
+    from _typeshed.wsgi import StartResponse, WSGIApplication, WSGIEnvironment
+
+    from facilitate.edit import EditScript
+    from facilitate.model.program import Program
+
+NDJSON = "application/x-ndjson"
+
+# the time budget of a request, in seconds, may be given by this header or by its time_budget field
+TIME_BUDGET_HEADER = "X-Time-Budget"
+
+limits = RequestLimits.build()
+
+# the solutions that have been registered for each level (see PUT /levels/<level_id>/solutions)
+registry = SolutionRegistry.build()
+
+# the pq-gram profiles of recently seen programs (e.g., the solutions to a level)
+_profiles = ProfileCache()
+
+# the responses to recent diff, distance and progress requests
+responses = ResponseCache.build()
+
+# the fields of a request that do not affect its response, if that response is memoized
+_UNKEYED_FIELDS = frozenset({"time_budget"})
+
+_ENVIRON_DECODE_ERROR = "facilitate.wire.error"
+
+
+class _RequestDecoder:
+    """Transcodes compressed and non-JSON request bodies to JSON before they reach the app.
+
+    This allows the request schemas to be validated in the same way regardless of
+    the encoding of the request. Bodies that cannot be decoded (or are too large once
+    decompressed) are flagged within the WSGI environment and rejected by the app
+    itself (see _reject_undecodable_request), as are bodies whose values have no
+    JSON equivalent.
+    """
+    def __init__(self, app: WSGIApplication) -> None:
+        self._app = app
+
+    def __call__(self, environ: WSGIEnvironment, start_response: StartResponse) -> t.Iterable[bytes]:
+        content_encoding = environ.get("HTTP_CONTENT_ENCODING")
+        content_type = environ.get("CONTENT_TYPE")
+        if not content_encoding and (not content_type or content_type.startswith(JSON)):
+            return self._app(environ, start_response)
+
+        max_size = limits.max_request_bytes or None
+        try:
+            body = werkzeug.wsgi.get_input_stream(environ, max_content_length=max_size).read()
+            payload = decode_request(body, content_type, content_encoding, max_size=max_size)
+        except UnsupportedWireFormatError as err:
+            environ[_ENVIRON_DECODE_ERROR] = werkzeug.exceptions.UnsupportedMediaType(str(err))
+            return self._app(environ, start_response)
+        except (AdmissionError, werkzeug.exceptions.RequestEntityTooLarge) as err:
+            environ[_ENVIRON_DECODE_ERROR] = werkzeug.exceptions.RequestEntityTooLarge(str(err))
+            return self._app(environ, start_response)
+
+        # NOTE MessagePack and CBOR can encode values that JSON cannot (e.g., bytes, timestamps and tags)
+        try:
+            body = get_wire_format(JSON).dumps(payload)
+        except (TypeError, ValueError) as err:
+            error = f"request body cannot be represented as JSON: {err}"
+            environ[_ENVIRON_DECODE_ERROR] = werkzeug.exceptions.UnprocessableEntity(error)
+            return self._app(environ, start_response)
+
+        environ.pop("HTTP_CONTENT_ENCODING", None)
+        environ["CONTENT_TYPE"] = JSON
+        environ["CONTENT_LENGTH"] = str(len(body))
+        environ["wsgi.input"] = io.BytesIO(body)
+        return self._app(environ, start_response)
+
 
 app = APIFlask(__name__)
+app.config["MAX_CONTENT_LENGTH"] = limits.max_request_bytes or None
+app.wsgi_app = _RequestDecoder(app.wsgi_app)  # type: ignore[method-assign]
 flask_cors.CORS(app)
 
 
+@app.before_request
+def _reject_undecodable_request() -> None:
+    error = flask.request.environ.get(_ENVIRON_DECODE_ERROR)
+    if error is not None:
+        raise error
+
+
+@app.errorhandler(AdmissionError)
+def _reject_oversized_request(error: AdmissionError) -> t.Any:  # noqa: ANN401
+    return app.handle_http_exception(werkzeug.exceptions.RequestEntityTooLarge(str(error)))
+
+
+@app.errorhandler(UnknownSolutionError)
+def _reject_unknown_solution(error: UnknownSolutionError) -> t.Any:  # noqa: ANN401
+    return app.handle_http_exception(werkzeug.exceptions.NotFound(str(error)))
+
+
+def _request_deadline(json_data: dict[str, t.Any]) -> float | None:
+    """Determines the deadline of a request from the tightest of its time budgets."""
+    budget = limits.time_budget(
+        flask.request.headers.get(TIME_BUDGET_HEADER, type=float),
+        json_data.get("time_budget"),
+    )
+    return deadline_after(budget)
+
+
+def _response_wire_format() -> WireFormat:
+    """Determines the format of the response from the Accept header of the request."""
+    return negotiate_wire_format(flask.request.headers.get("Accept"))
+
+
+def _encode_edit_script(edit_script: EditScript, *, compact: bool) -> dict[str, t.Any]:
+    if compact:
+        return edit_script.to_compact_dict()
+    return edit_script.to_dict()
+
+
+def _respond(payload: t.Any, wire_format: WireFormat) -> flask.Response:  # noqa: ANN401
+    """Encodes a response payload in the given format, compressing it if the client accepts gzip."""
+    body, headers = encode_response(
+        payload,
+        wire_format,
+        gzip_allowed=accepts_gzip(flask.request.headers.get("Accept-Encoding")),
+    )
+    response = flask.Response(body, headers=headers)
+    response.headers.add("Access-Control-Allow-Origin", "*")
+    return response
+
+
+def _respond_memoized(
+    json_data: dict[str, t.Any],
+    compute: t.Callable[[WireFormat], t.Any],
+) -> flask.Response:
+    """Responds with the memoized response to a request, computing its payload via compute if there is none."""
+    wire_format = _response_wire_format()
+    gzip_allowed = accepts_gzip(flask.request.headers.get("Accept-Encoding"))
+    key = response_key(flask.request.path, json_data, wire_format, gzip_allowed=gzip_allowed)
+    cached = responses.get(key)
+    if cached is None:
+        payload = compute(wire_format)
+        body, headers = encode_response(payload, wire_format, gzip_allowed=gzip_allowed)
+        cached = CachedResponse(body=body, headers=headers)
+        if is_memoizable(json_data, payload):
+            responses.put(key, cached)
+    response = flask.Response(cached.body, headers=cached.headers)
+    response.headers.add("Access-Control-Allow-Origin", "*")
+    return response
+
+
 class Block(Schema):
     opcode = String(required=True)
     next_ = String(
@@ -59,7 +236,7 @@ class Solution(Schema):
         required=True,
         strict=True,
     )
-    weight = Float(strict=True)
+    weight = Float()
     program = String(required=True)
     created_at = DateTime(required=False)
     updated_at = DateTime(required=False)
@@ -78,73 +255,382 @@ class DiffRequest(Schema):
         required=True,
         data_key="to",
     )
+    compact = Boolean(load_default=False)
 
 
-class ProgressRequest(Schema):
-    user_program = String()
+class DistanceRequest(DiffRequest):
+    time_budget = Float(
+        load_default=None,
+        validate=Range(min=0, min_inclusive=False),
+    )
+    method = String(
+        load_default="gumtree",
+        validate=OneOf(DISTANCE_METHODS),
+    )
+
+
+def _validate_solution_source(data: dict[str, t.Any]) -> None:
+    """Ensures that a request either gives its solutions in full or refers to the solutions to a level."""
+    if ("solutions" in data) == ("level" in data):
+        error = "exactly one of solutions and level must be given"
+        raise ValidationError(error, "solutions")
+    if "solution_ids" in data and "level" not in data:
+        error = "solution_ids may only be given together with level"
+        raise ValidationError(error, "solution_ids")
+
+
+class RegisterSolutionsRequest(Schema):
     solutions = List(
         Nested(Solution()),
         required=True,
     )
 
 
-@app.put("/diff")  # type: ignore
-@app.input(DiffRequest, location="json")
-def diff(json_data: dict[str, t.Any]) -> flask.Response:
-    jsn_from_program = json_data["from_program"]
-    jsn_to_program = json_data["to_program"]
+class ProgressRequest(Schema):
+    user_program = String()
+    # the solutions are either given in full, or refer to those registered for a level
+    solutions = List(Nested(Solution()))
+    level = String()
+    solution_ids = List(Integer(strict=True))
+    time_budget = Float(
+        load_default=None,
+        validate=Range(min=0, min_inclusive=False),
+    )
+    method = String(
+        load_default="gumtree",
+        validate=OneOf(DISTANCE_METHODS),
+    )
 
-    from_program = load_program_from_block_descriptions(jsn_from_program)
-    to_program = load_program_from_block_descriptions(jsn_to_program)
+    @validates_schema
+    def _validate_solutions(self, data: dict[str, t.Any], **_: t.Any) -> None:  # noqa: ANN401
+        _validate_solution_source(data)
 
-    edit_script = compute_edit_script(from_program, to_program)
-    response = flask.jsonify(edit_script.to_dict())
-    response.headers.add("Access-Control-Allow-Origin", "*")
-    return response
 
+class StreamingProgressRequest(ProgressRequest):
+    order = String(
+        load_default="solution",
+        validate=OneOf(["solution", "completion"]),
+    )
 
-@app.put("/distance")  # type: ignore
-@app.input(DiffRequest, location="json")
-def distance(json_data: dict[str, t.Any]) -> flask.Response:
-    jsn_from_program = json_data["from_program"]
-    jsn_to_program = json_data["to_program"]
 
-    from_program = load_program_from_block_descriptions(jsn_from_program)
-    to_program = load_program_from_block_descriptions(jsn_to_program)
+class TrajectoryProgressRequest(Schema):
+    user_programs = List(
+        String(),
+        required=True,
+    )
+    solutions = List(Nested(Solution()))
+    level = String()
+    solution_ids = List(Integer(strict=True))
+    include_edits = Boolean(load_default=False)
+
+    @validates_schema
+    def _validate_solutions(self, data: dict[str, t.Any], **_: t.Any) -> None:  # noqa: ANN401
+        _validate_solution_source(data)
+
+
+# NOTE the handlers below are shared with the asynchronous entry point (see facilitate.asgi),
+# which runs them within worker processes; they take the loaded request and return the
+# payload of the response
+
 
-    edit_script, distance = compute_edit_script_and_distance(from_program, to_program)
-    response = flask.jsonify({
-        "edits": edit_script.to_dict(),
+def _load_program(description: dict[str, t.Any] | str, *, project: bool = False) -> Program:
+    """Loads a program from a request, subject to the admission limits."""
+    if project:
+        assert isinstance(description, str)
+        program = load_program_from_project(description)
+    else:
+        assert isinstance(description, dict)
+        program = load_program_from_block_descriptions(description)
+    limits.check_program(program)
+    return program
+
+
+def _load_solutions(json_data: dict[str, t.Any]) -> t.Iterator[tuple[t.Any, Program]]:
+    """Loads the solutions of a request, which are either given in full or registered for a level.
+
+    The number of solutions is checked immediately, whereas the solutions
+    themselves are loaded lazily.
+    """
+    if "level" in json_data:
+        prepared_solutions = registry.get(json_data["level"], json_data.get("solution_ids"))
+        limits.check_solutions(len(prepared_solutions))
+        return ((solution.id_, solution.program) for solution in prepared_solutions)
+
+    limits.check_solutions(len(json_data["solutions"]))
+    return (
+        (solution["id"], _load_program(solution["program"], project=True))
+        for solution in json_data["solutions"]
+    )
+
+
+def response_key(
+    path: str,
+    json_data: dict[str, t.Any],
+    wire_format: WireFormat,
+    *,
+    gzip_allowed: bool,
+) -> bytes:
+    """Derives the key under which the response to a diff, distance or progress request is memoized.
+
+    Programs are represented by their content hashes, whereas the other fields of
+    the request are included as they are, except for time budgets: only exact
+    results are memoized (see is_memoizable), and these do not depend on them.
+    """
+    fields = {name: value for name, value in json_data.items() if name not in _UNKEYED_FIELDS}
+    for name in ("from_program", "to_program", "user_program"):
+        if name in fields:
+            fields[name] = content_digest(fields[name])
+    if "level" in json_data:
+        fields["solutions"] = [
+            [solution.id_, solution.content_hash]
+            for solution in registry.get(json_data["level"], json_data.get("solution_ids"))
+        ]
+    elif "solutions" in json_data:
+        fields["solutions"] = [
+            [solution["id"], content_digest(solution["program"])]
+            for solution in json_data["solutions"]
+        ]
+    return ResponseCache.key(path, LOADER_VERSION, COST_MODEL_VERSION, wire_format.media_type, gzip_allowed, fields)
+
+
+def is_memoizable(json_data: dict[str, t.Any], payload: t.Any) -> bool:  # noqa: ANN401
+    """Determines whether a response may be memoized.
+
+    Distances that were approximated because the deadline of the request passed
+    are not, since the same request may be answered exactly given more time.
+    """
+    if json_data.get("method") == "pqgram":
+        return True
+    results = payload if isinstance(payload, list) else [payload]
+    return not any(result.get("approximate", False) for result in results)
+
+
+def handle_diff(json_data: dict[str, t.Any], *, compact_edits: bool = False) -> dict[str, t.Any]:
+    from_program = _load_program(json_data["from_program"])
+    to_program = _load_program(json_data["to_program"])
+
+    edit_script = compute_edit_script(from_program, to_program, compact=json_data["compact"])
+    return _encode_edit_script(edit_script, compact=compact_edits)
+
+
+def handle_distance(
+    json_data: dict[str, t.Any],
+    *,
+    compact_edits: bool = False,
+    deadline: float | None = None,
+) -> dict[str, t.Any]:
+    from_program = _load_program(json_data["from_program"])
+    to_program = _load_program(json_data["to_program"])
+
+    if json_data["method"] == "pqgram":
+        distance = PQGramProfile.build(from_program).distance_to(PQGramProfile.build(to_program))
+        return {"edits": None, "distance": distance, "approximate": True}
+
+    with enforce_deadline(deadline):
+        edit_script, distance = compute_edit_script_and_distance_before_deadline(
+            from_program,
+            to_program,
+            compact=json_data["compact"],
+        )
+    return {
+        "edits": None if edit_script is None else _encode_edit_script(edit_script, compact=compact_edits),
         "distance": distance,
-    })
-    response.headers.add("Access-Control-Allow-Origin", "*")
-    return response
+        "approximate": edit_script is None,
+    }
+
+
+def handle_progress(
+    json_data: dict[str, t.Any],
+    *,
+    compact_edits: bool = False,
+    deadline: float | None = None,
+) -> list[dict[str, t.Any]]:
+    with enforce_deadline(deadline):
+        return [
+            solution_distance.to_dict(compact=compact_edits)
+            for solution_distance in _compute_progress(json_data)
+        ]
+
+
+def split_progress_request(json_data: dict[str, t.Any]) -> list[dict[str, t.Any]]:
+    """Splits a progress request into one request per solution (see handle_solution_progress)."""
+    if "level" in json_data:
+        solution_ids = json_data.get("solution_ids")
+        if solution_ids is None:
+            solution_ids = registry.solution_ids(json_data["level"])
+        requests = [json_data | {"solution_ids": [solution_id]} for solution_id in solution_ids]
+    else:
+        requests = [json_data | {"solutions": [solution]} for solution in json_data["solutions"]]
+    limits.check_solutions(len(requests))
+    return requests
+
+
+def handle_solution_progress(
+    json_data: dict[str, t.Any],
+    *,
+    deadline: float | None = None,
+) -> dict[str, t.Any]:
+    """Computes the progress towards the only solution of a request, as a single line of a /progress/stream response."""
+    (solution_distance,) = handle_progress(json_data, deadline=deadline)
+    return solution_distance
+
+
+def _compute_progress(
+    json_data: dict[str, t.Any],
+    *,
+    order: ProgressOrder = "solution",
+) -> t.Iterator[SolutionDistance]:
+    if json_data["method"] == "pqgram":
+        return _compute_pqgram_progress(json_data)
+    user_program = _load_program(json_data["user_program"], project=True)
+    return compute_progress(user_program, _load_solutions(json_data), order=order)
+
+
+def _compute_pqgram_progress(json_data: dict[str, t.Any]) -> t.Iterator[SolutionDistance]:
+    """Approximates the progress towards each solution from the pq-gram profiles of the programs.
+
+    Profiles of the programs within the request are cached by their contents, so
+    solutions that are sent with every request are only parsed and profiled once.
+    """
+    def profile(project: str) -> PQGramProfile:
+        return _profiles.get(project, lambda: _load_program(project, project=True))
+
+    user_profile = profile(json_data["user_program"])
+    solution_profiles: t.Iterable[tuple[t.Any, PQGramProfile]]
+    if "level" in json_data:
+        solution_profiles = (
+            (solution_id, PQGramProfile.build(solution))
+            for solution_id, solution in _load_solutions(json_data)
+        )
+    else:
+        limits.check_solutions(len(json_data["solutions"]))
+        solution_profiles = (
+            (solution["id"], profile(solution["program"]))
+            for solution in json_data["solutions"]
+        )
+    return (
+        SolutionDistance(
+            solution_id=solution_id,
+            distance=user_profile.distance_to(solution_profile),
+            approximate=True,
+        )
+        for solution_id, solution_profile in solution_profiles
+    )
+
+
+def handle_trajectory_progress(
+    json_data: dict[str, t.Any],
+    *,
+    compact_edits: bool = False,
+) -> list[list[dict[str, t.Any]]]:
+    solutions = list(_load_solutions(json_data))
+    user_programs = (
+        _load_program(user_program, project=True) for user_program in json_data["user_programs"]
+    )
+    return [
+        [
+            solution_distance.to_dict(compact=compact_edits)
+            for solution_distance in solution_distances
+        ]
+        for solution_distances in compute_trajectory_progress(
+            user_programs,
+            solutions,
+            include_edits=json_data["include_edits"],
+        )
+    ]
+
+
+def handle_register_solutions(json_data: dict[str, t.Any], *, level_id: str) -> dict[str, t.Any]:
+    solution_ids = registry.register(level_id, _load_solutions(json_data))
+    return {"level": level_id, "solutions": solution_ids}
+
+
+def handle_registered_solutions(_: dict[str, t.Any], *, level_id: str) -> dict[str, t.Any]:
+    return {"level": level_id, "solutions": registry.solution_ids(level_id)}
+
+
+@app.get("/health")
+def health() -> dict[str, t.Any]:
+    return {
+        "status": "ok",
+        "verification": default_verification_policy().metrics.to_dict(),
+    }
+
+
+@app.put("/diff")  # type: ignore
+@app.input(DiffRequest, location="json")
+def diff(json_data: dict[str, t.Any]) -> flask.Response:
+    return _respond_memoized(
+        json_data,
+        lambda wire_format: handle_diff(json_data, compact_edits=wire_format.compact),
+    )
+
+
+@app.put("/distance")  # type: ignore
+@app.input(DistanceRequest, location="json")
+def distance(json_data: dict[str, t.Any]) -> flask.Response:
+    deadline = _request_deadline(json_data)
+    return _respond_memoized(
+        json_data,
+        lambda wire_format: handle_distance(json_data, compact_edits=wire_format.compact, deadline=deadline),
+    )
 
 
 @app.put("/progress")  # type: ignore
 @app.input(ProgressRequest, location="json")
 def progress(json_data: dict[str, t.Any]) -> flask.Response:
-    jsn_user_program = json.loads(json_data["user_program"])
-    jsn_user_blocks = jsn_user_program["targets"][0]["blocks"]
-    user_program = load_program_from_block_descriptions(jsn_user_blocks)
-
-    solution_distances: list[dict[str, t.Any]] = []
-
-    solutions = json_data["solutions"]
-    for solution in solutions:
-        jsn_solution_program = json.loads(solution["program"])
-        jsn_solution_blocks = jsn_solution_program["targets"][0]["blocks"]
-        solution_program = load_program_from_block_descriptions(jsn_solution_blocks)
-        edit_script, distance = compute_edit_script_and_distance(
-            tree_from=user_program,
-            tree_to=solution_program,
-        )
-        solution_distances.append({
-            "id": solution["id"],
-            "distance": distance,
-            "edits": edit_script.to_dict(),
-        })
+    deadline = _request_deadline(json_data)
+    return _respond_memoized(
+        json_data,
+        lambda wire_format: handle_progress(json_data, compact_edits=wire_format.compact, deadline=deadline),
+    )
+
+
+@app.put("/progress/stream")  # type: ignore
+@app.input(StreamingProgressRequest, location="json")
+def streaming_progress(json_data: dict[str, t.Any]) -> flask.Response:
+    deadline = _request_deadline(json_data)
+    solution_distances = _compute_progress(json_data, order=json_data["order"])
 
-    response = flask.jsonify(solution_distances)
+    def generate() -> t.Iterator[bytes]:
+        # NOTE the status of the response has already been sent, so errors are reported in-band
+        try:
+            with enforce_deadline(deadline):
+                for solution_distance in solution_distances:
+                    yield get_wire_format(JSON).dumps(solution_distance.to_dict()) + b"\n"
+        except Exception as err:  # noqa: BLE001
+            logger.exception("failed to compute progress")
+            error = {"error": exception_to_crash_description(err)}
+            yield get_wire_format(JSON).dumps(error) + b"\n"
+
+    lines = generate()
+    response = flask.Response(content_type=NDJSON)
+    if accepts_gzip(flask.request.headers.get("Accept-Encoding")):
+        response.response = compress_stream(lines)
+        response.headers["Content-Encoding"] = "gzip"
+    else:
+        response.response = lines
+    response.vary.add("Accept-Encoding")
     response.headers.add("Access-Control-Allow-Origin", "*")
     return response
+
+
+@app.put("/progress/trajectory")  # type: ignore
+@app.input(TrajectoryProgressRequest, location="json")
+def trajectory_progress(json_data: dict[str, t.Any]) -> flask.Response:
+    wire_format = _response_wire_format()
+    return _respond(
+        handle_trajectory_progress(json_data, compact_edits=wire_format.compact),
+        wire_format,
+    )
+
+
+@app.put("/levels/<level_id>/solutions")  # type: ignore
+@app.input(RegisterSolutionsRequest, location="json")
+def register_solutions(level_id: str, json_data: dict[str, t.Any]) -> flask.Response:
+    return _respond(handle_register_solutions(json_data, level_id=level_id), _response_wire_format())
+
+
+@app.get("/levels/<level_id>/solutions")
+def registered_solutions(level_id: str) -> flask.Response:
+    return _respond(handle_registered_solutions({}, level_id=level_id), _response_wire_format())
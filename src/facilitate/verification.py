@@ -0,0 +1,261 @@
+"""Decides how thoroughly the edit scripts that are computed by the diff are verified.
+
+The diff sanity checks its mappings and, once the edit script has been applied,
+that the edited tree is equivalent to the target tree. Both walk entire trees, so
+they are governed by a verification policy:
+
+* full: every diff is verified as it is computed (for tests and fuzzing).
+* sampled: one in every N diffs is verified as it is computed.
+* shadow: diffs are not verified as they are computed; instead, each edit script
+  is applied to a copy of its source tree and compared to its target tree by a
+  background thread, after the result has been returned. Verifications are
+  dropped (rather than queued without bound) if the thread falls behind.
+
+A failed verification is logged and counted (see VerificationMetrics). If a
+reproducer directory is given, the pair of programs is also written to it in the
+binary format (see facilitate.binary and load_reproducer). Failures found as a diff
+is computed still raise an AssertionError, since its edit script cannot be trusted.
+"""
+from __future__ import annotations
+
+__all__ = (
+    "ENV_REPRODUCER_DIR",
+    "ENV_VERIFICATION",
+    "ENV_VERIFICATION_SAMPLE_RATE",
+    "VerificationMetrics",
+    "VerificationMode",
+    "VerificationPolicy",
+    "default_verification_policy",
+    "load_reproducer",
+)
+
+import contextlib
+import enum
+import functools
+import hashlib
+import itertools
+import os
+import queue
+import threading
+import typing as t
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from loguru import logger
+
+from facilitate.binary import dump_program, load_program_from_bytes
+from facilitate.loader import LOADER_VERSION
+from facilitate.model.program import Program
+
+if t.TYPE_CHECKING:
+    from facilitate.edit import EditScript
+    from facilitate.mappings import NodeMappings
+    from facilitate.model.node import Node
+
+# the verification mode: full, sampled or shadow
+ENV_VERIFICATION = "FACILITATE_VERIFICATION"
+# in sampled mode, one in this many diffs is verified
+ENV_VERIFICATION_SAMPLE_RATE = "FACILITATE_VERIFICATION_SAMPLE_RATE"
+# the directory to which the programs of failed verifications are written, if any
+ENV_REPRODUCER_DIR = "FACILITATE_REPRODUCER_DIR"
+
+_DEFAULT_SAMPLE_RATE = 100
+_SHADOW_QUEUE_SIZE = 64
+
+
+class VerificationMode(enum.Enum):
+    FULL = "full"
+    SAMPLED = "sampled"
+    SHADOW = "shadow"
+
+
+@dataclass
+class VerificationMetrics:
+    """Counts the outcomes of verifications.
+
+    Attributes
+    ----------
+    verified
+        the number of diffs that were verified successfully
+    failed
+        the number of diffs that failed verification
+    skipped
+        the number of diffs that were not sampled for verification
+    dropped
+        the number of shadow verifications that were dropped because the
+        background thread had fallen behind
+    """
+    verified: int = 0
+    failed: int = 0
+    skipped: int = 0
+    dropped: int = 0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def count(self, outcome: t.Literal["verified", "failed", "skipped", "dropped"]) -> None:
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+
+    def to_dict(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "verified": self.verified,
+                "failed": self.failed,
+                "skipped": self.skipped,
+                "dropped": self.dropped,
+            }
+
+
+def load_reproducer(path: str | Path) -> tuple[Program, Program]:
+    """Loads the pair of programs that were written for a failed verification.
+
+    The path may be given with or without its .from.bin or .to.bin suffix.
+    """
+    path = Path(path)
+    stem = path.name.removesuffix(".from.bin").removesuffix(".to.bin")
+    from_path = path.with_name(f"{stem}.from.bin")
+    to_path = path.with_name(f"{stem}.to.bin")
+    return load_program_from_bytes(from_path.read_bytes()), load_program_from_bytes(to_path.read_bytes())
+
+
+@dataclass
+class VerificationPolicy:
+    """Decides which diffs are verified, and records the outcomes of their verification.
+
+    The policy is safe to share between threads.
+    """
+    mode: VerificationMode = VerificationMode.FULL
+    sample_rate: int = _DEFAULT_SAMPLE_RATE
+    reproducer_dir: Path | None = None
+    metrics: VerificationMetrics = field(default_factory=VerificationMetrics)
+    _counter: t.Iterator[int] = field(default_factory=itertools.count, init=False, repr=False)
+    _shadow_queue: queue.Queue[tuple[Node, Node, EditScript, NodeMappings]] = field(
+        default_factory=lambda: queue.Queue(maxsize=_SHADOW_QUEUE_SIZE),
+        init=False,
+        repr=False,
+    )
+    _shadow_thread: threading.Thread | None = field(default=None, init=False, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False)
+
+    @classmethod
+    def build(cls) -> VerificationPolicy:
+        """Builds a policy that is configured via environment variables."""
+        reproducer_dir = os.environ.get(ENV_REPRODUCER_DIR)
+        return VerificationPolicy(
+            mode=VerificationMode(os.environ.get(ENV_VERIFICATION, VerificationMode.FULL.value)),
+            sample_rate=int(os.environ.get(ENV_VERIFICATION_SAMPLE_RATE, _DEFAULT_SAMPLE_RATE)),
+            reproducer_dir=Path(reproducer_dir) if reproducer_dir else None,
+        )
+
+    def verify_inline(self) -> bool:
+        """Decides whether the next diff should be verified as it is computed."""
+        if self.mode is VerificationMode.FULL:
+            return True
+        if self.mode is VerificationMode.SAMPLED and next(self._counter) % max(self.sample_rate, 1) == 0:
+            return True
+        if self.mode is VerificationMode.SAMPLED:
+            self.metrics.count("skipped")
+        return False
+
+    def check_mappings(self, mappings: NodeMappings, *, tree_from: Node, tree_to: Node) -> None:
+        """Checks that the mappings between two trees are one-to-one and between nodes of the same type."""
+        try:
+            mappings.check()
+        except (TypeError, ValueError) as err:
+            logger.error(f"verification failed: invalid mappings from {tree_from.id_} to {tree_to.id_}: {err}")
+            self._record_failure(tree_from, tree_to)
+            raise
+
+    def check_result(self, edited: Node, *, tree_from: Node, tree_to: Node, edit_script: EditScript) -> None:
+        """Checks that applying an edit script to the source tree yielded a tree that is equivalent to the target tree.
+
+        Raises an AssertionError if it did not.
+        """
+        if edited.equivalent_to(tree_to):
+            self.metrics.count("verified")
+            return
+        error = (
+            f"verification failed: edit script of {len(edit_script)} edits "
+            f"does not transform {tree_from.id_} into {tree_to.id_}"
+        )
+        logger.error(error)
+        self._record_failure(tree_from, tree_to)
+        raise AssertionError(error)
+
+    def submit(self, edit_script: EditScript, mappings: NodeMappings, *, tree_from: Node, tree_to: Node) -> None:
+        """Queues the verification of a diff in shadow mode.
+
+        Neither tree may be modified afterwards, since they are read by the background thread.
+        """
+        self._ensure_shadow_thread()
+        try:
+            self._shadow_queue.put_nowait((tree_from, tree_to, edit_script, mappings))
+        except queue.Full:
+            self.metrics.count("dropped")
+
+    def join(self) -> None:
+        """Waits until every queued shadow verification has completed."""
+        self._shadow_queue.join()
+
+    def _ensure_shadow_thread(self) -> None:
+        with self._lock:
+            if self._shadow_thread is None or not self._shadow_thread.is_alive():
+                self._shadow_thread = threading.Thread(
+                    target=self._run_shadow_verifications,
+                    name="facilitate-verification",
+                    daemon=True,
+                )
+                self._shadow_thread.start()
+
+    def _run_shadow_verifications(self) -> None:
+        while True:
+            tree_from, tree_to, edit_script, mappings = self._shadow_queue.get()
+            try:
+                self._verify_in_shadow(tree_from, tree_to, edit_script, mappings)
+            finally:
+                self._shadow_queue.task_done()
+
+    def _verify_in_shadow(
+        self,
+        tree_from: Node,
+        tree_to: Node,
+        edit_script: EditScript,
+        mappings: NodeMappings,
+    ) -> None:
+        # NOTE failures are logged and recorded by each check, so they need not be raised any further
+        try:
+            self.check_mappings(mappings, tree_from=tree_from, tree_to=tree_to)
+        except (TypeError, ValueError):
+            return
+        try:
+            edited = edit_script.apply(tree_from)
+        except Exception as err:  # noqa: BLE001
+            logger.error(f"verification failed: cannot apply edit script to {tree_from.id_}: {err}")
+            self._record_failure(tree_from, tree_to)
+            return
+        with contextlib.suppress(AssertionError):
+            self.check_result(edited, tree_from=tree_from, tree_to=tree_to, edit_script=edit_script)
+
+    def _record_failure(self, tree_from: Node, tree_to: Node) -> None:
+        self.metrics.count("failed")
+        if self.reproducer_dir is None:
+            return
+        if not isinstance(tree_from, Program) or not isinstance(tree_to, Program):
+            logger.warning("cannot write reproducer: only pairs of programs can be written")
+            return
+        try:
+            dumped_from = dump_program(tree_from, loader_version=LOADER_VERSION)
+            dumped_to = dump_program(tree_to, loader_version=LOADER_VERSION)
+            stem = hashlib.blake2b(dumped_from + dumped_to, digest_size=16).hexdigest()
+            self.reproducer_dir.mkdir(parents=True, exist_ok=True)
+            (self.reproducer_dir / f"{stem}.from.bin").write_bytes(dumped_from)
+            (self.reproducer_dir / f"{stem}.to.bin").write_bytes(dumped_to)
+        except OSError as err:
+            logger.warning(f"failed to write reproducer [{self.reproducer_dir}]: {err}")
+            return
+        logger.error(f"wrote reproducer for failed verification: {self.reproducer_dir / stem}")
+
+
+@functools.cache
+def default_verification_policy() -> VerificationPolicy:
+    """Returns the policy that is configured via environment variables, which is shared by every diff."""
+    return VerificationPolicy.build()
@@ -0,0 +1,305 @@
+"""Provides the wire formats in which the HTTP API accepts and produces payloads.
+
+Payloads are exchanged as JSON by default. Clients may instead select a compact
+encoding, in which edit scripts use short keys and type names (see
+EditScript.to_compact_dict), via the Content-Type and Accept headers:
+
+* MessagePack (application/msgpack), if the msgpack package is installed;
+* CBOR (application/cbor), if the cbor2 package is installed;
+* compact JSON (application/vnd.facilitate.compact+json), which is always available
+  and is used in place of either binary format when its library is missing.
+
+Independently of their format, payloads may be compressed with gzip.
+"""
+from __future__ import annotations
+
+__all__ = (
+    "CBOR",
+    "COMPACT_JSON",
+    "JSON",
+    "MEDIA_TYPES",
+    "MSGPACK",
+    "StreamCompressor",
+    "UnsupportedWireFormatError",
+    "WireFormat",
+    "accepts_gzip",
+    "compress",
+    "compress_stream",
+    "decode_request",
+    "decompress",
+    "encode_response",
+    "get_wire_format",
+    "negotiate_wire_format",
+)
+
+import functools
+import gzip
+import json
+import typing as t
+import zlib
+from dataclasses import dataclass
+
+from werkzeug.datastructures import Accept, MIMEAccept
+from werkzeug.http import parse_accept_header
+
+from facilitate.limits import AdmissionError
+
+JSON = "application/json"
+COMPACT_JSON = "application/vnd.facilitate.compact+json"
+MSGPACK = "application/msgpack"
+CBOR = "application/cbor"
+
+# the media types that the API accepts and produces, in order of preference
+MEDIA_TYPES = (JSON, MSGPACK, CBOR, COMPACT_JSON)
+
+# responses smaller than this are not worth compressing
+_MIN_COMPRESSED_SIZE = 1024
+
+_ALIASES = {
+    "application/x-msgpack": MSGPACK,
+    "application/vnd.msgpack": MSGPACK,
+}
+
+
+class UnsupportedWireFormatError(ValueError):
+    """Raised when a payload is encoded in an unknown or unavailable format."""
+
+
+@dataclass(frozen=True)
+class WireFormat:
+    """Encodes and decodes payloads of a given media type.
+
+    Attributes
+    ----------
+    media_type
+        the media type of the encoded payloads
+    compact
+        whether edit scripts within payloads use the compact encoding
+    """
+    media_type: str
+    compact: bool
+    _dumps: t.Callable[[t.Any], bytes]
+    _loads: t.Callable[[bytes], t.Any]
+
+    def dumps(self, payload: t.Any) -> bytes:  # noqa: ANN401
+        return self._dumps(payload)
+
+    def loads(self, data: bytes) -> t.Any:  # noqa: ANN401
+        return self._loads(data)
+
+
+def _dump_json(payload: t.Any) -> bytes:  # noqa: ANN401
+    return json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+@functools.cache
+def _msgpack_format() -> WireFormat | None:
+    try:
+        import msgpack  # noqa: PLC0415  # msgpack is an optional dependency (see the msgpack extra)
+    except ImportError:
+        return None
+    return WireFormat(
+        media_type=MSGPACK,
+        compact=True,
+        _dumps=functools.partial(msgpack.packb, use_bin_type=True),
+        _loads=functools.partial(msgpack.unpackb, raw=False),
+    )
+
+
+@functools.cache
+def _cbor_format() -> WireFormat | None:
+    try:
+        import cbor2  # noqa: PLC0415  # cbor2 is an optional dependency (see the cbor extra)
+    except ImportError:
+        return None
+    return WireFormat(
+        media_type=CBOR,
+        compact=True,
+        _dumps=cbor2.dumps,
+        _loads=cbor2.loads,
+    )
+
+
+_JSON_FORMAT = WireFormat(
+    media_type=JSON,
+    compact=False,
+    _dumps=_dump_json,
+    _loads=json.loads,
+)
+_COMPACT_JSON_FORMAT = WireFormat(
+    media_type=COMPACT_JSON,
+    compact=True,
+    _dumps=_dump_json,
+    _loads=json.loads,
+)
+
+
+def get_wire_format(media_type: str | None, *, fallback: bool = False) -> WireFormat:
+    """Returns the wire format for a given media type.
+
+    Parameters
+    ----------
+    media_type
+        the media type (parameters, such as the charset, are ignored); JSON is
+        used if no media type is given
+    fallback
+        if True, compact JSON is returned in place of a binary format whose
+        library is not installed
+
+    Raises
+    ------
+    UnsupportedWireFormatError
+        if the media type is unknown, or if its library is not installed and
+        fallback is False
+    """
+    if not media_type:
+        return _JSON_FORMAT
+    media_type = media_type.split(";", 1)[0].strip().lower()
+    media_type = _ALIASES.get(media_type, media_type)
+
+    wire_format: WireFormat | None
+    if media_type == JSON:
+        return _JSON_FORMAT
+    if media_type == COMPACT_JSON:
+        return _COMPACT_JSON_FORMAT
+    if media_type == MSGPACK:
+        wire_format = _msgpack_format()
+    elif media_type == CBOR:
+        wire_format = _cbor_format()
+    else:
+        error = f"unsupported media type: {media_type}"
+        raise UnsupportedWireFormatError(error)
+
+    if wire_format is not None:
+        return wire_format
+    if fallback:
+        return _COMPACT_JSON_FORMAT
+    error = f"media type requires a library that is not installed: {media_type}"
+    raise UnsupportedWireFormatError(error)
+
+
+def compress(data: bytes) -> bytes:
+    """Compresses a payload with gzip."""
+    return gzip.compress(data, compresslevel=6)
+
+
+class StreamCompressor:
+    """Compresses a stream of chunks with gzip, flushing after each chunk so that it can be read immediately."""
+    def __init__(self) -> None:
+        """Creates a compressor that writes a gzip header, rather than a raw zlib stream."""
+        self._compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, chunk: bytes) -> bytes:
+        return self._compressor.compress(chunk) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+def compress_stream(chunks: t.Iterable[bytes]) -> t.Iterator[bytes]:
+    """Compresses a stream of chunks with gzip (see StreamCompressor)."""
+    compressor = StreamCompressor()
+    for chunk in chunks:
+        yield compressor.compress(chunk)
+    yield compressor.finish()
+
+
+def decompress(data: bytes, *, max_size: int | None = None) -> bytes:
+    """Decompresses a gzip-compressed payload.
+
+    Raises
+    ------
+    UnsupportedWireFormatError
+        if the payload is not valid gzip
+    AdmissionError
+        if the decompressed payload would exceed max_size bytes
+    """
+    if max_size is None:
+        try:
+            return gzip.decompress(data)
+        except (OSError, EOFError) as err:
+            error = "malformed gzip payload"
+            raise UnsupportedWireFormatError(error) from err
+
+    # decompress incrementally, so that a small payload cannot expand without bound
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    try:
+        decompressed = decompressor.decompress(data, max_size + 1)
+    except zlib.error as err:
+        error = "malformed gzip payload"
+        raise UnsupportedWireFormatError(error) from err
+    if len(decompressed) > max_size:
+        error = f"request body exceeds {max_size} bytes"
+        raise AdmissionError(error)
+    if not decompressor.eof:
+        error = "truncated gzip payload"
+        raise UnsupportedWireFormatError(error)
+    return decompressed
+
+
+def negotiate_wire_format(accept: str | None) -> WireFormat:
+    """Determines the format of a response from the Accept header of its request."""
+    media_type = parse_accept_header(accept, MIMEAccept).best_match(MEDIA_TYPES, default=JSON)
+    return get_wire_format(media_type, fallback=True)
+
+
+def accepts_gzip(accept_encoding: str | None) -> bool:
+    """Determines whether a client accepts gzip-compressed responses from its Accept-Encoding header."""
+    return bool(parse_accept_header(accept_encoding, Accept)["gzip"])
+
+
+def decode_request(
+    body: bytes,
+    content_type: str | None,
+    content_encoding: str | None = None,
+    *,
+    max_size: int | None = None,
+) -> t.Any:  # noqa: ANN401
+    """Decodes the body of a request according to its Content-Type and Content-Encoding headers.
+
+    Raises
+    ------
+    UnsupportedWireFormatError
+        if the body is not encoded in a supported format, or cannot be decoded
+    AdmissionError
+        if the (decompressed) body exceeds max_size bytes
+    """
+    content_encoding = (content_encoding or "").strip().lower()
+    if content_encoding not in {"", "identity", "gzip"}:
+        error = f"unsupported content encoding: {content_encoding}"
+        raise UnsupportedWireFormatError(error)
+    wire_format = get_wire_format(content_type)
+    if content_encoding == "gzip":
+        body = decompress(body, max_size=max_size)
+    elif max_size is not None and len(body) > max_size:
+        error = f"request body exceeds {max_size} bytes"
+        raise AdmissionError(error)
+    try:
+        return wire_format.loads(body)
+    except ValueError as err:
+        error = f"malformed {wire_format.media_type} payload"
+        raise UnsupportedWireFormatError(error) from err
+
+
+def encode_response(
+    payload: t.Any,  # noqa: ANN401
+    wire_format: WireFormat,
+    *,
+    gzip_allowed: bool = False,
+) -> tuple[bytes, dict[str, str]]:
+    """Encodes the payload of a response, compressing it if allowed and worthwhile.
+
+    Returns
+    -------
+    tuple[bytes, dict[str, str]]
+        the body of the response, and its Content-Type, Content-Encoding and Vary headers
+    """
+    body = wire_format.dumps(payload)
+    headers = {
+        "Content-Type": wire_format.media_type,
+        "Vary": "Accept, Accept-Encoding",
+    }
+    if gzip_allowed and len(body) >= _MIN_COMPRESSED_SIZE:
+        body = compress(body)
+        headers["Content-Encoding"] = "gzip"
+    return body, headers
@@ -5,7 +5,9 @@ from pathlib import Path
 
 import pytest
 
+from facilitate.cache import ENV_CACHE_DIR
 from facilitate.loader import load_from_file
+from facilitate.memo import ResponseCache
 
 if t.TYPE_CHECKING:
     from facilitate.model.node import Node
@@ -20,6 +22,19 @@ _MINIMAL_EXAMPLE_PATH = _EXAMPLES_DIR / "minimal.json"
 _MINIMAL_WITH_EXTRA_EXAMPLE_PATH = _EXAMPLES_DIR / "minimal_with_extra.json"
 
 
+@pytest.fixture(autouse=True)
+def _disable_program_cache(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Ensures that tests never read or write a program cache outside of their own temporary directories."""
+    monkeypatch.delenv(ENV_CACHE_DIR, raising=False)
+
+
+@pytest.fixture(autouse=True)
+def _disable_memoized_responses(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Ensures that every request is computed afresh, unless a test enables memoization itself."""
+    monkeypatch.setattr("facilitate.server.responses", ResponseCache(max_size=0))
+    monkeypatch.setattr("facilitate.asgi.responses", ResponseCache(max_size=0))
+
+
 @pytest.fixture()
 def good_tree() -> Node:
     return load_from_file(_GOOD_EXAMPLE_PATH)
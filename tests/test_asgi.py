@@ -0,0 +1,248 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import typing as t
+from http import HTTPStatus
+from pathlib import Path
+
+import pytest
+
+import facilitate.asgi
+import facilitate.server
+from facilitate.asgi import AsyncApp
+from facilitate.limits import RequestLimits
+from facilitate.memo import ResponseCache
+from facilitate.registry import SolutionRegistry
+from facilitate.server import app as flask_app
+
+_PATH_TESTS = Path(__file__).parent
+_PATH_PROGRAMS = _PATH_TESTS / "resources" / "programs"
+_PATH_VACUUM = _PATH_PROGRAMS / "spike_curric_vacuum_mini_challenge"
+_PATH_FROM = _PATH_VACUUM / "2515268" / "20.json"
+_PATH_TO = _PATH_VACUUM / "2515268" / "36.json"
+
+
+@pytest.fixture
+def asgi_app() -> t.Iterator[AsyncApp]:
+    app = AsyncApp(max_workers=2)
+    yield app
+    app.close()
+
+
+async def _request_async(
+    app: AsyncApp,
+    method: str,
+    path: str,
+    payload: t.Any = None,  # noqa: ANN401
+) -> tuple[int, dict[str, str], bytes]:
+    body = b"" if payload is None else json.dumps(payload).encode()
+    scope = {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "headers": [(b"content-type", b"application/json")],
+    }
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    sent: list[dict[str, t.Any]] = []
+
+    async def receive() -> dict[str, t.Any]:
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+    async def send(message: dict[str, t.Any]) -> None:
+        sent.append(message)
+
+    await app(scope, receive, send)
+    start, *bodies = sent
+    headers = {name.decode(): value.decode() for name, value in start["headers"]}
+    return start["status"], headers, b"".join(message["body"] for message in bodies)
+
+
+def _request(
+    app: AsyncApp,
+    method: str,
+    path: str,
+    payload: t.Any = None,  # noqa: ANN401
+) -> tuple[int, dict[str, str], bytes]:
+    return asyncio.run(_request_async(app, method, path, payload))
+
+
+def _diff_request() -> dict[str, t.Any]:
+    return {
+        "from": json.loads(_PATH_FROM.read_text()),
+        "to": json.loads(_PATH_TO.read_text()),
+    }
+
+
+def _project(path: Path) -> str:
+    return json.dumps({"targets": [{"blocks": json.loads(path.read_text())}]})
+
+
+def test_health(asgi_app: AsyncApp) -> None:
+    status, _, body = _request(asgi_app, "GET", "/health")
+    assert status == HTTPStatus.OK
+    assert json.loads(body)["status"] == "ok"
+
+
+def test_distance_matches_flask(asgi_app: AsyncApp) -> None:
+    status, headers, body = _request(asgi_app, "PUT", "/distance", _diff_request())
+    assert status == HTTPStatus.OK
+    assert headers["content-type"] == "application/json"
+
+    expected = flask_app.test_client().put("/distance", json=_diff_request()).json
+    assert json.loads(body)["distance"] == expected["distance"]
+    assert asgi_app.pending == 0
+
+
+def test_invalid_request(asgi_app: AsyncApp) -> None:
+    status, _, body = _request(asgi_app, "PUT", "/diff", {"from": {}})
+    assert status == HTTPStatus.UNPROCESSABLE_ENTITY
+    assert "to" in json.loads(body)["detail"]["json"]
+
+    status, _, _ = _request(asgi_app, "PUT", "/nowhere", {})
+    assert status == HTTPStatus.NOT_FOUND
+    status, _, _ = _request(asgi_app, "GET", "/diff")
+    assert status == HTTPStatus.METHOD_NOT_ALLOWED
+
+
+def test_rejects_requests_when_saturated() -> None:
+    app = AsyncApp(max_workers=1, max_pending=0, retry_after=7)
+    status, headers, _ = _request(app, "PUT", "/distance", _diff_request())
+    assert status == HTTPStatus.SERVICE_UNAVAILABLE
+    assert headers["retry-after"] == "7"
+
+    # health checks never wait for the pool
+    status, _, _ = _request(app, "GET", "/health")
+    assert status == HTTPStatus.OK
+
+
+@pytest.mark.parametrize("order", ["solution", "completion"])
+def test_streaming_progress(asgi_app: AsyncApp, order: str) -> None:
+    solution_files = [_PATH_VACUUM / "2605231" / "4189.json", _PATH_TO, _PATH_FROM]
+    status, headers, body = _request(asgi_app, "PUT", "/progress/stream", {
+        "user_program": _project(_PATH_FROM),
+        "solutions": [
+            {"id": index, "cmra_blocks_element_id": 0, "program": _project(path)}
+            for index, path in enumerate(solution_files)
+        ],
+        "order": order,
+    })
+    assert status == HTTPStatus.OK
+    assert headers["content-type"] == "application/x-ndjson"
+
+    lines = [json.loads(line) for line in body.splitlines()]
+    ids = [line["id"] for line in lines]
+    if order == "solution":
+        assert ids == [0, 1, 2]
+    assert sorted(ids) == [0, 1, 2]
+    distances = {line["id"]: line["distance"] for line in lines}
+    assert distances[2] == 0
+
+
+def test_streaming_progress_beyond_max_pending() -> None:
+    # a request is admitted once, and its jobs are then throttled rather than rejected
+    app = AsyncApp(max_workers=1, max_pending=1)
+    try:
+        status, _, body = _request(app, "PUT", "/progress/stream", {
+            "user_program": _project(_PATH_FROM),
+            "solutions": [
+                {"id": index, "cmra_blocks_element_id": 0, "program": _project(path)}
+                for index, path in enumerate([_PATH_TO, _PATH_FROM, _PATH_TO])
+            ],
+            "order": "completion",
+        })
+    finally:
+        app.close()
+    assert status == HTTPStatus.OK
+    assert sorted(json.loads(line)["id"] for line in body.splitlines()) == [0, 1, 2]
+    assert app.pending == 0
+
+
+def test_concurrent_streams_share_max_pending(monkeypatch: pytest.MonkeyPatch) -> None:
+    app = AsyncApp(max_workers=2, max_pending=2)
+    submit = app._submit
+    most_pending = 0
+
+    def submit_and_count(*args: t.Any, **kwargs: t.Any) -> asyncio.Future[t.Any]:  # noqa: ANN401
+        nonlocal most_pending
+        most_pending = max(most_pending, app.pending)
+        return submit(*args, **kwargs)
+
+    monkeypatch.setattr(app, "_submit", submit_and_count)
+    payload = {
+        "user_program": _project(_PATH_FROM),
+        "solutions": [
+            {"id": index, "cmra_blocks_element_id": 0, "program": _project(path)}
+            for index, path in enumerate([_PATH_TO, _PATH_FROM, _PATH_TO, _PATH_FROM])
+        ],
+        "order": "completion",
+    }
+
+    async def stream_concurrently() -> list[tuple[int, dict[str, str], bytes]]:
+        # each request is admitted while the pool still has room, after which their jobs compete for it
+        first = asyncio.ensure_future(_request_async(app, "PUT", "/progress/stream", payload))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(_request_async(app, "PUT", "/progress/stream", payload))
+        return list(await asyncio.gather(first, second))
+
+    try:
+        responses = asyncio.run(stream_concurrently())
+    finally:
+        app.close()
+    for status, _, body in responses:
+        assert status == HTTPStatus.OK
+        assert sorted(json.loads(line)["id"] for line in body.splitlines()) == [0, 1, 2, 3]
+    assert most_pending <= app.max_pending
+    assert app.pending == 0
+
+
+def test_time_budget_and_limits(asgi_app: AsyncApp, monkeypatch: pytest.MonkeyPatch) -> None:
+    status, _, body = _request(asgi_app, "PUT", "/distance", _diff_request() | {"time_budget": 1e-6})
+    assert status == HTTPStatus.OK
+    assert json.loads(body)["approximate"] is True
+
+    monkeypatch.setattr(facilitate.asgi, "limits", RequestLimits(max_request_bytes=100))
+    status, _, _ = _request(asgi_app, "PUT", "/distance", _diff_request())
+    assert status == HTTPStatus.REQUEST_ENTITY_TOO_LARGE
+
+
+def test_memoized_responses_bypass_the_pool(asgi_app: AsyncApp, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(facilitate.asgi, "responses", ResponseCache())
+    status, _, body = _request(asgi_app, "PUT", "/distance", _diff_request())
+    assert status == HTTPStatus.OK
+
+    # a full pool rejects every request that must be computed
+    monkeypatch.setattr(asgi_app, "max_pending", 0)
+    memoized_status, _, memoized_body = _request(asgi_app, "PUT", "/distance", _diff_request())
+    assert (memoized_status, memoized_body) == (200, body)
+    status, _, _ = _request(asgi_app, "PUT", "/diff", _diff_request() | {"compact": False})
+    assert status == HTTPStatus.SERVICE_UNAVAILABLE
+
+
+def test_solution_registry(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    solutions = [{"id": 0, "cmra_blocks_element_id": 0, "program": _project(_PATH_TO)}]
+
+    # the registry cannot be shared between workers unless it is persisted
+    app = AsyncApp(max_workers=1)
+    status, _, _ = _request(app, "PUT", "/levels/vacuum/solutions", {"solutions": solutions})
+    assert status == HTTPStatus.NOT_IMPLEMENTED
+    app.close()
+
+    registry = SolutionRegistry(directory=tmp_path)
+    monkeypatch.setattr(facilitate.server, "registry", registry)
+    monkeypatch.setattr(facilitate.asgi, "registry", registry)
+    app = AsyncApp(max_workers=1)
+    try:
+        status, _, body = _request(app, "PUT", "/levels/vacuum/solutions", {"solutions": solutions})
+        assert status == HTTPStatus.OK
+        assert json.loads(body)["solutions"] == [0]
+
+        payload = {"user_program": _project(_PATH_TO), "level": "vacuum"}
+        status, _, body = _request(app, "PUT", "/progress/stream", payload)
+        assert status == HTTPStatus.OK
+        assert [json.loads(line)["distance"] for line in body.splitlines()] == [0]
+
+        status, _, _ = _request(app, "GET", "/levels/nowhere/solutions")
+        assert status == HTTPStatus.NOT_FOUND
+    finally:
+        app.close()
@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import csv
+import itertools
+import json
+from pathlib import Path
+
+import pytest
+
+from facilitate.batch import read_manifest, run_batch
+from facilitate.distance import compute_edit_script_and_distance
+from facilitate.loader import load_from_file
+
+_PATH_TESTS = Path(__file__).parent
+_PATH_STUDENT = (
+    _PATH_TESTS / "resources" / "programs" / "spike_curric_vacuum_mini_challenge" / "2515268"
+)
+
+
+def _pairs() -> list[tuple[str, str]]:
+    program_files = sorted(_PATH_STUDENT.glob("*.json"), key=lambda path: int(path.stem))
+    return [(str(before), str(after)) for before, after in itertools.pairwise(program_files)]
+
+
+def test_read_csv_manifest(tmp_path: Path) -> None:
+    manifest = tmp_path / "manifest.csv"
+    manifest.write_text("before,after\na.json,b.json\n\nb.json,c.json\n")
+    items = list(read_manifest(manifest))
+    assert [(item.index, item.before, item.after) for item in items] == [
+        (0, "a.json", "b.json"),
+        (1, "b.json", "c.json"),
+    ]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+@pytest.mark.parametrize("ordered", [True, False])
+def test_run_batch(tmp_path: Path, workers: int, ordered: bool) -> None:
+    pairs = [*_pairs(), (str(tmp_path / "missing.json"), str(tmp_path / "missing.json"))]
+    manifest = tmp_path / "manifest.jsonl"
+    with manifest.open("w") as file:
+        for before, after in pairs:
+            file.write(json.dumps({"before": before, "after": after}) + "\n")
+
+    output = tmp_path / "distances.jsonl"
+    stats = run_batch(
+        manifest,
+        output,
+        workers=workers,
+        chunk_size=2,
+        ordered=ordered,
+        include_edit_scripts=True,
+    )
+    assert stats.pairs == len(pairs)
+    assert stats.failures == 1
+
+    with output.open() as file:
+        results = [json.loads(line) for line in file]
+    if ordered:
+        assert [result["index"] for result in results] == list(range(len(pairs)))
+    results.sort(key=lambda result: result["index"])
+
+    assert "error" in results[-1]
+    for (before, after), result in zip(pairs, results[:-1], strict=False):
+        edit_script, distance = compute_edit_script_and_distance(
+            load_from_file(before),
+            load_from_file(after),
+        )
+        assert result["distance"] == distance
+        assert result["num-edits"] == len(edit_script)
+        assert "edit-script" in result
+
+
+def test_run_batch_csv(tmp_path: Path) -> None:
+    manifest = tmp_path / "manifest.csv"
+    with manifest.open("w", newline="") as file:
+        csv.writer(file).writerows(_pairs())
+
+    output = tmp_path / "distances.csv"
+    run_batch(manifest, output)
+    with output.open(newline="") as file:
+        rows = list(csv.DictReader(file))
+    assert len(rows) == len(_pairs())
+    assert all(row["distance"] and not row["error"] for row in rows)
@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+
+from facilitate.binary import (
+    BinaryFormatError,
+    dump_program,
+    load_program_from_bytes,
+)
+from facilitate.cache import ProgramCache
+from facilitate.loader import LOADER_VERSION, load_from_file
+
+_PATH_TESTS = Path(__file__).parent
+_PATH_PROGRAMS = _PATH_TESTS / "resources" / "programs"
+
+
+@pytest.mark.parametrize(
+    "filename",
+    sorted(_PATH_PROGRAMS.glob("**/*.json")),
+    ids=lambda path: str(path.relative_to(_PATH_PROGRAMS)),
+)
+def test_binary_roundtrip(filename: Path) -> None:
+    program = load_from_file(filename, cache=False)
+    decoded = load_program_from_bytes(dump_program(program))
+
+    assert decoded.equivalent_to(program)
+    assert [node.id_ for node in decoded.nodes()] == [node.id_ for node in program.nodes()]
+    for node in decoded.nodes():
+        for child in node.children():
+            assert child.parent is node
+
+
+def test_binary_rejects_garbage() -> None:
+    with pytest.raises(BinaryFormatError):
+        load_program_from_bytes(b"not a program")
+
+
+def test_cache_hit_and_invalidation(tmp_path: Path) -> None:
+    filename = _PATH_PROGRAMS / "spike_curric_vacuum_mini_challenge" / "2515268" / "36.json"
+    cache = ProgramCache(directory=tmp_path, loader_version=LOADER_VERSION)
+
+    program = load_from_file(filename, cache=cache)
+    entries = list(tmp_path.glob("*/*.fcp"))
+    assert len(entries) == 1
+
+    cached = cache.get(filename.read_bytes())
+    assert cached is not None
+    assert cached is not program
+    assert cached.equivalent_to(program)
+    assert load_from_file(filename, cache=cache).equivalent_to(program)
+
+    # a change to the loader version should invalidate existing entries
+    newer_cache = ProgramCache(directory=tmp_path, loader_version=LOADER_VERSION + 1)
+    assert newer_cache.get(filename.read_bytes()) is None
@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import itertools
+import json
+import typing as t
+from pathlib import Path
+
+import pytest
+
+from facilitate.diff import compute_edit_script
+from facilitate.distance import compute_distance
+from facilitate.edit import (
+    AddSubtree,
+    Delete,
+    DeleteSubtree,
+    EditScript,
+    build_subtree,
+    describe_subtree,
+)
+from facilitate.loader import load_from_file
+from facilitate.model.block import Block
+
+_PATH_TESTS = Path(__file__).parent
+_PATH_PROGRAMS = _PATH_TESTS / "resources" / "programs"
+_PATH_VACUUM = _PATH_PROGRAMS / "spike_curric_vacuum_mini_challenge"
+_PATH_TURNING = _PATH_PROGRAMS / "spike_curric_turning_in_place_left_turn_try_it"
+
+
+def _round_trip(script: EditScript) -> EditScript:
+    return EditScript.from_dict(json.loads(json.dumps(script.to_dict())))
+
+
+def test_describe_and_build_subtree() -> None:
+    program = load_from_file(_PATH_VACUUM / "2515268" / "36.json")
+    for node in program.nodes():
+        if not isinstance(node, Block):
+            continue
+        rebuilt = build_subtree(describe_subtree(node))
+        assert rebuilt.equivalent_to(node)
+        assert rebuilt.id_ != node.id_
+
+
+@pytest.mark.parametrize(
+    ("before_file", "after_file"),
+    [
+        (_PATH_VACUUM / "2515268" / "20.json", _PATH_VACUUM / "2515268" / "36.json"),
+        (_PATH_VACUUM / "2515268" / "36.json", _PATH_VACUUM / "2515268" / "20.json"),
+        (_PATH_TURNING / "4847845" / "4.json", _PATH_VACUUM / "2605231" / "4189.json"),
+        (_PATH_VACUUM / "2605231" / "4189.json", _PATH_TURNING / "4847845" / "4.json"),
+        (
+            _PATH_PROGRAMS / "tricky_cases" / "delete_node_with_kids" / "before.json",
+            _PATH_PROGRAMS / "tricky_cases" / "cannot_find_node" / "before.json",
+        ),
+    ],
+)
+def test_compact_edit_script(before_file: Path, after_file: Path) -> None:
+    tree_from = load_from_file(before_file)
+    tree_to = load_from_file(after_file)
+
+    edit_script = compute_edit_script(tree_from, tree_to)
+    compacted = compute_edit_script(tree_from, tree_to, compact=True)
+    assert len(compacted) < len(edit_script)
+    assert any(isinstance(edit, AddSubtree | DeleteSubtree) for edit in compacted)
+    assert compacted.apply(tree_from).equivalent_to(tree_to)
+
+    distance = compute_distance(tree_from=tree_from, tree_to=tree_to, edit_script=edit_script)
+    compacted_distance = compute_distance(tree_from=tree_from, tree_to=tree_to, edit_script=compacted)
+    assert compacted_distance == distance
+
+    assert _round_trip(compacted) == compacted
+
+
+def test_replay_compacted_edit_script() -> None:
+    tree_from = load_from_file(_PATH_VACUUM / "2515268" / "20.json")
+    tree_to = load_from_file(_PATH_VACUUM / "2515268" / "36.json")
+
+    # the inserted subtrees no longer refer to the IDs of nodes added during the diff
+    compacted = _round_trip(compute_edit_script(tree_from, tree_to, compact=True))
+    assert compacted.apply(tree_from).equivalent_to(tree_to)
+
+
+def test_fall_back_to_uncompacted_edit_script(monkeypatch: pytest.MonkeyPatch) -> None:
+    tree_from = load_from_file(_PATH_VACUUM / "2515268" / "20.json")
+    tree_to = load_from_file(_PATH_VACUUM / "2515268" / "36.json")
+    edit_script = compute_edit_script(tree_from, tree_to)
+
+    # a compaction that loses every edit cannot be replayed to the target tree
+    monkeypatch.setattr("facilitate.diff.compact_edit_script", lambda *_: EditScript())
+    compacted = compute_edit_script(tree_from, tree_to, compact=True)
+    assert compacted == edit_script
+
+
+# pairs that the diff itself cannot handle yet
+_UNSUPPORTED_PAIRS = {
+    (
+        _PATH_PROGRAMS / "tricky_cases" / "delete_node_with_kids" / "before.json",
+        _PATH_PROGRAMS / "tricky_cases" / "delete_node_with_kids" / "after.json",
+    ),
+}
+
+
+def _pairs_within_levels() -> list[t.Any]:
+    pairs: list[t.Any] = []
+    for level_directory in sorted(path for path in _PATH_PROGRAMS.iterdir() if path.is_dir()):
+        program_files = sorted(level_directory.glob("*/*.json"))
+        for pair in itertools.permutations(program_files, 2):
+            if pair in _UNSUPPORTED_PAIRS:
+                pairs.append(pytest.param(*pair, marks=pytest.mark.xfail(raises=ValueError, strict=True)))
+            else:
+                pairs.append(pair)
+    return pairs
+
+
+@pytest.mark.parametrize(
+    ("before_file", "after_file"),
+    _pairs_within_levels(),
+    ids=lambda path: f"{path.parent.name}/{path.stem}",
+)
+def test_replay_compacted_edit_scripts_across_corpus(before_file: Path, after_file: Path) -> None:
+    tree_from = load_from_file(before_file)
+    tree_to = load_from_file(after_file)
+    compacted = compute_edit_script(tree_from, tree_to, compact=True)
+    assert compacted.apply(tree_from).equivalent_to(tree_to)
+    assert _round_trip(compacted).apply(tree_from).equivalent_to(tree_to)
+
+
+def test_load_uncompacted_edit_script() -> None:
+    tree_from = load_from_file(_PATH_VACUUM / "2605231" / "4189.json")
+    tree_to = load_from_file(_PATH_TURNING / "4847845" / "4.json")
+    edit_script = compute_edit_script(tree_from, tree_to)
+    assert any(isinstance(edit, Delete) for edit in edit_script)
+    assert _round_trip(edit_script) == edit_script
+
+
+def test_delete_subtree() -> None:
+    program = load_from_file(_PATH_VACUUM / "2515268" / "36.json")
+    sequence = program.top_level_nodes[0]
+    block = sequence.blocks[-1]
+    num_nodes = len(list(program.nodes()))
+    num_deleted = len(list(block.nodes()))
+
+    edited = EditScript([DeleteSubtree(node_id=block.id_)]).apply(program)
+    assert len(list(edited.nodes())) == num_nodes - num_deleted
+    assert edited.find(block.id_) is None
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import copy
+from pathlib import Path
+
+import pytest
+
+from facilitate.corpus import Corpus, CorpusError, close_open_corpora, load_from_locator
+from facilitate.diff import compute_edit_script
+from facilitate.fuzzer.diff import SuccessiveVersionDiffFuzzer
+from facilitate.hashing import structural_hash
+from facilitate.loader import load_from_file
+
+_PATH_TESTS = Path(__file__).parent
+_PATH_PROGRAMS = _PATH_TESTS / "resources" / "programs"
+
+
+@pytest.fixture
+def corpus_file(tmp_path: Path) -> Path:
+    path = tmp_path / "corpus.sqlite"
+    with Corpus.open(path) as corpus:
+        corpus.import_directory(_PATH_PROGRAMS)
+    return path
+
+
+def test_import_directory(corpus_file: Path) -> None:
+    # programs that aren't named after their frame (e.g., before.json) are skipped
+    program_files = [path for path in _PATH_PROGRAMS.glob("*/*/*.json") if path.stem.isdigit()]
+    with Corpus.open(corpus_file, readonly=True) as corpus:
+        assert len(corpus) == len(program_files)
+        assert corpus.levels() == sorted({path.parent.parent.name for path in program_files})
+
+        for record in corpus.programs():
+            path = _PATH_PROGRAMS / record.level_id / record.user_id / f"{record.frame}.json"
+            assert corpus.blocks(record.id_) == path.read_bytes()
+
+            assert record.metadata is not None
+            assert record.metadata.parse_status == "ok"
+            program = load_from_file(path)
+            assert record.metadata.num_nodes == program.size()
+            assert record.metadata.structural_hash == structural_hash(program)
+
+
+def test_successive_pairs_are_ordered_by_frame(corpus_file: Path) -> None:
+    with Corpus.open(corpus_file, readonly=True) as corpus:
+        pairs = list(corpus.successive_pairs())
+        assert pairs
+        for from_id, to_id in pairs:
+            from_record = corpus.program(from_id)
+            to_record = corpus.program(to_id)
+            assert (from_record.level_id, from_record.user_id) == (to_record.level_id, to_record.user_id)
+            assert from_record.frame < to_record.frame
+
+
+def test_locators(corpus_file: Path) -> None:
+    with Corpus.open(corpus_file, readonly=True) as corpus:
+        record = next(corpus.programs())
+        locator = corpus.locator(record.id_)
+    path = _PATH_PROGRAMS / record.level_id / record.user_id / f"{record.frame}.json"
+    assert load_from_locator(locator).equivalent_to(load_from_file(path))
+    assert load_from_locator(path).equivalent_to(load_from_file(path))
+
+    # corpora that were opened via locators are reopened once closed
+    close_open_corpora()
+    assert load_from_locator(locator).equivalent_to(load_from_file(path))
+    close_open_corpora()
+
+
+def test_results(corpus_file: Path) -> None:
+    with Corpus.open(corpus_file) as corpus:
+        from_id, to_id = next(corpus.successive_pairs())
+        edit_script = compute_edit_script(corpus.load_program(from_id), corpus.load_program(to_id))
+        distance = 3.0
+        corpus.add_result(from_id, to_id, method="gumtree", distance=distance, edit_script=edit_script)
+        assert corpus.result(to_id, from_id, method="gumtree") is None
+
+    with Corpus.open(corpus_file, readonly=True) as corpus:
+        result = corpus.result(from_id, to_id, method="gumtree")
+        assert result is not None
+        assert result.distance == distance
+        assert result.num_edits == len(edit_script)
+        assert result.edit_script is not None
+        assert result.edit_script.to_dict() == edit_script.to_dict()
+
+
+def test_diff_fuzzer_reads_corpus(corpus_file: Path) -> None:
+    fuzzer = SuccessiveVersionDiffFuzzer.build(number=3, program_directory=corpus_file, seed=0)
+    pairs = list(fuzzer.generate_pairs())
+    assert pairs
+    assert all(str(path).startswith(f"{corpus_file}#") for pair in pairs for path in pair)
+    assert list(fuzzer.run()) == []
+
+
+def test_missing_program(corpus_file: Path) -> None:
+    with Corpus.open(corpus_file, readonly=True) as corpus, pytest.raises(CorpusError):
+        corpus.blocks(10**9)
+
+
+def test_structural_hash_ignores_ids() -> None:
+    path = next(_PATH_PROGRAMS.glob("*/*/*.json"))
+    program = load_from_file(path)
+    other = copy.deepcopy(program)
+    for node in other.nodes():
+        node.id_ = f"other:{node.id_}"
+    assert structural_hash(program) == structural_hash(other)
@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import json
+import time
+from http import HTTPStatus
+from pathlib import Path
+
+import pytest
+
+import facilitate.server
+from facilitate.deadline import (
+    DeadlineExceededError,
+    check_deadline,
+    deadline_after,
+    enforce_deadline,
+    time_remaining,
+)
+from facilitate.distance import (
+    approximate_distance,
+    compute_edit_script_and_distance,
+    compute_edit_script_and_distance_before_deadline,
+)
+from facilitate.limits import RequestLimits
+from facilitate.loader import load_from_file
+from facilitate.server import app
+
+_PATH_LEVEL = Path(__file__).parent / "resources" / "programs" / "spike_curric_vacuum_mini_challenge"
+_PATH_FROM = _PATH_LEVEL / "2515268" / "20.json"
+_PATH_TO = _PATH_LEVEL / "2515268" / "36.json"
+
+
+def _project(path: Path) -> str:
+    return json.dumps({"targets": [{"blocks": json.loads(path.read_text())}]})
+
+
+def test_nested_deadlines() -> None:
+    assert time_remaining() is None
+    outer_budget, inner_budget = 60, 3600
+    with enforce_deadline(deadline_after(outer_budget)):
+        with enforce_deadline(deadline_after(inner_budget)):
+            remaining = time_remaining()
+            assert remaining is not None
+            assert remaining <= outer_budget
+        with enforce_deadline(time.monotonic() - 1), pytest.raises(DeadlineExceededError):
+            check_deadline()
+        check_deadline()
+    assert time_remaining() is None
+
+
+def test_approximate_distance() -> None:
+    tree_from = load_from_file(_PATH_FROM)
+    tree_to = load_from_file(_PATH_TO)
+    assert approximate_distance(tree_from, tree_from.copy()) == 0
+
+    _, exact = compute_edit_script_and_distance(tree_from, tree_to)
+    approximate = approximate_distance(tree_from, tree_to)
+    assert approximate > 0
+    assert exact / 4 <= approximate <= exact * 4
+
+
+def test_falls_back_to_approximation_after_deadline() -> None:
+    tree_from = load_from_file(_PATH_FROM)
+    tree_to = load_from_file(_PATH_TO)
+
+    with enforce_deadline(deadline_after(60)):
+        edit_script, _ = compute_edit_script_and_distance_before_deadline(tree_from, tree_to)
+    assert edit_script is not None
+
+    with enforce_deadline(deadline_after(1e-6)):
+        edit_script, distance = compute_edit_script_and_distance_before_deadline(tree_from, tree_to)
+    assert edit_script is None
+    assert distance == approximate_distance(tree_from, tree_to)
+
+
+def test_distance_with_time_budget() -> None:
+    payload = {
+        "from": json.loads(_PATH_FROM.read_text()),
+        "to": json.loads(_PATH_TO.read_text()),
+    }
+    client = app.test_client()
+
+    response = client.put("/distance", json=payload)
+    assert response.status_code == HTTPStatus.OK
+    assert response.json["approximate"] is False
+    assert response.json["edits"] is not None
+
+    response = client.put("/distance", json=payload, headers={"X-Time-Budget": "0.000001"})
+    assert response.status_code == HTTPStatus.OK
+    assert response.json["approximate"] is True
+    assert response.json["edits"] is None
+
+    response = client.put("/distance", json=payload | {"time_budget": -1})
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+
+
+def test_progress_with_time_budget() -> None:
+    response = app.test_client().put("/progress", json={
+        "user_program": _project(_PATH_FROM),
+        "solutions": [{"id": 0, "cmra_blocks_element_id": 0, "program": _project(_PATH_TO)}],
+        "time_budget": 0.000001,
+    })
+    assert response.status_code == HTTPStatus.OK
+    (solution,) = response.json
+    assert solution["approximate"] is True
+    assert solution["distance"] > 0
+
+
+def test_rejects_requests_beyond_limits(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(facilitate.server, "limits", RequestLimits(max_solutions=1, max_program_nodes=10))
+    client = app.test_client()
+    solution = {"id": 0, "cmra_blocks_element_id": 0, "program": _project(_PATH_TO)}
+
+    response = client.put("/progress", json={
+        "user_program": _project(_PATH_FROM),
+        "solutions": [solution, solution],
+    })
+    assert response.status_code == HTTPStatus.REQUEST_ENTITY_TOO_LARGE
+
+    response = client.put("/distance", json={
+        "from": json.loads(_PATH_FROM.read_text()),
+        "to": json.loads(_PATH_TO.read_text()),
+    })
+    assert response.status_code == HTTPStatus.REQUEST_ENTITY_TOO_LARGE
@@ -1,12 +1,21 @@
+import itertools
+import random
 from pathlib import Path
 
+import pytest
+
+from facilitate.algorithms import longest_increasing_subsequence
 from facilitate.diff import compute_edit_script
 from facilitate.edit import (
+    AddSequenceToProgram,
     Delete,
     EditScript,
+    MoveBlockInSequence,
+    NodeIds,
 )
-from facilitate.loader import load_from_file
+from facilitate.loader import load_from_file, load_program_from_block_descriptions
 from facilitate.model.node import Node
+from facilitate.model.program import Program
 
 _PATH_TESTS = Path(__file__).parent
 _PATH_PROGRAMS = _PATH_TESTS / "resources" / "programs"
@@ -113,3 +122,118 @@ def test_diff_minimal_trees(minimal_tree: Node, minimal_with_extra_tree: Node) -
     tree_from = minimal_tree
     tree_to = minimal_with_extra_tree
     compute_edit_script(tree_from, tree_to)
+
+
+def test_diff_identical_programs_with_anchored_ids() -> None:
+    student_dir = _PATH_PROGRAMS / "spike_curric_turning_in_place_left_turn_try_it" / "4847845"
+    tree_from = load_from_file(student_dir / "5.json")
+    tree_to = load_from_file(student_dir / "5.json")
+    assert not compute_edit_script(tree_from, tree_to, anchor_ids=True)
+
+
+def test_diff_with_anchored_ids_is_no_longer_than_without() -> None:
+    tree_from = load_from_file(_PATH_PROGRAMS / "tricky_cases" / "cannot_find_node" / "before.json")
+    tree_to = load_from_file(_PATH_PROGRAMS / "tricky_cases" / "cannot_find_node" / "after.json")
+    edit_script = compute_edit_script(tree_from, tree_to)
+    anchored_edit_script = compute_edit_script(tree_from, tree_to, anchor_ids=True)
+    assert len(anchored_edit_script) <= len(edit_script)
+
+
+def test_diff_is_deterministic() -> None:
+    student_dir = _PATH_PROGRAMS / "spike_curric_search_for_ice_part_3_mini_challenge" / "2952421"
+    edit_scripts = [
+        compute_edit_script(
+            load_from_file(student_dir / "89.json", cache=False),
+            load_from_file(student_dir / "145.json", cache=False),
+        )
+        for _ in range(2)
+    ]
+    assert edit_scripts[0].to_dict() == edit_scripts[1].to_dict()
+
+    # the nodes added by the edits must not reuse the IDs of existing nodes
+    tree_from = load_from_file(student_dir / "89.json", cache=False)
+    edited = edit_scripts[0].apply(tree_from)
+    ids = [node.id_ for node in edited.nodes()]
+    assert len(ids) == len(set(ids))
+
+
+def test_edits_share_node_ids(minimal_tree: Node, monkeypatch: pytest.MonkeyPatch) -> None:
+    script = EditScript([
+        AddSequenceToProgram(position=0),
+        Delete(node_id=f":seq@{minimal_tree.id_}"),
+        AddSequenceToProgram(position=0),
+        AddSequenceToProgram(position=0),
+    ])
+    # the IDs within the tree are only collected once per application of the script
+    scanned: set[int] = set()
+    claim = NodeIds.claim
+
+    def record_claim(self: NodeIds, kind: str, parent_id: str) -> str:
+        scanned.add(id(self))
+        return claim(self, kind, parent_id)
+
+    monkeypatch.setattr(NodeIds, "claim", record_claim)
+    edited = script.apply(minimal_tree)
+    assert len(scanned) == 1
+
+    # the ID of a deleted node is free to be claimed again
+    assert {node.id_ for node in edited.nodes()} >= {f":seq@{minimal_tree.id_}", f":seq#2@{minimal_tree.id_}"}
+    assert f":seq#3@{minimal_tree.id_}" not in {node.id_ for node in edited.nodes()}
+
+
+def _build_sequence_program(order: list[int]) -> Program:
+    descriptions = {
+        f"b{block}": {
+            "opcode": "motion_movesteps",
+            "next": f"b{order[position + 1]}" if position + 1 < len(order) else None,
+            "parent": f"b{order[position - 1]}" if position > 0 else None,
+            "inputs": {},
+            "fields": {"STEPS": [str(block), None]},
+            "shadow": False,
+            "topLevel": position == 0,
+        }
+        for position, block in enumerate(order)
+    }
+    return load_program_from_block_descriptions(descriptions)
+
+
+def test_diff_aligns_reordered_sequence() -> None:
+    rng = random.Random(0)  # noqa: S311
+    order = list(range(200))
+    reordered = order.copy()
+    for _ in range(50):
+        reordered.insert(rng.randrange(len(reordered)), reordered.pop(rng.randrange(len(reordered))))
+
+    tree_from = _build_sequence_program(order)
+    tree_to = _build_sequence_program(reordered)
+    edit_script = compute_edit_script(tree_from, tree_to)
+    assert edit_script.apply(tree_from).equivalent_to(tree_to)
+
+    # only the blocks outside a longest common subsequence of both orders are moved
+    moves = [edit for edit in edit_script if isinstance(edit, MoveBlockInSequence)]
+    assert len(moves) == len(edit_script)
+    assert len(moves) == len(order) - len(longest_increasing_subsequence(reordered))
+
+
+def test_longest_increasing_subsequence() -> None:
+    values = [3, 1, 4, 1, 5, 9, 2, 6, 5, 3, 5, 8, 9, 7, 9]
+    positions = longest_increasing_subsequence(values)
+    assert positions == sorted(positions)
+    subsequence = [values[position] for position in positions]
+    length_of_longest = 6
+    assert len(subsequence) == length_of_longest
+    assert all(x < y for x, y in itertools.pairwise(subsequence))
+    assert longest_increasing_subsequence([]) == []
+
+
+def test_diff_deletes_unmapped_nodes_in_postorder() -> None:
+    tree_from = _build_sequence_program(list(range(100)))
+    tree_to = _build_sequence_program(list(range(10)))
+    edit_script = compute_edit_script(tree_from, tree_to)
+
+    deletions = [edit for edit in edit_script if isinstance(edit, Delete)]
+    deleted_ids = [node.id_ for node in tree_from.postorder() if node.id_ in {edit.node_id for edit in deletions}]
+    assert [edit.node_id for edit in deletions] == deleted_ids
+
+    # NOTE each deletion is applied separately here, which fails if a deleted node still has children
+    assert edit_script.apply(tree_from).equivalent_to(tree_to)
@@ -3,12 +3,14 @@ import pytest
 from pathlib import Path
 
 from facilitate.gumtree import (
+    compute_anchored_mappings,
     compute_gumtree_mappings,
     compute_topdown_mappings,
     dice,
 )
 from facilitate.loader import load_from_file
 from facilitate.mappings import NodeMappings
+from facilitate.model.block import Block
 from facilitate.model.node import Node
 
 _PATH_TESTS = Path(__file__).parent
@@ -22,8 +24,6 @@ def _load(filename: str) -> Node:
 def test_gumtree_with_two_top_level_sequences() -> None:
     tree_from = _load("tricky_cases/merge_two_top_level_sequences/before.json")
     tree_to = _load("tricky_cases/merge_two_top_level_sequences/after.json")
-    x = tree_from.find
-    y = tree_to.find
 
     mappings = compute_gumtree_mappings(
         tree_from,
@@ -64,6 +64,40 @@ def test_gumtree_with_field_value_change() -> None:
     ) in mappings
 
 
+def test_anchored_mappings() -> None:
+    tree_from = _load("tricky_cases/cannot_find_node/before.json")
+    tree_to = _load("tricky_cases/cannot_find_node/after.json")
+
+    anchored = compute_anchored_mappings(tree_from, tree_to)
+    anchored.check()
+    assert (tree_from, tree_to) in anchored
+
+    blocks_to = {node.id_: node for node in tree_to.nodes() if isinstance(node, Block)}
+    for block_from in tree_from.nodes():
+        if not isinstance(block_from, Block):
+            continue
+        block_to = blocks_to.get(block_from.id_)
+        if block_to is not None and block_to.opcode == block_from.opcode:
+            assert (block_from, block_to) in anchored
+            for input_from in block_from.inputs:
+                assert (input_from, block_to.find_input(input_from.name)) in anchored
+
+    # the anchored mappings are kept by GumTree
+    mappings = compute_gumtree_mappings(tree_from, tree_to, anchor_ids=True)
+    mappings.check()
+    assert anchored.as_tuples() <= mappings.as_tuples()
+
+
+def test_anchored_mappings_of_identical_programs() -> None:
+    tree_from = _load("tricky_cases/cannot_find_node/before.json")
+    tree_to = _load("tricky_cases/cannot_find_node/before.json")
+
+    mappings = compute_gumtree_mappings(tree_from, tree_to, anchor_ids=True)
+    assert len(mappings) == len(list(tree_from.nodes()))
+    for node_from, node_to in mappings:
+        assert node_from.equivalent_to(node_to)
+
+
 def test_dice(good_tree: Node, bad_tree: Node) -> None:
     mappings = NodeMappings()
 
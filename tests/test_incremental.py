@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import itertools
+import typing as t
+from pathlib import Path
+
+import pytest
+
+from facilitate import incremental
+from facilitate.deadline import DeadlineExceededError
+from facilitate.diff import compute_edit_script_and_mappings
+from facilitate.distance import compute_distance
+from facilitate.incremental import carry_over_mappings, compute_edit_script_incremental
+from facilitate.loader import load_from_file
+
+if t.TYPE_CHECKING:
+    from facilitate.mappings import NodeMappings
+
+_PATH_TESTS = Path(__file__).parent
+_PATH_PROGRAMS = _PATH_TESTS / "resources" / "programs"
+
+
+def _successive_versions() -> list[tuple[Path, Path]]:
+    pairs: list[tuple[Path, Path]] = []
+    for student_directory in sorted(_PATH_PROGRAMS.glob("*/*")):
+        versions = sorted(
+            (path for path in student_directory.glob("*.json") if path.stem.isdigit()),
+            key=lambda path: int(path.stem),
+        )
+        pairs += itertools.pairwise(versions)
+    return pairs
+
+
+@pytest.mark.parametrize(
+    ("previous_file", "new_file"),
+    _successive_versions(),
+    ids=lambda path: f"{path.parent.name}/{path.stem}",
+)
+def test_incremental_matches_full_recomputation(
+    previous_file: Path,
+    new_file: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    previous_from = load_from_file(previous_file)
+    new_from = load_from_file(new_file)
+
+    # record every diff that is computed incrementally, so that a fallback to a full diff is noticed
+    seeds: list[NodeMappings | None] = []
+
+    def compute_seeded(*args: t.Any, seed: NodeMappings | None = None, **kwargs: t.Any) -> t.Any:  # noqa: ANN401
+        seeds.append(seed)
+        return compute_edit_script_and_mappings(*args, seed=seed, **kwargs)
+
+    monkeypatch.setattr(incremental, "compute_edit_script_and_mappings", compute_seeded)
+
+    for to_file in sorted(previous_file.parent.parent.glob("*/*.json")):
+        tree_to = load_from_file(to_file)
+        _, previous_mappings = compute_edit_script_and_mappings(previous_from, tree_to)
+
+        script, mappings = compute_edit_script_incremental(
+            previous_from,
+            previous_mappings,
+            new_from,
+            tree_to,
+        )
+        full_script, _ = compute_edit_script_and_mappings(new_from, tree_to)
+        assert len(seeds) == 1
+        assert seeds.pop() is not None
+        assert script.apply(new_from).equivalent_to(tree_to)
+
+        # the mappings relate the given trees, so that they can seed the next diff
+        assert {source for source, _ in mappings} <= set(new_from.nodes())
+        assert {destination for _, destination in mappings} <= set(tree_to.nodes())
+        distance = compute_distance(tree_from=new_from, tree_to=tree_to, edit_script=script)
+        full_distance = compute_distance(tree_from=new_from, tree_to=tree_to, edit_script=full_script)
+        assert distance <= full_distance
+
+
+def test_carry_over_leaves_exact_matches_to_gumtree() -> None:
+    previous_file, new_file = _successive_versions()[0]
+    previous_from = load_from_file(previous_file)
+    new_from = load_from_file(new_file)
+    tree_to = load_from_file(new_file)
+
+    _, previous_mappings = compute_edit_script_and_mappings(previous_from, tree_to)
+    seed = carry_over_mappings(previous_from, previous_mappings, new_from, tree_to)
+    for source, destination in seed:
+        assert source.equivalent_to(destination)
+
+    script, _ = compute_edit_script_incremental(previous_from, previous_mappings, new_from, tree_to)
+    assert not script
+
+
+def test_incremental_propagates_deadline(monkeypatch: pytest.MonkeyPatch) -> None:
+    previous_file, new_file = _successive_versions()[0]
+    previous_from = load_from_file(previous_file)
+    new_from = load_from_file(new_file)
+    _, previous_mappings = compute_edit_script_and_mappings(previous_from, new_from)
+
+    def exceed_deadline(*args: t.Any, **kwargs: t.Any) -> t.NoReturn:  # noqa: ANN401
+        raise DeadlineExceededError
+
+    monkeypatch.setattr(incremental, "compute_edit_script_and_mappings", exceed_deadline)
+    with pytest.raises(DeadlineExceededError):
+        compute_edit_script_incremental(previous_from, previous_mappings, new_from, new_from)
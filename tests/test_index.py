@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import math
+import typing as t
+from pathlib import Path
+
+import pytest
+
+from facilitate.index import SolutionIndex, benchmark_index
+from facilitate.loader import load_from_file
+
+if t.TYPE_CHECKING:
+    from facilitate.model.program import Program
+
+_PATH_PROGRAMS = Path(__file__).parent / "resources" / "programs"
+
+
+@pytest.fixture(scope="module")
+def solutions() -> list[tuple[str, Program]]:
+    return [
+        (str(path.relative_to(_PATH_PROGRAMS)), load_from_file(path))
+        for path in sorted(_PATH_PROGRAMS.glob("spike_*/*/*.json"))
+    ]
+
+
+@pytest.fixture(scope="module")
+def solution_index(solutions: list[tuple[str, Program]]) -> SolutionIndex:
+    return SolutionIndex.build(solutions)
+
+
+def test_nearest_solution(solutions: list[tuple[str, Program]], solution_index: SolutionIndex) -> None:
+    num_diffs = 0
+    for _, program in solutions:
+        result = solution_index.nearest(program.copy())
+        (nearest,) = result.solutions
+        assert nearest.distance == 0
+        assert solution_index.solutions[solution_index.solution_ids.index(nearest.solution_id)].equivalent_to(program)
+        num_diffs += result.num_diffs
+    assert num_diffs < len(solutions) ** 2 / 2
+
+
+def test_exhaustive_with_infinite_slack(solutions: list[tuple[str, Program]], solution_index: SolutionIndex) -> None:
+    benchmark = benchmark_index(solution_index, [program for _, program in solutions[:2]], k=3, slack=math.inf)
+    assert benchmark.recall == 1.0
+    assert benchmark.index_diffs == benchmark.exhaustive_diffs == 2 * len(solutions)
+
+    benchmark = benchmark_index(solution_index, [program for _, program in solutions[:2]], k=3)
+    assert benchmark.index_diffs <= benchmark.exhaustive_diffs
+    assert "recall@3" in benchmark.describe()
+
+
+def test_build_from_precomputed_distances(solutions: list[tuple[str, Program]]) -> None:
+    calls: list[tuple[int, int]] = []
+
+    def distance(i: int, j: int) -> float:
+        calls.append((i, j))
+        return float(abs(i - j))
+
+    solution_index = SolutionIndex.build(solutions, distance=distance)
+    assert len(solution_index) == len(solutions)
+    assert calls
+    assert all(i != j for i, j in calls)
+
+
+def test_save_and_load(tmp_path: Path, solutions: list[tuple[str, Program]], solution_index: SolutionIndex) -> None:
+    path = tmp_path / "index.json"
+    solution_index.save(path)
+    loaded = SolutionIndex.load(path)
+    assert loaded.solution_ids == solution_index.solution_ids
+
+    _, program = solutions[5]
+    expected = solution_index.nearest(program, 2)
+    actual = loaded.nearest(program, 2)
+    distances = [solution.distance for solution in expected.solutions]
+    assert [solution.distance for solution in actual.solutions] == distances
+    assert actual.num_diffs == expected.num_diffs
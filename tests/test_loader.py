@@ -1,8 +1,12 @@
 
+import json
 from pathlib import Path
 
+import pytest
+
 from facilitate.loader import (
     _join_sequences,
+    load_blocks_from_project,
     load_from_file,
 )
 from facilitate.model.block import Block
@@ -63,5 +67,35 @@ def test_load_from_file() -> None:
         load_from_file(_PATH_PROGRAMS / filename)
 
     load("spike_curric_cleaning_the_home_challenge_v2/2605231/1.json")
-    # load("spike_curric_vacuum_mini_challenge/2605231/4189.json")
-    # load("spike_curric_investigating_the_collapsed_building_mini_challenge/2952421/1094.json")
+    load("spike_curric_vacuum_mini_challenge/2605231/4189.json")
+    load("spike_curric_investigating_the_collapsed_building_mini_challenge/2952421/1094.json")
+
+
+@pytest.mark.parametrize("num_assets", [0, 2000])
+def test_load_blocks_from_project(num_assets: int) -> None:
+    blocks = json.loads((_PATH_PROGRAMS / "spike_curric_vacuum_mini_challenge" / "2515268" / "36.json").read_text())
+    costumes = [
+        {"assetId": str(index), "md5ext": f"{index}.svg", "rotationCenterX": 1.5}
+        for index in range(num_assets)
+    ]
+    project = json.dumps({
+        "targets": [
+            {"isStage": True, "blocks": {}, "costumes": costumes},
+            {"isStage": False, "blocks": blocks, "costumes": costumes},
+        ],
+        "monitors": [],
+    })
+
+    # large projects are streamed, whereas small projects are decoded in full
+    assert load_blocks_from_project(project, target=1) == blocks
+    assert load_blocks_from_project(project.encode(), target=0) == {}
+    with pytest.raises(ValueError, match="no target 2"):
+        load_blocks_from_project(project, target=2)
+
+
+def test_load_from_file_is_deterministic() -> None:
+    path = _PATH_PROGRAMS / "spike_curric_vacuum_mini_challenge" / "2515268" / "36.json"
+    program = load_from_file(path, cache=False)
+    ids = [node.id_ for node in program.nodes()]
+    assert ids == [node.id_ for node in load_from_file(path, cache=False).nodes()]
+    assert len(ids) == len(set(ids))
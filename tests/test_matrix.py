@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import math
+import shutil
+import sys
+from pathlib import Path
+
+import pytest
+
+from facilitate.distance import compute_edit_script_and_distance
+from facilitate.loader import load_from_file
+from facilitate.matrix import compute_distance_matrix
+from facilitate.pqgram import pqgram_distance
+
+np = pytest.importorskip("numpy")
+
+_PATH_TESTS = Path(__file__).parent
+_PATH_PROGRAMS = _PATH_TESTS / "resources" / "programs"
+
+
+@pytest.fixture
+def level_directory(tmp_path: Path) -> Path:
+    """Builds a level in which each user submitted one of the example programs."""
+    program_files = sorted(
+        path for path in _PATH_PROGRAMS.glob("*/*/*.json") if path.stem.isdigit()
+    )[:4]
+    level_directory = tmp_path / "level"
+    for user_id, program_file in enumerate(program_files):
+        user_directory = level_directory / str(user_id)
+        user_directory.mkdir(parents=True)
+        # only the final frame of each user is compared
+        shutil.copy(program_files[0], user_directory / "1.json")
+        shutil.copy(program_file, user_directory / "10.json")
+
+    # a duplicate submission
+    shutil.copytree(level_directory / "1", level_directory / "duplicate")
+    return level_directory
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_compute_distance_matrix(level_directory: Path, tmp_path: Path, workers: int) -> None:
+    output_to = tmp_path / "matrix"
+    stats = compute_distance_matrix(level_directory, output_to, workers=workers, rows_per_chunk=3)
+    submissions = list(level_directory.iterdir())
+    assert stats.submissions == len(submissions)
+    # the duplicate submission is only compared once
+    assert stats.programs == len(submissions) - 1
+    assert stats.failures == 0
+
+    matrix = np.load(output_to / "distances.npy")
+    assert matrix.shape == (4, 4)
+    programs = [load_from_file(level_directory / str(user_id) / "10.json") for user_id in range(4)]
+    for i, program_from in enumerate(programs):
+        for j, program_to in enumerate(programs):
+            _, expected = compute_edit_script_and_distance(program_from, program_to)
+            assert math.isclose(matrix[i, j], expected)
+
+
+def test_resume_distance_matrix(level_directory: Path, tmp_path: Path) -> None:
+    output_to = tmp_path / "matrix"
+    compute_distance_matrix(level_directory, output_to, rows_per_chunk=1)
+    expected = np.load(output_to / "distances.npy")
+
+    # simulate an interruption during the last two rows
+    done_path = output_to / "done.txt"
+    lines = done_path.read_text().splitlines(keepends=True)
+    done_path.write_text("".join(lines[:2]) + "2 3")
+    matrix = np.load(output_to / "distances.npy", mmap_mode="r+")
+    matrix[2:] = math.nan
+    matrix.flush()
+    del matrix
+
+    stats = compute_distance_matrix(level_directory, output_to, rows_per_chunk=1)
+    assert stats.pairs == 2 * 3
+    assert np.array_equal(np.load(output_to / "distances.npy"), expected)
+
+
+def test_pqgram_distance_matrix(level_directory: Path, tmp_path: Path) -> None:
+    output_to = tmp_path / "matrix"
+    stats = compute_distance_matrix(level_directory, output_to, workers=2, method="pqgram")
+    assert stats.failures == 0
+
+    matrix = np.load(output_to / "distances.npy")
+    programs = [load_from_file(level_directory / str(user_id) / "10.json") for user_id in range(4)]
+    for i, program_from in enumerate(programs):
+        for j, program_to in enumerate(programs):
+            assert math.isclose(matrix[i, j], pqgram_distance(program_from, program_to))
+
+
+def test_distance_matrix_requires_numpy(
+    level_directory: Path,
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setitem(sys.modules, "numpy", None)
+    with pytest.raises(ImportError, match="matrix extra"):
+        compute_distance_matrix(level_directory, tmp_path / "matrix")
+    assert not (tmp_path / "matrix").exists()
@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import json
+import typing as t
+from http import HTTPStatus
+from pathlib import Path
+
+import pytest
+
+import facilitate.server
+from facilitate.memo import CachedResponse, ResponseCache, content_digest
+from facilitate.server import app
+
+_PATH_LEVEL = Path(__file__).parent / "resources" / "programs" / "spike_curric_vacuum_mini_challenge"
+_PATH_FROM = _PATH_LEVEL / "2515268" / "20.json"
+_PATH_TO = _PATH_LEVEL / "2515268" / "36.json"
+
+
+def _project(path: Path) -> str:
+    return json.dumps({"targets": [{"blocks": json.loads(path.read_text())}]})
+
+
+@pytest.fixture
+def responses(monkeypatch: pytest.MonkeyPatch) -> ResponseCache:
+    responses = ResponseCache()
+    monkeypatch.setattr(facilitate.server, "responses", responses)
+    return responses
+
+
+def test_content_digest_ignores_key_order() -> None:
+    blocks = json.loads(_PATH_FROM.read_text())
+    reordered = dict(reversed(blocks.items()))
+    assert content_digest(blocks) == content_digest(reordered)
+    assert content_digest(blocks) != content_digest(json.loads(_PATH_TO.read_text()))
+
+
+def test_response_cache_evicts_least_recently_used() -> None:
+    max_size = 2
+    cache = ResponseCache(max_size=max_size)
+    responses = {key: CachedResponse(body=key, headers={}) for key in (b"a", b"b", b"c")}
+    cache.put(b"a", responses[b"a"])
+    cache.put(b"b", responses[b"b"])
+    assert cache.get(b"a") == responses[b"a"]
+    cache.put(b"c", responses[b"c"])
+    assert len(cache) == max_size
+    assert cache.get(b"b") is None
+    assert cache.get(b"a") == responses[b"a"]
+
+
+def test_response_cache_persists_to_database(tmp_path: Path) -> None:
+    path = tmp_path / "responses.sqlite"
+    response = CachedResponse(body=b"{}", headers={"Content-Type": "application/json"})
+    ResponseCache(path=path).put(b"key", response)
+
+    cache = ResponseCache(max_size=0, path=path)
+    assert cache.get(b"key") == response
+    cache.clear()
+    assert cache.get(b"key") is None
+
+
+def test_memoizes_exact_responses(responses: ResponseCache, monkeypatch: pytest.MonkeyPatch) -> None:
+    client = app.test_client()
+    progress_request = {
+        "user_program": _project(_PATH_FROM),
+        "solutions": [{"id": 0, "cmra_blocks_element_id": 0, "program": _project(_PATH_TO)}],
+    }
+    distance_request = {
+        "from": json.loads(_PATH_FROM.read_text()),
+        "to": json.loads(_PATH_TO.read_text()),
+    }
+
+    # approximations are not memoized
+    response = client.put("/progress", json=progress_request | {"time_budget": 0.000001})
+    assert response.json[0]["approximate"] is True
+    assert len(responses) == 0
+
+    progress_response = client.put("/progress", json=progress_request)
+    distance_response = client.put("/distance", json=distance_request)
+    assert progress_response.json[0]["approximate"] is False
+    assert len(responses) == len([progress_response, distance_response])
+
+    def fail(*_: t.Any, **__: t.Any) -> t.NoReturn:  # noqa: ANN401
+        raise AssertionError
+
+    monkeypatch.setattr(facilitate.server, "handle_progress", fail)
+    monkeypatch.setattr(facilitate.server, "handle_distance", fail)
+    assert client.put("/progress", json=progress_request).data == progress_response.data
+    assert client.put("/distance", json=distance_request | {"time_budget": 10}).data == distance_response.data
+
+    # a different solution ID yields a different response, which must be computed
+    progress_request["solutions"][0]["id"] = 1
+    assert client.put("/progress", json=progress_request).status_code == HTTPStatus.INTERNAL_SERVER_ERROR
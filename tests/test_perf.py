@@ -0,0 +1,78 @@
+from pathlib import Path
+
+import pytest
+
+from facilitate.fuzzer.perf import (
+    DiffTiming,
+    ScalingModel,
+    _ddmin,
+    _restrict_block_descriptions,
+)
+from facilitate.loader import load_program_from_block_descriptions
+
+_PATH = Path("program.json")
+
+
+def test_scaling_model_fit() -> None:
+    timings = [
+        DiffTiming(_PATH, _PATH, num_nodes=n, seconds=0.5 * n ** 2)
+        for n in (10, 20, 40, 80)
+    ]
+    model = ScalingModel.fit(timings)
+    assert model is not None
+    assert model.exponent == pytest.approx(2.0)
+    assert model.predict(100) == pytest.approx(5000.0)
+
+    assert ScalingModel.fit(timings[:1]) is None
+
+
+def test_ddmin() -> None:
+    elements = [(0, str(i)) for i in range(20)]
+
+    def is_interesting(candidate: list[tuple[int, str]]) -> bool:
+        ids = {id_ for _, id_ in candidate}
+        return {"3", "17"} <= ids
+
+    assert sorted(_ddmin(elements, is_interesting)) == [(0, "17"), (0, "3")]
+
+
+def test_restrict_block_descriptions() -> None:
+    descriptions = {
+        "a": {
+            "opcode": "event_whenprogramstarts",
+            "next": "b",
+            "parent": None,
+            "inputs": {},
+            "fields": {},
+            "shadow": False,
+            "topLevel": True,
+        },
+        "b": {
+            "opcode": "motion_movesteps",
+            "next": None,
+            "parent": "a",
+            "inputs": {"STEPS": [3, "c", [4, "10"]]},
+            "fields": {},
+            "shadow": False,
+            "topLevel": False,
+        },
+        "c": {
+            "opcode": "operator_add",
+            "next": None,
+            "parent": "b",
+            "inputs": {},
+            "fields": {},
+            "shadow": False,
+            "topLevel": False,
+        },
+    }
+    restricted = _restrict_block_descriptions(descriptions, {"b"})
+    assert list(restricted) == ["b"]
+    assert restricted["b"]["parent"] is None
+    assert restricted["b"]["inputs"]["STEPS"][1] is None
+
+    # the original descriptions should be left untouched
+    assert descriptions["b"]["inputs"]["STEPS"][1] == "c"
+
+    program = load_program_from_block_descriptions(restricted)
+    assert program.find("b") is not None
@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import json
+import typing as t
+from http import HTTPStatus
+from pathlib import Path
+
+import pytest
+
+from facilitate.loader import load_from_file
+from facilitate.pqgram import PQGramProfile, ProfileCache, pqgram_distance
+from facilitate.server import app
+
+if t.TYPE_CHECKING:
+    from facilitate.model.program import Program
+
+_PATH_LEVEL = Path(__file__).parent / "resources" / "programs" / "spike_curric_vacuum_mini_challenge"
+_PATH_FROM = _PATH_LEVEL / "2515268" / "20.json"
+_PATH_TO = _PATH_LEVEL / "2515268" / "36.json"
+_PATH_SOLUTION = _PATH_LEVEL / "2605231" / "4189.json"
+
+
+def _project(path: Path) -> str:
+    return json.dumps({"targets": [{"blocks": json.loads(path.read_text())}]})
+
+
+def test_profile_size() -> None:
+    # each leaf contributes one pq-gram, and each other node contributes one per child plus q - 1
+    program = load_from_file(_PATH_FROM)
+    expected = sum(
+        1 if not list(node.children()) else len(list(node.children())) + 2
+        for node in program.nodes()
+    )
+    assert PQGramProfile.build(program).size == expected
+
+
+def test_pqgram_distance() -> None:
+    program_from = load_from_file(_PATH_FROM)
+    program_to = load_from_file(_PATH_TO)
+    solution = load_from_file(_PATH_SOLUTION)
+
+    assert pqgram_distance(program_from, program_from.copy()) == 0
+    distance = pqgram_distance(program_from, program_to)
+    assert 0 < distance <= 1
+    assert distance == pqgram_distance(program_to, program_from)
+    # the later snapshot is closer to the solution
+    assert pqgram_distance(program_to, solution) < pqgram_distance(program_from, solution)
+
+
+def test_profile_encoding() -> None:
+    profile = PQGramProfile.build(load_from_file(_PATH_FROM))
+    assert PQGramProfile.from_bytes(profile.to_bytes()) == profile
+
+    with pytest.raises(ValueError, match="shapes"):
+        profile.distance_to(PQGramProfile.build(load_from_file(_PATH_FROM), p=1, q=2))
+
+
+def test_profile_cache() -> None:
+    cache = ProfileCache(max_size=1)
+    loads: list[Path] = []
+
+    def load(path: Path) -> PQGramProfile:
+        def load_program() -> Program:
+            loads.append(path)
+            return load_from_file(path)
+        return cache.get(path.read_bytes(), load_program)
+
+    assert load(_PATH_FROM) is load(_PATH_FROM)
+    load(_PATH_TO)
+    load(_PATH_FROM)
+    assert loads == [_PATH_FROM, _PATH_TO, _PATH_FROM]
+    assert len(cache) == 1
+
+
+def test_pqgram_endpoints() -> None:
+    client = app.test_client()
+    response = client.put("/distance", json={
+        "from": json.loads(_PATH_FROM.read_text()),
+        "to": json.loads(_PATH_TO.read_text()),
+        "method": "pqgram",
+    })
+    assert response.status_code == HTTPStatus.OK
+    assert response.json["approximate"] is True
+    assert response.json["distance"] == pqgram_distance(load_from_file(_PATH_FROM), load_from_file(_PATH_TO))
+
+    response = client.put("/progress", json={
+        "user_program": _project(_PATH_FROM),
+        "solutions": [
+            {"id": 0, "cmra_blocks_element_id": 0, "program": _project(_PATH_SOLUTION)},
+            {"id": 1, "cmra_blocks_element_id": 0, "program": _project(_PATH_FROM)},
+        ],
+        "method": "pqgram",
+    })
+    assert response.status_code == HTTPStatus.OK
+    distances = {solution["id"]: solution["distance"] for solution in response.json}
+    assert distances[1] == 0
+    assert distances[0] > 0
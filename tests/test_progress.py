@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+import gzip
+import json
+import typing as t
+from http import HTTPStatus
+from pathlib import Path
+
+import pytest
+
+import facilitate.progress
+from facilitate.deadline import deadline_after, enforce_deadline
+from facilitate.distance import compute_edit_script_and_distance
+from facilitate.loader import load_from_file
+from facilitate.progress import (
+    ProgressOrder,
+    compute_progress,
+    compute_trajectory_progress,
+    load_snapshots,
+)
+from facilitate.scraper.trajectory import encode_trajectory
+from facilitate.server import app
+
+_PATH_TESTS = Path(__file__).parent
+_PATH_LEVEL = _PATH_TESTS / "resources" / "programs" / "spike_curric_vacuum_mini_challenge"
+_PATH_TRAJECTORY = _PATH_LEVEL / "2515268"
+_PATH_SOLUTION = _PATH_LEVEL / "2605231" / "4189.json"
+_PATH_TRICKY_CASES = _PATH_TESTS / "resources" / "programs" / "tricky_cases"
+
+
+def test_load_snapshots_from_directory() -> None:
+    snapshots = load_snapshots(_PATH_TRAJECTORY)
+    assert [frame for frame, _ in snapshots] == [20, 36]
+
+
+def test_load_snapshots_from_trajectory(tmp_path: Path) -> None:
+    # the C-blocks of these programs hold substacks, which loading rewrites in place
+    program_files = [
+        _PATH_TRICKY_CASES / "add_control_forever" / "before.json",
+        _PATH_TRICKY_CASES / "add_control_forever" / "after.json",
+        _PATH_TRICKY_CASES / "add_control_forever" / "after.json",
+        _PATH_TRICKY_CASES / "delete_node_with_kids" / "after.json",
+    ]
+    frames = [(index, json.loads(path.read_text())) for index, path in enumerate(program_files)]
+    records = encode_trajectory(frames, checkpoint_interval=100)
+    trajectory_file = tmp_path / "7.trajectory.jsonl"
+    trajectory_file.write_bytes(b"\n".join(record for _, record in records))
+
+    snapshots = load_snapshots(trajectory_file)
+    assert [frame for frame, _ in snapshots] == list(range(len(program_files)))
+    for (_, program), path in zip(snapshots, program_files, strict=True):
+        assert program.equivalent_to(load_from_file(path))
+
+
+@pytest.mark.parametrize("include_edits", [False, True])
+def test_compute_trajectory_progress(include_edits: bool) -> None:
+    snapshots = [program for _, program in load_snapshots(_PATH_TRAJECTORY)]
+    final_snapshot = load_from_file(_PATH_TRAJECTORY / "36.json")
+    solutions = [
+        ("other", load_from_file(_PATH_SOLUTION)),
+        ("final", final_snapshot),
+    ]
+
+    progress = list(compute_trajectory_progress(snapshots, solutions, include_edits=include_edits))
+    assert len(progress) == len(snapshots)
+
+    # the first snapshot is diffed from scratch
+    for (_, solution), distance in zip(solutions, progress[0], strict=True):
+        _, expected_distance = compute_edit_script_and_distance(snapshots[0], solution)
+        assert distance.distance == expected_distance
+        assert (distance.edit_script is not None) == include_edits
+
+    # a snapshot that is identical to a solution has made complete progress towards it
+    assert [distance.solution_id for distance in progress[1]] == ["other", "final"]
+    assert progress[1][1].distance == 0
+    assert progress[1][0].distance > 0
+
+
+@pytest.mark.parametrize("order", ["solution", "completion"])
+def test_compute_progress(order: ProgressOrder) -> None:
+    program = load_from_file(_PATH_TRAJECTORY / "20.json")
+    solutions = [
+        ("other", load_from_file(_PATH_SOLUTION)),
+        ("final", load_from_file(_PATH_TRAJECTORY / "36.json")),
+        ("same", load_from_file(_PATH_TRAJECTORY / "20.json")),
+    ]
+
+    distances = list(compute_progress(program, solutions, order=order))
+    if order == "solution":
+        assert [distance.solution_id for distance in distances] == ["other", "final", "same"]
+
+    expected = {
+        solution_id: compute_edit_script_and_distance(program, solution)[1]
+        for solution_id, solution in solutions
+    }
+    assert {distance.solution_id: distance.distance for distance in distances} == expected
+    assert all(distance.edit_script is not None for distance in distances)
+
+
+def test_compute_progress_in_completion_order_keeps_deadline() -> None:
+    program = load_from_file(_PATH_TRAJECTORY / "20.json")
+    solutions = [("final", load_from_file(_PATH_TRAJECTORY / "36.json"))]
+
+    # the deadline of the caller is handed to the worker processes
+    with enforce_deadline(deadline_after(0)):
+        [distance] = compute_progress(program, solutions, order="completion")
+    assert distance.approximate
+
+
+def test_compute_progress_falls_back_to_solution_order(monkeypatch: pytest.MonkeyPatch) -> None:
+    def unavailable(*_: t.Any, **__: t.Any) -> t.NoReturn:  # noqa: ANN401
+        error = "[Errno 38] Function not implemented"
+        raise OSError(error)
+
+    # e.g., AWS Lambda provides no shared memory for the locks of a process pool
+    monkeypatch.setattr(facilitate.progress, "_executors", {})
+    monkeypatch.setattr(facilitate.progress, "ProcessPoolExecutor", unavailable)
+    program = load_from_file(_PATH_TRAJECTORY / "20.json")
+    solutions = [
+        ("other", load_from_file(_PATH_SOLUTION)),
+        ("final", load_from_file(_PATH_TRAJECTORY / "36.json")),
+    ]
+
+    distances = list(compute_progress(program, solutions, order="completion"))
+    assert distances == list(compute_progress(program, solutions, order="solution"))
+
+
+def _project(path: Path) -> str:
+    return json.dumps({"targets": [{"blocks": json.loads(path.read_text())}]})
+
+
+@pytest.mark.parametrize("accept_encoding", ["identity", "gzip"])
+def test_streaming_progress(accept_encoding: str) -> None:
+    client = app.test_client()
+    solution_files = [_PATH_SOLUTION, _PATH_TRAJECTORY / "36.json"]
+    response = client.put(
+        "/progress/stream",
+        json={
+            "user_program": _project(_PATH_TRAJECTORY / "20.json"),
+            "solutions": [
+                {"id": index, "cmra_blocks_element_id": 0, "program": _project(path)}
+                for index, path in enumerate(solution_files)
+            ],
+            "order": "completion",
+        },
+        headers={"Accept-Encoding": accept_encoding},
+    )
+    assert response.status_code == HTTPStatus.OK
+    assert response.mimetype == "application/x-ndjson"
+
+    body = response.data
+    if accept_encoding == "gzip":
+        body = gzip.decompress(body)
+    lines = [json.loads(line) for line in body.splitlines()]
+    assert sorted(line["id"] for line in lines) == [0, 1]
+    assert all("edits" in line and "distance" in line for line in lines)
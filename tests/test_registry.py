@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import json
+import os
+from http import HTTPStatus
+from pathlib import Path
+
+import pytest
+
+import facilitate.server
+from facilitate.loader import load_from_file
+from facilitate.registry import SolutionRegistry, UnknownSolutionError
+from facilitate.server import app
+
+_PATH_LEVEL = Path(__file__).parent / "resources" / "programs" / "spike_curric_vacuum_mini_challenge"
+_PATH_FROM = _PATH_LEVEL / "2515268" / "20.json"
+_PATH_TO = _PATH_LEVEL / "2515268" / "36.json"
+_PATH_SOLUTION = _PATH_LEVEL / "2605231" / "4189.json"
+
+
+def _project(path: Path) -> str:
+    return json.dumps({"targets": [{"blocks": json.loads(path.read_text())}]})
+
+
+def _solutions() -> list[dict[str, object]]:
+    return [
+        {"id": index, "cmra_blocks_element_id": 0, "program": _project(path)}
+        for index, path in enumerate([_PATH_SOLUTION, _PATH_TO])
+    ]
+
+
+@pytest.fixture
+def registry(monkeypatch: pytest.MonkeyPatch) -> SolutionRegistry:
+    registry = SolutionRegistry()
+    monkeypatch.setattr(facilitate.server, "registry", registry)
+    return registry
+
+
+def test_register_and_get() -> None:
+    registry = SolutionRegistry()
+    solutions = [("a", load_from_file(_PATH_SOLUTION)), ("b", load_from_file(_PATH_TO))]
+    assert registry.register("vacuum", solutions) == ["a", "b"]
+    assert registry.solution_ids("vacuum") == ["a", "b"]
+    assert [solution.id_ for solution in registry.get("vacuum", ["b"])] == ["b"]
+
+    with pytest.raises(UnknownSolutionError):
+        registry.get("vacuum", ["c"])
+    with pytest.raises(UnknownSolutionError):
+        registry.get("other")
+
+
+def test_persistence(tmp_path: Path) -> None:
+    registry = SolutionRegistry(directory=tmp_path)
+    assert registry.persistent
+    registry.register("vacuum", [("a", load_from_file(_PATH_SOLUTION))])
+
+    # another process that shares the directory sees the solutions, and any later changes to them
+    other = SolutionRegistry(directory=tmp_path)
+    (solution,) = other.get("vacuum")
+    assert solution.program.equivalent_to(load_from_file(_PATH_SOLUTION))
+
+    registry.register("vacuum", [("a", load_from_file(_PATH_TO)), ("b", load_from_file(_PATH_FROM))])
+    (path,) = tmp_path.glob("*.json")
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    assert other.solution_ids("vacuum") == ["a", "b"]
+
+
+def test_progress_with_registered_solutions(registry: SolutionRegistry) -> None:
+    client = app.test_client()
+    response = client.put("/levels/vacuum/solutions", json={"solutions": _solutions()})
+    assert response.status_code == HTTPStatus.OK
+    assert response.json == {"level": "vacuum", "solutions": [0, 1]}
+    assert client.get("/levels/vacuum/solutions").json["solutions"] == [0, 1]
+
+    expected = client.put("/progress", json={
+        "user_program": _project(_PATH_FROM),
+        "solutions": _solutions(),
+    }).json
+    response = client.put("/progress", json={
+        "user_program": _project(_PATH_FROM),
+        "level": "vacuum",
+    })
+    assert response.status_code == HTTPStatus.OK
+    # NOTE the IDs of generated nodes differ between loads, so only distances are compared
+    assert [(solution["id"], solution["distance"]) for solution in response.json] == [
+        (solution["id"], solution["distance"]) for solution in expected
+    ]
+
+    response = client.put("/progress", json={
+        "user_program": _project(_PATH_FROM),
+        "level": "vacuum",
+        "solution_ids": [1],
+    })
+    assert [solution["id"] for solution in response.json] == [1]
+
+    response = client.put("/progress/stream", json={
+        "user_program": _project(_PATH_FROM),
+        "level": "vacuum",
+        "method": "pqgram",
+    })
+    lines = [json.loads(line) for line in response.data.splitlines()]
+    assert [line["id"] for line in lines] == [0, 1]
+
+
+def test_unknown_and_invalid_solutions(registry: SolutionRegistry) -> None:
+    client = app.test_client()
+    assert client.get("/levels/nowhere/solutions").status_code == HTTPStatus.NOT_FOUND
+    response = client.put("/progress", json={"user_program": _project(_PATH_FROM), "level": "nowhere"})
+    assert response.status_code == HTTPStatus.NOT_FOUND
+
+    # exactly one of solutions and level must be given
+    response = client.put("/progress", json={"user_program": _project(_PATH_FROM)})
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+    response = client.put("/progress", json={
+        "user_program": _project(_PATH_FROM),
+        "solutions": _solutions(),
+        "level": "vacuum",
+    })
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
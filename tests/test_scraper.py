@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import gzip
+import json
+from pathlib import Path
+
+import pytest
+
+from facilitate.corpus import Corpus
+from facilitate.scraper import scrape
+from facilitate.scraper.frame import LazyFrame
+
+_PATH_TESTS = Path(__file__).parent
+_PATH_PROGRAMS = _PATH_TESTS / "resources" / "programs"
+_PATH_STUDENT = _PATH_PROGRAMS / "spike_curric_vacuum_mini_challenge" / "2515268"
+
+
+def _load_blocks(filename: str) -> dict:
+    with (_PATH_STUDENT / filename).open() as file:
+        return json.load(file)
+
+
+def _programming_frame(blocks: dict, *, user_id: int = 7) -> dict:
+    return {
+        "actor": "programming_interface",
+        "verb": "program_changed",
+        "user_id": user_id,
+        "consent": True,
+        "assent": True,
+        "state_info": {"program": {"targets": [{"blocks": blocks}]}},
+    }
+
+
+@pytest.fixture
+def dump(tmp_path: Path) -> Path:
+    blocks_before = _load_blocks("20.json")
+    blocks_after = _load_blocks("36.json")
+    frames = [
+        {"actor": "student", "verb": "episode_started", "user_id": 7, "object_name": "vacuum"},
+        json.dumps(_programming_frame(blocks_before)),
+        _programming_frame(blocks_before),
+        {"actor": "student", "verb": "clicked", "user_id": 7},
+        json.dumps(_programming_frame(blocks_after)),
+    ]
+    sessions = [
+        {"_id": {"$oid": "a"}, "frames": frames},
+        {"_id": 2, "level_id": "other", "frames": [_programming_frame(blocks_after, user_id=8)]},
+        {"frames": []},
+    ]
+    filename = tmp_path / "dump.json"
+    with filename.open("w") as file:
+        json.dump(sessions, file)
+    return filename
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_scrape_directory(dump: Path, tmp_path: Path, workers: int) -> None:
+    output_to = tmp_path / "programs"
+    stats = scrape(dump, output_to, workers=workers)
+    assert stats.sessions == len(json.loads(dump.read_text()))
+    # the repeated program of the first session is skipped
+    num_program_frames = 3
+    assert stats.frames == num_program_frames
+
+    written = sorted(str(path.relative_to(output_to)) for path in output_to.glob("**/*.json"))
+    assert written == ["other/8/0.json", "vacuum/7/1.json", "vacuum/7/4.json"]
+
+    blocks = json.loads((output_to / "vacuum" / "7" / "4.json").read_text())
+    expected = _load_blocks("36.json")
+    for block in expected.values():
+        block.pop("x", None)
+        block.pop("y", None)
+    assert blocks == expected
+
+
+def test_scrape_compressed_bundle(dump: Path, tmp_path: Path) -> None:
+    output_to = tmp_path / "programs"
+    scrape(dump, output_to, output_format="bundle", compress=True)
+
+    with gzip.open(output_to / "vacuum" / "7.jsonl.gz", "rt") as file:
+        records = [json.loads(line) for line in file]
+    assert [record["frame"] for record in records] == [1, 4]
+    assert (output_to / "other" / "8.jsonl.gz").exists()
+
+
+def test_scrape_bundle_again_replaces_records(dump: Path, tmp_path: Path) -> None:
+    output_to = tmp_path / "programs"
+    for _ in range(2):
+        scrape(dump, output_to, output_format="bundle")
+
+    with (output_to / "vacuum" / "7.jsonl").open() as file:
+        records = [json.loads(line) for line in file]
+    assert [record["frame"] for record in records] == [1, 4]
+
+
+def test_scrape_ignores_key_order_of_unchanged_programs(tmp_path: Path) -> None:
+    blocks = _load_blocks("20.json")
+    reordered = dict(reversed(blocks.items()))
+    frames = [
+        {"actor": "student", "verb": "episode_started", "user_id": 7, "object_name": "vacuum"},
+        _programming_frame(blocks),
+        _programming_frame(reordered),
+    ]
+    filename = tmp_path / "dump.json"
+    filename.write_text(json.dumps([{"_id": 1, "frames": frames}]))
+
+    stats = scrape(filename, tmp_path / "programs")
+    assert stats.frames == 1
+
+
+def test_lazy_frame_decodes_only_what_is_needed() -> None:
+    text = json.dumps({
+        "actor": "programming_interface",
+        "verb": "program_changed",
+        "state_info": {"program": {"targets": []}},
+        "user_id": 7,
+    })
+    frame = LazyFrame(text)
+    assert frame.may_contain('"programming_interface"')
+    assert not frame.may_contain('"episode_started"')
+
+    assert frame.get("actor") == "programming_interface"
+    assert "state_info" not in frame._values
+
+    assert frame.get("state_info") == {"program": {"targets": []}}
+    default = object()
+    assert frame.get("missing", default) is default
+    assert "verb" in frame
+    assert "missing" not in frame
+
+
+def test_lazy_frame_rejects_malformed_frames() -> None:
+    with pytest.raises(ValueError, match="not a JSON object"):
+        LazyFrame("[1, 2]")
+    with pytest.raises(ValueError, match="malformed frame"):
+        LazyFrame('{"actor" 1}').get("verb")
+
+
+def test_scrape_corpus(dump: Path, tmp_path: Path) -> None:
+    output_to = tmp_path / "corpus.sqlite"
+    scrape(dump, output_to, output_format="corpus", workers=2)
+
+    with Corpus.open(output_to, readonly=True) as corpus:
+        records = list(corpus.programs())
+        assert [(r.level_id, r.user_id, r.frame) for r in records] == [
+            ("other", "8", 0),
+            ("vacuum", "7", 1),
+            ("vacuum", "7", 4),
+        ]
+        assert all(r.metadata is not None and r.metadata.parse_status == "ok" for r in records)
@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import itertools
+import json
+from pathlib import Path
+
+import pytest
+
+from facilitate.scraper import scrape
+from facilitate.scraper.trajectory import Trajectory, encode_trajectory
+
+_PATH_TESTS = Path(__file__).parent
+_PATH_PROGRAMS = _PATH_TESTS / "resources" / "programs"
+
+
+def _load_blocks(path: Path) -> dict:
+    with path.open() as file:
+        return json.load(file)
+
+
+@pytest.fixture
+def frames() -> list[tuple[int, dict]]:
+    student_dir = _PATH_PROGRAMS / "spike_curric_vacuum_mini_challenge" / "2515268"
+    before = _load_blocks(student_dir / "20.json")
+    after = _load_blocks(student_dir / "36.json")
+
+    # build a trajectory that gradually removes blocks and then adds them back
+    ids = list(after)
+    frames = [(0, before), (1, after)]
+    for index in range(1, len(ids)):
+        frames.append((len(frames), {id_: after[id_] for id_ in ids[:-index]}))
+    frames.append((len(frames), after))
+
+    # reordering blocks must be stored exactly
+    frames.append((len(frames), dict(reversed(after.items()))))
+    return frames
+
+
+@pytest.mark.parametrize("checkpoint_interval", [1, 4, 100])
+def test_trajectory_roundtrip(frames: list[tuple[int, dict]], checkpoint_interval: int) -> None:
+    records = encode_trajectory(frames, checkpoint_interval=checkpoint_interval)
+    trajectory = Trajectory.from_bytes(b"\n".join(record for _, record in records))
+    assert len(trajectory) == len(frames)
+
+    for position, (index, blocks) in enumerate(frames):
+        rebuilt = trajectory.blocks(position)
+        assert trajectory.frame_index(position) == index
+        assert rebuilt == blocks
+        assert list(rebuilt) == list(blocks)
+
+    assert [(index, list(blocks)) for index, blocks in trajectory.frames()] == [
+        (index, list(blocks)) for index, blocks in frames
+    ]
+
+
+def test_trajectory_is_smaller_than_snapshots(frames: list[tuple[int, dict]]) -> None:
+    records = encode_trajectory(frames)
+    trajectory_size = sum(len(record) for _, record in records)
+    snapshots_size = sum(len(json.dumps(blocks, separators=(",", ":"))) for _, blocks in frames)
+    assert trajectory_size < snapshots_size / 3
+
+
+def test_scrape_trajectory(tmp_path: Path, frames: list[tuple[int, dict]]) -> None:
+    session = {
+        "_id": 1,
+        "level_id": "vacuum",
+        "frames": [
+            {
+                "actor": "programming_interface",
+                "verb": "program_changed",
+                "user_id": 7,
+                "state_info": {"program": {"targets": [{"blocks": blocks}]}},
+            }
+            for _, blocks in frames
+        ],
+    }
+    dump = tmp_path / "dump.json"
+    dump.write_text(json.dumps([session]))
+
+    output_to = tmp_path / "programs"
+    scrape(dump, output_to, output_format="trajectory", compress=True, workers=2)
+
+    # the final frame only reorders the blocks of its predecessor, so it is skipped as unchanged
+    trajectory = Trajectory.load(output_to / "vacuum" / "7.trajectory.jsonl.gz")
+    assert len(trajectory) == len(frames) - 1
+    assert trajectory.blocks(-1) == frames[-1][1]
+
+
+def test_trajectory_with_checkpoint_block_id(frames: list[tuple[int, dict]]) -> None:
+    # a delta whose first added block is named "checkpoint" must not be mistaken for a checkpoint
+    _, after = frames[1]
+    block = next(iter(after.values()))
+    trajectory_frames = [(0, {}), (1, {"checkpoint": block}), (2, {"checkpoint": block, "x": block})]
+    records = encode_trajectory(trajectory_frames, checkpoint_interval=100)
+    trajectory = Trajectory.from_bytes(b"\n".join(record for _, record in records))
+    for position, (_, blocks) in enumerate(trajectory_frames):
+        assert trajectory.blocks(position) == blocks
+
+
+def test_trajectory_frames_are_read_only(frames: list[tuple[int, dict]]) -> None:
+    records = encode_trajectory(frames, checkpoint_interval=100)
+    trajectory = Trajectory.from_bytes(b"\n".join(record for _, record in records))
+
+    # frames share the descriptions of unchanged blocks with their predecessors
+    (_, first), (_, second) = itertools.islice(trajectory.frames(), 2)
+    shared_ids = [id_ for id_ in second if id_ in first and first[id_] == second[id_]]
+    assert shared_ids
+    assert all(second[id_] is first[id_] for id_ in shared_ids)
+
+    # whereas rebuilt frames can be modified without affecting any other frame
+    rebuilt = trajectory.blocks(1)
+    assert all(rebuilt[id_] is not second[id_] for id_ in shared_ids)
+    rebuilt.clear()
+    assert trajectory.blocks(1) == frames[1][1]
@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+import typing as t
+
+import pytest
+
+from facilitate.diff import compute_edit_script
+from facilitate.edit import EditScript
+from facilitate.mappings import NodeMappings
+from facilitate.verification import VerificationMode, VerificationPolicy, load_reproducer
+
+if t.TYPE_CHECKING:
+    from pathlib import Path
+
+    from facilitate.model.node import Node
+
+
+def test_sampled_verification(minimal_tree: Node, minimal_with_extra_tree: Node) -> None:
+    policy = VerificationPolicy(mode=VerificationMode.SAMPLED, sample_rate=3)
+    for _ in range(6):
+        compute_edit_script(minimal_tree, minimal_with_extra_tree, verification=policy)
+    assert policy.metrics.to_dict() == {"verified": 2, "failed": 0, "skipped": 4, "dropped": 0}
+
+
+def test_shadow_verification(minimal_tree: Node, minimal_with_extra_tree: Node, tmp_path: Path) -> None:
+    policy = VerificationPolicy(mode=VerificationMode.SHADOW, reproducer_dir=tmp_path)
+    compute_edit_script(minimal_tree, minimal_with_extra_tree, verification=policy)
+    policy.join()
+    assert policy.metrics.verified == 1
+
+    # an empty edit script does not transform one program into another
+    policy.submit(EditScript(), NodeMappings(), tree_from=minimal_tree, tree_to=minimal_with_extra_tree)
+    policy.join()
+    assert policy.metrics.failed == 1
+
+    [reproducer] = tmp_path.glob("*.from.bin")
+    tree_from, tree_to = load_reproducer(reproducer)
+    assert tree_from.equivalent_to(minimal_tree)
+    assert tree_to.equivalent_to(minimal_with_extra_tree)
+
+
+def test_failed_verification_raises(minimal_tree: Node, minimal_with_extra_tree: Node, tmp_path: Path) -> None:
+    policy = VerificationPolicy(reproducer_dir=tmp_path)
+    with pytest.raises(AssertionError, match="verification failed"):
+        policy.check_result(
+            minimal_tree,
+            tree_from=minimal_tree,
+            tree_to=minimal_with_extra_tree,
+            edit_script=EditScript(),
+        )
+    assert policy.metrics.failed == 1
+    assert len(list(tmp_path.glob("*.to.bin"))) == 1
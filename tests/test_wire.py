@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import gzip
+import json
+from http import HTTPStatus
+from pathlib import Path
+
+import pytest
+
+import facilitate.server
+from facilitate.diff import compute_edit_script
+from facilitate.edit import EditScript
+from facilitate.loader import load_from_file
+from facilitate.server import app
+from facilitate.wire import (
+    COMPACT_JSON,
+    JSON,
+    MSGPACK,
+    UnsupportedWireFormatError,
+    get_wire_format,
+)
+
+_PATH_TESTS = Path(__file__).parent
+_PATH_PROGRAMS = _PATH_TESTS / "resources" / "programs"
+_PATH_VACUUM = _PATH_PROGRAMS / "spike_curric_vacuum_mini_challenge"
+_PATH_FROM = _PATH_VACUUM / "2515268" / "20.json"
+_PATH_TO = _PATH_VACUUM / "2515268" / "36.json"
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_compact_round_trip(compact: bool) -> None:
+    tree_from = load_from_file(_PATH_FROM)
+    tree_to = load_from_file(_PATH_TO)
+    edit_script = compute_edit_script(tree_from, tree_to, compact=compact)
+
+    wire_format = get_wire_format(COMPACT_JSON)
+    encoded = edit_script.to_bytes(wire_format)
+    assert EditScript.from_bytes(encoded, wire_format) == edit_script
+    assert len(encoded) < len(edit_script.to_bytes(get_wire_format(JSON)))
+
+
+def test_get_wire_format() -> None:
+    assert get_wire_format(None).media_type == JSON
+    assert get_wire_format("application/json; charset=utf-8").media_type == JSON
+    assert get_wire_format(COMPACT_JSON).compact
+    with pytest.raises(UnsupportedWireFormatError):
+        get_wire_format("text/html")
+
+    # binary formats fall back to compact JSON when their library is missing
+    assert get_wire_format("application/x-msgpack", fallback=True).compact
+
+
+def _diff_request() -> dict[str, object]:
+    return {
+        "from": json.loads(_PATH_FROM.read_text()),
+        "to": json.loads(_PATH_TO.read_text()),
+    }
+
+
+def test_server_json_by_default() -> None:
+    client = app.test_client()
+    response = client.put("/distance", json=_diff_request())
+    assert response.status_code == HTTPStatus.OK
+    assert response.mimetype == JSON
+    assert "Content-Encoding" not in response.headers
+    EditScript.from_dict(response.json["edits"])
+
+
+def test_server_compressed_compact_json() -> None:
+    client = app.test_client()
+    body = gzip.compress(json.dumps(_diff_request()).encode())
+    response = client.put(
+        "/distance",
+        data=body,
+        headers={
+            "Content-Type": COMPACT_JSON,
+            "Content-Encoding": "gzip",
+            "Accept": COMPACT_JSON,
+            "Accept-Encoding": "gzip",
+        },
+    )
+    assert response.status_code == HTTPStatus.OK
+    assert response.mimetype == COMPACT_JSON
+    assert response.headers["Content-Encoding"] == "gzip"
+
+    payload = json.loads(gzip.decompress(response.data))
+    edit_script = EditScript.from_compact_dict(payload["edits"])
+    assert len(edit_script) > 0
+
+
+def test_server_rejects_undecodable_request() -> None:
+    client = app.test_client()
+    response = client.put(
+        "/diff",
+        data=b"not gzip",
+        headers={"Content-Type": JSON, "Content-Encoding": "gzip"},
+    )
+    assert response.status_code == HTTPStatus.UNSUPPORTED_MEDIA_TYPE
+
+
+def test_server_rejects_request_without_json_equivalent(monkeypatch: pytest.MonkeyPatch) -> None:
+    # NOTE MessagePack decodes binary values as bytes, which cannot be transcoded to JSON
+    payload = _diff_request() | {"from": b"\x00"}
+    monkeypatch.setattr(facilitate.server, "decode_request", lambda *_, **__: payload)
+    client = app.test_client()
+    response = client.put("/diff", data=b"", headers={"Content-Type": MSGPACK})
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+
+
+def test_server_msgpack() -> None:
+    msgpack = pytest.importorskip("msgpack")
+    client = app.test_client()
+    response = client.put(
+        "/diff",
+        data=msgpack.packb(_diff_request()),
+        headers={"Content-Type": MSGPACK, "Accept": MSGPACK},
+    )
+    assert response.status_code == HTTPStatus.OK
+    assert response.mimetype == MSGPACK
+    EditScript.from_compact_dict(msgpack.unpackb(response.data))